@@ -1,16 +1,19 @@
-from backend.app import app  # Import your existing Flask app
+"""
+Vercel serverless entry point.
 
+@vercel/python serves the WSGI application named `app`, so no adapter of
+our own is needed. The backend modules import each other as top-level
+modules (`import config`), so backend/ goes on the path first.
+create_app(preload_frontend=False) leaves the Redis and model API clients
+and each file of the frontend build to be loaded when a request first
+needs them, which keeps cold starts short.
+"""
+import os
+import sys
 
-def handler(request, response):
-    """
-    A simple WSGI adapter to allow your Flask app to run as a Vercel serverless function.
-    """
-    # Convert Vercel's request/response objects to a WSGI-compatible format
-    environ = request.environ
-    # Define a start_response function that Vercel's response object expects
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+sys.path.insert(0, os.path.normpath(BACKEND_DIR))
 
-    def start_response(status, headers):
-        response.status_code = int(status.split(" ")[0])
-        for header, value in headers:
-            response.headers[header] = value
-    return app(environ, start_response)
+from app import create_app  # noqa: E402
+
+app = create_app(preload_frontend=False)
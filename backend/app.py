@@ -1,50 +1,55 @@
+import contextlib
 import os
 import re
-import openai
 import logging
-import redis
 import json
-from typing import Any, Dict, List
-from flask import Flask, request, jsonify, Response, send_from_directory
-from flask_cors import CORS
+import hmac
+import threading
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
+from flask import (
+    Blueprint,
+    Flask,
+    request,
+    jsonify,
+    g,
+    Response,
+    stream_with_context,
+)
 import config  # Import our configuration settings
+import metrics
+import ratings
+import structured_logging
+import tracing
+from filters import StreamingFilter, dynamic_filter
+from policy import VERSION_KEY as POLICY_VERSION_KEY, PolicyEngine
+from rate_limiter import LocalRateLimiter, RateLimiter, RateLimitResult
+from redis_factory import create_redis_client
+from response_cache import ResponseCache
+from single_flight import SingleFlight
+from static_assets import StaticAssets
+from context_builder import ContextBuilder
+from llm_client import LLMError, create_llm_client
+from model_router import ModelRouter, Route
+from prompts import VERSION_KEY as PROMPT_VERSION_KEY, PromptRegistry
+import time
 import uuid
-from datetime import datetime
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+if TYPE_CHECKING:
+    import redis
 
-# Set OpenAI API key from config
-if not config.OPENAI_API_KEY or config.OPENAI_API_KEY.startswith(
-    "your_openai_api_key_here"
-):
-    logger.warning(
-        "No valid OpenAI API key found! Please set OPENAI_API_KEY in your .env file."
-    )
-openai.api_key = config.OPENAI_API_KEY
+    from resilience import CircuitBreaker
 
-# Initialize Flask and configure it to serve the frontend build
-app = Flask(
-    __name__,
-    static_folder=os.path.join(os.path.dirname(__file__), "../frontend/build"),
-    static_url_path="",
-)
+logger = logging.getLogger(__name__)
 
-# Set up CORS for API routes
-CORS(
-    app,
-    resources={
-        r"/api/*": {
-            "origins": ["http://localhost:3000", "https://tutorgpt.onrender.com"]
-        }
-    },
-)
+FRONTEND_BUILD_DIR = os.path.join(os.path.dirname(__file__), "../frontend/build")
+
+# Routes and request hooks; create_app() registers them on a Flask app
+api = Blueprint("api", __name__)
 
 # Ensure all responses include CORS headers (even on errors)
 
 
-@app.after_request
+@api.after_app_request
 def add_cors_headers(response):
     allowed_origins = ["http://localhost:3000", "https://tutorgpt.onrender.com"]
     origin = request.headers.get("Origin")
@@ -56,10 +61,12 @@ def add_cors_headers(response):
         )
     response.headers["Access-Control-Allow-Headers"] = "Content-Type,Authorization"
     response.headers["Access-Control-Allow-Methods"] = "GET,POST,PUT,DELETE,OPTIONS"
+    # Let the frontend read the IDs for error reports
+    response.headers["Access-Control-Expose-Headers"] = "X-Request-ID,X-Trace-ID"
     return response
 
 
-@app.errorhandler(500)
+@api.app_errorhandler(500)
 def handle_500_error(e):
     response = jsonify({"error": "Internal Server Error", "details": str(e)})
     origin = request.headers.get("Origin")
@@ -75,25 +82,73 @@ def handle_500_error(e):
     return response, 500
 
 
+class LazyClient:
+    """
+    Stands in for a client that is created on first use, so importing the
+    app, and requests that never need the client, do not pay for it.
+    Attribute reads and writes go to the client.
+    """
+
+    def __init__(self, factory):
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_client", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def _target(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    object.__setattr__(self, "_client", self._factory())
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self._target(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._target(), name, value)
+
+    def __delattr__(self, name):
+        delattr(self._target(), name)
+
+
 # Set up Redis client
-redis_client = redis.Redis(
-    host=config.REDIS_HOST,
-    port=config.REDIS_PORT,
-    db=0,
-    decode_responses=True,  # so we get string outputs instead of bytes
-)
+redis_client = LazyClient(create_redis_client)
+
+
+def create_redis_breaker() -> "CircuitBreaker":
+    # resilience imports redis, which `import app` defers
+    from resilience import CircuitBreaker
+
+    return CircuitBreaker(
+        "redis",
+        failure_threshold=config.REDIS_FAILURE_THRESHOLD,
+        probe=lambda: redis_client.ping(),
+        probe_interval=config.REDIS_PROBE_INTERVAL,
+    )
+
+
+# Trips after repeated Redis failures; requests then use in-process
+# fallbacks until the background probe sees Redis answer again
+redis_breaker = LazyClient(create_redis_breaker)
 
 
 # ----------------------------------------------------
 # Serve the Frontend
 # ----------------------------------------------------
-@app.route("/", defaults={"path": ""})
-@app.route("/<path:path>")
+# Loaded by create_app(); requests are answered from memory
+static_assets: Optional[StaticAssets] = None
+
+
+@api.route("/", defaults={"path": ""})
+@api.route("/<path:path>")
 def serve_frontend(path):
-    if path and os.path.exists(os.path.join(app.static_folder, path)):
-        return send_from_directory(app.static_folder, path)
-    else:
-        return send_from_directory(app.static_folder, "index.html")
+    # Unknown paths get index.html, so client-side routes work on reload
+    response = static_assets.response(path, request) or static_assets.response(
+        "index.html", request
+    )
+    if response is None:
+        return jsonify({"error": "Not found"}), 404
+    return response
 
 
 # ----------------------------------------------------
@@ -101,31 +156,219 @@ def serve_frontend(path):
 # ----------------------------------------------------
 
 
+chat_rate_limiter = RateLimiter(
+    "rate",
+    limit=config.MAX_REQUESTS_PER_WINDOW,
+    window_seconds=config.RATE_LIMIT_SECONDS,
+    algorithm=config.RATE_LIMIT_ALGORITHM,
+)
+local_chat_rate_limiter = LocalRateLimiter(
+    limit=config.MAX_REQUESTS_PER_WINDOW,
+    window_seconds=config.RATE_LIMIT_SECONDS,
+)
+
+
 def rate_limit_exceeded(ip: str) -> bool:
     """
     Enhanced rate limiting using Redis to track requests per IP.
     Returns True if the client has exceeded the rate limit.
+    The result is kept on `g` so the response can carry RateLimit-* headers.
     """
-    key = f"rate:{ip}"
-    pipe = redis_client.pipeline()
+    g.rate_limit = redis_breaker.call(
+        chat_rate_limiter.check,
+        redis_client,
+        ip,
+        fallback=lambda: local_chat_rate_limiter.check(ip),
+    )
+    return not g.rate_limit.allowed
 
-    # Get current count and increment
-    current = redis_client.get(key)
-    if current is None:
-        # First request - set initial count and expiry
-        pipe.set(key, 1)
-        pipe.expire(key, config.RATE_LIMIT_SECONDS)
-        pipe.execute()
-        return False
 
-    # Increment existing count
-    count = int(current)
-    if count >= config.MAX_REQUESTS_PER_WINDOW:
-        return True
+@api.after_app_request
+def add_rate_limit_headers(response):
+    rate_limit = g.get("rate_limit")
+    if rate_limit is not None:
+        response.headers.update(rate_limit.headers())
+    return response
 
-    pipe.incr(key)
-    pipe.execute()
-    return False
+
+# ----------------------------------------------------
+# Request IDs
+# ----------------------------------------------------
+
+
+@api.before_app_request
+def assign_request_id():
+    g.request_id = structured_logging.request_id_from(
+        request.headers.get("X-Request-ID")
+    )
+    g.request_id_token = structured_logging.request_id_var.set(g.request_id)
+
+
+@api.after_app_request
+def add_request_id_header(response):
+    response.headers["X-Request-ID"] = g.get("request_id", "")
+    return response
+
+
+@api.teardown_app_request
+def clear_request_id(exc=None):
+    token = g.pop("request_id_token", None)
+    if token is not None:
+        structured_logging.request_id_var.reset(token)
+
+
+# ----------------------------------------------------
+# Tracing
+# ----------------------------------------------------
+
+
+@api.before_app_request
+def begin_trace():
+    if request.path.startswith("/api/"):
+        g.trace = start_request_trace(
+            request.method,
+            request.path,
+            request.headers.get("traceparent"),
+            rule=request.url_rule,
+        )
+
+
+def start_request_trace(
+    method: str, path: str, traceparent: Optional[str], rule=None
+) -> Optional[tracing.Span]:
+    """
+    The root span of an API request, if tracing is on, named after the
+    route `rule` (or the path). asgi.py uses this too.
+    """
+    if not tracing.enabled():
+        return None
+    root = tracing.start_trace(
+        f"{method} {rule or path}",
+        traceparent,
+        **{"http.method": method, "http.route": path},
+    )
+    root.set(request_id=structured_logging.request_id_var.get())
+    return root
+
+
+@api.after_app_request
+def add_trace_header(response):
+    root = g.get("trace")
+    if root is not None:
+        root.set(**{"http.status_code": response.status_code})
+        response.headers["X-Trace-ID"] = root.trace_id
+        # Ends once the body, streamed or not, has been sent
+        response.call_on_close(root.end)
+    return response
+
+
+@api.teardown_app_request
+def clear_trace(exc=None):
+    # Runs after a stream_with_context body, whose spans belong to the trace
+    root = g.pop("trace", None)
+    if root is not None:
+        tracing.end_trace(root)
+        if exc is not None:
+            root.error = f"{type(exc).__name__}: {exc}"
+            root.end()
+
+
+# ----------------------------------------------------
+# Metrics
+# ----------------------------------------------------
+
+# Endpoints whose stages, Redis round trips and rate limiting are measured
+INSTRUMENTED_ENDPOINTS = ("chat", "rate")
+
+
+@api.before_app_request
+def begin_request_metrics():
+    # Endpoints are named "api.<view>"
+    g.request_metrics = start_request_metrics(
+        (request.endpoint or "").rpartition(".")[2]
+    )
+
+
+def start_request_metrics(endpoint: str) -> Optional[metrics.RequestMetrics]:
+    """Start measuring a request to `endpoint`, if it is instrumented."""
+    if config.METRICS_ENABLED and endpoint in INSTRUMENTED_ENDPOINTS:
+        return metrics.begin_request(endpoint)
+    return None
+
+
+@api.after_app_request
+def end_request_metrics(response):
+    request_metrics = g.pop("request_metrics", None)
+    if request_metrics is not None:
+        finish_request_metrics(
+            request_metrics, request.method, request.path, response.status_code
+        )
+    return response
+
+
+def finish_request_metrics(
+    request_metrics: metrics.RequestMetrics, method: str, path: str, status: int
+) -> None:
+    """Record an instrumented request's metrics and log it; asgi.py uses this too."""
+    metrics.end_request(request_metrics, status)
+    logger.info(
+        "%s %s %d",
+        method,
+        path,
+        status,
+        extra={
+            # Sampled, so a client hammering a limit cannot flood the log
+            "event": "rate_limited" if status == 429 else "request",
+            "endpoint": request_metrics.endpoint,
+            "status": status,
+            "duration_ms": round(request_metrics.duration * 1000, 2),
+            "stages_ms": {
+                name: round(seconds * 1000, 2)
+                for name, seconds in request_metrics.stages.items()
+            },
+            "redis_round_trips": request_metrics.round_trips,
+        },
+    )
+
+
+def metric_gauges() -> Dict[str, Tuple[str, float]]:
+    """Values read when /metrics is scraped."""
+    gauges = {}
+    # Only the pools built by redis_factory report metrics (not fakeredis)
+    pool = getattr(redis_client, "connection_pool", None)
+    if hasattr(pool, "metrics"):
+        pool_metrics = pool.metrics()
+        gauges["tutorgpt_redis_pool_in_use"] = (
+            "Redis connections in use in this worker",
+            pool_metrics["in_use"],
+        )
+        gauges["tutorgpt_redis_pool_saturation"] = (
+            "Share of this worker's Redis connections in use",
+            pool_metrics["saturation"],
+        )
+    backlog = redis_breaker.call(ratings.backlog, redis_client, fallback=lambda: None)
+    if backlog is not None:
+        gauges["tutorgpt_rating_backlog"] = (
+            "Ratings queued but not yet stored",
+            backlog,
+        )
+    return gauges
+
+
+@api.route("/metrics", methods=["GET"])
+def metrics_endpoint() -> Response:
+    """Prometheus metrics, summed over all workers in multiprocess mode."""
+    if not config.METRICS_ENABLED:
+        return jsonify({"error": "Not found"}), 404
+    body, content_type = metrics.render(metric_gauges())
+    return Response(body, content_type=content_type)
+
+
+@contextlib.contextmanager
+def stage(name: str):
+    """Time a stage of the current request, as a metric and a trace span."""
+    with metrics.stage(name), tracing.span(name) as span:
+        yield span
 
 
 # ----------------------------------------------------
@@ -146,14 +389,14 @@ def handle_rate_limit_error(e):
     return response
 
 
-app.register_error_handler(429, handle_rate_limit_error)
+api.app_errorhandler(429)(handle_rate_limit_error)
 
 
-@app.errorhandler(Exception)
+@api.app_errorhandler(Exception)
 def handle_generic_error(e):
     """Generic error handler with detailed logging"""
     error_id = str(uuid.uuid4())
-    logger.error(f"Error ID: {error_id}", exc_info=True)
+    logger.error("Error ID: %s", error_id, exc_info=True)
 
     response = jsonify(
         {
@@ -171,282 +414,286 @@ def handle_generic_error(e):
 # ----------------------------------------------------
 
 
-def get_conversation_history(max_messages: int = 10) -> List[Dict[str, str]]:
+HISTORY_TTL_SECONDS = 60 * 60 * 24  # Expire after 24 hours
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def history_key(session_id: str) -> str:
+    """Redis list holding one JSON-encoded message per entry for a session"""
+    return f"conversation:{session_id}"
+
+
+def get_conversation_history(
+    session_id: str, max_messages: int = 10
+) -> List[Dict[str, str]]:
     """
-    Get conversation history with improved context management
+    Get the most recent messages of a session's conversation history.
+    A single LRANGE, so the cost does not grow with the stored history.
     """
-    history_key = "conversation_history"
-    raw_history = redis_client.get(history_key)
+    raw_messages = redis_breaker.call(
+        redis_client.lrange,
+        history_key(session_id),
+        -max_messages,
+        -1,
+        fallback=list,  # Degrade to a fresh conversation while Redis is down
+    )
+    return decode_history(raw_messages)
 
-    if not raw_history:
-        return []
 
-    try:
-        history = json.loads(raw_history)
-        # Keep only the most recent messages to maintain context window
-        return history[-max_messages:]
-    except json.JSONDecodeError:
-        logger.error("Error decoding conversation history")
-        return []
+def decode_history(raw_messages: List[str]) -> List[Dict[str, str]]:
+    """Decode the JSON entries of a history list, skipping corrupt ones"""
+    history = []
+    for raw_message in raw_messages:
+        try:
+            history.append(json.loads(raw_message))
+        except json.JSONDecodeError:
+            logger.error("Error decoding conversation history")
+    return history
 
 
-def save_conversation_history(
-    history: List[Dict[str, str]], max_history: int = 50
+def append_conversation_history(
+    session_id: str, messages: List[Dict[str, str]], max_history: int = 50
 ) -> None:
     """
-    Save conversation history with size limit and TTL
+    Append messages to a session's history, trimming it to `max_history`
+    entries and refreshing its TTL in one pipeline.
     """
-    # Trim history to prevent unlimited growth
-    if len(history) > max_history:
-        history = history[-max_history:]
-
     try:
-        redis_client.set(
-            "conversation_history",
-            json.dumps(history),
-            ex=60 * 60 * 24,  # Expire after 24 hours
-        )
+        pipe = redis_client.pipeline()
+        queue_history_append(pipe, session_id, messages, max_history)
+        redis_breaker.call(pipe.execute)
     except Exception as e:
-        logger.error(f"Error saving conversation history: {e}")
+        logger.error("Error saving conversation history: %s", e)
+
 
+def queue_history_append(
+    pipe: "redis.client.Pipeline",
+    session_id: str,
+    messages: List[Dict[str, str]],
+    max_history: int = 50,
+) -> None:
+    """Add the writes of append_conversation_history to a pipeline."""
+    key = history_key(session_id)
+    pipe.rpush(key, *(encode_history_message(message) for message in messages))
+    pipe.ltrim(key, -max_history, -1)
+    pipe.expire(key, HISTORY_TTL_SECONDS)
 
-def prepare_messages(user_message: str) -> List[Dict[str, str]]:
+
+def encode_history_message(message: Dict[str, str]) -> str:
     """
-    Enhanced message preparation with dynamic system instructions
+    JSON entry for a history list. The message's token count is stored with
+    it so the context builder does not recount it on every request.
     """
-    # Get conversation history with reasonable context window
-    history = get_conversation_history(max_messages=5)
-
-    # Analyze conversation context
-    message_count = len(history)
-    has_recent_policy_violation = any(
-        is_violating_policy(msg["content"])
-        for msg in history[-3:]
-        if msg["role"] == "user"
+    return json.dumps(
+        {
+            "role": message["role"],
+            "content": message["content"],
+            "tokens": context_builder.count_tokens(message["content"]),
+        }
     )
 
-    # Customize system instructions based on context
-    base_instructions = get_base_system_instructions()
-    context_specific_instructions = []
 
-    if message_count == 0:
-        context_specific_instructions.append(
-            "This is a new conversation. Start by introducing yourself briefly and ask how you can help with CS109 concepts."
-        )
+def create_context_builder(model_name: str, budget: Optional[int] = None):
+    return ContextBuilder(
+        model_name,
+        budget=budget,
+        summarize=config.CONTEXT_SUMMARY_ENABLED,
+        summary_tokens=config.CONTEXT_SUMMARY_TOKENS,
+        cache_dir=config.TIKTOKEN_CACHE_DIR,
+    )
 
-    if has_recent_policy_violation:
-        context_specific_instructions.append(
-            "The user has recently made policy-violating requests. Be extra vigilant and remind them gently about academic integrity if needed."
-        )
 
-    if message_count > 0:
-        context_specific_instructions.append(
-            "Maintain continuity with the previous discussion while staying focused on CS109 topics."
-        )
+# Packs the prompt into the token budget for config.MODEL_NAME, and counts
+# the tokens stored with history messages
+context_builder = create_context_builder(
+    config.MODEL_NAME, budget=config.CONTEXT_TOKEN_BUDGET or None
+)
+# One builder per model a turn can be routed to, each with its own budget
+context_builders: Dict[str, ContextBuilder] = {config.MODEL_NAME: context_builder}
+if config.ROUTER_FAST_MODEL:
+    context_builders[config.ROUTER_FAST_MODEL] = create_context_builder(
+        config.ROUTER_FAST_MODEL
+    )
 
-    # Combine instructions
-    system_message = {
-        "role": "system",
-        "content": base_instructions
-        + "\n\n"
-        + "\n".join(context_specific_instructions),
-    }
 
-    # Prepare final message list
-    messages = [system_message]
-    messages.extend(history)
-    messages.append({"role": "user", "content": user_message})
+def load_token_encodings() -> None:
+    """Read the encoding files of every model a turn can be routed to."""
+    for builder in list(context_builders.values()):
+        builder.counter.load()
 
-    # Save updated history
-    save_conversation_history(messages[1:])  # Exclude system message from history
 
-    return messages
+def context_builder_for(model_name: str) -> ContextBuilder:
+    builder = context_builders.get(model_name)
+    if builder is None:
+        builder = context_builders.setdefault(
+            model_name, create_context_builder(model_name)
+        )
+    return builder
 
 
-def get_base_system_instructions() -> str:
+def prepare_messages(user_message: str, session_id: str) -> List[Dict[str, str]]:
+    """
+    Enhanced message preparation with dynamic system instructions.
+    The new user message is stored with the reply once it is generated.
     """
-    Get base system instructions from Redis or return default
-    """
-    instructions = redis_client.get("system:base_instructions")
-    if instructions:
-        return instructions
-
-    # Default instructions (your existing system prompt)
-    default_instructions = (
-        "You are Tutor++, an AI-powered tutoring assistant designed to help students in CS109 while upholding academic integrity. "
-        "Your role is to provide guidance as a TA during office hours: you are patient, approachable, and dedicated to uncovering each student's thought process. "
-        "Your goal is to help students build problem-solving skills, promote independent learning, and develop confidence through critical thinking. "
-        "\n\n"
-        "SPECIFIC TEACHING STRATEGIES:\n"
-        "- Use Socratic questioning: Ask thoughtful, open-ended questions (e.g., 'What have you tried so far?' or 'Why do you think that approach didn't work?') to encourage students to think deeply and arrive at answers independently.\n"
-        "- Employ scaffolding: Break down complex problems into manageable steps, guiding students step-by-step without providing complete solutions.\n"
-        "- Encourage metacognition: Prompt students to reflect on their learning process by asking questions like 'What strategy did you find most helpful here?' or 'What would you do differently next time?'.\n"
-        "- Use real-world analogies: Relate abstract or complex concepts to familiar, real-life scenarios to make them more concrete and memorable.\n\n"
-        "EXPLICIT BOUNDARIES ON THE AI'S ROLE:\n"
-        "- Never provide full solutions, final code, or direct answers to assignments. Instead, offer hints, pseudocode, and conceptual explanations.\n"
-        "- Remain within the CS109 academic scope. If a request is off-topic (e.g., personal advice or non-CS109 topics), politely redirect or decline to answer.\n"
-        "- If a student repeatedly requests disallowed content, firmly remind them of academic integrity policies and encourage them to work through the problem with guidance.\n\n"
-        "HANDLING AMBIGUOUS OR EDGE-CASE REQUESTS:\n"
-        "- When faced with vague or ambiguous questions, ask clarifying questions before providing guidance.\n"
-        "- If the conversation drifts from the original problem, confirm whether the student intends to switch topics. Only proceed with the new focus if it is explicitly requested and remains within the academic scope.\n"
-        "- Always use all the provided context when answering questions and avoid straying from your initial prompt unless the student explicitly asks for a change.\n\n"
-        "RESPONSE FORMATTING AND CLARITY:\n"
-        "- Structure explanations in clear, logical steps (e.g., 'Step 1: Understand the Problem', 'Step 2: Break Down the Components').\n"
-        "- Use bullet points or numbered lists for multi-part explanations.\n"
-        "- Keep responses concise yet thorough, avoiding unnecessary jargon and ensuring clarity for students at different levels.\n"
-        "- Format key terms in bold or italics as needed and include code blocks for code snippets.\n\n"
-        "ENGAGEMENT, PERSONALIZATION, AND INCLUSIVITY:\n"
-        "- Adapt explanations based on the student's level of understanding: use simpler language for beginners and more technical details for advanced students.\n"
-        "- Provide encouragement and positive reinforcement throughout the learning process.\n"
-        "- Use inclusive, respectful language that avoids stereotypes and welcomes students from diverse backgrounds.\n"
-        "- Whenever possible, relate problems to diverse, real-world contexts to increase relevance and engagement.\n\n"
-        "GENERAL REMINDERS:\n"
-        "- Always use all the context provided when answering questions. Never stray from your prompt or drift from the initial focus unless directly requested to, or unless a new problem is explicitly given.\n"
-        "- If you are unsure about what is being asked, ask the user for clarification rather than guessing.\n\n"
-        "Your ultimate objective is to guide students through the problem-solving process without giving away answers, helping them build independent learning skills while maintaining academic integrity."
+    # Candidate history; the context builder keeps what fits the token budget
+    history = get_conversation_history(
+        session_id, max_messages=config.CONTEXT_HISTORY_MESSAGES
     )
+    return prepare_messages_from_history(user_message, history)
 
-    # Cache for future use
-    redis_client.set("system:base_instructions", default_instructions)
-    return default_instructions
+
+def prepare_messages_from_history(
+    user_message: str, history: List[Dict[str, str]], route: Optional[Route] = None
+) -> List[Dict[str, str]]:
+    """
+    prepare_messages for history that was already read from Redis, packed
+    for the model `route` goes to (by default, the route of this turn).
+    """
+    # Policy and prompt variants are compiled in-process; Redis is only
+    # consulted when a version changes
+    redis_breaker.call(policy_engine.refresh, redis_client, fallback=lambda: None)
+    with tracing.span("PromptRegistry.refresh"):
+        redis_breaker.call(prompt_registry.refresh, redis_client, fallback=lambda: None)
+    return build_turn_messages(user_message, history, route)
 
 
-# ----------------------------------------------------
-# Enhanced Policy Checking and Content Filtering
-# ----------------------------------------------------
+def build_turn_messages(
+    user_message: str, history: List[Dict[str, str]], route: Optional[Route] = None
+) -> List[Dict[str, str]]:
+    """
+    build_messages, flagging a policy violation in the recent history. The
+    policy and prompts must already be loaded, as load_chat_state() and
+    its async version leave them. Shared by both chat endpoints; no I/O.
+    """
+    has_recent_policy_violation = any(
+        check_policy(msg["content"]) for msg in history[-3:] if msg["role"] == "user"
+    )
+    return build_messages(user_message, history, has_recent_policy_violation, route)
 
 
-def is_violating_policy(user_message: str) -> bool:
+def build_messages(
+    user_message: str,
+    history: List[Dict[str, str]],
+    has_recent_policy_violation: bool,
+    route: Optional[Route] = None,
+) -> List[Dict[str, str]]:
     """
-    Enhanced policy checking with more sophisticated rules and patterns
-    """
-    # Load blacklisted phrases from Redis cache or initialize if not exists
-    blacklist_key = "policy:blacklist"
-    if not redis_client.exists(blacklist_key):
-        default_blacklist = [
-            "give me the homework solution",
-            "provide me the test answer",
-            "help me cheat",
-            "give me the code",
-            "give me the answer",
-            "solve this for me",
-            "do my homework",
-            "complete this assignment",
-            "write the code for",
-            "malicious usage request",
-        ]
-        redis_client.sadd(blacklist_key, *default_blacklist)
-
-    blacklisted_phrases = redis_client.smembers(blacklist_key)
-
-    # Check for prompt injection attempts
-    injection_patterns = [
-        r"ignore previous",
-        r"override .* instructions",
-        r"disregard .* rules",
-        r"bypass .* restrictions",
-    ]
-
-    message_lower = user_message.lower()
-
-    # Check blacklisted phrases
-    if any(phrase in message_lower for phrase in blacklisted_phrases):
-        logger.warning(f"Policy violation detected: blacklisted phrase in message")
-        return True
-
-    # Check injection patterns
-    for pattern in injection_patterns:
-        if re.search(pattern, message_lower, re.IGNORECASE):
-            logger.warning(
-                f"Policy violation detected: injection attempt with pattern {pattern}"
-            )
-            return True
-
-    # Check for code request patterns
-    code_request_patterns = [
-        r"write .*code",
-        r"implement .* function",
-        r"create .* class",
-        r"give .* implementation",
-        r"show .* solution",
-    ]
-
-    for pattern in code_request_patterns:
-        if re.search(pattern, message_lower, re.IGNORECASE):
-            logger.warning(
-                f"Policy violation detected: code request with pattern {pattern}"
-            )
-            return True
+    Assemble the system prompt, history and new user message within the
+    token budget of the model the turn is routed to.
+    Shared by the sync and async request paths; does no I/O.
+    """
+    if route is None:
+        route = model_router.route_turn(history, user_message)
+    # The system prompt variant depends only on the conversation context
+    prompt = prompt_registry.variant(len(history) == 0, has_recent_policy_violation)
+    system_message = {"role": "system", "content": prompt.content}
+
+    # Keep the most recent history turns that fit the token budget
+    return context_builder_for(route.model).build(system_message, history, user_message)
+
+
+# Default instructions (your existing system prompt)
+DEFAULT_SYSTEM_INSTRUCTIONS = (
+    "You are Tutor++, an AI-powered tutoring assistant designed to help students in CS109 while upholding academic integrity. "
+    "Your role is to provide guidance as a TA during office hours: you are patient, approachable, and dedicated to uncovering each student's thought process. "
+    "Your goal is to help students build problem-solving skills, promote independent learning, and develop confidence through critical thinking. "
+    "\n\n"
+    "SPECIFIC TEACHING STRATEGIES:\n"
+    "- Use Socratic questioning: Ask thoughtful, open-ended questions (e.g., 'What have you tried so far?' or 'Why do you think that approach didn't work?') to encourage students to think deeply and arrive at answers independently.\n"
+    "- Employ scaffolding: Break down complex problems into manageable steps, guiding students step-by-step without providing complete solutions.\n"
+    "- Encourage metacognition: Prompt students to reflect on their learning process by asking questions like 'What strategy did you find most helpful here?' or 'What would you do differently next time?'.\n"
+    "- Use real-world analogies: Relate abstract or complex concepts to familiar, real-life scenarios to make them more concrete and memorable.\n\n"
+    "EXPLICIT BOUNDARIES ON THE AI'S ROLE:\n"
+    "- Never provide full solutions, final code, or direct answers to assignments. Instead, offer hints, pseudocode, and conceptual explanations.\n"
+    "- Remain within the CS109 academic scope. If a request is off-topic (e.g., personal advice or non-CS109 topics), politely redirect or decline to answer.\n"
+    "- If a student repeatedly requests disallowed content, firmly remind them of academic integrity policies and encourage them to work through the problem with guidance.\n\n"
+    "HANDLING AMBIGUOUS OR EDGE-CASE REQUESTS:\n"
+    "- When faced with vague or ambiguous questions, ask clarifying questions before providing guidance.\n"
+    "- If the conversation drifts from the original problem, confirm whether the student intends to switch topics. Only proceed with the new focus if it is explicitly requested and remains within the academic scope.\n"
+    "- Always use all the provided context when answering questions and avoid straying from your initial prompt unless the student explicitly asks for a change.\n\n"
+    "RESPONSE FORMATTING AND CLARITY:\n"
+    "- Structure explanations in clear, logical steps (e.g., 'Step 1: Understand the Problem', 'Step 2: Break Down the Components').\n"
+    "- Use bullet points or numbered lists for multi-part explanations.\n"
+    "- Keep responses concise yet thorough, avoiding unnecessary jargon and ensuring clarity for students at different levels.\n"
+    "- Format key terms in bold or italics as needed and include code blocks for code snippets.\n\n"
+    "ENGAGEMENT, PERSONALIZATION, AND INCLUSIVITY:\n"
+    "- Adapt explanations based on the student's level of understanding: use simpler language for beginners and more technical details for advanced students.\n"
+    "- Provide encouragement and positive reinforcement throughout the learning process.\n"
+    "- Use inclusive, respectful language that avoids stereotypes and welcomes students from diverse backgrounds.\n"
+    "- Whenever possible, relate problems to diverse, real-world contexts to increase relevance and engagement.\n\n"
+    "GENERAL REMINDERS:\n"
+    "- Always use all the context provided when answering questions. Never stray from your prompt or drift from the initial focus unless directly requested to, or unless a new problem is explicitly given.\n"
+    "- If you are unsure about what is being asked, ask the user for clarification rather than guessing.\n\n"
+    "Your ultimate objective is to guide students through the problem-solving process without giving away answers, helping them build independent learning skills while maintaining academic integrity."
+)
 
-    return False
+
+prompt_registry = PromptRegistry(
+    DEFAULT_SYSTEM_INSTRUCTIONS,
+    refresh_seconds=config.PROMPT_REFRESH_SECONDS,
+    subscribe=config.PROMPT_PUBSUB_ENABLED,
+)
 
 
-def dynamic_filter(ai_response: str) -> str:
+def get_base_system_instructions() -> str:
     """
-    Enhanced multi-stage pipeline for content filtering
+    Get base system instructions from Redis or return default.
+    Served from the in-process prompt registry, which falls back to the
+    default prompt while Redis is unavailable.
     """
-    # Stage 1: Remove code blocks with language-specific detection
-    code_block_patterns = [
-        # Markdown code blocks with optional language
-        r"```[\w]*\n[\s\S]*?```",
-        # HTML code tags
-        r"<code>[\s\S]*?</code>",
-        # Inline code backticks
-        r"`[^`]+`",
-    ]
+    redis_breaker.call(prompt_registry.refresh, redis_client, fallback=lambda: None)
+    return prompt_registry.base_instructions
 
-    sanitized_response = ai_response
-    for pattern in code_block_patterns:
-        sanitized_response = re.sub(
-            pattern, "[CODE BLOCK REMOVED FOR ACADEMIC INTEGRITY]", sanitized_response
-        )
 
-    # Stage 2: Remove specific code patterns
-    code_patterns = {
-        "python": r"(def\s+\w+\(.*?\)|class\s+\w+.*?:|import\s+\w+|from\s+\w+\s+import)",
-        "java": r"(public\s+class|private\s+class|protected\s+class|class\s+\w+|public\s+\w+\s+\w+\(.*?\))",
-        "javascript": r"(function\s+\w+\(.*?\)|const\s+\w+\s*=|let\s+\w+\s*=|var\s+\w+\s*=)",
-        "cpp": r"(#include\s*<.*?>|\w+\s+\w+\(.*?\)\s*{)",
-    }
+# ----------------------------------------------------
+# Enhanced Policy Checking and Content Filtering
+# ----------------------------------------------------
+policy_engine = PolicyEngine(
+    refresh_seconds=config.POLICY_REFRESH_SECONDS,
+    subscribe=config.POLICY_PUBSUB_ENABLED,
+)
 
-    for lang, pattern in code_patterns.items():
-        sanitized_response = re.sub(
-            pattern,
-            f"[{lang.upper()} CODE REMOVED]",
-            sanitized_response,
-            flags=re.IGNORECASE | re.MULTILINE,
-        )
+POLICY_VIOLATION_LABELS = {
+    "blacklist": "blacklisted phrase in message",
+    "injection": "injection attempt",
+    "code_request": "code request",
+}
 
-    # Stage 3: Remove solution-indicating phrases
-    solution_phrases = [
-        r"here'?s\s+the\s+solution",
-        r"the\s+answer\s+is",
-        r"you\s+should\s+write",
-        r"complete\s+solution",
-        r"full\s+implementation",
-        r"implement\s+it\s+like\s+this",
-    ]
-
-    for phrase in solution_phrases:
-        sanitized_response = re.sub(
-            phrase,
-            "[SOLUTION INDICATION REMOVED]",
-            sanitized_response,
-            flags=re.IGNORECASE,
-        )
 
-    # Stage 4: Final safety check
-    if len(re.findall(r"[{};]", sanitized_response)) > 5:
-        # Too many code-like characters, might be code
-        sanitized_response = "I apologize, but I cannot provide direct code solutions. Let me help you understand the concepts instead."
+def is_violating_policy(user_message: str) -> bool:
+    """
+    Enhanced policy checking with more sophisticated rules and patterns.
+    Matching runs against the in-process policy engine; Redis is only
+    consulted when the blacklist version changes.
+    """
+    # While Redis is unavailable the last loaded policy keeps serving
+    redis_breaker.call(policy_engine.refresh, redis_client, fallback=lambda: None)
+    return check_policy(user_message)
+
 
-    return sanitized_response
+def check_policy(user_message: str) -> bool:
+    """Match a message against the loaded policy and log any violation."""
+    violation = policy_engine.check(user_message)
+    if violation is None:
+        return False
+
+    # Sampled per second, so a client looping on violations cannot flood the log
+    logger.warning(
+        "Policy violation detected: %s",
+        POLICY_VIOLATION_LABELS[violation],
+        extra={"event": "policy_violation", "violation": violation},
+    )
+    return True
 
 
 # ----------------------------------------------------
 # Discrete Functions for the Chat Endpoint
 # ----------------------------------------------------
 MAX_MESSAGE_LENGTH = 1000  # Maximum allowed length for user messages
+# Replies shared with the async chat endpoint in asgi.py
+POLICY_REFUSAL = "I'm sorry, but I cannot help with that request."
+CHAT_RATE_LIMITED = "Too many requests. Please slow down."
 
 
 def validate_request(data: Dict[str, Any]) -> str:
@@ -462,14 +709,113 @@ def validate_request(data: Dict[str, Any]) -> str:
     return user_message
 
 
-def call_gpt_api(messages: List[Dict[str, str]]) -> str:
+def validate_session_id(data: Dict[str, Any]) -> str:
     """
-    Interact with the OpenAI ChatCompletion API and return the raw AI response.
+    Extract the client's conversation session ID, or start a new session
+    if none was sent. Raises ValueError if the ID is malformed.
     """
+    session_id = data.get("sessionId")
+    if session_id is None:
+        return uuid.uuid4().hex
+    if not isinstance(session_id, str) or not SESSION_ID_PATTERN.match(session_id):
+        raise ValueError("sessionId must be 1-64 letters, digits, '-' or '_'")
+    return session_id
+
+
+llm_client = LazyClient(create_llm_client)
+
+model_router = ModelRouter(
+    config.MODEL_NAME,
+    fast_model=config.ROUTER_FAST_MODEL,
+    fast_max_chars=config.ROUTER_FAST_MAX_CHARS,
+    flagged=lambda message: policy_engine.check(message) is not None,
+)
+
+
+def completion_usage(completion) -> Dict[str, int]:
+    """Token counts reported with a completion, if any."""
     try:
-        completion = openai.ChatCompletion.create(
-            model=config.MODEL_NAME, messages=messages
+        usage = completion["usage"]
+    except (KeyError, TypeError):
+        return {}
+    return {
+        "prompt_tokens": usage.get("prompt_tokens", 0),
+        "completion_tokens": usage.get("completion_tokens", 0),
+    }
+
+
+def estimate_usage(messages: List[Dict[str, str]], response: str) -> Dict[str, int]:
+    """Token counts for a streamed completion, which reports no usage."""
+    return {
+        "prompt_tokens": sum(
+            context_builder.counter.message_tokens(message) for message in messages
+        ),
+        "completion_tokens": context_builder.count_tokens(response),
+    }
+
+
+def create_completion(
+    route: Route, messages: List[Dict[str, str]], fallback: bool = False
+) -> Any:
+    """Call the route's model and record its latency and token usage."""
+    start = time.perf_counter()
+    with tracing.span("llm.completion", model=route.model, fallback=fallback):
+        try:
+            completion = llm_client.create(model=route.model, messages=messages)
+        except Exception:
+            record_failure(route, time.perf_counter() - start, fallback)
+            raise
+        record_completion(
+            route, time.perf_counter() - start, completion_usage(completion), fallback
         )
+    return completion
+
+
+def record_completion(
+    route: Route, seconds: float, usage: Dict[str, int], fallback: bool = False
+) -> None:
+    """Record a successful model call's latency and token usage."""
+    metrics.observe_model_call(route.name, route.model, seconds, fallback=fallback)
+    metrics.observe_tokens(route.model, usage)
+    tracing.set_attributes(**usage)
+
+
+def record_failure(route: Route, seconds: float, fallback: bool = False) -> None:
+    """Record a failed model call."""
+    metrics.observe_model_call(
+        route.name, route.model, seconds, error=True, fallback=fallback
+    )
+
+
+def fallback_route(route: Route, error: LLMError) -> Route:
+    """
+    The route to retry a failed model call on; re-raises `error` if
+    `route` has none. Shared by the sync and async model calls.
+    """
+    fallback = model_router.fallback(route)
+    if fallback is None:
+        raise error
+    logger.warning(
+        "%s failed, falling back to %s: %s", route.model, fallback.model, error
+    )
+    return fallback
+
+
+def call_gpt_api(messages: List[Dict[str, str]], route: Optional[Route] = None) -> str:
+    """
+    Interact with the OpenAI ChatCompletion API and return the raw AI response.
+    The model is the one the messages were packed for (`route`), or else
+    picked by model_router; if the fast model fails, the strong model is
+    tried once.
+    """
+    route = route or model_router.route(messages)
+    try:
+        try:
+            completion = create_completion(route, messages)
+        except LLMError as e:
+            completion = create_completion(
+                fallback_route(route, e), messages, fallback=True
+            )
         ai_response = completion["choices"][0]["message"]["content"].strip()
         return ai_response
     except Exception as e:
@@ -477,6 +823,116 @@ def call_gpt_api(messages: List[Dict[str, str]]) -> str:
         raise
 
 
+single_flight = SingleFlight(
+    wait_timeout=config.SINGLE_FLIGHT_WAIT_SECONDS,
+    lock_ttl=config.SINGLE_FLIGHT_LOCK_SECONDS,
+    result_ttl=config.SINGLE_FLIGHT_RESULT_SECONDS,
+    contended_ttl=config.SINGLE_FLIGHT_CONTENDED_SECONDS,
+    breaker=redis_breaker,
+)
+
+
+def call_gpt_api_once(
+    messages: List[Dict[str, str]], route: Optional[Route] = None
+) -> str:
+    """
+    call_gpt_api, sharing one call among concurrent requests with the same
+    prepared messages, in this worker and, for prompts that have drawn
+    concurrent requests, through Redis across workers.
+    """
+    if not config.SINGLE_FLIGHT_ENABLED:
+        return call_gpt_api(messages, route)
+    return single_flight.do(
+        messages, lambda: call_gpt_api(messages, route), redis_client
+    )
+
+
+def call_gpt_api_stream(
+    messages: List[Dict[str, str]], route: Optional[Route] = None
+) -> Iterator[str]:
+    """
+    Stream the raw AI response from the OpenAI ChatCompletion API,
+    yielding content chunks as they arrive. Picks the model and falls back
+    like call_gpt_api if the fast model fails before streaming starts.
+    """
+    route = route or model_router.route(messages)
+    is_fallback = False
+    start = time.perf_counter()
+    try:
+        try:
+            chunks = llm_client.create(
+                model=route.model, messages=messages, stream=True
+            )
+        except LLMError as e:
+            fallback = fallback_route(route, e)
+            record_failure(route, time.perf_counter() - start)
+            route, is_fallback = fallback, True
+            start = time.perf_counter()
+            chunks = llm_client.create(
+                model=route.model, messages=messages, stream=True
+            )
+        pieces = []
+        for chunk in chunks:
+            content = chunk["choices"][0]["delta"].get("content")
+            if content:
+                pieces.append(content)
+                yield content
+    except Exception as e:
+        record_failure(route, time.perf_counter() - start, is_fallback)
+        logger.error("Error calling OpenAI API: %s", e)
+        raise
+    record_completion(
+        route,
+        time.perf_counter() - start,
+        estimate_usage(messages, "".join(pieces)),
+        is_fallback,
+    )
+
+
+def call_gpt_api_stream_once(
+    messages: List[Dict[str, str]], route: Optional[Route] = None
+) -> Iterator[str]:
+    """
+    call_gpt_api_stream, sharing one streamed call among concurrent
+    requests with the same prepared messages like call_gpt_api_once.
+    Requests that join a stream in progress replay it from the start.
+    """
+    if not config.SINGLE_FLIGHT_ENABLED:
+        return call_gpt_api_stream(messages, route)
+    return single_flight.stream(
+        messages, lambda: call_gpt_api_stream(messages, route), redis_client
+    )
+
+
+response_cache = ResponseCache(
+    ttl_seconds=config.RESPONSE_CACHE_TTL,
+    similarity_enabled=config.RESPONSE_CACHE_SIMILARITY,
+    similarity_threshold=config.RESPONSE_CACHE_SIMILARITY_THRESHOLD,
+)
+
+
+def get_cached_response(messages: List[Dict[str, str]]) -> Optional[str]:
+    """
+    Return a cached raw response for these prepared messages, if any.
+    Hits and misses are counted in `response_cache.stats`.
+    """
+    if not config.RESPONSE_CACHE_ENABLED:
+        return None
+    hit = redis_breaker.call(
+        response_cache.get, redis_client, messages, fallback=lambda: None
+    )
+    metrics.observe_cache_lookup(hit is not None)
+    return hit.response if hit else None
+
+
+def cache_response(messages: List[Dict[str, str]], raw_response: str) -> None:
+    if not config.RESPONSE_CACHE_ENABLED or not raw_response:
+        return
+    redis_breaker.call(
+        response_cache.set, redis_client, messages, raw_response, fallback=lambda: None
+    )
+
+
 def format_response(raw_response: str) -> str:
     """
     Apply dynamic filtering to the raw API response.
@@ -484,35 +940,297 @@ def format_response(raw_response: str) -> str:
     return dynamic_filter(raw_response)
 
 
+def sse_event(event: str, payload: Dict[str, Any]) -> str:
+    """Format a single Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+class ChatStream:
+    """
+    The Server-Sent Events of one streamed chat response, shared by
+    stream_chat_response() and its async version in asgi.py. Inside
+    traced(), feed() each raw chunk as it arrives, then finish(); send the
+    events they return, save the exchange and send done().
+    """
+
+    def __init__(self, session_id: str, cached_response: Optional[str] = None):
+        self.session_id = session_id
+        self.cached = cached_response is not None
+        self.response_filter = StreamingFilter()
+        self.raw_chunks: List[str] = []
+        self._span = None
+        self._start = 0.0
+
+    @contextlib.contextmanager
+    def traced(self):
+        """A `stream` span around the model call and the filter."""
+        with tracing.span("stream", cached=self.cached) as span:
+            self._span = span
+            self._start = time.perf_counter()
+            yield
+
+    def feed(self, chunk: str) -> Optional[str]:
+        """The `delta` event for a raw chunk, if any of it is safe to show."""
+        if self._span and not self.raw_chunks:
+            self._span.set(first_chunk_ms=(time.perf_counter() - self._start) * 1000)
+        self.raw_chunks.append(chunk)
+        return self._delta(self.response_filter.feed(chunk))
+
+    def finish(self) -> Optional[str]:
+        """The last `delta` event, once the stream has ended."""
+        return self._delta(self.response_filter.finish())
+
+    @staticmethod
+    def _delta(delta: str) -> Optional[str]:
+        return sse_event("delta", {"content": delta}) if delta else None
+
+    @property
+    def final_response(self) -> str:
+        return self.response_filter.result
+
+    @property
+    def raw_response(self) -> Optional[str]:
+        """The model's reply to cache; None when it came from the cache."""
+        return None if self.cached else "".join(self.raw_chunks).strip()
+
+    def done(self) -> str:
+        return sse_event(
+            "done",
+            {"assistant_message": self.final_response, "session_id": self.session_id},
+        )
+
+
+def stream_chat_response(
+    messages: List[Dict[str, str]],
+    session_id: str,
+    cached_response: Optional[str] = None,
+    route: Optional[Route] = None,
+) -> Response:
+    """
+    Stream the filtered AI response as Server-Sent Events.
+
+    Emits `delta` events with filtered text as it becomes safe to show, then
+    a `done` event carrying the complete filtered message (which replaces the
+    streamed text if the final code check refused the response). History is
+    saved, and a fresh response cached, once the stream completes.
+    """
+
+    def generate() -> Iterator[str]:
+        chat_stream = ChatStream(session_id, cached_response)
+        try:
+            if cached_response is not None:
+                chunks = iter([cached_response])
+            else:
+                chunks = call_gpt_api_stream_once(messages, route)
+            with chat_stream.traced():
+                for chunk in chunks:
+                    event = chat_stream.feed(chunk)
+                    if event:
+                        yield event
+                event = chat_stream.finish()
+            if event:
+                yield event
+
+            with tracing.span("save"):
+                save_chat_exchange(
+                    session_id,
+                    messages,
+                    chat_stream.final_response,
+                    chat_stream.raw_response,
+                )
+            yield chat_stream.done()
+        except Exception:
+            logger.exception("Error streaming /api/chat response")
+            yield sse_event("error", {"error": "Internal Server Error"})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ----------------------------------------------------
+# Request-scoped Redis Access
+# ----------------------------------------------------
+
+
+def queue_chat_reads(pipe: "redis.client.Pipeline", client_ip: str, session_id: str):
+    """
+    Queue the reads chat() needs before the model call: the rate limit
+    check, the session's history and any policy / prompt version checks
+    that are due. Returns the engines whose version keys were queued, in
+    order, after the first two replies.
+    """
+    chat_rate_limiter.queue_check(pipe, client_ip)
+    pipe.lrange(history_key(session_id), -config.CONTEXT_HISTORY_MESSAGES, -1)
+    stale = []
+    for engine, version_key in (
+        (policy_engine, POLICY_VERSION_KEY),
+        (prompt_registry, PROMPT_VERSION_KEY),
+    ):
+        if engine.needs_refresh():
+            pipe.get(version_key)
+            stale.append(engine)
+    return stale
+
+
+def load_chat_state(
+    client_ip: str, session_id: str
+) -> Tuple[RateLimitResult, List[Dict[str, str]]]:
+    """
+    Read everything chat() needs before the model call in one pipelined
+    round trip. While Redis is unavailable, falls back to the local rate
+    limiter and an empty history.
+    """
+    stale = []
+
+    def read() -> list:
+        pipe = redis_client.pipeline(transaction=False)
+        stale[:] = queue_chat_reads(pipe, client_ip, session_id)
+        return pipe.execute(raise_on_error=False)
+
+    with tracing.span("redis.read_chat_state") as span:
+        results = redis_breaker.call(read, fallback=lambda: None)
+        if span:
+            span.set(fallback=results is None)
+    if results is None:
+        return local_chat_rate_limiter.check(client_ip), []
+
+    rate_reply, raw_history, *versions = results
+    with tracing.span("rate_limit.check"):
+        rate_limit = redis_breaker.call(
+            chat_rate_limiter.check_reply,
+            redis_client,
+            client_ip,
+            rate_reply,
+            fallback=lambda: local_chat_rate_limiter.check(client_ip),
+        )
+    # Only reloads (another round trip) when a version actually changed
+    for engine, version in zip(stale, versions):
+        if not isinstance(version, Exception):
+            with tracing.span(f"{type(engine).__name__}.refresh"):
+                redis_breaker.call(
+                    engine.refresh, redis_client, version, fallback=lambda: None
+                )
+    return rate_limit, decode_history_reply(raw_history)
+
+
+def decode_history_reply(reply) -> List[Dict[str, str]]:
+    """decode_history for an LRANGE reply from a non-raising pipeline"""
+    if isinstance(reply, Exception):
+        logger.error("Error reading conversation history: %s", reply)
+        return []
+    return decode_history(reply)
+
+
+def queue_chat_exchange(
+    pipe: "redis.client.Pipeline",
+    session_id: str,
+    messages: List[Dict[str, str]],
+    final_response: str,
+    raw_response: Optional[str] = None,
+) -> None:
+    """
+    Queue the writes chat() makes after the model call: the exchange
+    appended to history and, for a fresh (uncached) response, the response
+    cache entry.
+    """
+    queue_history_append(
+        pipe,
+        session_id,
+        [messages[-1], {"role": "assistant", "content": final_response}],
+    )
+    if config.RESPONSE_CACHE_ENABLED and raw_response:
+        response_cache.queue_set(pipe, messages, raw_response)
+
+
+def save_chat_exchange(
+    session_id: str,
+    messages: List[Dict[str, str]],
+    final_response: str,
+    raw_response: Optional[str] = None,
+) -> None:
+    """Write everything chat() stores after the model call in one pipeline."""
+    try:
+        pipe = redis_client.pipeline()
+        queue_chat_exchange(pipe, session_id, messages, final_response, raw_response)
+        redis_breaker.call(pipe.execute)
+    except Exception as e:
+        logger.error("Error saving chat exchange: %s", e)
+
+
 # ----------------------------------------------------
 # Chat API Endpoint
 # ----------------------------------------------------
 
 
-@app.route("/api/chat", methods=["POST"])
+@api.route("/api/chat", methods=["POST"])
 def chat() -> Response:
     try:
         client_ip = request.remote_addr or "unknown"
-        if rate_limit_exceeded(client_ip):
-            return jsonify({"error": "Too many requests. Please slow down."}), 429
-
         data = request.get_json() or {}
-        user_message = validate_request(data)
-        if is_violating_policy(user_message):
+        try:
+            user_message = validate_request(data)
+            session_id = validate_session_id(data)
+        except ValueError:
+            # Invalid requests still count against the rate limit
+            if rate_limit_exceeded(client_ip):
+                return jsonify({"error": CHAT_RATE_LIMITED}), 429
+            raise
+
+        # One Redis round trip for the rate limit, history and policy state
+        with stage("load_state") as span:
+            g.rate_limit, history = load_chat_state(client_ip, session_id)
+            if span:
+                span.set(rate_limited=not g.rate_limit.allowed, history=len(history))
+        if not g.rate_limit.allowed:
+            return jsonify({"error": CHAT_RATE_LIMITED}), 429
+
+        with stage("policy") as span:
+            violating = is_violating_policy(user_message)
+            if span:
+                span.set(violation=violating)
+        if violating:
             return jsonify(
-                {"assistant_message": "I'm sorry, but I cannot help with that request."}
+                {
+                    "assistant_message": POLICY_REFUSAL,
+                    "session_id": session_id,
+                }
             )
 
-        messages = prepare_messages(user_message)
-        raw_response = call_gpt_api(messages)
-        final_response = format_response(raw_response)
+        with stage("prepare_messages"):
+            # Routed first, so the prompt is packed for the model it goes to
+            route = model_router.route_turn(history, user_message)
+            messages = prepare_messages_from_history(user_message, history, route)
+        with stage("cache_lookup") as span:
+            cached_response = get_cached_response(messages)
+            if span:
+                span.set(hit=cached_response is not None)
+        if data.get("stream"):
+            return stream_chat_response(messages, session_id, cached_response, route)
+
+        if cached_response is not None:
+            raw_response = None
+        else:
+            with stage("llm"):
+                raw_response = call_gpt_api_once(messages, route)
+        with stage("filter"):
+            final_response = format_response(
+                cached_response if raw_response is None else raw_response
+            )
 
-        # Append to conversation history
-        history = get_conversation_history()
-        history.append({"role": "assistant", "content": final_response})
-        save_conversation_history(history)
+        # Store the exchange in the session's history, and cache a fresh
+        # response, in one pipeline
+        with stage("save"):
+            save_chat_exchange(session_id, messages, final_response, raw_response)
 
-        return jsonify({"assistant_message": final_response}), 200
+        return (
+            jsonify({"assistant_message": final_response, "session_id": session_id}),
+            200,
+        )
+    except ValueError as e:
+        return jsonify({"error": "Invalid request", "message": str(e)}), 400
     except Exception as e:
         logger.exception("Error in /api/chat endpoint")
         return jsonify({"error": "Internal Server Error", "details": str(e)}), 500
@@ -534,20 +1252,26 @@ def validate_rating_data(data: Dict[str, Any]) -> None:
 
 
 def store_rating(rating_data: Dict[str, Any]) -> None:
-    """Store rating data in Redis with TTL"""
-    key = f"rating:{rating_data['messageId']}"
-    # Store as hash to save space and enable easier querying
-    redis_client.hmset(
-        key,
-        {
-            "rating": rating_data["rating"],
-            "user_input": rating_data.get("userInput", ""),
-            "assistant_output": rating_data.get("assistantOutput", ""),
-            "timestamp": datetime.utcnow().isoformat(),
-        },
+    """
+    Queue a rating for the rating worker, which stores it and updates the
+    aggregates. One XADD; fails fast with CircuitOpenError while Redis is
+    unavailable.
+    """
+    redis_breaker.call(
+        ratings.queue_rating, redis_client, rating_data, config.RATING_STREAM_MAXLEN
     )
-    # Keep ratings for 30 days
-    redis_client.expire(key, 60 * 60 * 24 * 30)
+
+
+rating_rate_limiter = RateLimiter(
+    "rate:rating",
+    limit=config.MAX_RATINGS_PER_WINDOW,
+    window_seconds=config.RATING_RATE_LIMIT_SECONDS,
+    algorithm=config.RATE_LIMIT_ALGORITHM,
+)
+local_rating_rate_limiter = LocalRateLimiter(
+    limit=config.MAX_RATINGS_PER_WINDOW,
+    window_seconds=config.RATING_RATE_LIMIT_SECONDS,
+)
 
 
 def rate_limit_rating_exceeded(ip: str) -> bool:
@@ -555,26 +1279,16 @@ def rate_limit_rating_exceeded(ip: str) -> bool:
     Rate limiting specifically for ratings to prevent spam
     Returns True if the client has exceeded the rating limit
     """
-    key = f"rate:rating:{ip}"
-    pipe = redis_client.pipeline()
-
-    current = redis_client.get(key)
-    if current is None:
-        pipe.set(key, 1)
-        pipe.expire(key, 300)  # 5 minute window
-        pipe.execute()
-        return False
-
-    count = int(current)
-    if count >= 10:  # Max 10 ratings per 5 minutes
-        return True
-
-    pipe.incr(key)
-    pipe.execute()
-    return False
+    g.rate_limit = redis_breaker.call(
+        rating_rate_limiter.check,
+        redis_client,
+        ip,
+        fallback=lambda: local_rating_rate_limiter.check(ip),
+    )
+    return not g.rate_limit.allowed
 
 
-@app.route("/api/rate", methods=["POST"])
+@api.route("/api/rate", methods=["POST"])
 def rate() -> Response:
     """
     Enhanced rating endpoint with validation and storage
@@ -582,7 +1296,9 @@ def rate() -> Response:
     try:
         # Add rate limiting check
         client_ip = request.remote_addr or "unknown"
-        if rate_limit_rating_exceeded(client_ip):
+        with stage("rate_limit"):
+            limited = rate_limit_rating_exceeded(client_ip)
+        if limited:
             return (
                 jsonify({"error": "Too many ratings. Please wait a few minutes."}),
                 429,
@@ -590,15 +1306,16 @@ def rate() -> Response:
 
         data = request.get_json() or {}
         validate_rating_data(data)
-        store_rating(data)
+        with stage("queue"):
+            store_rating(data)
 
         # Log rating for analytics
         logger.info(
-            "Rating received: %s",
-            {
+            "Rating received",
+            extra={
+                "event": "rating",
                 "message_id": data["messageId"],
                 "rating": data["rating"],
-                "timestamp": datetime.utcnow().isoformat(),
             },
         )
 
@@ -624,5 +1341,142 @@ def rate() -> Response:
         )
 
 
+def is_admin_request() -> bool:
+    """Whether the request carries the admin token as a bearer token."""
+    if not config.ADMIN_API_TOKEN:
+        return False
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(
+        token.encode("utf-8"), config.ADMIN_API_TOKEN.encode("utf-8")
+    )
+
+
+@api.route("/api/ratings/summary", methods=["GET"])
+def ratings_summary() -> Response:
+    """
+    Admin-only rating report: counts per score, rolling mean, a daily
+    series over `days` (default 30, at most 365) and the `lowest` (default
+    10) lowest-rated messages. Reads only the precomputed aggregates.
+    """
+    if not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    try:
+        days = int(request.args.get("days", 30))
+        lowest = int(request.args.get("lowest", 10))
+    except ValueError:
+        return jsonify({"error": "days and lowest must be integers"}), 400
+    if not 1 <= days <= 365 or not 1 <= lowest <= ratings.LOWEST_RATED_LIMIT:
+        return (
+            jsonify(
+                {
+                    "error": "days must be 1-365 and lowest 1-"
+                    f"{ratings.LOWEST_RATED_LIMIT}"
+                }
+            ),
+            400,
+        )
+    try:
+        return jsonify(redis_breaker.call(ratings.summary, redis_client, days, lowest))
+    except redis_breaker.errors:
+        logger.exception("Error reading rating summary")
+        return jsonify({"error": "Ratings are temporarily unavailable"}), 503
+
+
+@api.route("/api/health", methods=["GET"])
+def health() -> Response:
+    """Liveness check; touches neither Redis nor the model API."""
+    return jsonify({"status": "ok"})
+
+
+# ----------------------------------------------------
+# App Factory
+# ----------------------------------------------------
+
+_process_configured = False
+_process_lock = threading.Lock()
+_app_lock = threading.Lock()
+
+
+def configure_process() -> None:
+    """
+    Process-wide setup shared by every app: logging, token encodings and
+    tracing.
+    """
+    global _process_configured
+    with _process_lock:
+        if _process_configured:
+            return
+        _process_configured = True
+        # Records are written by a background thread
+        structured_logging.setup_logging(
+            level=config.LOG_LEVEL,
+            json_format=config.LOG_FORMAT == "json",
+            queue_size=config.LOG_QUEUE_SIZE,
+            events_per_second=config.LOG_EVENTS_PER_SECOND,
+        )
+        if not config.OPENAI_API_KEY or config.OPENAI_API_KEY.startswith(
+            "your_openai_api_key_here"
+        ):
+            logger.warning(
+                "No valid OpenAI API key found! "
+                "Please set OPENAI_API_KEY in your .env file."
+            )
+        # Encoding files are read in the background so startup stays fast. A
+        # request that counts tokens before they are loaded waits for the
+        # local read, never for a download.
+        threading.Thread(
+            target=load_token_encodings, name="token-encodings", daemon=True
+        ).start()
+        if config.TRACING_ENABLED:
+            tracing.configure(
+                tracing.create_exporter(
+                    config.TRACING_EXPORTER,
+                    config.TRACING_OTLP_ENDPOINT,
+                    config.TRACING_FILE,
+                    config.TRACING_SERVICE_NAME,
+                )
+            )
+
+
+def create_app(preload_frontend: bool = True) -> Flask:
+    """
+    Build the Flask app. The Redis and model API clients are created when
+    a request first needs them. With preload_frontend=False each file of
+    the frontend build is also read on its first request, which keeps
+    serverless cold starts (api/index.py) short.
+    """
+    global static_assets
+    # Only needed here, so importing this module does not pay for it
+    from flask_cors import CORS
+
+    configure_process()
+    metrics.init_metrics()
+    flask_app = Flask(__name__, static_folder=None)
+    # Set up CORS for API routes
+    CORS(
+        flask_app,
+        resources={
+            r"/api/*": {
+                "origins": ["http://localhost:3000", "https://tutorgpt.onrender.com"]
+            }
+        },
+    )
+    flask_app.register_blueprint(api)
+    if static_assets is None:
+        static_assets = StaticAssets(FRONTEND_BUILD_DIR, lazy=not preload_frontend)
+    return flask_app
+
+
+def __getattr__(name: str) -> Any:
+    # `app` is built on first access, so `gunicorn app:app`,
+    # `from app import app` and asgi.py keep working
+    if name == "app":
+        with _app_lock:
+            if "app" not in globals():
+                globals()["app"] = create_app()
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 if __name__ == "__main__":
-    app.run(host=config.HOST, port=config.PORT, debug=config.DEBUG)
+    create_app().run(host=config.HOST, port=config.PORT, debug=config.DEBUG)
@@ -0,0 +1,600 @@
+"""
+ASGI entry point for the backend: `uvicorn asgi:application`.
+
+POST /api/chat and /api/rate are served natively on the event loop, using
+redis.asyncio and the async OpenAI client, so one worker can hold many
+in-flight GPT calls without a thread per request. Every other path (the
+frontend build, CORS preflights) is handed to the Flask app through
+asgiref's WSGI adapter. The Flask app in app.py is still the WSGI entry
+point for gunicorn and behaves exactly as before.
+
+Only the I/O is async here. Everything else in the chat and rating flow
+comes from app.py: building the prompt, model fallback, the streamed
+events (app.ChatStream), the replies, and the request metrics, log line
+and trace.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from asgiref.wsgi import WsgiToAsgi
+
+import app
+import config
+import metrics
+import ratings
+import structured_logging
+import tracing
+from llm_client import LLMError
+from model_router import Route
+from rate_limiter import RateLimitResult
+from redis_factory import create_async_redis_client
+
+logger = logging.getLogger(__name__)
+
+ALLOWED_ORIGINS = ["http://localhost:3000", "https://tutorgpt.onrender.com"]
+
+async_redis_client = create_async_redis_client()
+
+flask_application = WsgiToAsgi(app.app)
+
+Headers = List[Tuple[bytes, bytes]]
+
+
+# ----------------------------------------------------
+# Async equivalents of the app.py request helpers
+# ----------------------------------------------------
+
+
+async def create_completion_async(
+    route: Route, messages: List[Dict[str, str]], fallback: bool = False
+) -> Any:
+    """Async version of app.create_completion."""
+    start = time.perf_counter()
+    with tracing.span("llm.completion", model=route.model, fallback=fallback):
+        try:
+            completion = await app.llm_client.acreate(
+                model=route.model, messages=messages
+            )
+        except Exception:
+            app.record_failure(route, time.perf_counter() - start, fallback)
+            raise
+        app.record_completion(
+            route,
+            time.perf_counter() - start,
+            app.completion_usage(completion),
+            fallback,
+        )
+    return completion
+
+
+async def call_gpt_api_async(
+    messages: List[Dict[str, str]], route: Optional[Route] = None
+) -> str:
+    """Async version of app.call_gpt_api."""
+    route = route or app.model_router.route(messages)
+    try:
+        try:
+            completion = await create_completion_async(route, messages)
+        except LLMError as e:
+            completion = await create_completion_async(
+                app.fallback_route(route, e), messages, fallback=True
+            )
+        return completion["choices"][0]["message"]["content"].strip()
+    except Exception as e:
+        logger.error("Error calling OpenAI API: %s", e)
+        raise
+
+
+async def call_gpt_api_once_async(
+    messages: List[Dict[str, str]], route: Optional[Route] = None
+) -> str:
+    """Async version of app.call_gpt_api_once."""
+    if not config.SINGLE_FLIGHT_ENABLED:
+        return await call_gpt_api_async(messages, route)
+    return await app.single_flight.do_async(
+        messages, lambda: call_gpt_api_async(messages, route), async_redis_client
+    )
+
+
+async def call_gpt_api_stream_async(
+    messages: List[Dict[str, str]], route: Optional[Route] = None
+) -> AsyncIterator[str]:
+    """Async version of app.call_gpt_api_stream."""
+    route = route or app.model_router.route(messages)
+    is_fallback = False
+    start = time.perf_counter()
+    try:
+        try:
+            chunks = await app.llm_client.acreate(
+                model=route.model, messages=messages, stream=True
+            )
+        except LLMError as e:
+            fallback = app.fallback_route(route, e)
+            app.record_failure(route, time.perf_counter() - start)
+            route, is_fallback = fallback, True
+            start = time.perf_counter()
+            chunks = await app.llm_client.acreate(
+                model=route.model, messages=messages, stream=True
+            )
+        pieces = []
+        async for chunk in chunks:
+            content = chunk["choices"][0]["delta"].get("content")
+            if content:
+                pieces.append(content)
+                yield content
+    except Exception as e:
+        app.record_failure(route, time.perf_counter() - start, is_fallback)
+        logger.error("Error calling OpenAI API: %s", e)
+        raise
+    app.record_completion(
+        route,
+        time.perf_counter() - start,
+        app.estimate_usage(messages, "".join(pieces)),
+        is_fallback,
+    )
+
+
+def call_gpt_api_stream_once_async(
+    messages: List[Dict[str, str]], route: Optional[Route] = None
+) -> AsyncIterator[str]:
+    """Async version of app.call_gpt_api_stream_once."""
+    if not config.SINGLE_FLIGHT_ENABLED:
+        return call_gpt_api_stream_async(messages, route)
+    return app.single_flight.stream_async(
+        messages, lambda: call_gpt_api_stream_async(messages, route), async_redis_client
+    )
+
+
+async def get_cached_response_async(messages: List[Dict[str, str]]) -> Optional[str]:
+    if not config.RESPONSE_CACHE_ENABLED:
+        return None
+    hit = await app.redis_breaker.call_async(
+        app.response_cache.get_async,
+        async_redis_client,
+        messages,
+        fallback=lambda: None,
+    )
+    metrics.observe_cache_lookup(hit is not None)
+    return hit.response if hit else None
+
+
+async def load_chat_state_async(
+    client_ip: str, session_id: str
+) -> Tuple[RateLimitResult, List[Dict[str, str]]]:
+    """Async version of app.load_chat_state."""
+    stale = []
+
+    async def read() -> list:
+        pipe = async_redis_client.pipeline(transaction=False)
+        stale[:] = app.queue_chat_reads(pipe, client_ip, session_id)
+        return await pipe.execute(raise_on_error=False)
+
+    with tracing.span("redis.read_chat_state") as span:
+        results = await app.redis_breaker.call_async(read, fallback=lambda: None)
+        if span:
+            span.set(fallback=results is None)
+    if results is None:
+        return app.local_chat_rate_limiter.check(client_ip), []
+
+    rate_reply, raw_history, *versions = results
+    with tracing.span("rate_limit.check"):
+        rate_limit = await app.redis_breaker.call_async(
+            app.chat_rate_limiter.check_reply_async,
+            async_redis_client,
+            client_ip,
+            rate_reply,
+            fallback=lambda: app.local_chat_rate_limiter.check(client_ip),
+        )
+    for engine, version in zip(stale, versions):
+        if not isinstance(version, Exception):
+            with tracing.span(f"{type(engine).__name__}.refresh"):
+                await app.redis_breaker.call_async(
+                    engine.refresh_async,
+                    async_redis_client,
+                    version,
+                    fallback=lambda: None,
+                )
+    return rate_limit, app.decode_history_reply(raw_history)
+
+
+async def save_chat_exchange_async(
+    session_id: str,
+    messages: List[Dict[str, str]],
+    final_response: str,
+    raw_response: Optional[str] = None,
+) -> None:
+    """Async version of app.save_chat_exchange."""
+    try:
+        pipe = async_redis_client.pipeline()
+        app.queue_chat_exchange(
+            pipe, session_id, messages, final_response, raw_response
+        )
+        await app.redis_breaker.call_async(pipe.execute)
+    except Exception as e:
+        logger.error("Error saving chat exchange: %s", e)
+
+
+async def store_rating_async(rating_data: Dict[str, Any]) -> None:
+    """Async version of app.store_rating."""
+    await app.redis_breaker.call_async(
+        ratings.queue_rating,
+        async_redis_client,
+        rating_data,
+        config.RATING_STREAM_MAXLEN,
+    )
+
+
+async def check_rate_limit_async(
+    limiter, local_limiter, client_ip: str
+) -> RateLimitResult:
+    return await app.redis_breaker.call_async(
+        limiter.check_async,
+        async_redis_client,
+        client_ip,
+        fallback=lambda: local_limiter.check(client_ip),
+    )
+
+
+# ----------------------------------------------------
+# ASGI plumbing
+# ----------------------------------------------------
+
+
+def response_headers(scope: Dict[str, Any], extra: Optional[dict] = None) -> Headers:
+    """CORS and X-Request-ID headers matching app.py's, plus `extra`."""
+    request_headers = dict(scope.get("headers") or [])
+    origin = request_headers.get(b"origin", b"").decode("latin-1")
+    headers = {
+        "Access-Control-Allow-Origin": (
+            origin if origin in ALLOWED_ORIGINS else "https://tutorgpt.onrender.com"
+        ),
+        "Access-Control-Allow-Headers": "Content-Type,Authorization",
+        "Access-Control-Allow-Methods": "GET,POST,PUT,DELETE,OPTIONS",
+        "Access-Control-Expose-Headers": "X-Request-ID,X-Trace-ID",
+        "X-Request-ID": structured_logging.request_id_var.get() or "",
+    }
+    headers.update(extra or {})
+    return [
+        (k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers.items()
+    ]
+
+
+async def read_json(receive) -> Dict[str, Any]:
+    """Read the request body and decode it as a JSON object."""
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+    if not body:
+        return {}
+    try:
+        data = json.loads(body)
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        raise ValueError("Request body must be valid JSON")
+    if data is None:
+        return {}
+    if not isinstance(data, dict):
+        raise ValueError("Request body must be a JSON object")
+    return data
+
+
+async def send_json(send, status: int, payload: Dict[str, Any], headers: Headers):
+    body = json.dumps(payload).encode("utf-8")
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+            ]
+            + headers,
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _single_chunk(text: str) -> AsyncIterator[str]:
+    yield text
+
+
+async def stream_chat_response_async(
+    send,
+    messages: List[Dict[str, str]],
+    session_id: str,
+    cached_response: Optional[str],
+    headers: Headers,
+    route: Optional[Route] = None,
+) -> None:
+    """Async version of app.stream_chat_response; same events and payloads."""
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream; charset=utf-8"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+            ]
+            + headers,
+        }
+    )
+
+    async def send_event(event: str) -> None:
+        body = event.encode("utf-8")
+        await send({"type": "http.response.body", "body": body, "more_body": True})
+
+    chat_stream = app.ChatStream(session_id, cached_response)
+    try:
+        if cached_response is not None:
+            chunks = _single_chunk(cached_response)
+        else:
+            chunks = call_gpt_api_stream_once_async(messages, route)
+        with chat_stream.traced():
+            async for chunk in chunks:
+                event = chat_stream.feed(chunk)
+                if event:
+                    await send_event(event)
+            event = chat_stream.finish()
+        if event:
+            await send_event(event)
+
+        with tracing.span("save"):
+            await save_chat_exchange_async(
+                session_id,
+                messages,
+                chat_stream.final_response,
+                chat_stream.raw_response,
+            )
+        await send_event(chat_stream.done())
+    except Exception:
+        logger.exception("Error streaming /api/chat response")
+        await send_event(app.sse_event("error", {"error": "Internal Server Error"}))
+    await send({"type": "http.response.body", "body": b""})
+
+
+# ----------------------------------------------------
+# Endpoints
+# ----------------------------------------------------
+
+
+async def chat(scope, receive, send) -> None:
+    """Async version of app.chat."""
+    headers = response_headers(scope)
+    try:
+        client_ip = (scope.get("client") or ("unknown",))[0]
+        try:
+            data = await read_json(receive)
+            user_message = app.validate_request(data)
+            session_id = app.validate_session_id(data)
+        except ValueError:
+            # Invalid requests still count against the rate limit
+            rate_limit = await check_rate_limit_async(
+                app.chat_rate_limiter, app.local_chat_rate_limiter, client_ip
+            )
+            headers = response_headers(scope, rate_limit.headers())
+            if not rate_limit.allowed:
+                await send_json(send, 429, {"error": app.CHAT_RATE_LIMITED}, headers)
+                return
+            raise
+
+        # One Redis round trip for the rate limit, history and policy state
+        with app.stage("load_state") as span:
+            rate_limit, history = await load_chat_state_async(client_ip, session_id)
+            if span:
+                span.set(rate_limited=not rate_limit.allowed, history=len(history))
+        headers = response_headers(scope, rate_limit.headers())
+        if not rate_limit.allowed:
+            await send_json(send, 429, {"error": app.CHAT_RATE_LIMITED}, headers)
+            return
+
+        with app.stage("policy") as span:
+            violating = app.check_policy(user_message)
+            if span:
+                span.set(violation=violating)
+        if violating:
+            await send_json(
+                send,
+                200,
+                {
+                    "assistant_message": app.POLICY_REFUSAL,
+                    "session_id": session_id,
+                },
+                headers,
+            )
+            return
+
+        with app.stage("prepare_messages"):
+            # Policy and prompts were refreshed with the batched read above
+            route = app.model_router.route_turn(history, user_message)
+            messages = app.build_turn_messages(user_message, history, route)
+        with app.stage("cache_lookup") as span:
+            cached_response = await get_cached_response_async(messages)
+            if span:
+                span.set(hit=cached_response is not None)
+        if data.get("stream"):
+            await stream_chat_response_async(
+                send, messages, session_id, cached_response, headers, route
+            )
+            return
+
+        if cached_response is not None:
+            raw_response = None
+        else:
+            with app.stage("llm"):
+                raw_response = await call_gpt_api_once_async(messages, route)
+        with app.stage("filter"):
+            final_response = app.format_response(
+                cached_response if raw_response is None else raw_response
+            )
+
+        with app.stage("save"):
+            await save_chat_exchange_async(
+                session_id, messages, final_response, raw_response
+            )
+        await send_json(
+            send,
+            200,
+            {"assistant_message": final_response, "session_id": session_id},
+            headers,
+        )
+    except ValueError as e:
+        await send_json(
+            send, 400, {"error": "Invalid request", "message": str(e)}, headers
+        )
+    except Exception as e:
+        logger.exception("Error in /api/chat endpoint")
+        await send_json(
+            send, 500, {"error": "Internal Server Error", "details": str(e)}, headers
+        )
+
+
+async def rate(scope, receive, send) -> None:
+    """Async version of app.rate."""
+    headers = response_headers(scope)
+    try:
+        client_ip = (scope.get("client") or ("unknown",))[0]
+        with app.stage("rate_limit"):
+            rate_limit = await check_rate_limit_async(
+                app.rating_rate_limiter, app.local_rating_rate_limiter, client_ip
+            )
+        headers = response_headers(scope, rate_limit.headers())
+        if not rate_limit.allowed:
+            await send_json(
+                send,
+                429,
+                {"error": "Too many ratings. Please wait a few minutes."},
+                headers,
+            )
+            return
+
+        data = await read_json(receive)
+        app.validate_rating_data(data)
+        with app.stage("queue"):
+            await store_rating_async(data)
+
+        logger.info(
+            "Rating received",
+            extra={
+                "event": "rating",
+                "message_id": data["messageId"],
+                "rating": data["rating"],
+            },
+        )
+        await send_json(
+            send,
+            200,
+            {"status": "success", "message": "Rating stored successfully"},
+            headers,
+        )
+    except ValueError as e:
+        await send_json(
+            send, 400, {"error": "Invalid request", "message": str(e)}, headers
+        )
+    except Exception as e:
+        logger.exception("Error storing rating")
+        await send_json(
+            send,
+            500,
+            {
+                "error": "Internal server error",
+                "message": str(e) if config.DEBUG else "An unexpected error occurred",
+            },
+            headers,
+        )
+
+
+ROUTES = {"/api/chat": chat, "/api/rate": rate}
+
+
+async def instrumented(endpoint, scope, receive, send) -> None:
+    """
+    Run `endpoint` with the request metrics, log line and trace app.py's
+    request hooks record. Like those, the metrics end when the response
+    starts, and the root span once the whole body has been sent.
+    """
+    method, path = scope["method"], scope["path"]
+    request_headers = dict(scope.get("headers") or [])
+    root = app.start_request_trace(
+        method, path, request_headers.get(b"traceparent", b"").decode("latin-1")
+    )
+    request_metrics = app.start_request_metrics(endpoint.__name__)
+
+    async def send_and_record(message) -> None:
+        nonlocal request_metrics
+        if message["type"] == "http.response.start":
+            if root is not None:
+                root.set(**{"http.status_code": message["status"]})
+                message = dict(
+                    message,
+                    headers=list(message["headers"])
+                    + [(b"x-trace-id", root.trace_id.encode("latin-1"))],
+                )
+            if request_metrics is not None:
+                app.finish_request_metrics(
+                    request_metrics, method, path, message["status"]
+                )
+                request_metrics = None
+        await send(message)
+
+    try:
+        await endpoint(scope, receive, send_and_record)
+    except BaseException as e:
+        if root is not None:
+            root.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        # The endpoint failed before responding
+        if request_metrics is not None:
+            app.finish_request_metrics(request_metrics, method, path, 500)
+        if root is not None:
+            tracing.end_trace(root)
+            root.end()
+
+
+async def lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            # Load the policy and prompts with the sync client so their
+            # pub/sub invalidation listeners start as they do under WSGI
+            for refresh in (app.policy_engine.refresh, app.prompt_registry.refresh):
+                await asyncio.to_thread(
+                    app.redis_breaker.call,
+                    refresh,
+                    app.redis_client,
+                    fallback=lambda: None,
+                )
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await async_redis_client.close()
+            await app.llm_client.aclose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send) -> None:
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    endpoint = ROUTES.get(scope.get("path"))
+    if scope["type"] == "http" and scope["method"] == "POST" and endpoint:
+        request_headers = dict(scope.get("headers") or [])
+        header = request_headers.get(b"x-request-id", b"").decode("latin-1")
+        token = structured_logging.request_id_var.set(
+            structured_logging.request_id_from(header)
+        )
+        try:
+            await instrumented(endpoint, scope, receive, send)
+        finally:
+            structured_logging.request_id_var.reset(token)
+        return
+    await flask_application(scope, receive, send)
@@ -0,0 +1,150 @@
+"""
+Load-testing harness for the Flask backend.
+
+Serves the app on a local port against the stub ChatCompletion server
+(llm_stub.py) and fakeredis or a real Redis, drives it with simulated
+students and reports throughput, p50/p95/p99 latency and the time spent
+per stage (Redis, policy, LLM, filter) as JSON:
+
+    cd backend
+    python -m bench --users 20 --duration 30 --llm-latency 0.8 \\
+        --reply-words 50 300 --output bench.json
+    python -m bench --redis-url redis://localhost:6379/1 --compare bench.json
+
+Stage times are measured in the app process and are exclusive: the Redis
+calls made by the policy check count as Redis, not policy. Streamed
+responses are filtered incrementally and that filter is not broken out.
+"""
+import subprocess
+import threading
+import time
+from typing import Dict, List, Optional
+
+from werkzeug.serving import make_server
+
+from bench.load import DEFAULT_MIX, parse_mix, run_load, summarize
+from bench.stages import StageTimer, instrument
+
+__all__ = [
+    "DEFAULT_MIX",
+    "compare",
+    "parse_mix",
+    "run_benchmark",
+]
+
+# Metrics compared between runs, and whether higher is better
+COMPARED = [
+    ("throughput_rps", True),
+    ("latency_ms.p50", False),
+    ("latency_ms.p95", False),
+    ("latency_ms.p99", False),
+    ("errors", False),
+]
+
+
+def git_commit(cwd: Optional[str] = None) -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=cwd,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(
+    app_module,
+    redis_client,
+    api_base: str,
+    users: int = 10,
+    duration: float = 10.0,
+    max_requests: Optional[int] = None,
+    mix: Optional[Dict[str, float]] = None,
+    think_time: float = 0.0,
+    seed: int = 0,
+    rating_worker: bool = True,
+) -> Dict[str, object]:
+    """
+    Serve `app_module.app` against `redis_client` and the API at
+    `api_base`, run the load and return the report. With `rating_worker`,
+    a worker thread stores queued ratings as in production.
+    """
+    from rating_worker import RatingWorker
+
+    timer = StageTimer()
+    stop = threading.Event()
+    worker_thread = None
+    if rating_worker:
+        worker = RatingWorker(redis_client, "bench", flush_interval=0.1)
+        worker_thread = threading.Thread(
+            target=worker.run, args=(stop,), kwargs={"report_interval": 3600}
+        )
+        worker_thread.start()
+
+    with instrument(app_module, timer, redis_client, api_base, rate_limit=10**9):
+        server = make_server("127.0.0.1", 0, app_module.app, threaded=True)
+        server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+        server_thread.start()
+        try:
+            start = time.perf_counter()
+            samples = run_load(
+                f"http://127.0.0.1:{server.server_port}",
+                users=users,
+                duration=duration,
+                max_requests=max_requests,
+                mix=mix,
+                think_time=think_time,
+                seed=seed,
+            )
+            elapsed = time.perf_counter() - start
+        finally:
+            server.shutdown()
+            server_thread.join()
+            stop.set()
+            if worker_thread:
+                worker_thread.join()
+
+    report = {
+        "commit": git_commit(),
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "settings": {
+            "users": users,
+            "duration": duration,
+            "max_requests": max_requests,
+            "mix": mix or DEFAULT_MIX,
+            "think_time": think_time,
+            "seed": seed,
+        },
+    }
+    report.update(summarize(samples, elapsed))
+    report["stages_ms"] = timer.snapshot(len(samples))
+    report["llm_client"] = dict(app_module.llm_client.stats)
+    return report
+
+
+def _lookup(report: Dict[str, object], path: str):
+    value = report
+    for part in path.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+def compare(
+    baseline: Dict[str, object], report: Dict[str, object], compared=COMPARED
+) -> List[str]:
+    """One line per compared metric: baseline, new value and the change."""
+    lines = []
+    for path, higher_is_better in compared:
+        old, new = _lookup(baseline, path), _lookup(report, path)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old * 100 if old else 0.0
+        worse = change < 0 if higher_is_better else change > 0
+        lines.append(
+            f"{path:<16} {old:>10.2f} -> {new:>10.2f} ({change:+.1f}%)"
+            + (" worse" if worse and abs(change) >= 5 else "")
+        )
+    return lines
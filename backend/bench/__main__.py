@@ -0,0 +1,99 @@
+import argparse
+import json
+import logging
+import os
+import sys
+
+import bench
+from bench import compare, parse_mix, run_benchmark
+from llm_stub import StubChatCompletionServer
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m bench", description=bench.__doc__.split("\n\n")[0]
+    )
+    parser.add_argument("--users", type=int, default=10, help="concurrent students")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--requests", type=int, default=None, help="stop after N")
+    parser.add_argument(
+        "--mix", type=parse_mix, default=None, help="e.g. chat=0.7,stream=0.1,rate=0.2"
+    )
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds")
+    parser.add_argument("--llm-jitter", type=float, default=0.2, help="seconds")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--reply-words", type=int, nargs=2, default=(50, 300), metavar=("LOW", "HIGH")
+    )
+    parser.add_argument(
+        "--redis-url", default=None, help="real Redis to use instead of fakeredis"
+    )
+    parser.add_argument("--no-worker", action="store_true", help="leave ratings queued")
+    parser.add_argument("--output", default=None, help="write the JSON report here")
+    parser.add_argument("--compare", default=None, help="baseline JSON report")
+    args = parser.parse_args(argv)
+
+    # The app warns at import without a key; the stub does not check it
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    import app as app_module
+
+    # Per-request INFO logs would dominate the measurement
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    if args.redis_url:
+        import redis
+
+        redis_client = redis.Redis.from_url(args.redis_url, decode_responses=True)
+    else:
+        import fakeredis
+
+        redis_client = fakeredis.FakeStrictRedis(decode_responses=True)
+
+    with StubChatCompletionServer(
+        latency=args.llm_latency,
+        jitter=args.llm_jitter,
+        error_rate=args.llm_error_rate,
+        reply_words=tuple(args.reply_words),
+    ) as stub:
+        report = run_benchmark(
+            app_module,
+            redis_client,
+            stub.api_base,
+            users=args.users,
+            duration=args.duration,
+            max_requests=args.requests,
+            mix=args.mix,
+            think_time=args.think_time,
+            seed=args.seed,
+            rating_worker=not args.no_worker,
+        )
+    report["settings"].update(
+        llm_latency=args.llm_latency,
+        llm_jitter=args.llm_jitter,
+        llm_error_rate=args.llm_error_rate,
+        reply_words=list(args.reply_words),
+        redis="real" if args.redis_url else "fakeredis",
+    )
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(
+            f"Compared with {args.compare} ({baseline.get('commit')}):", file=sys.stderr
+        )
+        for line in compare(baseline, report):
+            print("  " + line, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+Closed-loop load driver and report.
+
+Each simulated student is a thread with its own HTTP session and chat
+session ID, which sends a request, waits for the whole response (streamed
+ones included), pauses for the think time and sends the next. The request
+kind is drawn from a traffic mix such as {"chat": 0.7, "stream": 0.1,
+"rate": 0.2}.
+"""
+
+import collections
+import math
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import requests
+
+DEFAULT_MIX = {"chat": 0.7, "stream": 0.1, "rate": 0.2}
+
+QUESTIONS = [
+    "How do I compute P(A|B) when I only know P(B|A)?",
+    "Why is the variance of a sum not always the sum of the variances?",
+    "Can you explain what a probability mass function is?",
+    "How should I start on the homework question about independent events?",
+    "What is the difference between a permutation and a combination?",
+    "I am stuck on the expected value of a geometric random variable.",
+]
+
+
+@dataclass
+class Sample:
+    kind: str
+    status: int
+    seconds: float
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """Parse "chat=0.7,stream=0.1,rate=0.2" into weights."""
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        kind = kind.strip()
+        if kind not in DEFAULT_MIX:
+            raise ValueError(f"Unknown request kind: {kind!r}")
+        mix[kind] = float(weight)
+    if not any(mix.values()):
+        raise ValueError("The traffic mix needs a positive weight")
+    return mix
+
+
+class Student(threading.Thread):
+    def __init__(
+        self,
+        base_url: str,
+        mix: Dict[str, float],
+        deadline: float,
+        budget: "RequestBudget",
+        think_time: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        super().__init__(daemon=True)
+        self.base_url = base_url.rstrip("/")
+        self.kinds = list(mix)
+        self.weights = list(mix.values())
+        self.deadline = deadline
+        self.budget = budget
+        self.think_time = think_time
+        self.random = random.Random(seed)
+        self.session_id = uuid.UUID(int=self.random.getrandbits(128)).hex
+        self.http = requests.Session()
+        self.turns = 0
+        self.samples: List[Sample] = []
+
+    def run(self) -> None:
+        while time.monotonic() < self.deadline and self.budget.take():
+            kind = self.random.choices(self.kinds, self.weights)[0]
+            start = time.perf_counter()
+            try:
+                status = getattr(self, kind)()
+            except requests.RequestException:
+                status = 0
+            self.samples.append(Sample(kind, status, time.perf_counter() - start))
+            if self.think_time:
+                time.sleep(self.random.expovariate(1 / self.think_time))
+        self.http.close()
+
+    def question(self) -> str:
+        self.turns += 1
+        # Distinct per student and turn, so the response cache does not
+        # answer for the model
+        return f"{self.random.choice(QUESTIONS)} (turn {self.turns} of {self.session_id[:8]})"
+
+    def chat(self) -> int:
+        response = self.http.post(
+            f"{self.base_url}/api/chat",
+            json={"message": self.question(), "sessionId": self.session_id},
+        )
+        return response.status_code
+
+    def stream(self) -> int:
+        with self.http.post(
+            f"{self.base_url}/api/chat",
+            json={
+                "message": self.question(),
+                "sessionId": self.session_id,
+                "stream": True,
+            },
+            stream=True,
+        ) as response:
+            for _ in response.iter_content(chunk_size=None):
+                pass
+            return response.status_code
+
+    def rate(self) -> int:
+        response = self.http.post(
+            f"{self.base_url}/api/rate",
+            json={
+                "messageId": uuid.UUID(int=self.random.getrandbits(128)).hex,
+                "rating": self.random.randint(1, 5),
+                "userInput": self.question(),
+                "assistantOutput": "Think about the definition first.",
+            },
+        )
+        return response.status_code
+
+
+class RequestBudget:
+    """Shared cap on the number of requests; None means unlimited."""
+
+    def __init__(self, limit: Optional[int]):
+        self.remaining = limit
+        self._lock = threading.Lock()
+
+    def take(self) -> bool:
+        if self.remaining is None:
+            return True
+        with self._lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+
+def run_load(
+    base_url: str,
+    users: int = 10,
+    duration: float = 10.0,
+    max_requests: Optional[int] = None,
+    mix: Optional[Dict[str, float]] = None,
+    think_time: float = 0.0,
+    seed: int = 0,
+) -> List[Sample]:
+    """Run `users` students for `duration` seconds or `max_requests` requests."""
+    deadline = time.monotonic() + duration
+    budget = RequestBudget(max_requests)
+    students = [
+        Student(base_url, mix or DEFAULT_MIX, deadline, budget, think_time, seed + i)
+        for i in range(users)
+    ]
+    for student in students:
+        student.start()
+    for student in students:
+        student.join()
+    return [sample for student in students for sample in student.samples]
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of already sorted values; 0 when empty."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(q * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def latency_summary(seconds: List[float]) -> Dict[str, float]:
+    values = sorted(seconds)
+    return {
+        name: round(value * 1000, 3)
+        for name, value in (
+            ("p50", percentile(values, 0.50)),
+            ("p95", percentile(values, 0.95)),
+            ("p99", percentile(values, 0.99)),
+            ("mean", sum(values) / len(values) if values else 0.0),
+            ("max", values[-1] if values else 0.0),
+        )
+    }
+
+
+def summarize(samples: List[Sample], elapsed: float) -> Dict[str, object]:
+    """Throughput and latency, overall and per request kind, in milliseconds."""
+    by_kind = collections.defaultdict(list)
+    for sample in samples:
+        by_kind[sample.kind].append(sample)
+
+    def errors(group: List[Sample]) -> int:
+        return sum(1 for sample in group if not 200 <= sample.status < 300)
+
+    return {
+        "requests": len(samples),
+        "errors": errors(samples),
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(samples) / elapsed, 3) if elapsed else 0.0,
+        "latency_ms": latency_summary([sample.seconds for sample in samples]),
+        "endpoints": {
+            kind: {
+                "requests": len(group),
+                "errors": errors(group),
+                "statuses": dict(
+                    collections.Counter(str(sample.status) for sample in group)
+                ),
+                "latency_ms": latency_summary([sample.seconds for sample in group]),
+            }
+            for kind, group in sorted(by_kind.items())
+        },
+    }
@@ -0,0 +1,158 @@
+"""
+Per-stage timing for the benchmark.
+
+StageTimer records exclusive time per stage: time spent in a stage nested
+inside another (Redis calls made by the policy check, say) counts towards
+the inner stage only. instrument() wraps the app's Redis client, policy
+check, model calls and response filter while a benchmark runs.
+"""
+
+import collections
+import contextlib
+import functools
+import threading
+import time
+from typing import Callable, Dict, Iterator
+
+
+class StageTimer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.seconds = collections.Counter()
+        self.calls = collections.Counter()
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        stack = self._local.__dict__.setdefault("stack", [])
+        # Time spent in nested stages, subtracted from this one
+        nested = [0.0]
+        stack.append(nested)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+            if stack:
+                stack[-1][0] += elapsed
+            with self._lock:
+                self.seconds[name] += elapsed - nested[0]
+                self.calls[name] += 1
+
+    def wrap(self, name: str, func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.stage(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    def wrap_iter(self, name: str, iterator: Iterator) -> Iterator:
+        """Time each step of an iterator, such as a streamed completion."""
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def snapshot(self, requests: int) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                name: {
+                    "calls": self.calls[name],
+                    "total_ms": round(seconds * 1000, 3),
+                    "per_request_ms": round(seconds * 1000 / max(requests, 1), 3),
+                }
+                for name, seconds in sorted(self.seconds.items())
+            }
+
+
+class TimedRedis:
+    """Redis client proxy that times every command and pipeline."""
+
+    def __init__(self, client, timer: StageTimer):
+        self.client = client
+        self.timer = timer
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if not callable(attr):
+            return attr
+        return self.timer.wrap("redis", attr)
+
+    def pipeline(self, *args, **kwargs):
+        return TimedPipeline(self.client.pipeline(*args, **kwargs), self.timer)
+
+
+class TimedPipeline:
+    def __init__(self, pipe, timer: StageTimer):
+        self.pipe = pipe
+        self.timer = timer
+
+    def __getattr__(self, name):
+        return getattr(self.pipe, name)
+
+    def execute(self, *args, **kwargs):
+        with self.timer.stage("redis"):
+            return self.pipe.execute(*args, **kwargs)
+
+
+@contextlib.contextmanager
+def instrument(
+    app_module, timer: StageTimer, redis_client, api_base: str, rate_limit: int
+):
+    """
+    Point the Flask app at `redis_client` and the stub API at `api_base`,
+    time its stages with `timer` and lift the per-IP rate limits to
+    `rate_limit`, since all simulated students share one address. Restores
+    everything on exit.
+    """
+    # Patch the client itself, not the LazyClient standing in for it
+    llm_client = app_module.llm_client._target()
+
+    def create(*args, **kwargs):
+        with timer.stage("llm"):
+            result = original_create(*args, **kwargs)
+        if kwargs.get("stream"):
+            return timer.wrap_iter("llm", iter(result))
+        return result
+
+    original_create = llm_client.create
+    patches = [
+        (app_module, "redis_client", TimedRedis(redis_client, timer)),
+        (
+            app_module,
+            "is_violating_policy",
+            timer.wrap("policy", app_module.is_violating_policy),
+        ),
+        (
+            app_module,
+            "format_response",
+            timer.wrap("filter", app_module.format_response),
+        ),
+        (llm_client, "create", create),
+        (llm_client, "url", api_base.rstrip("/") + "/chat/completions"),
+    ]
+    for limiter in (
+        app_module.chat_rate_limiter,
+        app_module.local_chat_rate_limiter,
+        app_module.rating_rate_limiter,
+        app_module.local_rating_rate_limiter,
+    ):
+        patches.append((limiter, "limit", rate_limit))
+
+    saved = []
+    for obj, name, value in patches:
+        saved.append((obj, name, name in vars(obj), getattr(obj, name)))
+        setattr(obj, name, value)
+    try:
+        yield
+    finally:
+        for obj, name, own, value in reversed(saved):
+            if own:
+                setattr(obj, name, value)
+            else:
+                delattr(obj, name)
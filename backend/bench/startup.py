@@ -0,0 +1,250 @@
+"""
+Cold-start benchmark: how long a fresh process takes to import the app,
+build it and answer its first requests.
+
+Each run starts a new interpreter in the backend directory, imports `app`,
+calls create_app() (or uses `app.app` in trees from before the factory)
+and times the first GET of each path. One more run with `-X importtime`
+attributes the import time to the modules `app` pulls in.
+
+The run fails if the median import takes longer than --import-budget-ms,
+or if `import app` loads a module that the app defers to first use
+(DEFERRED_MODULES). Point --backend-dir at another checkout to measure
+the tree before a change:
+
+    cd backend
+    python -m bench.startup --output startup.json
+    git worktree add /tmp/before HEAD~1
+    python -m bench.startup --backend-dir /tmp/before/backend \\
+        --compare startup.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+from bench import compare, git_commit
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_PATHS = ("/api/health", "/")
+
+# `import app` took about 340 ms with redis and prometheus_client imported
+# eagerly and about 230 ms without; most of what is left is Flask
+DEFAULT_IMPORT_BUDGET_MS = 300.0
+# Imported where first needed (client factories, create_app() for metrics,
+# async paths), never by `import app`
+DEFERRED_MODULES = (
+    "redis",
+    "redis.asyncio",
+    "prometheus_client",
+    "asyncio",
+    "requests",
+    "aiohttp",
+    "tiktoken",
+    "flask_cors",
+)
+
+# Startup metrics compared between runs; lower is better for all of them
+STARTUP_COMPARED = [
+    ("process_ms", False),
+    ("import_ms", False),
+    ("create_app_ms", False),
+    ("first_request_ms./api/health", False),
+    ("first_request_ms./", False),
+]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app as app_module
+imported = time.perf_counter()
+deferred = sorted(name for name in {deferred!r} if name in sys.modules)
+create_app = getattr(app_module, "create_app", None)
+if create_app is None:
+    flask_app = app_module.app
+elif {lazy_frontend!r}:
+    flask_app = create_app(preload_frontend=False)
+else:
+    flask_app = create_app()
+created = time.perf_counter()
+client = flask_app.test_client()
+first_request, status = {{}}, {{}}
+for path in {paths!r}:
+    request_start = time.perf_counter()
+    response = client.get(path)
+    first_request[path] = (time.perf_counter() - request_start) * 1000
+    status[path] = response.status_code
+    response.close()
+print(json.dumps({{
+    "import_ms": (imported - start) * 1000,
+    "create_app_ms": (created - imported) * 1000,
+    "deferred_imported": deferred,
+    "first_request_ms": first_request,
+    "status": status,
+}}))
+"""
+
+
+def run_probe(
+    backend_dir: str, paths, lazy_frontend: bool, importtime: bool = False
+) -> subprocess.CompletedProcess:
+    env = dict(os.environ)
+    # The app warns without a key and logs every request; neither is measured
+    env.setdefault("OPENAI_API_KEY", "bench")
+    env.setdefault("LOG_LEVEL", "WARNING")
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += [
+        "-c",
+        PROBE.format(
+            paths=tuple(paths), lazy_frontend=lazy_frontend, deferred=DEFERRED_MODULES
+        ),
+    ]
+    return subprocess.run(
+        command, cwd=backend_dir, env=env, capture_output=True, text=True, check=True
+    )
+
+
+def parse_importtime(stderr: str, module: str = "app", top: int = 10) -> Dict:
+    """
+    The cumulative import time of `module` and the `top` heaviest modules
+    it imported directly, in milliseconds, from `-X importtime` output.
+    """
+    children: List[Dict] = []
+    total = None
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            if name.strip() == module:
+                total = int(cumulative) / 1000
+                break
+            children = []
+        elif depth == 1:
+            children.append({"module": name.strip(), "ms": int(cumulative) / 1000})
+    children.sort(key=lambda child: child["ms"], reverse=True)
+    return {f"{module}_ms": total, "heaviest": children[:top]}
+
+
+def measure_startup(
+    backend_dir: str = BACKEND_DIR,
+    paths=DEFAULT_PATHS,
+    runs: int = 5,
+    lazy_frontend: bool = True,
+) -> Dict:
+    """Median startup timings over `runs` fresh processes, as a report."""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = run_probe(backend_dir, paths, lazy_frontend)
+        sample = json.loads(result.stdout.strip().splitlines()[-1])
+        sample["process_ms"] = (time.perf_counter() - start) * 1000
+        samples.append(sample)
+
+    def median(key: str, path: Optional[str] = None) -> float:
+        values = [
+            sample[key] if path is None else sample[key][path] for sample in samples
+        ]
+        return round(statistics.median(values), 2)
+
+    imports = parse_importtime(
+        run_probe(backend_dir, paths, lazy_frontend, importtime=True).stderr
+    )
+    return {
+        "commit": git_commit(backend_dir),
+        "backend_dir": os.path.abspath(backend_dir),
+        "settings": {"runs": runs, "lazy_frontend": lazy_frontend},
+        "process_ms": median("process_ms"),
+        "import_ms": median("import_ms"),
+        "create_app_ms": median("create_app_ms"),
+        "first_request_ms": {path: median("first_request_ms", path) for path in paths},
+        "status": samples[-1]["status"],
+        "deferred_imported": sorted(
+            {name for sample in samples for name in sample["deferred_imported"]}
+        ),
+        "imports": imports,
+    }
+
+
+def budget_failures(report: Dict, import_budget_ms: float) -> List[str]:
+    """Why `report` misses the import budget; empty if it does not."""
+    failures = []
+    if import_budget_ms and report["import_ms"] > import_budget_ms:
+        failures.append(
+            f"import app took {report['import_ms']} ms, "
+            f"over the {import_budget_ms:g} ms budget"
+        )
+    for name in report["deferred_imported"]:
+        failures.append(f"import app imported {name}, which should load on first use")
+    return failures
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m bench.startup", description=__doc__.split("\n\n")[0]
+    )
+    parser.add_argument("--backend-dir", default=BACKEND_DIR, help="backend to measure")
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes")
+    parser.add_argument(
+        "--path",
+        action="append",
+        dest="paths",
+        default=None,
+        help="path to request first (repeatable)",
+    )
+    parser.add_argument(
+        "--preload-frontend",
+        action="store_true",
+        help="read the frontend build in create_app(), as gunicorn does",
+    )
+    parser.add_argument(
+        "--import-budget-ms",
+        type=float,
+        default=DEFAULT_IMPORT_BUDGET_MS,
+        help="fail if the median import takes longer (0 to skip)",
+    )
+    parser.add_argument("--output", default=None, help="write the JSON report here")
+    parser.add_argument("--compare", default=None, help="baseline JSON report")
+    args = parser.parse_args(argv)
+
+    report = measure_startup(
+        args.backend_dir,
+        paths=args.paths or DEFAULT_PATHS,
+        runs=args.runs,
+        lazy_frontend=not args.preload_frontend,
+    )
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(
+            f"Compared with {args.compare} ({baseline.get('commit')}):", file=sys.stderr
+        )
+        for line in compare(baseline, report, STARTUP_COMPARED):
+            print("  " + line, file=sys.stderr)
+
+    failures = budget_failures(report, args.import_budget_ms)
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,13 +10,161 @@ DEBUG = os.getenv("DEBUG", "False").lower() in ("true", "1", "t")
 HOST = os.getenv("HOST", "0.0.0.0")
 PORT = int(os.getenv("PORT", 5001))
 
+# OpenAI HTTP client settings
+OPENAI_API_BASE = os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1")
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", 3))
+# Longest wait for the response, or between streamed chunks
+OPENAI_READ_TIMEOUT = float(os.getenv("OPENAI_READ_TIMEOUT", 60))
+# Retries on 429, 5xx and network errors, with exponential backoff and jitter
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", 2))
+OPENAI_BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", 0.5))
+OPENAI_BACKOFF_MAX = float(os.getenv("OPENAI_BACKOFF_MAX", 8))
+# Keep-alive connections per process
+OPENAI_POOL_SIZE = int(os.getenv("OPENAI_POOL_SIZE", 20))
+# Send a second request when a call runs past the recent p95 latency
+OPENAI_HEDGE_ENABLED = os.getenv("OPENAI_HEDGE_ENABLED", "False").lower() in (
+    "true",
+    "1",
+    "t",
+)
+OPENAI_HEDGE_PERCENTILE = float(os.getenv("OPENAI_HEDGE_PERCENTILE", 0.95))
+OPENAI_HEDGE_MIN_SAMPLES = int(os.getenv("OPENAI_HEDGE_MIN_SAMPLES", 20))
+
+# Model routing settings
+# Model for short, simple turns; empty sends every turn to MODEL_NAME
+ROUTER_FAST_MODEL = os.getenv("ROUTER_FAST_MODEL", "")
+# Longest message, in characters, that may go to the fast model
+ROUTER_FAST_MAX_CHARS = int(os.getenv("ROUTER_FAST_MAX_CHARS", 120))
+
 # Add Redis configuration settings
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 REDIS_DB = int(os.getenv("REDIS_DB", 0))
 REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", None)
+REDIS_USERNAME = os.getenv("REDIS_USERNAME", None)
 REDIS_SSL = os.getenv("REDIS_SSL", "False").lower() in ("true", "1", "t")
+# "required", "optional" or "none"
+REDIS_SSL_CERT_REQS = os.getenv("REDIS_SSL_CERT_REQS", "required")
+REDIS_SSL_CA_CERTS = os.getenv("REDIS_SSL_CA_CERTS", None)
+# Connections per process; requests wait up to REDIS_POOL_TIMEOUT for one
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 20))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", 0.5))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", 0.25))
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", 0.5))
+# Consecutive failures before Redis calls switch to in-process fallbacks
+REDIS_FAILURE_THRESHOLD = int(os.getenv("REDIS_FAILURE_THRESHOLD", 3))
+REDIS_PROBE_INTERVAL = float(os.getenv("REDIS_PROBE_INTERVAL", 1))
 
 # Rate limiting settings
 RATE_LIMIT_SECONDS = int(os.getenv("RATE_LIMIT_SECONDS", 5))
 MAX_REQUESTS_PER_WINDOW = int(os.getenv("MAX_REQUESTS_PER_WINDOW", 3))
+RATING_RATE_LIMIT_SECONDS = int(os.getenv("RATING_RATE_LIMIT_SECONDS", 300))
+MAX_RATINGS_PER_WINDOW = int(os.getenv("MAX_RATINGS_PER_WINDOW", 10))
+# One of "fixed_window", "sliding_window" or "token_bucket"
+RATE_LIMIT_ALGORITHM = os.getenv("RATE_LIMIT_ALGORITHM", "fixed_window")
+
+# Serve Prometheus metrics on /metrics; with several gunicorn workers also
+# set PROMETHEUS_MULTIPROC_DIR to an empty directory shared by them
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True").lower() in ("true", "1", "t")
+
+# Logging: records go through a queue to a background thread so requests
+# never wait on stderr. LOG_FORMAT is "json" (one object per line) or "text"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# Records queued beyond this are dropped rather than blocking a request
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+# Most records per second written for each noisy event type (policy_violation,
+# rate_limited); other records are not sampled
+LOG_EVENTS_PER_SECOND = int(os.getenv("LOG_EVENTS_PER_SECOND", 10))
+
+# Per-request tracing, off by default. TRACING_EXPORTER is "otlp" (a
+# collector's OTLP/HTTP endpoint) or "file" (JSON lines in TRACING_FILE)
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "False").lower() in ("true", "1", "t")
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "otlp")
+TRACING_OTLP_ENDPOINT = os.getenv(
+    "OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318"
+)
+TRACING_FILE = os.getenv("TRACING_FILE", "traces.jsonl")
+TRACING_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "tutorgpt-backend")
+
+# Bearer token for admin endpoints such as /api/ratings/summary; unset disables them
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN")
+
+# Rating ingestion settings
+# Cap on queued ratings, in case the rating worker is not running
+RATING_STREAM_MAXLEN = int(os.getenv("RATING_STREAM_MAXLEN", 100000))
+# The rating worker stores a batch once it is full or this old
+RATING_WORKER_BATCH_SIZE = int(os.getenv("RATING_WORKER_BATCH_SIZE", 100))
+RATING_WORKER_FLUSH_SECONDS = float(os.getenv("RATING_WORKER_FLUSH_SECONDS", 1))
+# Consumer name; defaults to the hostname. Keep it stable across restarts
+RATING_WORKER_NAME = os.getenv("RATING_WORKER_NAME", "")
+
+# Policy engine settings
+POLICY_REFRESH_SECONDS = float(os.getenv("POLICY_REFRESH_SECONDS", 5))
+POLICY_PUBSUB_ENABLED = os.getenv("POLICY_PUBSUB_ENABLED", "True").lower() in (
+    "true",
+    "1",
+    "t",
+)
+
+# Prompt registry settings
+PROMPT_REFRESH_SECONDS = float(os.getenv("PROMPT_REFRESH_SECONDS", 1))
+PROMPT_PUBSUB_ENABLED = os.getenv("PROMPT_PUBSUB_ENABLED", "True").lower() in (
+    "true",
+    "1",
+    "t",
+)
+
+# Response cache settings
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "True").lower() in (
+    "true",
+    "1",
+    "t",
+)
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 60 * 60 * 24))
+# Near-duplicate matching for first-turn questions (MinHash + LSH)
+RESPONSE_CACHE_SIMILARITY = os.getenv("RESPONSE_CACHE_SIMILARITY", "False").lower() in (
+    "true",
+    "1",
+    "t",
+)
+RESPONSE_CACHE_SIMILARITY_THRESHOLD = float(
+    os.getenv("RESPONSE_CACHE_SIMILARITY_THRESHOLD", 0.8)
+)
+
+# Request coalescing settings
+# Share one ChatCompletion call among concurrent identical requests
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "True").lower() in (
+    "true",
+    "1",
+    "t",
+)
+# Longest a request waits on another's call before making its own
+SINGLE_FLIGHT_WAIT_SECONDS = float(os.getenv("SINGLE_FLIGHT_WAIT_SECONDS", 30))
+SINGLE_FLIGHT_LOCK_SECONDS = float(os.getenv("SINGLE_FLIGHT_LOCK_SECONDS", 60))
+SINGLE_FLIGHT_RESULT_SECONDS = float(os.getenv("SINGLE_FLIGHT_RESULT_SECONDS", 30))
+# How long a prompt that drew concurrent requests in a worker is also
+# coalesced across workers through Redis; other prompts never touch Redis
+SINGLE_FLIGHT_CONTENDED_SECONDS = float(
+    os.getenv("SINGLE_FLIGHT_CONTENDED_SECONDS", 60)
+)
+
+# Prompt context settings
+# Prompt token budget; 0 uses the default for MODEL_NAME
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 0))
+# Stored messages considered when packing history into the budget
+CONTEXT_HISTORY_MESSAGES = int(os.getenv("CONTEXT_HISTORY_MESSAGES", 20))
+# Summarize turns that no longer fit instead of dropping them
+CONTEXT_SUMMARY_ENABLED = os.getenv("CONTEXT_SUMMARY_ENABLED", "False").lower() in (
+    "true",
+    "1",
+    "t",
+)
+CONTEXT_SUMMARY_TOKENS = int(os.getenv("CONTEXT_SUMMARY_TOKENS", 200))
+# tiktoken encoding files, fetched at build time with `python context_builder.py`
+# and loaded at startup; requests never download them
+TIKTOKEN_CACHE_DIR = os.getenv(
+    "TIKTOKEN_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "tiktoken_cache"),
+)
@@ -0,0 +1,314 @@
+"""
+Token-budgeted prompt assembly for prepare_messages.
+
+Instead of a fixed number of history messages, the system prompt, the new
+user message and as many of the most recent conversation turns as fit are
+packed into a token budget for the configured model. Tokens are counted
+locally with tiktoken's BPE encodings, read from TIKTOKEN_CACHE_DIR. They
+are never downloaded while serving: fetch them at build time with
+`python context_builder.py`, and the app loads them at startup. Without
+tiktoken (or its encoding files) counts fall back to a conservative
+estimate.
+
+Turns that no longer fit can optionally be replaced by a short summary.
+"""
+import functools
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Default prompt budgets (context window minus room for the reply), matched
+# on the longest prefix of the model name
+MODEL_TOKEN_BUDGETS = {
+    "gpt-3.5-turbo": 3072,
+    "gpt-3.5-turbo-16k": 12288,
+    "gpt-4": 6144,
+    "gpt-4-32k": 24576,
+    "gpt-4-turbo": 16384,
+    "gpt-4o": 16384,
+}
+DEFAULT_TOKEN_BUDGET = 3072
+
+# Source and SHA-256 of the encoding files of the models this app uses
+ENCODING_FILES = {
+    "cl100k_base": (
+        "https://openaipublic.blob.core.windows.net/encodings/cl100k_base.tiktoken",
+        "223921b76ee99bde995b7ff738513eef100fb51d18c93597a113bcffe865b2a7",
+    ),
+    "o200k_base": (
+        "https://openaipublic.blob.core.windows.net/encodings/o200k_base.tiktoken",
+        "446a9538cb6c348e3516120d7c08b09f57c36495e2acfffe59a5bf8b0cfb1a2d",
+    ),
+}
+
+# Chat format overhead: each message costs its content plus a few framing
+# tokens, and every reply is primed with a few more
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+
+SUMMARY_PREFIX = "Summary of earlier parts of this conversation: the student asked "
+
+_ESTIMATE_PIECES = re.compile(r"\w+|[^\w\s]+")
+_FIRST_SENTENCE = re.compile(r"^(.+?[.?!])(?:\s|$)", re.DOTALL)
+
+
+def token_budget(model_name: str) -> int:
+    """Default prompt token budget for a model, including fine-tuned ones."""
+    # Fine-tuned models are named like "ft:gpt-3.5-turbo-0613:org::id"
+    base_model = model_name[3:] if model_name.startswith("ft:") else model_name
+    matches = [name for name in MODEL_TOKEN_BUDGETS if base_model.startswith(name)]
+    if not matches:
+        return DEFAULT_TOKEN_BUDGET
+    return MODEL_TOKEN_BUDGETS[max(matches, key=len)]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough BPE token count: about one token per four characters of a word."""
+    return sum(1 + (len(piece) - 1) // 4 for piece in _ESTIMATE_PIECES.findall(text))
+
+
+def default_cache_dir() -> str:
+    """Where tiktoken itself would look for encoding files."""
+    return (
+        os.environ.get("TIKTOKEN_CACHE_DIR")
+        or os.environ.get("DATA_GYM_CACHE_DIR")
+        or os.path.join(tempfile.gettempdir(), "data-gym-cache")
+    )
+
+
+def encoding_name(model_name: str) -> str:
+    """The tiktoken encoding a model uses (cl100k_base if unknown)."""
+    import tiktoken.model
+
+    base_model = (
+        model_name[3:].split(":")[0] if model_name.startswith("ft:") else model_name
+    )
+    if base_model in tiktoken.model.MODEL_TO_ENCODING:
+        return tiktoken.model.MODEL_TO_ENCODING[base_model]
+    for prefix, name in tiktoken.model.MODEL_PREFIX_TO_ENCODING.items():
+        if base_model.startswith(prefix):
+            return name
+    return "cl100k_base"
+
+
+def encoding_path(name: str, cache_dir: str) -> Optional[str]:
+    """
+    The file tiktoken caches an encoding in, if it is there and intact.
+    tiktoken names cache files by the SHA-1 of the source URL.
+    """
+    if name not in ENCODING_FILES:
+        return None
+    url, sha256 = ENCODING_FILES[name]
+    path = os.path.join(cache_dir, hashlib.sha1(url.encode()).hexdigest())
+    try:
+        with open(path, "rb") as f:
+            intact = hashlib.sha256(f.read()).hexdigest() == sha256
+    except OSError:
+        return None
+    return path if intact else None
+
+
+_encodings: Dict[Tuple[str, str], Callable[[str], int]] = {}
+_encodings_lock = threading.Lock()
+
+
+def _load_encoder(model_name: str, cache_dir: str) -> Callable[[str], int]:
+    try:
+        import tiktoken
+    except ImportError:
+        logger.warning("tiktoken is not installed; estimating token counts")
+        return estimate_tokens
+
+    name = encoding_name(model_name)
+    with _encodings_lock:
+        if (name, cache_dir) in _encodings:
+            return _encodings[name, cache_dir]
+        # tiktoken downloads encodings it cannot find in its cache, and a
+        # request must never wait on that
+        if encoding_path(name, cache_dir) is None:
+            logger.warning(
+                "No %s encoding file in %s; estimating token counts "
+                "(run `python context_builder.py` to fetch it)",
+                name,
+                cache_dir,
+            )
+            return estimate_tokens
+        os.environ["TIKTOKEN_CACHE_DIR"] = cache_dir
+        encoding = tiktoken.get_encoding(name)
+        encode = functools.partial(_count_with, encoding)
+        _encodings[name, cache_dir] = encode
+        return encode
+
+
+def _count_with(encoding, text: str) -> int:
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def download_encodings(model_names: Iterable[str], cache_dir: str) -> List[str]:
+    """Fetch the encodings the models use into cache_dir, for offline use."""
+    import tiktoken
+
+    os.makedirs(cache_dir, exist_ok=True)
+    os.environ["TIKTOKEN_CACHE_DIR"] = cache_dir
+    names = sorted({encoding_name(model_name) for model_name in model_names})
+    for name in names:
+        tiktoken.get_encoding(name)
+    return [encoding_path(name, cache_dir) or name for name in names]
+
+
+class TokenCounter:
+    """
+    Counts tokens for one model. The encoding is read from cache_dir by
+    load(), which the app calls at startup, or else on first use; counts
+    for recently seen texts (such as the system prompt) are memoized.
+    """
+
+    def __init__(
+        self, model_name: str, cache_size: int = 1024, cache_dir: Optional[str] = None
+    ):
+        self.model_name = model_name
+        self.cache_dir = cache_dir or default_cache_dir()
+        self._encode = None
+        self._lock = threading.Lock()
+        self.count = functools.lru_cache(maxsize=cache_size)(self._count)
+
+    def load(self) -> None:
+        with self._lock:
+            if self._encode is None:
+                self._encode = _load_encoder(self.model_name, self.cache_dir)
+
+    def _count(self, text: str) -> int:
+        if self._encode is None:
+            self.load()
+        return self._encode(text)
+
+    def message_tokens(self, message: Dict) -> int:
+        """Tokens a chat message costs, using its stored count if present."""
+        tokens = message.get("tokens")
+        if tokens is None:
+            tokens = self.count(message["content"])
+        return TOKENS_PER_MESSAGE + tokens
+
+
+def extractive_summary(
+    turns: List[List[Dict]], counter: TokenCounter, max_tokens: int
+) -> Optional[str]:
+    """
+    Summarize dropped turns by the first sentence of each user message,
+    keeping the most recent ones that fit in `max_tokens`. Runs locally, so
+    summarizing adds no model call to the request path.
+    """
+    user_messages = [
+        message["content"]
+        for turn in turns
+        for message in turn
+        if message["role"] == "user"
+    ]
+    questions = []
+    used = counter.count(SUMMARY_PREFIX)
+    for content in reversed(user_messages):
+        text = " ".join(content.split())
+        match = _FIRST_SENTENCE.match(text)
+        question = f'"{match.group(1) if match else text}"'
+        cost = counter.count(question) + 1
+        if used + cost > max_tokens:
+            break
+        questions.append(question)
+        used += cost
+    if not questions:
+        return None
+    return SUMMARY_PREFIX + "; ".join(reversed(questions)) + "."
+
+
+class ContextBuilder:
+    """
+    Packs a system message, recent history and the new user message into
+    `budget` tokens. History is kept in whole turns (a user message with the
+    replies that follow it), newest first, so the model never sees an answer
+    without its question.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        budget: Optional[int] = None,
+        summarize: bool = False,
+        summary_tokens: int = 200,
+        summarizer: Callable[
+            [List[List[Dict]], TokenCounter, int], Optional[str]
+        ] = extractive_summary,
+        cache_dir: Optional[str] = None,
+    ):
+        self.counter = TokenCounter(model_name, cache_dir=cache_dir)
+        self.budget = budget or token_budget(model_name)
+        self.summarize = summarize
+        self.summary_tokens = summary_tokens
+        self.summarizer = summarizer
+
+    def count_tokens(self, text: str) -> int:
+        return self.counter.count(text)
+
+    def build(
+        self, system_message: Dict, history: List[Dict], user_message: str
+    ) -> List[Dict[str, str]]:
+        user = {"role": "user", "content": user_message}
+        budget = self.budget - TOKENS_PER_REPLY
+        if self.summarize:
+            budget -= self.summary_tokens + TOKENS_PER_MESSAGE
+        used = self.counter.message_tokens(system_message)
+        used += self.counter.message_tokens(user)
+
+        turns = _group_turns(history)
+        kept = 0
+        for turn in reversed(turns):
+            cost = sum(self.counter.message_tokens(message) for message in turn)
+            if used + cost > budget:
+                break
+            used += cost
+            kept += 1
+
+        messages = [_strip(system_message)]
+        dropped = turns[: len(turns) - kept]
+        if self.summarize and dropped:
+            summary = self.summarizer(dropped, self.counter, self.summary_tokens)
+            if summary:
+                messages.append({"role": "system", "content": summary})
+        for turn in turns[len(turns) - kept :]:
+            messages.extend(_strip(message) for message in turn)
+        messages.append(user)
+        return messages
+
+
+def _group_turns(history: List[Dict]) -> List[List[Dict]]:
+    turns = []
+    for message in history:
+        if message["role"] == "user" or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return turns
+
+
+def _strip(message: Dict) -> Dict[str, str]:
+    # Stored history entries carry a cached token count the API must not see
+    return {"role": message["role"], "content": message["content"]}
+
+
+if __name__ == "__main__":
+    # Usage: python context_builder.py [model ...]
+    # Run at build time; the app never downloads encodings while serving.
+    import sys
+
+    import config
+
+    models = sys.argv[1:] or [
+        name for name in (config.MODEL_NAME, config.ROUTER_FAST_MODEL) if name
+    ]
+    for path in download_encodings(models, config.TIKTOKEN_CACHE_DIR):
+        print(path)
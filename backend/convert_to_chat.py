@@ -1,8 +1,26 @@
 #!/usr/bin/env python3
 
+import argparse
 import json
+import os
 import re
 import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+# Removes "any filename .txt" plus newline + ### + newline from a prompt
+SUFFIX_PATTERN = re.compile(r"\.txt\s*\n*\s*###\s*\n*\s*", re.IGNORECASE)
+
+CHAT_ROLES = ("system", "user", "assistant")
+
+# Bytes read per chunk in convert_file; extended to the next line break
+CHUNK_SIZE = 1 << 20
 
 
 def convert_to_chat_format(prompt: str, completion: str, system_prompt: str = None):
@@ -13,11 +31,7 @@ def convert_to_chat_format(prompt: str, completion: str, system_prompt: str = No
     - Optionally includes a system-level role if system_prompt is given.
     """
     # 1. Remove known suffix from prompt
-    #    The old code often used '.txt\\n\\n###\\n\\n'. Let's do a simple re.sub
-    #    that removes "any filename .txt" plus newline + ### + newline
-    #    If your suffix is exactly `.txt\n\n###\n\n`, you can do a simpler replace.
-    cleaned_prompt = re.sub(r"\.txt\s*\n*\s*###\s*\n*\s*",
-                            "", prompt, flags=re.IGNORECASE)
+    cleaned_prompt = SUFFIX_PATTERN.sub("", prompt)
 
     # 2. Remove trailing "<END>" from completion
     cleaned_completion = completion
@@ -37,6 +51,144 @@ def convert_to_chat_format(prompt: str, completion: str, system_prompt: str = No
     return {"messages": messages}
 
 
+def validate_chat_record(record):
+    """
+    Returns why `record` is not a valid chat fine-tuning example, or None.
+    Each example needs a user message and must end with a non-empty
+    assistant reply.
+    """
+    messages = record.get("messages") if isinstance(record, dict) else None
+    if not isinstance(messages, list) or not messages:
+        return "missing messages"
+    for message in messages:
+        if not isinstance(message, dict) or message.get("role") not in CHAT_ROLES:
+            return "invalid role"
+        content = message.get("content")
+        if not isinstance(content, str) or not content.strip():
+            return f"empty {message['role']} content"
+    if not any(message["role"] == "user" for message in messages):
+        return "no user message"
+    if messages[-1]["role"] != "assistant":
+        return "does not end with an assistant message"
+    return None
+
+
+if orjson is not None:
+    _loads = orjson.loads
+
+    def _dumps(obj):
+        return orjson.dumps(obj) + b"\n"
+else:
+    _loads = json.loads
+
+    def _dumps(obj):
+        return (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def convert_chunk(chunk: bytes, system_prompt: str = None):
+    """
+    Converts a chunk of whole JSONL lines. Returns the chat-format output,
+    the number of records in it and (line index in chunk, error, line)
+    for each rejected line.
+    """
+    output = []
+    rejected = []
+    for index, line in enumerate(chunk.split(b"\n")):
+        if not line.strip():
+            continue
+        try:
+            data = _loads(line)
+            prompt = data.get("prompt", "")
+            completion = data.get("completion", "")
+            if not isinstance(prompt, str) or not isinstance(completion, str):
+                raise TypeError("prompt and completion must be strings")
+        except (ValueError, TypeError, AttributeError) as e:
+            rejected.append((index, f"invalid input: {e}",
+                             line.decode("utf-8", "replace")))
+            continue
+
+        new_obj = convert_to_chat_format(
+            prompt, completion, system_prompt=system_prompt)
+        error = validate_chat_record(new_obj)
+        if error:
+            rejected.append((index, error, line.decode("utf-8", "replace")))
+            continue
+        output.append(_dumps(new_obj))
+    return b"".join(output), len(output), rejected
+
+
+def read_chunks(in_f, chunk_size: int = CHUNK_SIZE):
+    """Yields chunks of about `chunk_size` bytes that end on a line break."""
+    while True:
+        chunk = in_f.read(chunk_size)
+        if not chunk:
+            return
+        if not chunk.endswith(b"\n"):
+            chunk += in_f.readline()
+        yield chunk
+
+
+def convert_file(input_path, output_path, system_prompt=None, reject_path=None,
+                 workers=None, chunk_size=CHUNK_SIZE):
+    """
+    High-throughput version of main(): reads `input_path` in chunks,
+    converts them on `workers` processes (default: one per CPU; 1 converts
+    in this process) and writes the results in input order. Lines that
+    are not valid JSON or do not make a valid chat example are written to
+    `reject_path` (default: <output_path>.rejects.jsonl) with their line
+    number and the reason. At most a few chunks per worker are in memory
+    at once.
+
+    Returns a dict of records, rejected, bytes read and seconds taken.
+    """
+    workers = workers or os.cpu_count() or 1
+    reject_path = reject_path or output_path + ".rejects.jsonl"
+    stats = {"records": 0, "rejected": 0, "bytes": 0, "seconds": 0.0}
+    start = time.perf_counter()
+
+    with open(input_path, "rb") as in_f, \
+            open(output_path, "wb") as out_f, \
+            open(reject_path, "w", encoding="utf-8") as reject_f:
+
+        def write(result, first_line):
+            output, records, rejected = result
+            out_f.write(output)
+            stats["records"] += records
+            stats["rejected"] += len(rejected)
+            for index, error, line in rejected:
+                reject_f.write(json.dumps(
+                    {"line": first_line + index, "error": error, "text": line},
+                    ensure_ascii=False) + "\n")
+
+        line_number = 1
+        if workers == 1:
+            for chunk in read_chunks(in_f, chunk_size):
+                stats["bytes"] += len(chunk)
+                write(convert_chunk(chunk, system_prompt), line_number)
+                line_number += chunk.count(b"\n")
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                pending = deque()
+                for chunk in read_chunks(in_f, chunk_size):
+                    stats["bytes"] += len(chunk)
+                    pending.append((pool.submit(convert_chunk, chunk,
+                                                system_prompt), line_number))
+                    line_number += chunk.count(b"\n")
+                    # Bound memory: wait for the oldest chunk once enough
+                    # are in flight
+                    if len(pending) >= workers * 2:
+                        future, first_line = pending.popleft()
+                        write(future.result(), first_line)
+                while pending:
+                    future, first_line = pending.popleft()
+                    write(future.result(), first_line)
+
+    if not stats["rejected"]:
+        os.remove(reject_path)
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
 def main(input_path, output_path, system_prompt=None):
     """
     Reads the old prompt-completion JSONL from `input_path`,
@@ -67,18 +219,34 @@ if __name__ == "__main__":
 
     Example:
       python convert_to_chat.py dataset_prepared.jsonl dataset_chat_prepared.jsonl "You are a helpful TA..."
+
+    For large datasets, --workers N converts chunks on N processes (0: one
+    per CPU), rejects invalid lines to --rejects and prints throughput.
     """
-    if len(sys.argv) < 3:
-        print(
-            "Usage: python convert_to_chat.py <input.jsonl> <output.jsonl> [optional system prompt]")
-        sys.exit(1)
-
-    input_file = sys.argv[1]
-    output_file = sys.argv[2]
-    if len(sys.argv) > 3:
-        # Combine all extra args as system prompt, or just take sys.argv[3] if single string
-        system_msg = " ".join(sys.argv[3:])
-    else:
-        system_msg = None
-
-    main(input_file, output_file, system_msg)
+    parser = argparse.ArgumentParser(
+        description="Convert prompt-completion JSONL to chat format.")
+    parser.add_argument("input_file")
+    parser.add_argument("output_file")
+    # Combine all extra args as system prompt
+    parser.add_argument("system_prompt", nargs="*")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="convert in chunks on N processes (0: one per CPU)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--rejects", default=None,
+                        help="default: <output_file>.rejects.jsonl")
+    args = parser.parse_intermixed_args()
+    system_msg = " ".join(args.system_prompt) or None
+
+    if args.workers is None:
+        main(args.input_file, args.output_file, system_msg)
+        sys.exit(0)
+
+    stats = convert_file(args.input_file, args.output_file, system_msg,
+                         reject_path=args.rejects, workers=args.workers,
+                         chunk_size=args.chunk_size)
+    seconds = max(stats["seconds"], 1e-9)
+    print(f"Converted {stats['records']} records "
+          f"({stats['rejected']} rejected) in {stats['seconds']:.2f}s: "
+          f"{stats['records'] / seconds:,.0f} records/s, "
+          f"{stats['bytes'] / seconds / 1e6:,.1f} MB/s",
+          file=sys.stderr)
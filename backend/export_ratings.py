@@ -0,0 +1,252 @@
+"""
+Export well-rated conversations from Redis as fine-tuning JSONL.
+
+Walks the rating:<messageId> hashes with SCAN, fetches each batch of keys
+with one pipelined round of HGETALL, keeps pairs rated at or above the
+threshold and writes them through convert_to_chat_format:
+
+    python export_ratings.py ratings_chat.jsonl --min-rating 4
+    python export_ratings.py ratings_chat.jsonl --resume
+
+Memory use does not depend on the number of ratings: one batch is held at
+a time, and duplicate pairs are detected with a Redis set of content
+digests rather than in process. After every batch the SCAN cursor and the
+output size are saved to a checkpoint file, so an interrupted export can be
+resumed; output written after the last checkpoint is discarded first.
+SCAN may return a key more than once, which the digest set also absorbs.
+
+The output file, not the digest set, is the record of what was exported:
+digests are only added once their lines are on disk and checkpointed, and
+a resumed export rebuilds the set from the checkpointed output, so a crash
+at any point neither drops nor repeats a pair.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import redis
+
+import ratings
+from convert_to_chat import convert_to_chat_format
+from redis_factory import create_redis_client
+
+SEEN_TTL_SECONDS = 60 * 60 * 24 * 7
+
+
+@dataclass
+class Checkpoint:
+    cursor: int = 0
+    output_bytes: int = 0
+    scanned: int = 0
+    exported: int = 0
+    done: bool = False
+
+    @classmethod
+    def load(cls, path: str) -> "Checkpoint":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(**json.load(f))
+
+    def save(self, path: str) -> None:
+        # Write and rename, so a crash never leaves a half-written checkpoint
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(asdict(self), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+
+def pair_digest(user_input: str, assistant_output: str) -> str:
+    encoded = json.dumps(
+        [" ".join(user_input.split()).lower(), " ".join(assistant_output.split())],
+        ensure_ascii=False,
+    ).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:32]
+
+
+def record_digest(record: Dict) -> str:
+    """pair_digest() of an exported chat record's user and assistant turns."""
+    contents = {message["role"]: message["content"] for message in record["messages"]}
+    return pair_digest(contents["user"], contents["assistant"])
+
+
+def read_digests(path: str, size: int) -> Iterator[str]:
+    """Digests of the records in the first `size` bytes of `path`."""
+    with open(path, "rb") as f:
+        for line in f.read(size).splitlines():
+            if line.strip():
+                yield record_digest(json.loads(line))
+
+
+def scan_batches(
+    client: redis.Redis, cursor: int, batch_size: int
+) -> Iterator[Tuple[int, List[str], List[Dict[str, str]]]]:
+    """
+    Yield (next cursor, keys, hashes) for each SCAN step from `cursor`,
+    fetching the hashes in one pipeline.
+    """
+    while True:
+        cursor, keys = client.scan(
+            cursor=cursor, match=ratings.rating_key("*"), count=batch_size
+        )
+        hashes = []
+        if keys:
+            pipe = client.pipeline(transaction=False)
+            for key in keys:
+                pipe.hgetall(key)
+            hashes = pipe.execute()
+        yield cursor, keys, hashes
+        if cursor == 0:
+            return
+
+
+def select_pairs(
+    hashes: List[Dict[str, str]], min_rating: float
+) -> List[Tuple[str, str]]:
+    """(user_input, assistant_output) pairs worth training on."""
+    pairs = []
+    for fields in hashes:
+        try:
+            rating = float(fields.get("rating", ""))
+        except ValueError:
+            continue
+        user_input = fields.get("user_input", "").strip()
+        assistant_output = fields.get("assistant_output", "").strip()
+        # Expired between SCAN and HGETALL, or rated without the text
+        if rating >= min_rating and user_input and assistant_output:
+            pairs.append((user_input, assistant_output))
+    return pairs
+
+
+def mark_seen(client: redis.Redis, seen_key: str, digests: List[str]) -> None:
+    pipe = client.pipeline(transaction=False)
+    pipe.sadd(seen_key, *digests)
+    pipe.expire(seen_key, SEEN_TTL_SECONDS)
+    pipe.execute()
+
+
+def rebuild_seen(
+    client: redis.Redis, seen_key: str, output_path: str, size: int, batch_size: int
+) -> None:
+    """
+    Reset the digest set to the records in the checkpointed part of the
+    output, whatever state an interrupted run left it in.
+    """
+    client.delete(seen_key)
+    if not os.path.exists(output_path):
+        return
+    batch = []
+    for digest in read_digests(output_path, size):
+        batch.append(digest)
+        if len(batch) == batch_size:
+            mark_seen(client, seen_key, batch)
+            batch = []
+    if batch:
+        mark_seen(client, seen_key, batch)
+
+
+def export_ratings(
+    client: redis.Redis,
+    output_path: str,
+    checkpoint_path: Optional[str] = None,
+    min_rating: float = 4,
+    system_prompt: Optional[str] = None,
+    batch_size: int = 500,
+    resume: bool = False,
+) -> Checkpoint:
+    """Run (or resume) an export and return the final checkpoint."""
+    checkpoint_path = checkpoint_path or output_path + ".checkpoint"
+    seen_key = (
+        "export:seen:"
+        + hashlib.sha1(os.path.abspath(output_path).encode("utf-8")).hexdigest()
+    )
+
+    if resume and os.path.exists(checkpoint_path):
+        checkpoint = Checkpoint.load(checkpoint_path)
+        if checkpoint.done:
+            return checkpoint
+        rebuild_seen(client, seen_key, output_path, checkpoint.output_bytes, batch_size)
+    else:
+        checkpoint = Checkpoint()
+        client.delete(seen_key)
+
+    with open(output_path, "ab") as out_f:
+        # Drop anything written after the last checkpoint
+        out_f.truncate(checkpoint.output_bytes)
+        out_f.seek(checkpoint.output_bytes)
+
+        for cursor, keys, hashes in scan_batches(client, checkpoint.cursor, batch_size):
+            new_records = {}
+            pairs = select_pairs(hashes, min_rating)
+            if pairs:
+                records = [
+                    convert_to_chat_format(
+                        user_input, assistant_output, system_prompt=system_prompt
+                    )
+                    for user_input, assistant_output in pairs
+                ]
+                digests = [record_digest(record) for record in records]
+                seen = client.smismember(seen_key, digests)
+                for digest, record, already in zip(digests, records, seen):
+                    if not already:
+                        new_records.setdefault(digest, record)
+
+                lines = [
+                    json.dumps(record, ensure_ascii=False) + "\n"
+                    for record in new_records.values()
+                ]
+                out_f.write("".join(lines).encode("utf-8"))
+                checkpoint.exported += len(lines)
+
+            out_f.flush()
+            os.fsync(out_f.fileno())
+            checkpoint.cursor = cursor
+            checkpoint.output_bytes = out_f.tell()
+            checkpoint.scanned += len(keys)
+            checkpoint.done = cursor == 0
+            checkpoint.save(checkpoint_path)
+
+            # Only now are these pairs durably exported; a crash before this
+            # point is repaired by rebuild_seen() on resume
+            if new_records:
+                mark_seen(client, seen_key, list(new_records))
+
+    return checkpoint
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("output", help="chat-format JSONL to write")
+    parser.add_argument("--min-rating", type=float, default=4)
+    parser.add_argument("--system-prompt", default=None)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--checkpoint", default=None, help="default: OUTPUT.checkpoint")
+    parser.add_argument(
+        "--resume", action="store_true", help="continue from the checkpoint"
+    )
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    checkpoint = export_ratings(
+        create_redis_client(socket_timeout=30),
+        args.output,
+        checkpoint_path=args.checkpoint,
+        min_rating=args.min_rating,
+        system_prompt=args.system_prompt,
+        batch_size=args.batch_size,
+        resume=args.resume,
+    )
+    print(
+        f"Exported {checkpoint.exported} of {checkpoint.scanned} ratings "
+        f"to {args.output} in {time.perf_counter() - start:.1f}s",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+"""
+Response filtering applied to every AI answer before it reaches the student.
+
+The filter stages run in order, each over the text the previous one
+rewrote, exactly as the original pipeline did. Every pattern is compiled
+once at import rather than on each call.
+"""
+import re
+from typing import List, Optional, Tuple
+
+CODE_BLOCK_PLACEHOLDER = "[CODE BLOCK REMOVED FOR ACADEMIC INTEGRITY]"
+SOLUTION_PLACEHOLDER = "[SOLUTION INDICATION REMOVED]"
+CODE_REFUSAL = (
+    "I apologize, but I cannot provide direct code solutions. "
+    "Let me help you understand the concepts instead."
+)
+
+# Characters that suggest the response still contains code
+CODE_CHARACTERS = "{};"
+MAX_CODE_CHARACTERS = 5
+
+# Stage 1: Remove code blocks with language-specific detection
+CODE_BLOCK_PATTERNS = [
+    # Markdown code blocks with optional language
+    r"```[\w]*\n[\s\S]*?```",
+    # HTML code tags
+    r"<code>[\s\S]*?</code>",
+    # Inline code backticks
+    r"`[^`]+`",
+]
+
+# Stage 2: Remove specific code patterns
+CODE_PATTERNS = {
+    "python": r"def\s+\w+\(.*?\)|class\s+\w+.*?:|import\s+\w+|from\s+\w+\s+import",
+    "java": r"public\s+class|private\s+class|protected\s+class|class\s+\w+|public\s+\w+\s+\w+\(.*?\)",
+    "javascript": r"function\s+\w+\(.*?\)|const\s+\w+\s*=|let\s+\w+\s*=|var\s+\w+\s*=",
+    # The lookbehind only skips attempts starting mid-word, which could never
+    # match where an attempt at the start of the same word failed
+    "cpp": r"#include\s*<.*?>|(?<!\w)\w+\s+\w+\(.*?\)\s*{",
+}
+
+# Stage 3: Remove solution-indicating phrases
+SOLUTION_PHRASES = [
+    r"here'?s\s+the\s+solution",
+    r"the\s+answer\s+is",
+    r"you\s+should\s+write",
+    r"complete\s+solution",
+    r"full\s+implementation",
+    r"implement\s+it\s+like\s+this",
+]
+
+
+def _compile_stages() -> List[Tuple["re.Pattern[str]", str]]:
+    # Code blocks were always matched case-sensitively
+    stages = [
+        (re.compile(pattern), CODE_BLOCK_PLACEHOLDER) for pattern in CODE_BLOCK_PATTERNS
+    ]
+    for lang, pattern in CODE_PATTERNS.items():
+        stages.append(
+            (re.compile(pattern, re.IGNORECASE), f"[{lang.upper()} CODE REMOVED]")
+        )
+    for phrase in SOLUTION_PHRASES:
+        stages.append((re.compile(phrase, re.IGNORECASE), SOLUTION_PLACEHOLDER))
+    return stages
+
+
+FILTER_STAGES = _compile_stages()
+
+
+def apply_filter_stages(text: str) -> str:
+    """Run every filter stage in order, without the final safety check."""
+    for pattern, placeholder in FILTER_STAGES:
+        text = pattern.sub(placeholder, text)
+    return text
+
+
+def count_code_characters(text: str) -> int:
+    """Count code-like characters without building intermediate lists."""
+    return sum(text.count(char) for char in CODE_CHARACTERS)
+
+
+def dynamic_filter(ai_response: str) -> str:
+    """
+    Enhanced multi-stage pipeline for content filtering
+    """
+    sanitized_response = apply_filter_stages(ai_response)
+
+    # Final safety check
+    if count_code_characters(sanitized_response) > MAX_CODE_CHARACTERS:
+        # Too many code-like characters, might be code
+        sanitized_response = CODE_REFUSAL
+
+    return sanitized_response
+
+
+# Prefixes of filter patterns whose `.*?` can keep growing until the end of
+# the current line, so a line containing one is held back until it is done.
+OPEN_LINE_PATTERN = re.compile(
+    r"def\s+\w+\(|class\s+\w+|public\s+\w+\s+\w+\(|function\s+\w+\("
+    r"|#include\s*<|\w+\s+\w+\(",
+    re.IGNORECASE,
+)
+# Multi-word patterns can straddle whitespace (including newlines), so the
+# last few words are always held back until more text arrives.
+TRAILING_WORDS_PATTERN = re.compile(r"(?:\S+\s+){0,3}\S*\Z")
+# Where each stage-1 pattern can start a match, and the token that ends it.
+# Any backtick counts: one followed by another can still open an inline span
+# if a fence later swallows the second.
+CODE_BLOCK_OPENINGS = [
+    (re.compile(r"```\w*(?:\n|\Z)"), "```"),
+    (re.compile("<code>"), "</code>"),
+    (re.compile("`"), "`"),
+]
+# The stage-1 patterns, which run before the code patterns and phrases
+CODE_BLOCK_STAGES = len(CODE_BLOCK_PATTERNS)
+
+# One replacement made by a stage: its span in the stage's input and the
+# span of the placeholder in its output
+Replacement = Tuple[int, int, int, int]
+
+
+def _rewrite(
+    pattern: "re.Pattern[str]", placeholder: str, text: str
+) -> Tuple[str, List[Replacement]]:
+    """pattern.sub(placeholder, text), also returning where it replaced."""
+    parts, replacements, last, shift = [], [], 0, 0
+    for match in pattern.finditer(text):
+        start, end = match.span()
+        parts += [text[last:start], placeholder]
+        out_start = start + shift
+        shift += len(placeholder) - (end - start)
+        replacements.append((start, end, out_start, end + shift))
+        last = end
+    parts.append(text[last:])
+    return "".join(parts), replacements
+
+
+def _to_input(position: int, replacements: List[Replacement]) -> int:
+    """Map a position in a stage's output back to its input."""
+    shift = 0
+    for start, end, out_start, out_end in replacements:
+        if out_end <= position:
+            shift = end - out_end
+        elif out_start < position:
+            return start
+        else:
+            break
+    return position + shift
+
+
+def _to_output(position: int, replacements: List[Replacement]) -> int:
+    """Map a position in a stage's input to its output."""
+    shift = 0
+    for start, end, out_start, out_end in replacements:
+        if end > position:
+            if start < position:
+                return out_start
+            break
+        shift = out_end - end
+    return position + shift
+
+
+class StreamingFilter:
+    """
+    Incremental version of dynamic_filter for streamed responses.
+
+    feed() takes raw chunks from the model and returns the filtered text
+    that is safe to show right away. Only text that could still become part
+    of a code block, code pattern or solution phrase is held back; finish()
+    flushes the rest. Once the response trips the final code-character
+    check, nothing more is emitted and `result` becomes the refusal.
+
+    Everything up to the cut is filtered on its own, so no match of any
+    stage, in the text that stage actually sees, may cross the cut. When
+    the whole buffer is held for a construct that only a given token can
+    close (a code fence, `</code>`, a backtick or the end of the line),
+    later chunks are only searched for that token instead of rescanned.
+    """
+
+    def __init__(self):
+        self._pending = ""
+        self._emitted = []
+        self._code_characters = 0
+        self.refused = False
+        # Token that must arrive before the held buffer can be cut, and the
+        # chunks held since then, joined once it does
+        self._awaiting: Optional[str] = None
+        self._held: List[str] = []
+
+    @property
+    def result(self) -> str:
+        """The complete filtered response, as dynamic_filter would return it."""
+        if self.refused:
+            return CODE_REFUSAL
+        return "".join(self._emitted)
+
+    def feed(self, chunk: str) -> str:
+        if self._awaiting is not None:
+            # Only look at the new chunk and the end of the last one
+            overlap = len(self._awaiting) - 1
+            window = self._held[-1][len(self._held[-1]) - overlap :] + chunk
+            self._held.append(chunk)
+            if self._awaiting not in window:
+                return ""
+            self._release_held()
+        else:
+            self._pending += chunk
+        return self._commit(self._safe_cut())
+
+    def finish(self) -> str:
+        self._release_held()
+        self._pending = self._pending.rstrip()
+        return self._commit(len(self._pending))
+
+    def _release_held(self) -> None:
+        if self._held:
+            self._pending = "".join(self._held)
+            self._held = []
+        self._awaiting = None
+
+    def _safe_cut(self) -> int:
+        # Run the stages over the buffer, keeping each stage's input and
+        # where it replaced text
+        texts, replacements = [self._pending], []
+        for pattern, placeholder in FILTER_STAGES:
+            text, replaced = _rewrite(pattern, placeholder, texts[-1])
+            texts.append(text)
+            replacements.append(replaced)
+
+        def to_raw(position: int, stage: int) -> int:
+            for replaced in reversed(replacements[:stage]):
+                position = _to_input(position, replaced)
+            return position
+
+        def to_stage(position: int, stage: int) -> int:
+            for replaced in replacements[:stage]:
+                position = _to_output(position, replaced)
+            return position
+
+        # Matches that reach into text a stage can still see change are not
+        # final, and neither is anything after them: an unterminated code
+        # block can span any number of lines, and what later stages match
+        # depends on whether it is replaced. Find where that unknown text
+        # starts, and hold back every code block still open before it with
+        # the token that would close it (None if any new text might).
+        holds, unknown = [], len(self._pending)
+        while True:
+            start_of_unknown = unknown
+            for stage in range(len(FILTER_STAGES)):
+                limit, last = to_stage(start_of_unknown, stage), 0
+                for start, end, out_start, out_end in replacements[stage]:
+                    if end > limit:
+                        if start < limit:
+                            start_of_unknown = to_raw(start, stage)
+                            limit = start
+                        break
+                    last = end
+                if stage < CODE_BLOCK_STAGES:
+                    opening, token = CODE_BLOCK_OPENINGS[stage]
+                    match = opening.search(texts[stage], last, limit)
+                    if match:
+                        # A fence without its newline may still turn out
+                        # not to open a block
+                        fence = match.group().startswith("```")
+                        closed = None if fence and match.group()[-1] != "\n" else token
+                        holds.append((to_raw(match.start(), stage), closed))
+                        start_of_unknown = min(start_of_unknown, holds[-1][0])
+            if start_of_unknown == unknown:
+                break
+            unknown = start_of_unknown
+        # Until the block that starts the unknown text is closed, nothing in
+        # front of it is final either
+        unknown_closed_by = next(
+            (token for position, token in holds if position == unknown and token),
+            None,
+        )
+        holds.append((unknown, unknown_closed_by))
+
+        # The code patterns and phrases see the text with code blocks
+        # replaced, and only what comes before the unknown text is checked,
+        # as if the response ended there. Start looking a few words before
+        # the last line, since `\s+` in the patterns can reach back across
+        # the newline.
+        text = texts[CODE_BLOCK_STAGES]
+        end = to_stage(unknown, CODE_BLOCK_STAGES)
+        trailing_words = TRAILING_WORDS_PATTERN.search(text, 0, end).start()
+        holds.append((to_raw(trailing_words, CODE_BLOCK_STAGES), None))
+        line_start = text.rfind("\n", 0, end) + 1
+        search_from = TRAILING_WORDS_PATTERN.search(text, 0, line_start).start()
+        open_construct = OPEN_LINE_PATTERN.search(text, search_from, end)
+        if open_construct:
+            holds.append((to_raw(open_construct.start(), CODE_BLOCK_STAGES), "\n"))
+
+        held_at, awaiting = min(holds, key=lambda hold: (hold[0], hold[1] is None))
+        cut = held_at
+
+        # Never split a match of any stage in two. Moving the cut back can
+        # only expose earlier matches, so repeat until it stays put.
+        moved = True
+        while moved:
+            moved = False
+            position = cut
+            for stage, replaced in enumerate(replacements):
+                for start, end, out_start, out_end in replaced:
+                    if start < position < end:
+                        cut = to_raw(start, stage)
+                        moved = True
+                        break
+                    if start >= position:
+                        break
+                if moved:
+                    break
+                position = _to_output(position, replaced)
+
+        # Only text that arrives later can release a buffer held from its
+        # start: wait for the token that closes the unknown text, or else
+        # the one that releases the hold, as long as nothing else applied
+        if cut == 0:
+            if unknown_closed_by:
+                awaiting = unknown_closed_by
+            elif held_at > 0 or unknown < len(self._pending):
+                awaiting = None
+            self._awaiting = awaiting
+            if awaiting is not None:
+                self._held = [self._pending]
+        return cut
+
+    def _commit(self, cut: int) -> str:
+        if cut <= 0:
+            return ""
+        segment = self._pending[:cut]
+        self._pending = self._pending[cut:]
+        if not self._emitted:
+            segment = segment.lstrip()
+        filtered = apply_filter_stages(segment)
+        if not filtered or self.refused:
+            return ""
+
+        self._code_characters += count_code_characters(filtered)
+        if self._code_characters > MAX_CODE_CHARACTERS:
+            self.refused = True
+            return ""
+        self._emitted.append(filtered)
+        return filtered
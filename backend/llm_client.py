@@ -0,0 +1,428 @@
+"""
+HTTP client for the OpenAI ChatCompletion endpoint.
+
+One client per process keeps a pooled keep-alive session and bounds every
+call with separate connect and read timeouts. 429 and 5xx responses,
+timeouts and connection errors are retried with exponential backoff and
+full jitter, never sooner than the server's Retry-After allows.
+
+With hedging enabled, a non-streaming call that runs past the recent p95
+latency sends one more identical request and returns whichever answers
+first. That trades extra tokens on the slowest few percent of calls for a
+shorter tail; streaming calls are never hedged.
+
+LLMClient.create and acreate take the same arguments as
+openai.ChatCompletion.create and return the same JSON, as plain dicts.
+"""
+import collections
+import json
+import logging
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from email.utils import parsedate_to_datetime
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Dict, Iterator, Optional
+
+import config
+
+# requests, aiohttp and asyncio are imported where they are first needed, so
+# that importing this module (for LLMError, say) stays cheap on cold starts
+if TYPE_CHECKING:
+    import asyncio
+
+    import aiohttp
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class LLMError(Exception):
+    """A ChatCompletion call failed. `status` is None for network errors."""
+
+    def __init__(
+        self,
+        message: str,
+        status: Optional[int] = None,
+        retry_after: Optional[float] = None,
+    ):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status is None or self.status in RETRYABLE_STATUSES
+
+
+def parse_retry_after(headers) -> Optional[float]:
+    """Seconds to wait from retry-after-ms or Retry-After, if present."""
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return max(float(value) / 1000, 0.0)
+        except ValueError:
+            pass
+    value = headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        # HTTP-date form
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class LatencyWindow:
+    """Latencies of the most recent successful calls."""
+
+    def __init__(self, size: int = 200):
+        self._samples = collections.deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float, min_samples: int = 1) -> Optional[float]:
+        """The q-th quantile (0-1), or None with fewer than min_samples."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < max(min_samples, 1):
+            return None
+        return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+
+class LLMClient:
+    def __init__(
+        self,
+        api_base: str,
+        api_key: Optional[str],
+        connect_timeout: float = 3.0,
+        read_timeout: float = 60.0,
+        max_retries: int = 2,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        pool_size: int = 20,
+        hedge: bool = False,
+        hedge_percentile: float = 0.95,
+        hedge_min_samples: int = 20,
+    ):
+        self.url = api_base.rstrip("/") + "/chat/completions"
+        self.api_key = api_key
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool_size = pool_size
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.latency = LatencyWindow()
+        self.stats = collections.Counter()
+
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.session = requests.Session()
+        # Retries are ours; urllib3 should not retry underneath
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = None
+        self._aio_session = None
+
+    def headers(self) -> Dict[str, str]:
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Full-jitter delay before retry number `attempt` (0-based)."""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def _retry_delay(self, error: LLMError, attempt: int) -> Optional[float]:
+        """Seconds to sleep before retrying, or None to give up."""
+        if not error.retryable or attempt >= self.max_retries:
+            return None
+        # Rather fail now than hold the request for longer than we would back off
+        if error.retry_after is not None and error.retry_after > self.backoff_max:
+            return None
+        return self.backoff(attempt, error.retry_after)
+
+    # Sync API
+
+    def create(self, model: str, messages, stream: bool = False, **params) -> Any:
+        """
+        POST a ChatCompletion request. Returns the completion dict, or an
+        iterator of chunk dicts if `stream` is true. Raises LLMError.
+        """
+        payload = {"model": model, "messages": messages, **params}
+        if stream:
+            payload["stream"] = True
+            response = self._with_retries(lambda: self._post(payload, stream=True))
+            return self._iter_chunks(response)
+
+        def send():
+            return self._with_retries(lambda: self._post(payload).json())
+
+        if self.hedge:
+            return self._hedged(send)
+        return send()
+
+    def _post(self, payload: Dict[str, Any], stream: bool = False):
+        import requests
+
+        self.stats["requests"] += 1
+        start = time.perf_counter()
+        try:
+            response = self.session.post(
+                self.url,
+                json=payload,
+                headers=self.headers(),
+                stream=stream,
+                timeout=(self.connect_timeout, self.read_timeout),
+            )
+        except requests.RequestException as e:
+            raise LLMError(f"ChatCompletion request failed: {e}") from e
+        if response.status_code != 200:
+            retry_after = parse_retry_after(response.headers)
+            body = response.text[:200]
+            response.close()
+            raise LLMError(
+                f"ChatCompletion returned HTTP {response.status_code}: {body}",
+                status=response.status_code,
+                retry_after=retry_after,
+            )
+        if not stream:
+            self.latency.record(time.perf_counter() - start)
+        return response
+
+    def _with_retries(self, send: Callable[[], Any]) -> Any:
+        attempt = 0
+        while True:
+            try:
+                return send()
+            except LLMError as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                logger.warning("Retrying ChatCompletion in %.2fs: %s", delay, e)
+                self.stats["retries"] += 1
+                attempt += 1
+                time.sleep(delay)
+
+    def _hedged(self, send: Callable[[], Any]) -> Any:
+        delay = self.latency.percentile(self.hedge_percentile, self.hedge_min_samples)
+        if delay is None:
+            return send()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.pool_size, thread_name_prefix="llm-hedge"
+            )
+
+        primary = self._executor.submit(send)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        self.stats["hedges"] += 1
+        hedge = self._executor.submit(send)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self.stats["hedge_wins"] += 1
+                    # The slower request finishes in the background
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _iter_chunks(self, response) -> Iterator[Dict[str, Any]]:
+        import requests
+
+        with response:
+            try:
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data: "):
+                        continue
+                    data = line[len("data: ") :]
+                    if data == "[DONE]":
+                        return
+                    yield json.loads(data)
+            except requests.RequestException as e:
+                raise LLMError(f"ChatCompletion stream failed: {e}") from e
+
+    def close(self) -> None:
+        self.session.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    # Async API
+
+    async def acreate(
+        self, model: str, messages, stream: bool = False, **params
+    ) -> Any:
+        """create() for asyncio; streams as an async iterator."""
+        payload = {"model": model, "messages": messages, **params}
+        if stream:
+            payload["stream"] = True
+            response = await self._with_retries_async(
+                lambda: self._post_async(payload, stream=True)
+            )
+            return self._iter_chunks_async(response)
+
+        async def send():
+            return await self._with_retries_async(lambda: self._post_async(payload))
+
+        if self.hedge:
+            return await self._hedged_async(send)
+        return await send()
+
+    def _session_async(self) -> "aiohttp.ClientSession":
+        import asyncio
+
+        import aiohttp
+
+        # aiohttp sessions belong to one event loop
+        loop = asyncio.get_running_loop()
+        session = self._aio_session
+        if session is None or session.closed or session._loop is not loop:
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(
+                    sock_connect=self.connect_timeout, sock_read=self.read_timeout
+                ),
+            )
+            self._aio_session = session
+        return session
+
+    async def _post_async(self, payload: Dict[str, Any], stream: bool = False):
+        import asyncio
+
+        import aiohttp
+
+        self.stats["requests"] += 1
+        start = time.perf_counter()
+        try:
+            response = await self._session_async().post(
+                self.url, json=payload, headers=self.headers()
+            )
+            if response.status != 200:
+                body = (await response.text())[:200]
+                response.release()
+                raise LLMError(
+                    f"ChatCompletion returned HTTP {response.status}: {body}",
+                    status=response.status,
+                    retry_after=parse_retry_after(response.headers),
+                )
+            if stream:
+                return response
+            async with response:
+                completion = await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise LLMError(f"ChatCompletion request failed: {e!r}") from e
+        self.latency.record(time.perf_counter() - start)
+        return completion
+
+    async def _with_retries_async(self, send: Callable[[], Any]) -> Any:
+        import asyncio
+
+        attempt = 0
+        while True:
+            try:
+                return await send()
+            except LLMError as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                logger.warning("Retrying ChatCompletion in %.2fs: %s", delay, e)
+                self.stats["retries"] += 1
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def _hedged_async(self, send: Callable[[], Any]) -> Any:
+        import asyncio
+
+        delay = self.latency.percentile(self.hedge_percentile, self.hedge_min_samples)
+        if delay is None:
+            return await send()
+
+        primary = asyncio.ensure_future(send())
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+
+        self.stats["hedges"] += 1
+        hedge = asyncio.ensure_future(send())
+        pending = {primary, hedge}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.stats["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _iter_chunks_async(self, response) -> AsyncIterator[Dict[str, Any]]:
+        import asyncio
+
+        import aiohttp
+
+        async with response:
+            try:
+                async for raw in response.content:
+                    line = raw.decode("utf-8").strip()
+                    if not line.startswith("data: "):
+                        continue
+                    data = line[len("data: ") :]
+                    if data == "[DONE]":
+                        return
+                    yield json.loads(data)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                raise LLMError(f"ChatCompletion stream failed: {e!r}") from e
+
+    async def aclose(self) -> None:
+        if self._aio_session is not None:
+            await self._aio_session.close()
+            self._aio_session = None
+
+
+def create_llm_client() -> LLMClient:
+    """Build the process-wide ChatCompletion client; share it between threads."""
+    return LLMClient(
+        api_base=config.OPENAI_API_BASE,
+        api_key=config.OPENAI_API_KEY,
+        connect_timeout=config.OPENAI_CONNECT_TIMEOUT,
+        read_timeout=config.OPENAI_READ_TIMEOUT,
+        max_retries=config.OPENAI_MAX_RETRIES,
+        backoff_base=config.OPENAI_BACKOFF_BASE,
+        backoff_max=config.OPENAI_BACKOFF_MAX,
+        pool_size=config.OPENAI_POOL_SIZE,
+        hedge=config.OPENAI_HEDGE_ENABLED,
+        hedge_percentile=config.OPENAI_HEDGE_PERCENTILE,
+        hedge_min_samples=config.OPENAI_HEDGE_MIN_SAMPLES,
+    )
@@ -0,0 +1,233 @@
+"""
+Local stand-in for the OpenAI ChatCompletion endpoint.
+
+Answers POST .../chat/completions with a fixed reply (or one of a random
+number of words), streamed or not, after an injected delay, and fails a chosen fraction of requests (or a
+scripted sequence of them) with a given status and Retry-After. Used by the
+LLM client tests and for load testing without spending tokens:
+
+    python llm_stub.py --port 8001 --latency 0.5 --error-rate 0.05
+    OPENAI_API_BASE=http://127.0.0.1:8001/v1 gunicorn app:app
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Tuple
+
+WORDS = (
+    "consider the probability of each event and think about whether they are "
+    "independent before you apply the definition of conditional expectation"
+).split()
+
+
+class StubChatCompletionServer:
+    """
+    Threaded stub server. Settings may be changed while it runs.
+
+    `errors` is a list of statuses returned, in order, before falling back
+    to `error_rate`; `latencies` likewise overrides `latency` per request.
+    With `reply_words` as (low, high), each reply is that many random words
+    instead of `reply`.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        reply: str = "Assistant response",
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        retry_after: Optional[float] = None,
+        reply_words: Optional[Tuple[int, int]] = None,
+    ):
+        self.reply = reply
+        self.reply_words = reply_words
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.errors: List[int] = []
+        self.latencies: List[float] = []
+        self.requests: List[dict] = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+
+    @property
+    def api_base(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "StubChatCompletionServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _next_outcome(self, payload: dict):
+        """(delay, error status or None) for the next request."""
+        with self._lock:
+            self.requests.append(payload)
+            delay = self.latencies.pop(0) if self.latencies else self.latency
+            if self.errors:
+                status = self.errors.pop(0)
+            elif self.error_rate and random.random() < self.error_rate:
+                status = self.error_status
+            else:
+                status = None
+        return delay + random.uniform(0, self.jitter), status
+
+    def next_reply(self) -> str:
+        if not self.reply_words:
+            return self.reply
+        count = random.randint(*self.reply_words)
+        return " ".join(random.choice(WORDS) for _ in range(count))
+
+    def completion(self, model: str, reply: Optional[str] = None) -> dict:
+        reply = self.reply if reply is None else reply
+        return {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": reply},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": 0,
+                "completion_tokens": len(reply.split()),
+                "total_tokens": len(reply.split()),
+            },
+        }
+
+    def chunks(self, model: str, reply: Optional[str] = None):
+        words = (self.reply if reply is None else reply).split(" ")
+        for i, word in enumerate(words):
+            content = word if i == len(words) - 1 else word + " "
+            yield {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": content}}],
+            }
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+                if not self.path.endswith("/chat/completions"):
+                    self.send_json(404, {"error": {"message": "Not found"}})
+                    return
+                payload = json.loads(body or b"{}")
+                delay, status = stub._next_outcome(payload)
+                time.sleep(delay)
+
+                if status is not None:
+                    headers = {}
+                    if stub.retry_after is not None:
+                        headers["Retry-After"] = str(stub.retry_after)
+                    self.send_json(
+                        status,
+                        {"error": {"message": "Injected error", "type": "stub"}},
+                        headers,
+                    )
+                elif payload.get("stream"):
+                    self.send_stream(payload.get("model"), stub.next_reply())
+                else:
+                    self.send_json(
+                        200, stub.completion(payload.get("model"), stub.next_reply())
+                    )
+
+            def send_json(self, status, data, headers=None):
+                body = json.dumps(data).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_stream(self, model, reply):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                for chunk in stub.chunks(model, reply):
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--reply", default="Assistant response")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--retry-after", type=float, default=None)
+    parser.add_argument(
+        "--reply-words",
+        type=int,
+        nargs=2,
+        metavar=("LOW", "HIGH"),
+        help="reply with a random number of words instead of --reply",
+    )
+    args = parser.parse_args()
+
+    server = StubChatCompletionServer(
+        host=args.host,
+        port=args.port,
+        reply=args.reply,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        retry_after=args.retry_after,
+        reply_words=args.reply_words,
+    )
+    print(f"Stub ChatCompletion API at {server.api_base}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
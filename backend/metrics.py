@@ -0,0 +1,278 @@
+"""
+Prometheus metrics for the chat and rating endpoints, served on /metrics.
+
+Each instrumented request times its stages (loading state from Redis, the
+policy check, preparing messages, the model call, filtering, saving) with
+stage(), and on completion records its total time, the Redis round trips
+it made and whether it was rate limited. Token counts are recorded per
+completion and response cache lookups as hits or misses. Model calls are
+counted, timed and their fallbacks counted per route (fast or strong).
+Checkouts from the Redis connection pools that had to wait for a free
+connection, or timed out waiting, are counted and their waits timed, as
+are log records dropped by sampling or a full log queue.
+
+With several gunicorn workers, set PROMETHEUS_MULTIPROC_DIR to an empty
+directory shared by them before they start. prometheus_client then keeps
+each worker's samples in files there, and whichever worker answers
+/metrics reports the sum over all of them. Without it, each process
+reports only its own requests.
+"""
+import contextlib
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+import redis_factory
+
+
+class _Collectors:
+    """
+    The metrics themselves, created by init_metrics(). prometheus_client is
+    imported there rather than by importing this module.
+    """
+
+    def __init__(self):
+        from prometheus_client import Counter, Histogram
+
+        self.STAGE_SECONDS = Histogram(
+            "tutorgpt_stage_seconds",
+            "Time spent in each stage of a request",
+            ["endpoint", "stage"],
+            buckets=(
+                0.001,
+                0.0025,
+                0.005,
+                0.01,
+                0.025,
+                0.05,
+                0.1,
+                0.25,
+                0.5,
+                1,
+                2.5,
+                5,
+                10,
+                30,
+            ),
+        )
+        self.REQUEST_SECONDS = Histogram(
+            "tutorgpt_request_seconds",
+            "Time until the response (its headers, for streams) is returned",
+            ["endpoint", "status"],
+            buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+        )
+        self.REDIS_ROUND_TRIPS = Histogram(
+            "tutorgpt_redis_round_trips",
+            "Redis round trips (commands or pipelines) per request",
+            ["endpoint"],
+            buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20),
+        )
+        self.LLM_TOKENS = Histogram(
+            "tutorgpt_llm_tokens",
+            "Prompt and completion tokens per model call",
+            ["model", "kind"],
+            buckets=(16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384),
+        )
+        self.ROUTE_CALLS = Counter(
+            "tutorgpt_llm_route_calls_total",
+            "Model calls per route, model and outcome (ok or error)",
+            ["route", "model", "outcome"],
+        )
+        self.ROUTE_SECONDS = Histogram(
+            "tutorgpt_llm_route_seconds",
+            "Duration of successful model calls per route",
+            ["route", "model"],
+            buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60),
+        )
+        self.ROUTE_FALLBACKS = Counter(
+            "tutorgpt_llm_route_fallbacks_total",
+            "Model calls made on a route after another route failed",
+            ["route", "model"],
+        )
+        self.CACHE_LOOKUPS = Counter(
+            "tutorgpt_response_cache_lookups_total",
+            "Response cache lookups by result",
+            ["result"],
+        )
+        self.REDIS_POOL_WAITS = Counter(
+            "tutorgpt_redis_pool_waits_total",
+            "Redis connection checkouts that waited for a free connection",
+        )
+        self.REDIS_POOL_TIMEOUTS = Counter(
+            "tutorgpt_redis_pool_timeouts_total",
+            "Redis connection checkouts that timed out waiting",
+        )
+        self.REDIS_POOL_WAIT_SECONDS = Histogram(
+            "tutorgpt_redis_pool_wait_seconds",
+            "Time spent waiting for a Redis connection, when a checkout waited",
+            buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+        )
+        self.LOG_RECORDS_DROPPED = Counter(
+            "tutorgpt_log_records_dropped_total",
+            "Log records not written, by reason (sampled or queue_full) and event",
+            ["reason", "event"],
+        )
+        self.RATE_LIMITED = Counter(
+            "tutorgpt_rate_limited_total",
+            "Requests rejected by a rate limit",
+            ["endpoint"],
+        )
+
+
+_collectors_lock = threading.Lock()
+_collectors_instance: Optional[_Collectors] = None
+
+
+def init_metrics() -> _Collectors:
+    """
+    Create and register the collectors, once per process. create_app()
+    calls this; processes that never build the app, such as the rating
+    worker, get it on the first metric they record.
+    """
+    global _collectors_instance
+    # Registering the collectors twice would fail
+    with _collectors_lock:
+        if _collectors_instance is None:
+            _collectors_instance = _Collectors()
+    return _collectors_instance
+
+
+def _collectors() -> _Collectors:
+    return _collectors_instance or init_metrics()
+
+
+class RequestMetrics:
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.start = time.monotonic()
+        self._round_trips = redis_factory.start_round_trip_count()
+        self.token = None
+        # Stage name -> seconds, for the request log
+        self.stages: Dict[str, float] = {}
+        self.round_trips = 0
+        self.duration = 0.0
+
+    def finish(self, status: int) -> None:
+        self.round_trips = redis_factory.stop_round_trip_count(self._round_trips)
+        self.duration = time.monotonic() - self.start
+        _collectors().REQUEST_SECONDS.labels(self.endpoint, str(status)).observe(
+            self.duration
+        )
+        _collectors().REDIS_ROUND_TRIPS.labels(self.endpoint).observe(self.round_trips)
+        if status == 429:
+            _collectors().RATE_LIMITED.labels(self.endpoint).inc()
+
+
+_current: ContextVar[Optional[RequestMetrics]] = ContextVar(
+    "request_metrics", default=None
+)
+
+
+def begin_request(endpoint: str) -> RequestMetrics:
+    """Start instrumenting the current request; pass the result to end_request()."""
+    request_metrics = RequestMetrics(endpoint)
+    request_metrics.token = _current.set(request_metrics)
+    return request_metrics
+
+
+def end_request(request_metrics: RequestMetrics, status: int) -> None:
+    request_metrics.finish(status)
+    _current.reset(request_metrics.token)
+
+
+@contextlib.contextmanager
+def stage(name: str):
+    """Time a stage of the current request; does nothing outside one."""
+    request_metrics = _current.get()
+    if request_metrics is None:
+        yield
+        return
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        elapsed = time.monotonic() - start
+        _collectors().STAGE_SECONDS.labels(request_metrics.endpoint, name).observe(
+            elapsed
+        )
+        request_metrics.stages[name] = request_metrics.stages.get(name, 0.0) + elapsed
+
+
+def observe_tokens(model: str, usage: Dict[str, int]) -> None:
+    for kind in ("prompt", "completion"):
+        if f"{kind}_tokens" in usage:
+            _collectors().LLM_TOKENS.labels(model, kind).observe(
+                usage[f"{kind}_tokens"]
+            )
+
+
+def observe_model_call(
+    route: str, model: str, seconds: float, error: bool = False, fallback: bool = False
+) -> None:
+    """Count a model call on `route`, and time it if it succeeded."""
+    collectors = _collectors()
+    collectors.ROUTE_CALLS.labels(route, model, "error" if error else "ok").inc()
+    if fallback:
+        collectors.ROUTE_FALLBACKS.labels(route, model).inc()
+    if not error:
+        collectors.ROUTE_SECONDS.labels(route, model).observe(seconds)
+
+
+def observe_cache_lookup(hit: bool) -> None:
+    _collectors().CACHE_LOOKUPS.labels("hit" if hit else "miss").inc()
+
+
+def observe_dropped_log_record(reason: str, event: Optional[str]) -> None:
+    _collectors().LOG_RECORDS_DROPPED.labels(reason, event or "").inc()
+
+
+def observe_pool_wait(seconds: float, timed_out: bool = False) -> None:
+    """Count a Redis connection checkout that had to wait."""
+    collectors = _collectors()
+    if timed_out:
+        collectors.REDIS_POOL_TIMEOUTS.inc()
+    else:
+        collectors.REDIS_POOL_WAITS.inc()
+    collectors.REDIS_POOL_WAIT_SECONDS.observe(seconds)
+
+
+class _GaugeCollector:
+    def __init__(self, gauges: Dict[str, Tuple[str, float]]):
+        self.gauges = gauges
+
+    def collect(self):
+        from prometheus_client.core import GaugeMetricFamily
+
+        for name, (documentation, value) in self.gauges.items():
+            yield GaugeMetricFamily(name, documentation, value=value)
+
+
+def render(gauges: Optional[Dict[str, Tuple[str, float]]] = None) -> Tuple[bytes, str]:
+    """
+    The exposition body and its content type. `gauges` maps names to
+    (help, value) for values read at scrape time, such as this worker's
+    Redis pool usage.
+    """
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST,
+        REGISTRY,
+        CollectorRegistry,
+        generate_latest,
+        multiprocess,
+    )
+
+    # Register the collectors even if nothing was recorded yet
+    init_metrics()
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    body = generate_latest(registry)
+    if gauges:
+        extra = CollectorRegistry()
+        extra.register(_GaugeCollector(gauges))
+        body += generate_latest(extra)
+    return body, CONTENT_TYPE_LATEST
@@ -0,0 +1,127 @@
+"""
+Routes each chat turn to a fast or a strong model.
+
+Most turns are greetings, thanks and short clarifications that a small
+model answers as well as GPT-4, at a fraction of the latency and cost. The
+router classifies the prepared messages with local heuristics only, so it
+adds no I/O: a turn goes to the strong model when the policy engine flags
+any recent user message, when the message is long, when it mentions a
+course topic or contains math or code, or when it is a follow-up question
+in an ongoing conversation. Everything else goes to the fast model.
+
+The app routes a turn before packing its prompt, so each model gets the
+context its own token budget allows, and records calls, latency and
+fallbacks per route with metrics.observe_model_call so the effect of
+routing can be compared in production.
+"""
+import re
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+FAST = "fast"
+STRONG = "strong"
+
+# Course topics and problem-solving verbs that deserve the strong model
+TOPIC_KEYWORDS = [
+    r"prove",
+    r"proof",
+    r"derive",
+    r"derivation",
+    r"explain",
+    r"calculat\w*",
+    r"comput\w*",
+    r"bayes\w*",
+    r"probabilit\w*",
+    r"variance",
+    r"expectation",
+    r"expected value",
+    r"covariance",
+    r"correlation",
+    r"distribution\w*",
+    r"binomial",
+    r"poisson",
+    r"geometric",
+    r"exponential",
+    r"gaussian",
+    r"normal",
+    r"independen\w*",
+    r"conditional",
+    r"joint",
+    r"marginal",
+    r"likelihood",
+    r"mle",
+    r"central limit",
+    r"bootstrap\w*",
+    r"sampling",
+    r"combinatorics",
+    r"permutation\w*",
+    r"combination\w*",
+    r"pmf",
+    r"pdf",
+    r"cdf",
+]
+
+TOPIC_PATTERN = re.compile(r"\b(?:" + "|".join(TOPIC_KEYWORDS) + r")\b", re.IGNORECASE)
+# Digits next to operators, LaTeX, or code
+MATH_OR_CODE_PATTERN = re.compile(r"\d\s*[-+*/^=<>]|[-+*/^=<>]\s*\d|\\[a-z]+|```|[{}]")
+
+
+@dataclass(frozen=True)
+class Route:
+    name: str
+    model: str
+    reason: str
+
+
+class ModelRouter:
+    """
+    Picks a Route for prepared chat messages. With no `fast_model`, every
+    turn goes to the strong model.
+
+    `flagged` tells whether the policy engine matches a message; it must not
+    do I/O.
+    """
+
+    def __init__(
+        self,
+        strong_model: str,
+        fast_model: Optional[str] = None,
+        fast_max_chars: int = 120,
+        flagged: Callable[[str], bool] = lambda message: False,
+    ):
+        self.strong_model = strong_model
+        self.fast_model = fast_model
+        self.fast_max_chars = fast_max_chars
+        self.flagged = flagged
+
+    def strong(self, reason: str) -> Route:
+        return Route(STRONG, self.strong_model, reason)
+
+    def route(self, messages: List[Dict[str, str]]) -> Route:
+        if not self.fast_model:
+            return self.strong("single model")
+
+        user_messages = [m["content"] for m in messages if m["role"] == "user"]
+        user_message = user_messages[-1] if user_messages else ""
+        if any(self.flagged(message) for message in user_messages[-3:]):
+            return self.strong("policy")
+        if len(user_message) > self.fast_max_chars:
+            return self.strong("long message")
+        if TOPIC_PATTERN.search(user_message) or MATH_OR_CODE_PATTERN.search(
+            user_message
+        ):
+            return self.strong("topic")
+        # A question mid-conversation usually builds on the explanation so far
+        if len(user_messages) > 1 and "?" in user_message:
+            return self.strong("follow-up question")
+        return Route(FAST, self.fast_model, "simple turn")
+
+    def route_turn(self, history: List[Dict[str, str]], user_message: str) -> Route:
+        """Route a new user message on the stored history, before packing it."""
+        return self.route(history + [{"role": "user", "content": user_message}])
+
+    def fallback(self, route: Route) -> Optional[Route]:
+        """The route to retry on after `route` failed, if any."""
+        if route.name == FAST:
+            return self.strong("fallback")
+        return None
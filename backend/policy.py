@@ -0,0 +1,123 @@
+"""
+In-process policy engine backing is_violating_policy.
+
+The blacklist lives in Redis so TAs can edit it without a deploy, but the
+matching itself happens in memory: the blacklist phrases and the injection /
+code-request patterns are compiled into a single regex, and Redis is only
+consulted again when the policy version changes.
+"""
+import re
+from typing import TYPE_CHECKING, Iterable, List, Optional, Set
+
+from synced_state import SyncedState, publish_update
+
+if TYPE_CHECKING:
+    import redis
+    import redis.asyncio
+
+BLACKLIST_KEY = "policy:blacklist"
+VERSION_KEY = "policy:version"
+INVALIDATE_CHANNEL = "policy:invalidate"
+
+DEFAULT_BLACKLIST = [
+    "give me the homework solution",
+    "provide me the test answer",
+    "help me cheat",
+    "give me the code",
+    "give me the answer",
+    "solve this for me",
+    "do my homework",
+    "complete this assignment",
+    "write the code for",
+    "malicious usage request",
+]
+
+# Prompt injection attempts
+INJECTION_PATTERNS = [
+    r"ignore previous",
+    r"override .* instructions",
+    r"disregard .* rules",
+    r"bypass .* restrictions",
+]
+
+# Requests for code or full solutions
+CODE_REQUEST_PATTERNS = [
+    r"write .*code",
+    r"implement .* function",
+    r"create .* class",
+    r"give .* implementation",
+    r"show .* solution",
+]
+
+
+def compile_matcher(blacklist: Iterable[str]) -> "re.Pattern[str]":
+    """
+    Build one regex that matches any blacklisted phrase or policy pattern.
+    The name of the group that matched tells the caller which rule fired.
+    """
+    # Longest phrases first so overlapping phrases report the most specific one
+    phrases = sorted({phrase for phrase in blacklist if phrase}, key=len, reverse=True)
+    alternatives = []
+    if phrases:
+        alternatives.append(
+            "(?P<blacklist>" + "|".join(re.escape(p) for p in phrases) + ")"
+        )
+    alternatives.append("(?P<injection>(?i:" + "|".join(INJECTION_PATTERNS) + "))")
+    alternatives.append(
+        "(?P<code_request>(?i:" + "|".join(CODE_REQUEST_PATTERNS) + "))"
+    )
+    return re.compile("|".join(alternatives))
+
+
+class PolicyEngine(SyncedState):
+    """
+    Holds the compiled policy matcher and keeps it in sync with Redis.
+
+    In steady state a check is a single regex search with no network I/O.
+    The version key is polled at most once every `refresh_seconds`, and a
+    message on the invalidation channel forces a reload on the next check.
+    """
+
+    version_key = VERSION_KEY
+    invalidate_channel = INVALIDATE_CHANNEL
+
+    def __init__(
+        self,
+        refresh_seconds: float = 5.0,
+        subscribe: bool = True,
+        default_blacklist: Iterable[str] = DEFAULT_BLACKLIST,
+    ):
+        self.default_blacklist = list(default_blacklist)
+        super().__init__(refresh_seconds, subscribe)
+
+    def check(self, user_message: str) -> Optional[str]:
+        """
+        Return the rule category that the message violates
+        ("blacklist", "injection" or "code_request"), or None.
+        """
+        match = self._matcher.search(user_message.lower())
+        return match.lastgroup if match else None
+
+    def _default(self) -> List[str]:
+        return self.default_blacklist
+
+    def _load(self, client: "redis.Redis") -> Set[str]:
+        if not client.exists(BLACKLIST_KEY):
+            client.sadd(BLACKLIST_KEY, *self.default_blacklist)
+        return client.smembers(BLACKLIST_KEY)
+
+    async def _load_async(self, client: "redis.asyncio.Redis") -> Set[str]:
+        if not await client.exists(BLACKLIST_KEY):
+            await client.sadd(BLACKLIST_KEY, *self.default_blacklist)
+        return await client.smembers(BLACKLIST_KEY)
+
+    def _compile(self, phrases: Iterable[str]) -> None:
+        self._matcher = compile_matcher(phrases)
+
+
+def publish_policy_update(client: "redis.Redis") -> None:
+    """
+    Bump the policy version and notify all workers. Call this after editing
+    the policy:blacklist set.
+    """
+    publish_update(client.pipeline(), VERSION_KEY, INVALIDATE_CHANNEL, "blacklist")
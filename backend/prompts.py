@@ -0,0 +1,124 @@
+"""
+In-process registry of compiled system prompts.
+
+The base instructions live in Redis under system:base_instructions so they
+can be edited without a deploy. Each worker keeps every prompt variant
+(new conversation, continuing conversation, each with or without the
+recent-violation reminder) fully assembled in memory, and only reads Redis
+again when the prompt version changes, so building a request's messages
+needs no Redis round trip.
+
+Every variant has a stable ID derived from its name and content. Requests
+that share an ID send a byte-identical system prompt prefix, which is what
+provider-side prompt caching keys on.
+"""
+import hashlib
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict
+
+from synced_state import SyncedState, publish_update
+
+if TYPE_CHECKING:
+    import redis
+    import redis.asyncio
+
+BASE_INSTRUCTIONS_KEY = "system:base_instructions"
+VERSION_KEY = "prompt:version"
+INVALIDATE_CHANNEL = "prompt:invalidate"
+
+NEW_CONVERSATION_INSTRUCTIONS = "This is a new conversation. Start by introducing yourself briefly and ask how you can help with CS109 concepts."
+RECENT_VIOLATION_INSTRUCTIONS = "The user has recently made policy-violating requests. Be extra vigilant and remind them gently about academic integrity if needed."
+CONTINUING_INSTRUCTIONS = "Maintain continuity with the previous discussion while staying focused on CS109 topics."
+
+
+@dataclass(frozen=True)
+class PromptVariant:
+    id: str
+    content: str
+
+
+def compile_variants(base_instructions: str) -> Dict[tuple, PromptVariant]:
+    """
+    Assemble every system prompt variant, keyed by
+    (is_new_conversation, has_recent_policy_violation).
+    """
+    variants = {}
+    for is_new in (True, False):
+        for violation in (False, True):
+            name = "new" if is_new else "continuing"
+            context_specific_instructions = []
+            if is_new:
+                context_specific_instructions.append(NEW_CONVERSATION_INSTRUCTIONS)
+            if violation:
+                name += "-violation"
+                context_specific_instructions.append(RECENT_VIOLATION_INSTRUCTIONS)
+            if not is_new:
+                context_specific_instructions.append(CONTINUING_INSTRUCTIONS)
+
+            content = (
+                base_instructions + "\n\n" + "\n".join(context_specific_instructions)
+            )
+            digest = hashlib.sha256(content.encode("utf-8")).hexdigest()[:12]
+            variants[(is_new, violation)] = PromptVariant(f"{name}:{digest}", content)
+    return variants
+
+
+class PromptRegistry(SyncedState):
+    """
+    Holds the compiled prompt variants and keeps them in sync with Redis.
+
+    The version key is polled at most once every `refresh_seconds`, and a
+    message on the invalidation channel forces a reload on the next request.
+    """
+
+    version_key = VERSION_KEY
+    invalidate_channel = INVALIDATE_CHANNEL
+
+    def __init__(
+        self,
+        default_instructions: str,
+        refresh_seconds: float = 1.0,
+        subscribe: bool = True,
+    ):
+        self.default_instructions = default_instructions
+        super().__init__(refresh_seconds, subscribe)
+
+    @property
+    def base_instructions(self) -> str:
+        return self._prompts[0]
+
+    @property
+    def variants(self) -> Dict[str, PromptVariant]:
+        """All current variants by ID."""
+        return {variant.id: variant for variant in self._prompts[1].values()}
+
+    def variant(
+        self, is_new_conversation: bool, has_recent_policy_violation: bool
+    ) -> PromptVariant:
+        return self._prompts[1][(is_new_conversation, has_recent_policy_violation)]
+
+    def _default(self) -> str:
+        return self.default_instructions
+
+    def _load(self, client: "redis.Redis") -> str:
+        # Seed Redis with the default prompt on first use
+        client.set(BASE_INSTRUCTIONS_KEY, self.default_instructions, nx=True)
+        return client.get(BASE_INSTRUCTIONS_KEY) or self.default_instructions
+
+    async def _load_async(self, client: "redis.asyncio.Redis") -> str:
+        await client.set(BASE_INSTRUCTIONS_KEY, self.default_instructions, nx=True)
+        return await client.get(BASE_INSTRUCTIONS_KEY) or self.default_instructions
+
+    def _compile(self, instructions: str) -> None:
+        # One attribute swap, so readers never mix old and new prompts
+        self._prompts = (instructions, compile_variants(instructions))
+
+
+def publish_prompt_update(client: "redis.Redis", instructions: str) -> None:
+    """
+    Replace the base instructions and notify all workers. Edits made to
+    system:base_instructions without bumping the version are not picked up.
+    """
+    pipe = client.pipeline()
+    pipe.set(BASE_INSTRUCTIONS_KEY, instructions)
+    publish_update(pipe, VERSION_KEY, INVALIDATE_CHANNEL, "base_instructions")
@@ -0,0 +1,273 @@
+"""
+Atomic Redis-backed rate limiting.
+
+Each check runs one server-side Lua script via EVALSHA, so counting and
+enforcing the limit happen in a single round trip and concurrent requests
+cannot race past the limit. Three algorithms are available:
+
+- fixed_window: a counter that expires at the end of each window
+- sliding_window: a sorted-set log of request timestamps
+- token_bucket: a bucket refilled continuously at limit / window
+"""
+import hashlib
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Dict, List, Tuple
+
+if TYPE_CHECKING:
+    import redis
+    import redis.asyncio
+
+# All scripts take KEYS[1] = bucket key and ARGV = limit, window (ms), now (ms),
+# request id, and return {allowed, remaining, retry_after_ms, reset_after_ms}.
+FIXED_WINDOW_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local count = redis.call('INCR', KEYS[1])
+local ttl = redis.call('PTTL', KEYS[1])
+if ttl < 0 then
+  redis.call('PEXPIRE', KEYS[1], window)
+  ttl = window
+end
+if count > limit then
+  return {0, 0, ttl, ttl}
+end
+return {1, limit - count, 0, ttl}
+"""
+
+SLIDING_WINDOW_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+local count = redis.call('ZCARD', KEYS[1])
+if count >= limit then
+  local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+  local retry = tonumber(oldest[2]) + window - now
+  return {0, 0, retry, retry}
+end
+redis.call('ZADD', KEYS[1], now, ARGV[4])
+redis.call('PEXPIRE', KEYS[1], window)
+local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+return {1, limit - count - 1, 0, tonumber(oldest[2]) + window - now}
+"""
+
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local rate = capacity / window
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  allowed = 1
+else
+  retry = math.ceil((1 - tokens) / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], window)
+return {allowed, math.floor(tokens), retry, math.ceil((capacity - tokens) / rate)}
+"""
+
+SCRIPTS = {
+    "fixed_window": FIXED_WINDOW_SCRIPT,
+    "sliding_window": SLIDING_WINDOW_SCRIPT,
+    "token_bucket": TOKEN_BUCKET_SCRIPT,
+}
+
+
+@dataclass
+class RateLimitResult:
+    """Outcome of a rate limit check; times are in seconds."""
+
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: float
+    reset_after: float
+
+    def headers(self) -> dict:
+        """RateLimit-* response headers describing this result."""
+        headers = {
+            "RateLimit-Limit": str(self.limit),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(_ceil_seconds(self.reset_after)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(_ceil_seconds(self.retry_after))
+        return headers
+
+
+def _ceil_seconds(seconds: float) -> int:
+    return max(0, int(-(-seconds // 1)))
+
+
+class RateLimiter:
+    """
+    Limits each identifier (e.g. a client IP) to `limit` requests per
+    `window_seconds`, using one EVALSHA per check.
+    """
+
+    def __init__(
+        self,
+        prefix: str,
+        limit: int,
+        window_seconds: float,
+        algorithm: str = "fixed_window",
+        clock: Callable[[], float] = time.time,
+    ):
+        if algorithm not in SCRIPTS:
+            raise ValueError(
+                f"Unknown rate limit algorithm {algorithm!r}; "
+                f"expected one of {', '.join(SCRIPTS)}"
+            )
+        self.prefix = prefix
+        self.limit = limit
+        self.window_ms = int(window_seconds * 1000)
+        self.algorithm = algorithm
+        self.clock = clock
+        self._script = SCRIPTS[algorithm]
+        self._sha = hashlib.sha1(self._script.encode("utf-8")).hexdigest()
+
+    def key(self, identifier: str) -> str:
+        # The algorithm is part of the key since each one stores a different type
+        return f"{self.prefix}:{self.algorithm}:{identifier}"
+
+    def check(self, client: "redis.Redis", identifier: str) -> RateLimitResult:
+        """Count a request for `identifier` and report whether it is allowed."""
+        import redis
+
+        keys, args = self._script_args(identifier)
+        try:
+            reply = client.evalsha(self._sha, len(keys), *keys, *args)
+        except redis.exceptions.NoScriptError:
+            # First use on this server (or after SCRIPT FLUSH)
+            client.script_load(self._script)
+            reply = client.evalsha(self._sha, len(keys), *keys, *args)
+        return self._result(reply)
+
+    async def check_async(
+        self, client: "redis.asyncio.Redis", identifier: str
+    ) -> RateLimitResult:
+        """check() for a redis.asyncio client."""
+        import redis
+
+        keys, args = self._script_args(identifier)
+        try:
+            reply = await client.evalsha(self._sha, len(keys), *keys, *args)
+        except redis.exceptions.NoScriptError:
+            await client.script_load(self._script)
+            reply = await client.evalsha(self._sha, len(keys), *keys, *args)
+        return self._result(reply)
+
+    def queue_check(self, pipe: "redis.client.Pipeline", identifier: str) -> None:
+        """
+        Add this check to a pipeline. Pass the pipeline's reply to
+        check_reply(); execute with raise_on_error=False so a missing script
+        can be loaded and the check retried.
+        """
+        keys, args = self._script_args(identifier)
+        pipe.evalsha(self._sha, len(keys), *keys, *args)
+
+    def check_reply(
+        self, client: "redis.Redis", identifier: str, reply
+    ) -> RateLimitResult:
+        """Result of a check queued with queue_check()."""
+        if isinstance(reply, Exception):
+            import redis
+
+            if isinstance(reply, redis.exceptions.NoScriptError):
+                # The script did not run, so nothing was counted yet
+                return self.check(client, identifier)
+            raise reply
+        return self._result(reply)
+
+    async def check_reply_async(
+        self, client: "redis.asyncio.Redis", identifier: str, reply
+    ) -> RateLimitResult:
+        """check_reply() for a redis.asyncio client."""
+        if isinstance(reply, Exception):
+            import redis
+
+            if isinstance(reply, redis.exceptions.NoScriptError):
+                return await self.check_async(client, identifier)
+            raise reply
+        return self._result(reply)
+
+    def _script_args(self, identifier: str) -> Tuple[List[str], list]:
+        now_ms = int(self.clock() * 1000)
+        return (
+            [self.key(identifier)],
+            [self.limit, self.window_ms, now_ms, uuid.uuid4().hex],
+        )
+
+    def _result(self, reply: list) -> RateLimitResult:
+        allowed, remaining, retry_ms, reset_ms = reply
+        return RateLimitResult(
+            allowed=bool(allowed),
+            limit=self.limit,
+            remaining=int(remaining),
+            retry_after=int(retry_ms) / 1000,
+            reset_after=int(reset_ms) / 1000,
+        )
+
+
+class LocalRateLimiter:
+    """
+    In-process fixed-window limiter used while Redis is unavailable.
+    Limits are per worker process, so the effective limit is looser than
+    the shared Redis one, but clients are still throttled.
+    """
+
+    def __init__(
+        self,
+        limit: int,
+        window_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._windows: Dict[str, Tuple[float, int]] = {}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._windows.clear()
+
+    def check(self, identifier: str) -> RateLimitResult:
+        now = self.clock()
+        with self._lock:
+            start, count = self._windows.get(identifier, (now, 0))
+            if now - start >= self.window_seconds:
+                start, count = now, 0
+            if len(self._windows) > 10000:
+                self._prune(now)
+            count += 1
+            self._windows[identifier] = (start, count)
+
+        reset_after = start + self.window_seconds - now
+        allowed = count <= self.limit
+        return RateLimitResult(
+            allowed=allowed,
+            limit=self.limit,
+            remaining=max(0, self.limit - count),
+            retry_after=0 if allowed else reset_after,
+            reset_after=reset_after,
+        )
+
+    def _prune(self, now: float) -> None:
+        expired = [
+            identifier
+            for identifier, (start, _) in self._windows.items()
+            if now - start >= self.window_seconds
+        ]
+        for identifier in expired:
+            del self._windows[identifier]
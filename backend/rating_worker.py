@@ -0,0 +1,178 @@
+"""
+Worker that stores ratings queued on the ratings stream.
+
+Run one or more next to the web processes:
+
+    python rating_worker.py
+
+Workers share the rating-workers consumer group, so each rating is stored
+once. A batch is flushed when RATING_WORKER_BATCH_SIZE ratings have been
+read or RATING_WORKER_FLUSH_SECONDS after its first rating, whichever comes
+first. Entries are only acknowledged in the transaction that stores them;
+a worker that restarts under the same name picks up what it had read but
+not stored.
+"""
+import logging
+import signal
+import socket
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import redis
+
+import config
+import ratings
+import structured_logging
+from redis_factory import create_redis_client
+
+logger = logging.getLogger(__name__)
+
+
+class RatingWorker:
+    def __init__(
+        self,
+        client: redis.Redis,
+        consumer: str,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+    ):
+        self.client = client
+        self.consumer = consumer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.stored = 0
+        self.batches = 0
+        self.retries = 0
+
+    def ensure_group(self) -> None:
+        try:
+            self.client.xgroup_create(
+                ratings.STREAM_KEY, ratings.GROUP, id="0", mkstream=True
+            )
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def read(
+        self,
+        stream_id: str = ">",
+        block: Optional[float] = None,
+        count: Optional[int] = None,
+    ) -> list:
+        """Up to `count` (default batch_size) entries; `block` is in seconds."""
+        reply = self.client.xreadgroup(
+            ratings.GROUP,
+            self.consumer,
+            {ratings.STREAM_KEY: stream_id},
+            count=count or self.batch_size,
+            block=None if block is None else max(int(block * 1000), 1),
+        )
+        return reply[0][1] if reply else []
+
+    def poll(self) -> int:
+        """Read and store one batch. Returns the number of ratings stored."""
+        batch = self.read(block=self.flush_interval)
+        deadline = time.monotonic() + self.flush_interval
+        while batch and len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            more = self.read(block=remaining, count=self.batch_size - len(batch))
+            if not more:
+                break
+            batch.extend(more)
+        self.store(batch)
+        return len(batch)
+
+    def recover(self) -> int:
+        """Store entries this consumer read before a restart but never acked."""
+        recovered = 0
+        while True:
+            batch = self.read("0")
+            if not batch:
+                return recovered
+            # Entries trimmed from the stream come back without fields
+            trimmed = [entry_id for entry_id, fields in batch if not fields]
+            if trimmed:
+                self.client.xack(ratings.STREAM_KEY, ratings.GROUP, *trimmed)
+            batch = [entry for entry in batch if entry[1]]
+            self.store(batch)
+            recovered += len(batch)
+
+    def store(self, batch: List[Tuple[str, Dict[str, str]]]) -> None:
+        if not batch:
+            return
+        ids = [entry_id for entry_id, _ in batch]
+        entries = [fields for _, fields in batch]
+
+        pipe = self.client.pipeline()
+        try:
+            while True:
+                # If another worker stores one of these messages before EXEC,
+                # the transaction is aborted and the batch read again
+                pipe.watch(*ratings.watched_keys(entries))
+                reads = self.client.pipeline(transaction=False)
+                ratings.queue_previous_reads(reads, entries)
+                replies = reads.execute()
+
+                pipe.multi()
+                ratings.queue_store(pipe, entries, replies)
+                pipe.xack(ratings.STREAM_KEY, ratings.GROUP, *ids)
+                pipe.xdel(ratings.STREAM_KEY, *ids)
+                try:
+                    pipe.execute()
+                    break
+                except redis.WatchError:
+                    self.retries += 1
+        finally:
+            pipe.reset()
+
+        self.stored += len(batch)
+        self.batches += 1
+
+    def run(self, stop: threading.Event, report_interval: float = 60.0) -> None:
+        self.ensure_group()
+        recovered = self.recover()
+        if recovered:
+            logger.info("Stored %d ratings left over from a previous run", recovered)
+        reported_at = time.monotonic()
+        while not stop.is_set():
+            try:
+                self.poll()
+            except redis.RedisError as e:
+                logger.warning("Rating worker could not reach Redis: %s", e)
+                stop.wait(self.flush_interval)
+                continue
+            if time.monotonic() - reported_at >= report_interval:
+                reported_at = time.monotonic()
+                logger.info(
+                    "Rating worker stored %d ratings in %d batches; backlog %d",
+                    self.stored,
+                    self.batches,
+                    ratings.backlog(self.client),
+                )
+
+
+def main() -> None:
+    structured_logging.setup_logging(
+        level=config.LOG_LEVEL,
+        json_format=config.LOG_FORMAT == "json",
+        queue_size=config.LOG_QUEUE_SIZE,
+    )
+    worker = RatingWorker(
+        # Blocking reads wait up to the flush interval
+        create_redis_client(socket_timeout=config.RATING_WORKER_FLUSH_SECONDS + 5),
+        consumer=config.RATING_WORKER_NAME or socket.gethostname(),
+        batch_size=config.RATING_WORKER_BATCH_SIZE,
+        flush_interval=config.RATING_WORKER_FLUSH_SECONDS,
+    )
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *args: stop.set())
+    logger.info("Rating worker %s started", worker.consumer)
+    worker.run(stop)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""
+Rating storage and aggregates, fed through a Redis Stream.
+
+/api/rate appends each rating to the ratings:stream stream with a single
+XADD and returns. The rating worker (rating_worker.py) reads the stream in
+batches and, in one transaction per batch, writes the rating:<messageId>
+hashes, updates the aggregates and acknowledges the entries. The batch's
+rating hashes are WATCHed while their previous ratings are read, so if
+another worker stores one of those messages first, the transaction is
+retried rather than replacing the same old score twice:
+
+- ratings:histogram: hash of score -> count
+- ratings:daily:<YYYY-MM-DD>: hash with the day's rating count and sum,
+  from which the mean per day follows; kept for DAILY_TTL_SECONDS
+- ratings:lowest: sorted set of the LOWEST_RATED_LIMIT lowest-rated
+  message IDs, newest first among equal ratings, without messages whose
+  rating hash has expired
+
+Processed entries are deleted from the stream, so its length is the
+backlog of ratings not yet stored. summary() reads only the aggregates, so
+its cost depends on the number of days asked for, not on how many ratings
+there are.
+"""
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+if TYPE_CHECKING:
+    import redis
+
+STREAM_KEY = "ratings:stream"
+GROUP = "rating-workers"
+HISTOGRAM_KEY = "ratings:histogram"
+LOWEST_KEY = "ratings:lowest"
+LOWEST_RATED_LIMIT = 100
+
+# Keep ratings for 30 days
+RATING_TTL_SECONDS = 60 * 60 * 24 * 30
+
+# Keep per-day aggregates for as long as summary() can be asked to report
+DAILY_TTL_SECONDS = 60 * 60 * 24 * 366
+
+# Takes back a replaced rating: KEYS[1] = histogram, KEYS[2] = the day's
+# hash (if the old rating had a timestamp), ARGV[1] = old score. Counts that
+# are already zero, such as those of an expired day, stay at zero.
+UNRATE_SCRIPT = """
+if tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or '0') > 0 then
+  redis.call('HINCRBY', KEYS[1], ARGV[1], -1)
+end
+if KEYS[2] and tonumber(redis.call('HGET', KEYS[2], 'count') or '0') > 0 then
+  redis.call('HINCRBY', KEYS[2], 'count', -1)
+  redis.call('HINCRBYFLOAT', KEYS[2], 'sum', -tonumber(ARGV[1]))
+end
+"""
+
+# Drops message IDs whose rating hash has expired from KEYS[1] = lowest
+# set, then keeps the ARGV[1] lowest. KEYS[i + 1] is the rating hash of the
+# message ID ARGV[i + 1], for each ID the set held when it was read.
+PRUNE_LOWEST_SCRIPT = """
+for i = 2, #KEYS do
+  if redis.call('EXISTS', KEYS[i]) == 0 then
+    redis.call('ZREM', KEYS[1], ARGV[i])
+  end
+end
+redis.call('ZREMRANGEBYRANK', KEYS[1], tonumber(ARGV[1]), -1)
+"""
+
+
+def rating_key(message_id: str) -> str:
+    return f"rating:{message_id}"
+
+
+def daily_key(day: str) -> str:
+    return f"ratings:daily:{day}"
+
+
+def rating_entry(rating_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Stream entry for a validated rating."""
+    return {
+        "message_id": rating_data["messageId"],
+        # 4 and 4.0 count as the same score
+        "rating": f"{float(rating_data['rating']):g}",
+        "user_input": rating_data.get("userInput", ""),
+        "assistant_output": rating_data.get("assistantOutput", ""),
+        "timestamp": datetime.utcnow().isoformat(),
+    }
+
+
+def queue_rating(client, rating_data: Dict[str, Any], maxlen: int):
+    """
+    Append a rating to the stream. `client` may be a pipeline or a
+    redis.asyncio client, whose reply is returned to await. The stream is
+    capped at about `maxlen` entries in case no worker is running.
+    """
+    return client.xadd(
+        STREAM_KEY, rating_entry(rating_data), maxlen=maxlen, approximate=True
+    )
+
+
+def backlog(client: "redis.Redis") -> int:
+    """Ratings queued but not yet stored."""
+    return client.xlen(STREAM_KEY)
+
+
+def watched_keys(entries: List[Dict[str, str]]) -> List[str]:
+    """Keys to WATCH before queue_previous_reads() so queue_store() is safe."""
+    return sorted({rating_key(entry["message_id"]) for entry in entries})
+
+
+def queue_previous_reads(pipe, entries: List[Dict[str, str]]) -> None:
+    """
+    Read the stored rating and timestamp for each entry's message, then the
+    message IDs in the lowest-rated set: pass the replies to queue_store().
+    """
+    for entry in entries:
+        pipe.hmget(rating_key(entry["message_id"]), "rating", "timestamp")
+    pipe.zrange(LOWEST_KEY, 0, -1)
+
+
+def queue_store(pipe, entries: List[Dict[str, str]], reads: list) -> None:
+    """
+    Store rating hashes and update the aggregates. `reads` are the replies
+    to queue_previous_reads(): the (rating, timestamp) already stored for
+    each entry's message, so a changed rating replaces its old score in
+    the aggregates, and the lowest-rated IDs to check for expiry. `pipe`
+    must be a transaction WATCHing watched_keys() since they were read.
+    """
+    *previous, lowest_ids = reads
+    latest = {}
+    for entry, (old_rating, old_timestamp) in zip(entries, previous):
+        message_id = entry["message_id"]
+        # A message rated twice in one batch: compare with the earlier entry
+        if message_id in latest:
+            old_rating, old_timestamp = latest[message_id]
+        if old_rating is not None:
+            _queue_unrate(pipe, old_rating, old_timestamp)
+        _queue_aggregate(pipe, entry["rating"], entry["timestamp"])
+        latest[message_id] = (entry["rating"], entry["timestamp"])
+
+        key = rating_key(message_id)
+        pipe.hset(
+            key,
+            mapping={
+                "rating": entry["rating"],
+                "user_input": entry["user_input"],
+                "assistant_output": entry["assistant_output"],
+                "timestamp": entry["timestamp"],
+            },
+        )
+        pipe.expire(key, RATING_TTL_SECONDS)
+        pipe.zadd(LOWEST_KEY, {message_id: _lowest_score(entry)})
+    # Keep only the lowest-rated entries that are still stored
+    pipe.eval(
+        PRUNE_LOWEST_SCRIPT,
+        1 + len(lowest_ids),
+        LOWEST_KEY,
+        *[rating_key(message_id) for message_id in lowest_ids],
+        LOWEST_RATED_LIMIT,
+        *lowest_ids,
+    )
+
+
+def _lowest_score(entry: Dict[str, str]) -> float:
+    # Newer ratings sort first among equal scores; the offset stays below 1
+    timestamp = datetime.fromisoformat(entry["timestamp"]).timestamp()
+    return float(entry["rating"]) - timestamp / 1e10
+
+
+def _queue_aggregate(pipe, rating: str, timestamp: str) -> None:
+    pipe.hincrby(HISTOGRAM_KEY, rating, 1)
+    key = daily_key(timestamp[:10])
+    pipe.hincrby(key, "count", 1)
+    pipe.hincrbyfloat(key, "sum", float(rating))
+    pipe.expire(key, DAILY_TTL_SECONDS)
+
+
+def _queue_unrate(pipe, rating: str, timestamp: Optional[str]) -> None:
+    # Every key the script touches is passed in KEYS
+    keys = [HISTOGRAM_KEY]
+    if timestamp:
+        keys.append(daily_key(timestamp[:10]))
+    pipe.eval(UNRATE_SCRIPT, len(keys), *keys, rating)
+
+
+def daily_mean(client: "redis.Redis", day: str) -> Optional[float]:
+    """Mean rating on a UTC day (YYYY-MM-DD), or None without ratings."""
+    stats = client.hgetall(daily_key(day))
+    count = int(stats.get("count", 0))
+    return float(stats["sum"]) / count if count else None
+
+
+def histogram(client: "redis.Redis") -> Dict[str, int]:
+    """Count of stored ratings per score."""
+    return _score_counts(client.hgetall(HISTOGRAM_KEY))
+
+
+def _score_counts(histogram_hash: Dict[str, str]) -> Dict[str, int]:
+    return {score: int(count) for score, count in histogram_hash.items() if int(count)}
+
+
+def summary(
+    client: "redis.Redis",
+    days: int = 30,
+    lowest: int = 10,
+    today: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Rating report from the aggregates: counts per score, the mean over the
+    last `days` days, a per-day series and the `lowest` lowest-rated
+    messages. Two round trips.
+    """
+    end = datetime.fromisoformat(today) if today else datetime.utcnow()
+    day_names = [
+        (end - timedelta(days=offset)).strftime("%Y-%m-%d")
+        for offset in range(days - 1, -1, -1)
+    ]
+    lowest = min(lowest, LOWEST_RATED_LIMIT)
+
+    pipe = client.pipeline(transaction=False)
+    pipe.hgetall(HISTOGRAM_KEY)
+    for day in day_names:
+        pipe.hgetall(daily_key(day))
+    pipe.zrange(LOWEST_KEY, 0, lowest - 1)
+    pipe.xlen(STREAM_KEY)
+    replies = pipe.execute()
+    counts, daily, lowest_ids, queued = (
+        replies[0],
+        replies[1:-2],
+        replies[-2],
+        replies[-1],
+    )
+
+    pipe = client.pipeline(transaction=False)
+    for message_id in lowest_ids:
+        pipe.hmget(rating_key(message_id), "rating", "timestamp")
+    lowest_ratings = pipe.execute() if lowest_ids else []
+
+    series = []
+    total_count, total_sum = 0, 0.0
+    for day, stats in zip(day_names, daily):
+        count = int(stats.get("count", 0))
+        day_sum = float(stats.get("sum", 0))
+        total_count += count
+        total_sum += day_sum
+        series.append(
+            {"day": day, "count": count, "mean": day_sum / count if count else None}
+        )
+
+    return {
+        "counts": _score_counts(counts),
+        "window_days": days,
+        "window_count": total_count,
+        "rolling_mean": total_sum / total_count if total_count else None,
+        "series": series,
+        "lowest_rated": [
+            {"message_id": message_id, "rating": float(rating), "timestamp": timestamp}
+            for message_id, (rating, timestamp) in zip(lowest_ids, lowest_ratings)
+            # Skip ratings whose hash has expired
+            if rating is not None
+        ],
+        "backlog": queued,
+    }
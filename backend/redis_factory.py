@@ -0,0 +1,138 @@
+"""
+Redis client construction from config.
+
+Clients share one explicitly sized BlockingConnectionPool per process, so
+gunicorn threads queue for a connection (up to REDIS_POOL_TIMEOUT) instead of
+opening connections without bound. Size REDIS_MAX_CONNECTIONS so that
+workers * REDIS_MAX_CONNECTIONS stays under the server's connection limit;
+the pool's metrics() report saturation and how long requests wait.
+
+redis itself (and redis_pools, which subclasses its pools) is imported by
+the create functions, so importing this module stays cheap on cold starts.
+"""
+
+import contextvars
+import threading
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+import config
+
+if TYPE_CHECKING:
+    import redis
+    import redis.asyncio
+
+# Checkouts made in the current thread or task while they are counted; each
+# command or pipeline checks out one connection, so this is round trips
+_round_trips: contextvars.ContextVar[Optional[List[int]]] = contextvars.ContextVar(
+    "redis_round_trips", default=None
+)
+
+
+def start_round_trip_count() -> contextvars.Token:
+    """Count round trips made from here on in this context."""
+    return _round_trips.set([0])
+
+
+def stop_round_trip_count(token: contextvars.Token) -> int:
+    """Stop the count started with `token` and return it."""
+    count = _round_trips.get()[0]
+    _round_trips.reset(token)
+    return count
+
+
+class PoolStats:
+    """Thread-safe counters for connection checkouts from a pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def record(self, waited: float, blocked: bool, timed_out: bool = False) -> None:
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+                counter = _round_trips.get()
+                if counter is not None:
+                    counter[0] += 1
+            if blocked:
+                self.waits += 1
+                self.wait_seconds += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+                "wait_seconds": self.wait_seconds,
+                "max_wait_seconds": self.max_wait_seconds,
+            }
+
+
+def connection_kwargs() -> Dict[str, Any]:
+    """Connection settings shared by the sync and async clients."""
+    kwargs = {
+        "host": config.REDIS_HOST,
+        "port": config.REDIS_PORT,
+        "db": config.REDIS_DB,
+        "username": config.REDIS_USERNAME,
+        "password": config.REDIS_PASSWORD,
+        "decode_responses": True,  # so we get string outputs instead of bytes
+        # Bound every call so a stalled Redis cannot hang request threads
+        "socket_timeout": config.REDIS_SOCKET_TIMEOUT,
+        "socket_connect_timeout": config.REDIS_CONNECT_TIMEOUT,
+        "socket_keepalive": True,
+        # PING connections idle longer than this before reusing them
+        "health_check_interval": config.REDIS_HEALTH_CHECK_INTERVAL,
+    }
+    if config.REDIS_SSL:
+        kwargs["ssl_cert_reqs"] = config.REDIS_SSL_CERT_REQS
+        kwargs["ssl_ca_certs"] = config.REDIS_SSL_CA_CERTS
+    return kwargs
+
+
+def create_redis_client(socket_timeout: Optional[float] = None) -> "redis.Redis":
+    """
+    Build the process-wide Redis client; share it between threads.
+    Pass `socket_timeout` for clients that issue blocking commands.
+    """
+    import redis
+
+    from redis_pools import InstrumentedBlockingConnectionPool
+
+    kwargs = connection_kwargs()
+    if socket_timeout is not None:
+        kwargs["socket_timeout"] = socket_timeout
+    pool = InstrumentedBlockingConnectionPool(
+        max_connections=config.REDIS_MAX_CONNECTIONS,
+        timeout=config.REDIS_POOL_TIMEOUT,
+        connection_class=redis.SSLConnection if config.REDIS_SSL else redis.Connection,
+        **kwargs,
+    )
+    return redis.Redis(connection_pool=pool)
+
+
+def create_async_redis_client() -> "redis.asyncio.Redis":
+    """Build the Redis client for the ASGI app's event loop."""
+    import redis.asyncio
+
+    from redis_pools import InstrumentedAsyncBlockingConnectionPool
+
+    pool = InstrumentedAsyncBlockingConnectionPool(
+        max_connections=config.REDIS_MAX_CONNECTIONS,
+        timeout=config.REDIS_POOL_TIMEOUT,
+        connection_class=(
+            redis.asyncio.SSLConnection
+            if config.REDIS_SSL
+            else redis.asyncio.Connection
+        ),
+        **connection_kwargs(),
+    )
+    return redis.asyncio.Redis(connection_pool=pool)
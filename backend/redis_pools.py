@@ -0,0 +1,111 @@
+"""
+Redis connection pools that record checkout waits for redis_factory.
+
+Each pool counts its checkouts in a redis_factory.PoolStats, including how
+many had to wait for a free connection and how many timed out waiting;
+the waits and timeouts are also recorded in metrics.
+Kept apart from redis_factory because defining them imports redis.
+"""
+import asyncio
+import functools
+import queue
+import time
+from typing import Any, Dict
+
+import redis
+import redis.asyncio
+
+import metrics
+from redis_factory import PoolStats
+
+
+def _record_wait(stats: PoolStats, waited: float, timed_out: bool = False) -> None:
+    stats.record(waited, blocked=True, timed_out=timed_out)
+    metrics.observe_pool_wait(waited, timed_out=timed_out)
+
+
+class _TimedLifoQueue(queue.LifoQueue):
+    """Connection queue that records how long checkouts block."""
+
+    def __init__(self, stats: PoolStats, maxsize: int = 0):
+        super().__init__(maxsize)
+        self.stats = stats
+
+    def get(self, block: bool = True, timeout: float = None):
+        try:
+            item = super().get(block=False)
+        except queue.Empty:
+            if not block:
+                raise
+        else:
+            self.stats.record(0.0, blocked=False)
+            return item
+
+        start = time.perf_counter()
+        try:
+            item = super().get(block=True, timeout=timeout)
+        except queue.Empty:
+            _record_wait(self.stats, time.perf_counter() - start, timed_out=True)
+            raise
+        _record_wait(self.stats, time.perf_counter() - start)
+        return item
+
+
+class _TimedAsyncLifoQueue(asyncio.LifoQueue):
+    """asyncio counterpart of _TimedLifoQueue."""
+
+    def __init__(self, stats: PoolStats, maxsize: int = 0):
+        super().__init__(maxsize)
+        self.stats = stats
+
+    async def get(self):
+        try:
+            item = self.get_nowait()
+        except asyncio.QueueEmpty:
+            pass
+        else:
+            self.stats.record(0.0, blocked=False)
+            return item
+
+        start = time.perf_counter()
+        try:
+            item = await super().get()
+        except asyncio.CancelledError:
+            # The pool's timeout cancels the wait
+            _record_wait(self.stats, time.perf_counter() - start, timed_out=True)
+            raise
+        _record_wait(self.stats, time.perf_counter() - start)
+        return item
+
+
+class _PoolMetricsMixin:
+    def metrics(self) -> Dict[str, Any]:
+        """Pool size, saturation and checkout wait statistics."""
+        in_use = self.max_connections - self.pool.qsize()
+        return {
+            "max_connections": self.max_connections,
+            "created": len(self._connections),
+            "in_use": in_use,
+            "saturation": in_use / self.max_connections,
+            **self.stats.snapshot(),
+        }
+
+
+class InstrumentedBlockingConnectionPool(
+    _PoolMetricsMixin, redis.BlockingConnectionPool
+):
+    def __init__(self, **kwargs):
+        self.stats = PoolStats()
+        super().__init__(
+            queue_class=functools.partial(_TimedLifoQueue, self.stats), **kwargs
+        )
+
+
+class InstrumentedAsyncBlockingConnectionPool(
+    _PoolMetricsMixin, redis.asyncio.BlockingConnectionPool
+):
+    def __init__(self, **kwargs):
+        self.stats = PoolStats()
+        super().__init__(
+            queue_class=functools.partial(_TimedAsyncLifoQueue, self.stats), **kwargs
+        )
@@ -0,0 +1,130 @@
+"""
+Circuit breaker guarding calls to Redis.
+
+When Redis stalls or goes away, every request would otherwise wait on a
+socket timeout. After `failure_threshold` consecutive failures the breaker
+opens: calls skip Redis entirely and use their in-process fallback, and a
+background probe closes the breaker again once Redis answers.
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Optional, Tuple, Type
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+_RAISE = object()
+
+
+class CircuitOpenError(redis.ConnectionError):
+    """Raised instead of calling Redis while the circuit is open."""
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 3,
+        probe: Optional[Callable[[], Any]] = None,
+        probe_interval: float = 1.0,
+        errors: Optional[Tuple[Type[BaseException], ...]] = None,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.probe = probe
+        self.probe_interval = probe_interval
+        self.errors = errors or (redis.RedisError,)
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._open = False
+        self._probe_thread = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._open
+
+    def reset(self) -> None:
+        """Close the circuit and forget past failures."""
+        with self._lock:
+            self._failures = 0
+            self._open = False
+
+    def call(self, func: Callable[..., Any], *args, fallback=_RAISE, **kwargs) -> Any:
+        """
+        Run `func` unless the circuit is open. On failure, or while open,
+        return `fallback()` if a fallback was given, otherwise raise.
+        """
+        if self._open:
+            if fallback is _RAISE:
+                raise CircuitOpenError(f"{self.name} circuit is open")
+            return fallback()
+
+        try:
+            result = func(*args, **kwargs)
+        except self.errors as e:
+            self.record_failure(e)
+            if fallback is _RAISE:
+                raise
+            return fallback()
+
+        self.record_success()
+        return result
+
+    async def call_async(
+        self, func: Callable[..., Any], *args, fallback=_RAISE, **kwargs
+    ) -> Any:
+        """Like call(), for coroutine functions such as redis.asyncio commands."""
+        if self._open:
+            if fallback is _RAISE:
+                raise CircuitOpenError(f"{self.name} circuit is open")
+            return fallback()
+
+        try:
+            result = await func(*args, **kwargs)
+        except self.errors as e:
+            self.record_failure(e)
+            if fallback is _RAISE:
+                raise
+            return fallback()
+
+        self.record_success()
+        return result
+
+    def record_success(self) -> None:
+        self._failures = 0
+
+    def record_failure(self, error: BaseException) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._open or self._failures < self.failure_threshold:
+                return
+            self._open = True
+        logger.error(
+            "%s circuit opened after %d consecutive failures: %s",
+            self.name,
+            self.failure_threshold,
+            error,
+        )
+        self._start_probe()
+
+    def _start_probe(self) -> None:
+        if self.probe is None:
+            return
+        if self._probe_thread is not None and self._probe_thread.is_alive():
+            return
+        self._probe_thread = threading.Thread(
+            target=self._probe_until_closed, name=f"{self.name}-probe", daemon=True
+        )
+        self._probe_thread.start()
+
+    def _probe_until_closed(self) -> None:
+        while self._open:
+            time.sleep(self.probe_interval)
+            try:
+                self.probe()
+            except self.errors:
+                continue
+            logger.info("%s circuit closed, probe succeeded", self.name)
+            self.reset()
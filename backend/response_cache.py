@@ -0,0 +1,231 @@
+"""
+Response cache in front of call_gpt_api.
+
+Exact tier: responses are keyed on a normalized form of the prepared
+messages (system prompt, trimmed history, lowercased and whitespace-collapsed
+user text), so the same question asked in the same context is answered from
+Redis instead of another GPT call.
+
+Similarity tier (optional): first-turn questions also get a MinHash
+signature over their word shingles, indexed with LSH bands, so near
+duplicates like "what is bayes theorem?" / "what's bayes' theorem" can
+share an answer.
+
+Entries carry a TTL; run Redis with `maxmemory-policy volatile-lfu` (or
+volatile-lru) so that cache entries are evicted before memory runs out.
+"""
+import hashlib
+import json
+import random
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+if TYPE_CHECKING:
+    import redis
+    import redis.asyncio
+
+WHITESPACE = re.compile(r"\s+")
+WORD = re.compile(r"\w+")
+
+# MinHash parameters: NUM_BANDS * ROWS_PER_BAND permutations
+NUM_BANDS = 16
+ROWS_PER_BAND = 4
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(109)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_BANDS * ROWS_PER_BAND)
+]
+
+
+def normalize_text(text: str) -> str:
+    return WHITESPACE.sub(" ", text).strip()
+
+
+def normalize_messages(messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """The parts of a prepared message list that determine the answer."""
+    normalized = [
+        {"role": message["role"], "content": normalize_text(message["content"])}
+        for message in messages[:-1]
+    ]
+    normalized.append(
+        {"role": "user", "content": normalize_text(messages[-1]["content"]).lower()}
+    )
+    return normalized
+
+
+def _digest(value) -> str:
+    encoded = json.dumps(value, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def minhash_signature(text: str, shingle_size: int = 2) -> List[int]:
+    """MinHash signature over word shingles of `text`."""
+    words = WORD.findall(text.lower())
+    shingles = {
+        " ".join(words[i : i + shingle_size])
+        for i in range(max(1, len(words) - shingle_size + 1))
+    }
+    hashes = [
+        int.from_bytes(
+            hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big"
+        )
+        for s in shingles
+    ]
+    return [
+        min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS
+    ]
+
+
+def estimate_similarity(first: List[int], second: List[int]) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    return sum(a == b for a, b in zip(first, second)) / len(first)
+
+
+@dataclass
+class CacheHit:
+    response: str
+    kind: str  # "exact" or "similar"
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        ttl_seconds: int = 60 * 60 * 24,
+        similarity_enabled: bool = False,
+        similarity_threshold: float = 0.8,
+        prefix: str = "cache:response",
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.similarity_enabled = similarity_enabled
+        self.similarity_threshold = similarity_threshold
+        self.prefix = prefix
+        self.stats = Counter()
+        self._lock = threading.Lock()
+
+    def key(self, messages: List[Dict[str, str]]) -> str:
+        return f"{self.prefix}:{_digest(normalize_messages(messages))}"
+
+    def get(
+        self, client: "redis.Redis", messages: List[Dict[str, str]]
+    ) -> Optional[CacheHit]:
+        """Look up a cached response, counting the outcome in `stats`."""
+        response = client.get(self.key(messages))
+        if response is not None:
+            self._count("exact_hits")
+            return CacheHit(response, "exact")
+
+        if self._similarity_applies(messages):
+            response = self._get_similar(client, messages)
+            if response is not None:
+                self._count("similar_hits")
+                return CacheHit(response, "similar")
+
+        self._count("misses")
+        return None
+
+    async def get_async(
+        self, client: "redis.asyncio.Redis", messages: List[Dict[str, str]]
+    ) -> Optional[CacheHit]:
+        """get() for a redis.asyncio client."""
+        response = await client.get(self.key(messages))
+        if response is not None:
+            self._count("exact_hits")
+            return CacheHit(response, "exact")
+
+        if self._similarity_applies(messages):
+            signature = minhash_signature(messages[-1]["content"])
+            band_keys = self._band_keys(messages, signature)
+            candidates = {key for key in await client.mget(band_keys) if key}
+            if candidates:
+                pipe = client.pipeline()
+                self._queue_candidate_reads(pipe, candidates)
+                response = self._best_match(signature, await pipe.execute())
+                if response is not None:
+                    self._count("similar_hits")
+                    return CacheHit(response, "similar")
+
+        self._count("misses")
+        return None
+
+    def set(
+        self, client: "redis.Redis", messages: List[Dict[str, str]], response: str
+    ) -> None:
+        pipe = client.pipeline()
+        self.queue_set(pipe, messages, response)
+        pipe.execute()
+
+    async def set_async(
+        self,
+        client: "redis.asyncio.Redis",
+        messages: List[Dict[str, str]],
+        response: str,
+    ) -> None:
+        """set() for a redis.asyncio client."""
+        pipe = client.pipeline()
+        self.queue_set(pipe, messages, response)
+        await pipe.execute()
+
+    def queue_set(self, pipe, messages: List[Dict[str, str]], response: str) -> None:
+        """Add the writes of set() to a caller's pipeline."""
+        key = self.key(messages)
+        pipe.set(key, response, ex=self.ttl_seconds)
+        if self._similarity_applies(messages):
+            signature = minhash_signature(messages[-1]["content"])
+            pipe.set(
+                f"{key}:signature", ",".join(map(str, signature)), ex=self.ttl_seconds
+            )
+            for band_key in self._band_keys(messages, signature):
+                pipe.set(band_key, key, ex=self.ttl_seconds)
+
+    def _count(self, outcome: str) -> None:
+        with self._lock:
+            self.stats[outcome] += 1
+
+    def _similarity_applies(self, messages: List[Dict[str, str]]) -> bool:
+        # Only first-turn questions: later turns depend on the conversation
+        return self.similarity_enabled and len(messages) == 2
+
+    def _band_keys(
+        self, messages: List[Dict[str, str]], signature: List[int]
+    ) -> List[str]:
+        # Bands are scoped to the system prompt so prompt edits start fresh
+        system_digest = _digest(normalize_text(messages[0]["content"]))[:16]
+        return [
+            f"{self.prefix}:lsh:{system_digest}:{band}:"
+            + _digest(signature[band * ROWS_PER_BAND : (band + 1) * ROWS_PER_BAND])[:16]
+            for band in range(NUM_BANDS)
+        ]
+
+    def _get_similar(
+        self, client: "redis.Redis", messages: List[Dict[str, str]]
+    ) -> Optional[str]:
+        signature = minhash_signature(messages[-1]["content"])
+        candidates = {
+            key for key in client.mget(self._band_keys(messages, signature)) if key
+        }
+        if not candidates:
+            return None
+
+        pipe = client.pipeline()
+        self._queue_candidate_reads(pipe, candidates)
+        return self._best_match(signature, pipe.execute())
+
+    def _queue_candidate_reads(self, pipe, candidates) -> None:
+        for key in candidates:
+            pipe.get(f"{key}:signature")
+            pipe.get(key)
+
+    def _best_match(self, signature: List[int], results: list) -> Optional[str]:
+        best_response, best_similarity = None, self.similarity_threshold
+        for raw_signature, response in zip(results[::2], results[1::2]):
+            if raw_signature is None or response is None:
+                continue
+            candidate = [int(value) for value in raw_signature.split(",")]
+            similarity = estimate_similarity(signature, candidate)
+            if similarity >= best_similarity:
+                best_response, best_similarity = response, similarity
+        return best_response
@@ -0,0 +1,704 @@
+"""
+Request coalescing (single-flight) for identical chat prompts.
+
+When many students send the same question at once, only one ChatCompletion
+call should go out. Requests are keyed on the same normalized prepared
+messages as the response cache. Within a worker, the first request becomes
+the leader and the others wait on its future, without touching Redis.
+
+A key that has had followers in this worker is contended for a while
+(`contended_ttl`), and only then do its leaders coordinate with other
+workers: they race for a short-lived Redis lock, the winner calls the API,
+stores the response under a result key and publishes on the key's channel,
+and the rest wait on that channel instead of polling. An uncontended chat
+turn therefore makes no Redis calls here at all. The result key outlives
+the call by `result_ttl`, so requests that arrive late still find it.
+
+Followers give up waiting after `wait_timeout` and call the API themselves,
+so a stuck leader delays requests but never fails them. A leader's error
+is shared with the followers that were waiting on it in the same worker;
+other workers are woken when the lock is released and elect a new leader.
+Redis calls go through `breaker`, and any Redis failure falls back to a
+direct call.
+
+Streamed calls are shared the same way with stream() and stream_async().
+Followers in the leader's worker replay its chunks as they arrive; other
+workers wait on the Redis lock as above and get the complete text as one
+chunk. A follower that has not received anything when the leader's
+request goes away, or when `wait_timeout` passes without a new chunk,
+streams the call itself.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import (
+    TYPE_CHECKING,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+)
+
+from response_cache import normalize_messages
+
+if TYPE_CHECKING:
+    import asyncio
+
+    import redis
+    import redis.asyncio
+
+    from resilience import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+# Return the shared result if there is one, otherwise try to take the lock:
+# KEYS = lock, result; ARGV = token, lock TTL (ms). Replies with the result,
+# 1 if the lock was taken, or 0 if another worker holds it.
+ACQUIRE_SCRIPT = """
+local result = redis.call("GET", KEYS[2])
+if result then
+    return result
+end
+if redis.call("SET", KEYS[1], ARGV[1], "NX", "PX", ARGV[2]) then
+    return 1
+end
+return 0
+"""
+
+# Store the result, release the lock if we still hold it and wake waiting
+# workers: KEYS = lock, result; ARGV = token, result, result TTL (ms), channel
+PUBLISH_SCRIPT = """
+redis.call("SET", KEYS[2], ARGV[2], "PX", ARGV[3])
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    redis.call("DEL", KEYS[1])
+end
+return redis.call("PUBLISH", ARGV[4], "done")
+"""
+
+# Release the lock after a failed call and wake waiting workers so one of
+# them takes over: KEYS = lock; ARGV = token, channel
+RELEASE_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    redis.call("DEL", KEYS[1])
+    return redis.call("PUBLISH", ARGV[2], "released")
+end
+return 0
+"""
+
+_SHAS = {
+    script: hashlib.sha1(script.encode("utf-8")).hexdigest()
+    for script in (ACQUIRE_SCRIPT, PUBLISH_SCRIPT, RELEASE_SCRIPT)
+}
+
+# Contended keys are forgotten once they expire and this many are tracked
+MAX_CONTENDED_KEYS = 1024
+
+
+def _eval(client: "redis.Redis", script: str, keys: List[str], args: list):
+    import redis
+
+    try:
+        return client.evalsha(_SHAS[script], len(keys), *keys, *args)
+    except redis.exceptions.NoScriptError:
+        # First use on this server (or after SCRIPT FLUSH)
+        client.script_load(script)
+        return client.evalsha(_SHAS[script], len(keys), *keys, *args)
+
+
+def _redis_errors():
+    # Only evaluated once a Redis call has failed, so redis is imported
+    import redis
+
+    return redis.RedisError
+
+
+async def _eval_async(
+    client: "redis.asyncio.Redis", script: str, keys: List[str], args: list
+):
+    import redis
+
+    try:
+        return await client.evalsha(_SHAS[script], len(keys), *keys, *args)
+    except redis.exceptions.NoScriptError:
+        await client.script_load(script)
+        return await client.evalsha(_SHAS[script], len(keys), *keys, *args)
+
+
+class _StreamAbandoned(Exception):
+    """The leader's request went away before its stream finished."""
+
+
+class _Broadcast:
+    """A leader's streamed chunks, replayed to followers in other threads."""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._changed = threading.Condition()
+
+    def append(self, chunk: str) -> None:
+        with self._changed:
+            self.chunks.append(chunk)
+            self._changed.notify_all()
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        with self._changed:
+            self.done = True
+            self.error = error
+            self._changed.notify_all()
+
+    def replay(self, timeout: float) -> Iterator[str]:
+        """
+        Yield every chunk, waiting up to `timeout` for each new one. Raises
+        the leader's error, or FutureTimeoutError.
+        """
+        sent = 0
+        while True:
+            with self._changed:
+                if not self._changed.wait_for(
+                    lambda: self.done or len(self.chunks) > sent, timeout
+                ):
+                    raise FutureTimeoutError()
+                chunks, done, error = self.chunks[sent:], self.done, self.error
+            sent += len(chunks)
+            yield from chunks
+            if done:
+                if error is not None:
+                    raise error
+                return
+
+
+class _AsyncBroadcast:
+    """_Broadcast for followers on the leader's event loop."""
+
+    def __init__(self):
+        import asyncio
+
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._changed = asyncio.Event()
+
+    def _notify(self) -> None:
+        import asyncio
+
+        # Waiters hold the old event; the next wait needs a fresh one
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def append(self, chunk: str) -> None:
+        self.chunks.append(chunk)
+        self._notify()
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self.done = True
+        self.error = error
+        self._notify()
+
+    async def replay(self, timeout: float) -> AsyncIterator[str]:
+        """replay() for a coroutine; raises asyncio.TimeoutError."""
+        import asyncio
+
+        sent = 0
+        while True:
+            if sent < len(self.chunks):
+                sent += 1
+                yield self.chunks[sent - 1]
+                continue
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await asyncio.wait_for(self._changed.wait(), timeout)
+
+
+class SingleFlight:
+    def __init__(
+        self,
+        wait_timeout: float = 30.0,
+        lock_ttl: float = 60.0,
+        result_ttl: float = 30.0,
+        contended_ttl: float = 60.0,
+        prefix: str = "singleflight",
+        breaker: Optional["CircuitBreaker"] = None,
+    ):
+        self.wait_timeout = wait_timeout
+        self.lock_ttl = lock_ttl
+        self.result_ttl = result_ttl
+        self.contended_ttl = contended_ttl
+        self.prefix = prefix
+        self.breaker = breaker
+        self.stats = Counter()
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self._inflight_async: Dict[str, "asyncio.Task"] = {}
+        self._inflight_streams: Dict[str, _Broadcast] = {}
+        self._inflight_streams_async: Dict[str, _AsyncBroadcast] = {}
+        # Key -> when it stops being treated as contended (monotonic)
+        self._contended: Dict[str, float] = {}
+
+    def key(self, messages: List[Dict[str, str]]) -> str:
+        encoded = json.dumps(
+            normalize_messages(messages), sort_keys=True, ensure_ascii=False
+        ).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    def lock_key(self, key: str) -> str:
+        return f"{self.prefix}:lock:{key}"
+
+    def result_key(self, key: str) -> str:
+        return f"{self.prefix}:result:{key}"
+
+    def channel(self, key: str) -> str:
+        return f"{self.prefix}:done:{key}"
+
+    def _count(self, stat: str) -> None:
+        with self._lock:
+            self.stats[stat] += 1
+
+    def mark_contended(self, key: str) -> None:
+        """Coordinate calls for `key` across workers for `contended_ttl`."""
+        now = time.monotonic()
+        with self._lock:
+            if len(self._contended) >= MAX_CONTENDED_KEYS:
+                self._contended = {
+                    other: until
+                    for other, until in self._contended.items()
+                    if until > now
+                }
+            self._contended[key] = now + self.contended_ttl
+
+    def is_contended(self, key: str) -> bool:
+        with self._lock:
+            until = self._contended.get(key)
+            if until is not None and until <= time.monotonic():
+                del self._contended[key]
+                until = None
+        return until is not None
+
+    def _redis(self, func, *args, **kwargs):
+        if self.breaker is None:
+            return func(*args, **kwargs)
+        return self.breaker.call(func, *args, **kwargs)
+
+    async def _redis_async(self, func, *args, **kwargs):
+        if self.breaker is None:
+            return await func(*args, **kwargs)
+        return await self.breaker.call_async(func, *args, **kwargs)
+
+    def do(
+        self,
+        messages: List[Dict[str, str]],
+        func: Callable[[], str],
+        client: Optional["redis.Redis"] = None,
+    ) -> str:
+        """
+        Return func()'s result, sharing one call among concurrent requests
+        with the same messages. Without a client, only requests in this
+        process are coalesced.
+        """
+        key = self.key(messages)
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+
+        if not leader:
+            self._count("coalesced")
+            self.mark_contended(key)
+            try:
+                return future.result(timeout=self.wait_timeout)
+            except FutureTimeoutError:
+                self._count("timeouts")
+                return func()
+
+        try:
+            if client is None or not self.is_contended(key):
+                result = func()
+            else:
+                result = self._call_across_workers(client, key, func)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def _call_across_workers(
+        self, client: "redis.Redis", key: str, func: Callable[[], str]
+    ) -> str:
+        token = uuid.uuid4().hex
+        reply = self._acquire(client, key, token)
+        if isinstance(reply, str):
+            self._count("shared")
+            return reply
+        if reply != 1:
+            return func()
+
+        self._count("calls")
+        try:
+            result = func()
+        except BaseException:
+            self._release(client, key, token)
+            raise
+        self._publish(client, key, token, result)
+        return result
+
+    def _publish(
+        self, client: "redis.Redis", key: str, token: str, result: str
+    ) -> None:
+        self._redis_best_effort(
+            _eval,
+            client,
+            PUBLISH_SCRIPT,
+            [self.lock_key(key), self.result_key(key)],
+            [token, result, int(self.result_ttl * 1000), self.channel(key)],
+        )
+
+    def _release(self, client: "redis.Redis", key: str, token: str) -> None:
+        self._redis_best_effort(
+            _eval,
+            client,
+            RELEASE_SCRIPT,
+            [self.lock_key(key)],
+            [token, self.channel(key)],
+        )
+
+    def stream(
+        self,
+        messages: List[Dict[str, str]],
+        func: Callable[[], Iterator[str]],
+        client: Optional["redis.Redis"] = None,
+    ) -> Iterator[str]:
+        """
+        Yield func()'s chunks, sharing one streamed call among concurrent
+        requests with the same messages, like do().
+        """
+        key = self.key(messages)
+        with self._lock:
+            broadcast = self._inflight_streams.get(key)
+            leader = broadcast is None
+            if leader:
+                broadcast = self._inflight_streams[key] = _Broadcast()
+
+        if not leader:
+            self._count("coalesced")
+            self.mark_contended(key)
+            sent = False
+            try:
+                for chunk in broadcast.replay(self.wait_timeout):
+                    sent = True
+                    yield chunk
+            except (FutureTimeoutError, _StreamAbandoned) as e:
+                if sent:
+                    raise
+                if isinstance(e, FutureTimeoutError):
+                    self._count("timeouts")
+                yield from func()
+            return
+
+        try:
+            if client is None or not self.is_contended(key):
+                chunks = func()
+            else:
+                chunks = self._stream_across_workers(client, key, func)
+            for chunk in chunks:
+                broadcast.append(chunk)
+                yield chunk
+        except GeneratorExit:
+            broadcast.finish(_StreamAbandoned())
+            raise
+        except BaseException as e:
+            broadcast.finish(e)
+            raise
+        else:
+            broadcast.finish()
+        finally:
+            with self._lock:
+                del self._inflight_streams[key]
+
+    def _stream_across_workers(
+        self, client: "redis.Redis", key: str, func: Callable[[], Iterator[str]]
+    ) -> Iterator[str]:
+        token = uuid.uuid4().hex
+        reply = self._acquire(client, key, token)
+        if isinstance(reply, str):
+            self._count("shared")
+            yield reply
+            return
+        if reply != 1:
+            yield from func()
+            return
+
+        self._count("calls")
+        pieces = []
+        try:
+            for chunk in func():
+                pieces.append(chunk)
+                yield chunk
+        except BaseException:
+            self._release(client, key, token)
+            raise
+        self._publish(client, key, token, "".join(pieces))
+
+    def _acquire(self, client: "redis.Redis", key: str, token: str):
+        """
+        Wait until another worker's result is available (returned) or this
+        worker holds the lock (1). Returns None on timeout or Redis failure.
+        """
+        keys = [self.lock_key(key), self.result_key(key)]
+        deadline = time.monotonic() + self.wait_timeout
+        pubsub = None
+        try:
+            while True:
+                reply = self._redis(
+                    _eval,
+                    client,
+                    ACQUIRE_SCRIPT,
+                    keys,
+                    [token, int(self.lock_ttl * 1000)],
+                )
+                if isinstance(reply, str) or reply == 1:
+                    return reply
+                if pubsub is None:
+                    # Look again once subscribed, so a publish in between
+                    # is not missed
+                    pubsub = client.pubsub(ignore_subscribe_messages=True)
+                    self._redis(pubsub.subscribe, self.channel(key))
+                    continue
+                if not self._wait_for_message(pubsub, deadline):
+                    self._count("timeouts")
+                    return None
+        except _redis_errors() as e:
+            logger.warning("Single-flight lock unavailable: %s", e)
+            return None
+        finally:
+            if pubsub is not None:
+                self._redis_best_effort(pubsub.reset)
+
+    def _wait_for_message(self, pubsub, deadline: float) -> bool:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            # Subscribe confirmations come back as None
+            if self._redis(pubsub.get_message, timeout=remaining) is not None:
+                return True
+
+    def _redis_best_effort(self, func, *args):
+        try:
+            return self._redis(func, *args)
+        except _redis_errors() as e:
+            logger.warning("Could not update single-flight state: %s", e)
+
+    async def do_async(
+        self,
+        messages: List[Dict[str, str]],
+        func: Callable[[], Awaitable[str]],
+        client: Optional["redis.asyncio.Redis"] = None,
+    ) -> str:
+        """do() for coroutine functions and a redis.asyncio client."""
+        import asyncio
+
+        key = self.key(messages)
+        task = self._inflight_async.get(key)
+        if task is None:
+            if client is None or not self.is_contended(key):
+                task = asyncio.ensure_future(func())
+            else:
+                task = asyncio.ensure_future(
+                    self._call_across_workers_async(client, key, func)
+                )
+            self._inflight_async[key] = task
+            task.add_done_callback(lambda _: self._inflight_async.pop(key, None))
+            # Leaders wait as long as it takes; a cancelled request must not
+            # cancel the call its followers are waiting on
+            return await asyncio.shield(task)
+
+        self._count("coalesced")
+        self.mark_contended(key)
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), self.wait_timeout)
+        except asyncio.TimeoutError:
+            self._count("timeouts")
+            return await func()
+
+    async def _call_across_workers_async(
+        self,
+        client: "redis.asyncio.Redis",
+        key: str,
+        func: Callable[[], Awaitable[str]],
+    ) -> str:
+        token = uuid.uuid4().hex
+        reply = await self._acquire_async(client, key, token)
+        if isinstance(reply, str):
+            self._count("shared")
+            return reply
+        if reply != 1:
+            return await func()
+
+        self._count("calls")
+        try:
+            result = await func()
+        except BaseException:
+            await self._release_async(client, key, token)
+            raise
+        await self._publish_async(client, key, token, result)
+        return result
+
+    async def _publish_async(
+        self, client: "redis.asyncio.Redis", key: str, token: str, result: str
+    ) -> None:
+        await self._redis_best_effort_async(
+            _eval_async,
+            client,
+            PUBLISH_SCRIPT,
+            [self.lock_key(key), self.result_key(key)],
+            [token, result, int(self.result_ttl * 1000), self.channel(key)],
+        )
+
+    async def _release_async(
+        self, client: "redis.asyncio.Redis", key: str, token: str
+    ) -> None:
+        await self._redis_best_effort_async(
+            _eval_async,
+            client,
+            RELEASE_SCRIPT,
+            [self.lock_key(key)],
+            [token, self.channel(key)],
+        )
+
+    async def stream_async(
+        self,
+        messages: List[Dict[str, str]],
+        func: Callable[[], AsyncIterator[str]],
+        client: Optional["redis.asyncio.Redis"] = None,
+    ) -> AsyncIterator[str]:
+        """stream() for async generators and a redis.asyncio client."""
+        import asyncio
+
+        key = self.key(messages)
+        broadcast = self._inflight_streams_async.get(key)
+        if broadcast is not None:
+            self._count("coalesced")
+            self.mark_contended(key)
+            sent = False
+            try:
+                async for chunk in broadcast.replay(self.wait_timeout):
+                    sent = True
+                    yield chunk
+            except (asyncio.TimeoutError, _StreamAbandoned) as e:
+                if sent:
+                    raise
+                if isinstance(e, asyncio.TimeoutError):
+                    self._count("timeouts")
+                async for chunk in func():
+                    yield chunk
+            return
+
+        broadcast = self._inflight_streams_async[key] = _AsyncBroadcast()
+        try:
+            if client is None or not self.is_contended(key):
+                chunks = func()
+            else:
+                chunks = self._stream_across_workers_async(client, key, func)
+            async for chunk in chunks:
+                broadcast.append(chunk)
+                yield chunk
+        except (GeneratorExit, asyncio.CancelledError):
+            broadcast.finish(_StreamAbandoned())
+            raise
+        except BaseException as e:
+            broadcast.finish(e)
+            raise
+        else:
+            broadcast.finish()
+        finally:
+            del self._inflight_streams_async[key]
+
+    async def _stream_across_workers_async(
+        self,
+        client: "redis.asyncio.Redis",
+        key: str,
+        func: Callable[[], AsyncIterator[str]],
+    ) -> AsyncIterator[str]:
+        token = uuid.uuid4().hex
+        reply = await self._acquire_async(client, key, token)
+        if isinstance(reply, str):
+            self._count("shared")
+            yield reply
+            return
+        if reply != 1:
+            async for chunk in func():
+                yield chunk
+            return
+
+        self._count("calls")
+        pieces = []
+        try:
+            async for chunk in func():
+                pieces.append(chunk)
+                yield chunk
+        except BaseException:
+            await self._release_async(client, key, token)
+            raise
+        await self._publish_async(client, key, token, "".join(pieces))
+
+    async def _acquire_async(self, client: "redis.asyncio.Redis", key: str, token: str):
+        """_acquire() for a redis.asyncio client."""
+        keys = [self.lock_key(key), self.result_key(key)]
+        deadline = time.monotonic() + self.wait_timeout
+        pubsub = None
+        try:
+            while True:
+                reply = await self._redis_async(
+                    _eval_async,
+                    client,
+                    ACQUIRE_SCRIPT,
+                    keys,
+                    [token, int(self.lock_ttl * 1000)],
+                )
+                if isinstance(reply, str) or reply == 1:
+                    return reply
+                if pubsub is None:
+                    pubsub = client.pubsub(ignore_subscribe_messages=True)
+                    await self._redis_async(pubsub.subscribe, self.channel(key))
+                    continue
+                if not await self._wait_for_message_async(pubsub, deadline):
+                    self._count("timeouts")
+                    return None
+        except _redis_errors() as e:
+            logger.warning("Single-flight lock unavailable: %s", e)
+            return None
+        finally:
+            if pubsub is not None:
+                await self._redis_best_effort_async(pubsub.reset)
+
+    async def _wait_for_message_async(self, pubsub, deadline: float) -> bool:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            message = await self._redis_async(pubsub.get_message, timeout=remaining)
+            if message is not None:
+                return True
+
+    async def _redis_best_effort_async(self, func, *args):
+        try:
+            return await self._redis_async(func, *args)
+        except _redis_errors() as e:
+            logger.warning("Could not update single-flight state: %s", e)
@@ -0,0 +1,264 @@
+"""
+In-memory serving of the React build (frontend/build).
+
+StaticAssets reads the build once at startup, so requests for the frontend
+never touch the filesystem:
+
+- Every file gets its ETag computed up front. Files named in
+  asset-manifest.json under static/ carry a content hash in their name and
+  are served with `Cache-Control: immutable` for a year; everything else,
+  index.html included, is revalidated with its ETag.
+- Text assets also get gzip and, when the brotli module is installed,
+  brotli variants, picked per request from Accept-Encoding. Variants are
+  read from <file>.gz / <file>.br if the build has them (write them with
+  `python static_assets.py` after `npm run build`), otherwise compressed
+  once here.
+- Files larger than MAX_IN_MEMORY_BYTES, i.e. source maps, are left on
+  disk and sent from there.
+
+With lazy=True only the file list is read up front, and each file is
+loaded (and compressed) on its first request, so a serverless cold start
+pays only for the files it serves.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import sys
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+
+from flask import Request, Response, send_file
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+MAX_IN_MEMORY_BYTES = 1024 * 1024
+# Smaller files are not worth a Content-Encoding
+MIN_COMPRESS_BYTES = 256
+COMPRESSIBLE_EXTENSIONS = {
+    ".css",
+    ".html",
+    ".ico",
+    ".js",
+    ".json",
+    ".map",
+    ".svg",
+    ".ttf",
+    ".txt",
+}
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+# Source maps are JSON
+mimetypes.add_type("application/json", ".map")
+
+# Preferred first when the client accepts several
+ENCODINGS = ("br", "gzip")
+EXTENSIONS = {"br": ".br", "gzip": ".gz"}
+
+
+@dataclass
+class StaticAsset:
+    content_type: str
+    etag: str
+    cache_control: str
+    # Content-Encoding -> body; "identity" is the uncompressed file
+    bodies: Dict[str, bytes] = field(default_factory=dict)
+    # Set instead of bodies for files served from disk
+    file_path: Optional[str] = None
+
+
+def compress(data: bytes, encoding: str, best: bool = False) -> Optional[bytes]:
+    """`data` compressed with `encoding`, or None if that is unavailable."""
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=9 if best else 6, mtime=0)
+    if encoding == "br" and brotli is not None:
+        return brotli.compress(data, quality=11 if best else 5)
+    return None
+
+
+def accepted_encodings(accept_encoding: str) -> Dict[str, float]:
+    """Accept-Encoding as {coding: q}."""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        name, _, value = params.strip().partition("=")
+        if name.strip() == "q":
+            try:
+                q = float(value)
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip()] = q
+    return accepted
+
+
+def negotiate(accept_encoding: str, available) -> str:
+    accepted = accepted_encodings(accept_encoding)
+    best, best_q = "identity", 0.0
+    for encoding in ENCODINGS:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if encoding in available and q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class StaticAssets:
+    def __init__(self, root: str, lazy: bool = False):
+        self.root = os.path.abspath(root)
+        self.lazy = lazy
+        self.assets: Dict[str, StaticAsset] = {}
+        # Not yet loaded, with lazy: path -> (file path, immutable)
+        self.pending: Dict[str, Tuple[str, bool]] = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self) -> None:
+        if not os.path.isdir(self.root):
+            logger.warning("No frontend build at %s; only the API is served", self.root)
+            return
+        hashed = self.hashed_paths()
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if os.path.splitext(filename)[1] in (".gz", ".br"):
+                    continue
+                file_path = os.path.join(dirpath, filename)
+                path = os.path.relpath(file_path, self.root).replace(os.sep, "/")
+                if self.lazy:
+                    self.pending[path] = (file_path, path in hashed)
+                else:
+                    self.assets[path] = self.load_asset(file_path, path in hashed)
+
+    def hashed_paths(self) -> set:
+        """Content-hashed files named in asset-manifest.json."""
+        try:
+            with open(os.path.join(self.root, "asset-manifest.json"), "rb") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return set()
+        return {
+            url.lstrip("/")
+            for url in manifest.get("files", {}).values()
+            if url.startswith("/static/")
+        }
+
+    def load_asset(self, file_path: str, immutable: bool) -> StaticAsset:
+        with open(file_path, "rb") as f:
+            data = f.read()
+        content_type = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+        if content_type.startswith("text/") or content_type in (
+            "application/javascript",
+            "application/json",
+        ):
+            content_type += "; charset=utf-8"
+        asset = StaticAsset(
+            content_type=content_type,
+            etag=hashlib.sha1(data).hexdigest()[:20],
+            cache_control=IMMUTABLE if immutable else REVALIDATE,
+        )
+        if len(data) > MAX_IN_MEMORY_BYTES:
+            asset.file_path = file_path
+            return asset
+
+        asset.bodies["identity"] = data
+        extension = os.path.splitext(file_path)[1]
+        if extension in COMPRESSIBLE_EXTENSIONS and len(data) >= MIN_COMPRESS_BYTES:
+            for encoding in ENCODINGS:
+                body = self.read_variant(file_path, encoding) or compress(
+                    data, encoding
+                )
+                if body is not None and len(body) < len(data):
+                    asset.bodies[encoding] = body
+        return asset
+
+    @staticmethod
+    def read_variant(file_path: str, encoding: str) -> Optional[bytes]:
+        variant_path = file_path + EXTENSIONS[encoding]
+        # Ignore variants left over from an earlier build
+        if not os.path.exists(variant_path) or os.path.getmtime(
+            variant_path
+        ) < os.path.getmtime(file_path):
+            return None
+        with open(variant_path, "rb") as f:
+            return f.read()
+
+    def load_pending(self, path: str) -> Optional[StaticAsset]:
+        if path not in self.pending:
+            return None
+        with self._lock:
+            if path in self.pending:
+                file_path, immutable = self.pending[path]
+                self.assets[path] = self.load_asset(file_path, immutable)
+                del self.pending[path]
+        return self.assets[path]
+
+    def response(self, path: str, request: Request) -> Optional[Response]:
+        """The asset at `path` for `request`, or None if there is none."""
+        asset = self.assets.get(path) or self.load_pending(path)
+        if asset is None:
+            return None
+        if asset.file_path:
+            response = send_file(
+                asset.file_path,
+                mimetype=asset.content_type,
+                etag=asset.etag,
+                conditional=True,
+            )
+        else:
+            encoding = negotiate(
+                request.headers.get("Accept-Encoding", ""), asset.bodies
+            )
+            response = Response(asset.bodies[encoding], content_type=asset.content_type)
+            if encoding == "identity":
+                response.set_etag(asset.etag)
+            else:
+                response.headers["Content-Encoding"] = encoding
+                # Each representation needs its own strong ETag
+                response.set_etag(f"{asset.etag}-{encoding}")
+            if len(asset.bodies) > 1:
+                response.vary.add("Accept-Encoding")
+            response.make_conditional(request)
+        response.headers["Cache-Control"] = asset.cache_control
+        return response
+
+
+def precompress(root: str) -> None:
+    """Write .gz (and .br, with brotli installed) variants next to the build."""
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            extension = os.path.splitext(filename)[1]
+            file_path = os.path.join(dirpath, filename)
+            if (
+                extension not in COMPRESSIBLE_EXTENSIONS
+                or os.path.getsize(file_path) < MIN_COMPRESS_BYTES
+            ):
+                continue
+            with open(file_path, "rb") as f:
+                data = f.read()
+            for encoding in ENCODINGS:
+                body = compress(data, encoding, best=True)
+                if body is not None and len(body) < len(data):
+                    with open(file_path + EXTENSIONS[encoding], "wb") as f:
+                        f.write(body)
+
+
+if __name__ == "__main__":
+    # Usage: python static_assets.py [build directory]
+    build_dir = (
+        sys.argv[1]
+        if len(sys.argv) > 1
+        else os.path.join(os.path.dirname(__file__), "../frontend/build")
+    )
+    precompress(build_dir)
+    if brotli is None:
+        print("brotli is not installed; wrote gzip variants only", file=sys.stderr)
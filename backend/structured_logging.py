@@ -0,0 +1,217 @@
+"""
+Queue-based, structured logging.
+
+setup_logging() routes every record through a QueueHandler: the request
+thread only puts the record on a bounded in-memory queue, and a background
+QueueListener formats it and writes it to stderr. When the queue is full,
+records are dropped and counted instead of blocking the request.
+
+Records are one JSON object per line with the time, level, logger, message,
+the ID of the request being served (see request_id_var) and any fields
+passed with `extra=`. Records of the event types a client can trigger in a
+loop (SAMPLED_EVENTS: policy violations and rate-limited requests) are
+sampled per type: at most `events_per_second` of each are written per
+second, and the next one written carries how many were suppressed. Other
+records are always written. Records dropped by sampling or because the
+queue was full are counted in metrics.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import re
+import sys
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Dict, Iterable, Optional
+
+import metrics
+
+# The request being served, set by the app for the duration of a request
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has; anything else came from `extra=`
+_RECORD_ATTRIBUTES = set(logging.LogRecord("", 0, "", 0, "", None, None).__dict__) | {
+    "message",
+    "asctime",
+    "request_id",
+}
+
+# Event types that are sampled; records of any other type are all written
+SAMPLED_EVENTS = ("policy_violation", "rate_limited")
+
+# Client-supplied X-Request-ID values are used only if they look like IDs
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+_listener: Optional["_Listener"] = None
+
+
+def request_id_from(header: Optional[str]) -> str:
+    """The client's X-Request-ID if it is a plausible ID, else a new one."""
+    if header and REQUEST_ID_PATTERN.match(header):
+        return header
+    return uuid.uuid4().hex
+
+
+class RequestIdFilter(logging.Filter):
+    """Tags records with the current request ID, in the logging thread."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class EventSamplingFilter(logging.Filter):
+    """
+    Passes at most `events_per_second` records per `event` each second, for
+    the event types in `events`.
+    """
+
+    def __init__(self, events_per_second: int, events: Iterable[str] = SAMPLED_EVENTS):
+        super().__init__()
+        self.events_per_second = events_per_second
+        self.events = frozenset(events)
+        self._lock = threading.Lock()
+        # event -> [window start, records passed, records suppressed]
+        self._windows: Dict[str, list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, "event", None)
+        if event not in self.events:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(event)
+            if window is None or now - window[0] >= 1.0:
+                suppressed = window[2] if window else 0
+                window = self._windows[event] = [now, 0, 0]
+            else:
+                suppressed = 0
+            sampled_out = window[1] >= self.events_per_second
+            if sampled_out:
+                window[2] += 1
+            else:
+                window[1] += 1
+        if sampled_out:
+            metrics.observe_dropped_log_record("sampled", event)
+            return False
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records when the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            metrics.observe_dropped_log_record(
+                "queue_full", getattr(record, "event", None)
+            )
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve the message and traceback now, since args and exc_info may
+        # not survive until the listener gets to the record, but leave the
+        # formatting to the listener
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class _Listener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # Wait for room rather than fail when stopping with a full queue
+        self.queue.put(self._sentinel)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S")
+            + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+JsonFormatter.converter = time.gmtime
+
+
+def setup_logging(
+    level: str = "INFO",
+    json_format: bool = True,
+    queue_size: int = 10000,
+    events_per_second: int = 10,
+    sampled_events: Iterable[str] = SAMPLED_EVENTS,
+    stream=None,
+) -> DroppingQueueHandler:
+    """
+    Send the root logger's records through a queue to a background writer.
+    Replaces any earlier setup; returns the queue handler.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(
+        JsonFormatter()
+        if json_format
+        else logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    )
+    log_queue = queue.Queue(maxsize=queue_size)
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(RequestIdFilter())
+    handler.addFilter(EventSamplingFilter(events_per_second, sampled_events))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        if isinstance(existing, DroppingQueueHandler) or (
+            type(existing) is logging.StreamHandler
+        ):
+            root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    _listener = _Listener(log_queue, output)
+    _listener.start()
+    return handler
+
+
+def flush_logging() -> None:
+    """Write out everything queued so far."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener.start()
+
+
+@atexit.register
+def _stop_listener() -> None:
+    if _listener is not None:
+        _listener.stop()
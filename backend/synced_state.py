@@ -0,0 +1,132 @@
+"""
+In-process state kept in sync with a versioned copy in Redis.
+
+PolicyEngine (policy.py) and PromptRegistry (prompts.py) both serve
+requests from something compiled in memory out of data TAs edit in Redis.
+SyncedState holds the part they share: the version key is polled at most
+once every `refresh_seconds`, the data is only read and compiled again
+when the version changed, and a message on the invalidation channel,
+sent by publish_update(), forces a check on the next refresh.
+"""
+import threading
+import time
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    import redis
+    import redis.asyncio
+
+_FETCH = object()
+
+
+class SyncedState:
+    """
+    Base class for state compiled from Redis. Subclasses set `version_key`
+    and `invalidate_channel`, and implement _default() (the data to serve
+    before anything is loaded), _load() and _load_async() (read the data
+    from Redis, seeding it if missing) and _compile() (build and swap in
+    the state from the data).
+    """
+
+    version_key: str
+    invalidate_channel: str
+
+    def __init__(self, refresh_seconds: float, subscribe: bool = True):
+        self.refresh_seconds = refresh_seconds
+        self.subscribe = subscribe
+        self._lock = threading.Lock()
+        self._listener = None
+        self.reset()
+
+    def reset(self) -> None:
+        """Drop the loaded state so the next refresh reloads from Redis."""
+        self._compile(self._default())
+        self._version = None
+        self._loaded = False
+        self._stale = True
+        self._checked_at = 0.0
+
+    def invalidate(self) -> None:
+        """Force a version check on the next call to refresh()."""
+        self._stale = True
+
+    def needs_refresh(self) -> bool:
+        return (
+            self._stale or time.monotonic() - self._checked_at >= self.refresh_seconds
+        )
+
+    def refresh(self, client: "redis.Redis", version=_FETCH) -> None:
+        """
+        Reload from Redis if the version changed. Redis errors propagate to
+        the caller; the current state is kept. Pass `version` if the
+        version key was already read, e.g. in a pipeline.
+        """
+        if not self.needs_refresh():
+            return
+
+        with self._lock:
+            if not self.needs_refresh():
+                return
+            # Marked fresh before any I/O: if Redis fails, the last compiled
+            # state keeps serving and the next attempt waits a full interval
+            self._stale = False
+            self._checked_at = time.monotonic()
+            if self.subscribe and self._listener is None:
+                self._listen(client)
+            if version is _FETCH:
+                version = client.get(self.version_key)
+            if self._loaded and version == self._version:
+                return
+            self._compile(self._load(client))
+            self._version = version
+            self._loaded = True
+
+    async def refresh_async(
+        self, client: "redis.asyncio.Redis", version=_FETCH
+    ) -> None:
+        """
+        refresh() for a redis.asyncio client. Does not start the pub/sub
+        listener, which needs a sync client.
+        """
+        if not self.needs_refresh():
+            return
+        # No lock here: marking the state fresh before awaiting keeps other
+        # coroutines on this event loop from starting a second reload
+        self._stale = False
+        self._checked_at = time.monotonic()
+        if version is _FETCH:
+            version = await client.get(self.version_key)
+        if self._loaded and version == self._version:
+            return
+        self._compile(await self._load_async(client))
+        self._version = version
+        self._loaded = True
+
+    def _default(self) -> Any:
+        raise NotImplementedError
+
+    def _load(self, client: "redis.Redis") -> Any:
+        raise NotImplementedError
+
+    async def _load_async(self, client: "redis.asyncio.Redis") -> Any:
+        raise NotImplementedError
+
+    def _compile(self, data: Any) -> None:
+        raise NotImplementedError
+
+    def _listen(self, client: "redis.Redis") -> None:
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{self.invalidate_channel: lambda message: self.invalidate()})
+        self._listener = pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+
+def publish_update(
+    pipe: "redis.client.Pipeline", version_key: str, channel: str, message: str
+) -> None:
+    """
+    Bump `version_key` and notify all workers on `channel`, then execute
+    `pipe`, so the edits already queued on it land in the same transaction.
+    """
+    pipe.incr(version_key)
+    pipe.publish(channel, message)
+    pipe.execute()
@@ -1,19 +1,139 @@
 # tests/conftest.py
 import pytest
 import fakeredis
+import fakeredis.aioredis
+import redis
+import app as app_module
 from app import app  # Ensure this import points to your Flask app instance
 
 
 @pytest.fixture(autouse=True)
-def fake_redis(monkeypatch):
+def fake_redis_server():
+    # Shared by the sync and async fake clients
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture(autouse=True)
+def fake_redis(monkeypatch, fake_redis_server):
     # Create a fake Redis client that behaves like the real one
-    fake_redis_client = fakeredis.FakeStrictRedis(decode_responses=True)
+    fake_redis_client = fakeredis.FakeStrictRedis(
+        server=fake_redis_server, decode_responses=True)
     # Override the redis_client in our app with the fake one
     monkeypatch.setattr("app.redis_client", fake_redis_client)
+    # Make in-process caches reload from the fresh fake Redis
+    app_module.policy_engine.reset()
+    app_module.prompt_registry.reset()
+    app_module.redis_breaker.reset()
+    app_module.local_chat_rate_limiter.reset()
+    app_module.local_rating_rate_limiter.reset()
     yield fake_redis_client
 
 
+@pytest.fixture
+def async_fake_redis(monkeypatch, fake_redis_server):
+    # Async client for the ASGI app, seeing the same data as fake_redis
+    async_client = fakeredis.aioredis.FakeRedis(
+        server=fake_redis_server, decode_responses=True)
+    monkeypatch.setattr("asgi.async_redis_client", async_client)
+    return async_client
+
+
+@pytest.fixture
+def rating_worker(fake_redis):
+    # Stores queued ratings when a test calls poll()
+    from rating_worker import RatingWorker
+    worker = RatingWorker(fake_redis, "test-worker", flush_interval=0.01)
+    worker.ensure_group()
+    return worker
+
+
+def fake_completion(model, messages):
+    # A known reply, with token usage, in the ChatCompletion format
+    return {"choices": [{"message": {"content": "Assistant response"}}],
+            "usage": {"prompt_tokens": 120, "completion_tokens": 30}}
+
+
+@pytest.fixture
+def patch_openai(monkeypatch):
+    # Answer the app's model calls with fake_completion instead of OpenAI
+    monkeypatch.setattr("app.llm_client.create", fake_completion)
+
+
 @pytest.fixture
 def client():
     with app.test_client() as client:
         yield client
+
+
+class CountingRedis:
+    """
+    Wraps a Redis client and records every round trip: the name of each
+    command sent, or "pipeline" for each pipeline executed.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    @property
+    def calls(self):
+        return len(self.commands)
+
+    def pipeline(self, *args, **kwargs):
+        return CountingPipeline(self, self.client.pipeline(*args, **kwargs))
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if not callable(attr):
+            return attr
+
+        def wrapper(*args, **kwargs):
+            self.commands.append(name)
+            return attr(*args, **kwargs)
+
+        return wrapper
+
+
+class CountingPipeline:
+    def __init__(self, counter, pipe):
+        self.counter = counter
+        self.pipe = pipe
+
+    def __getattr__(self, name):
+        return getattr(self.pipe, name)
+
+    def execute(self, *args, **kwargs):
+        self.counter.commands.append("pipeline")
+        return self.pipe.execute(*args, **kwargs)
+
+
+@pytest.fixture
+def counting_redis(fake_redis):
+    return CountingRedis(fake_redis)
+
+
+class FaultyRedis:
+    """Wraps a Redis client and fails every command while `failing` is set."""
+
+    def __init__(self, client):
+        self.client = client
+        self.failing = False
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if not callable(attr):
+            return attr
+
+        def wrapper(*args, **kwargs):
+            if self.failing:
+                raise redis.ConnectionError("injected fault")
+            return attr(*args, **kwargs)
+
+        return wrapper
+
+
+@pytest.fixture
+def faulty_redis(monkeypatch, fake_redis):
+    faulty = FaultyRedis(fake_redis)
+    monkeypatch.setattr("app.redis_client", faulty)
+    return faulty
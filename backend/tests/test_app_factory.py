@@ -0,0 +1,74 @@
+import json
+import os
+import subprocess
+import sys
+
+import app as app_module
+from app import LazyClient, create_app
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(BACKEND_DIR)
+
+
+def run_python(code, cwd=BACKEND_DIR):
+    env = dict(os.environ, OPENAI_API_KEY="test", LOG_LEVEL="WARNING")
+    result = subprocess.run([sys.executable, "-c", code], cwd=cwd, env=env,
+                            check=True, capture_output=True, text=True)
+    return json.loads(result.stdout)
+
+
+def test_create_app_builds_independent_apps():
+    first, second = create_app(), create_app()
+    assert first is not second
+    for flask_app in (first, second):
+        response = flask_app.test_client().get("/api/health")
+        assert response.status_code == 200
+        assert response.get_json() == {"status": "ok"}
+    assert app_module.app.url_map is not first.url_map
+
+
+def test_health_and_frontend_need_no_clients():
+    state = run_python(
+        "import json, sys\n"
+        "import app\n"
+        "client = app.create_app(preload_frontend=False).test_client()\n"
+        "client.get('/api/health')\n"
+        "client.get('/')\n"
+        "print(json.dumps({\n"
+        "    'redis': app.redis_client._client is not None,\n"
+        "    'llm': app.llm_client._client is not None,\n"
+        "    'modules': [m for m in ('openai', 'aiohttp', 'requests',\n"
+        "                            'flask_cors') if m in sys.modules],\n"
+        "}))")
+    assert state == {"redis": False, "llm": False, "modules": ["flask_cors"]}
+
+
+def test_lazy_client_creates_once_and_forwards():
+    created = []
+
+    class Client:
+        url = "http://localhost"
+
+    def factory():
+        created.append(Client())
+        return created[-1]
+
+    lazy = LazyClient(factory)
+    assert created == []
+    assert lazy.url == "http://localhost"
+    lazy.url = "http://stub"
+    assert created[0].url == "http://stub"
+    del lazy.url
+    assert lazy.url == "http://localhost"
+    assert len(created) == 1
+
+
+def test_vercel_entry_point_serves_wsgi():
+    state = run_python(
+        "import json, runpy\n"
+        "from werkzeug.test import Client\n"
+        "app = runpy.run_path('api/index.py')['app']\n"
+        "response = Client(app).get('/api/health')\n"
+        "print(json.dumps([response.status_code, response.get_json()]))",
+        cwd=REPO_DIR)
+    assert state == [200, {"status": "ok"}]
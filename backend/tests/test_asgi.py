@@ -0,0 +1,377 @@
+# tests/test_asgi.py
+import asyncio
+import json
+import pytest
+import redis
+from prometheus_client import REGISTRY
+import asgi
+import tracing
+from tracing import FileExporter
+
+
+def asgi_request(path, payload=None, method="POST", headers=(), body=None):
+    """Run one request through the ASGI app and return (status, headers, body)."""
+    if body is None:
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode("utf-8"),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"content-type", b"application/json")] + list(headers),
+        "client": ("127.0.0.1", 5000),
+        "server": ("testserver", 80),
+    }
+    incoming = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return incoming.pop(0) if incoming else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    async def run():
+        try:
+            await asgi.application(scope, receive, send)
+        finally:
+            # Connections are bound to this event loop; drop them before the
+            # next asyncio.run
+            pool = getattr(asgi.async_redis_client, "connection_pool", None)
+            if pool is not None:
+                await pool.disconnect()
+
+    asyncio.run(run())
+    start = sent[0]
+    response_headers = {k.decode(): v.decode() for k, v in start["headers"]}
+    response_body = b"".join(m.get("body", b"") for m in sent[1:])
+    return start["status"], response_headers, response_body
+
+
+def parse_events(body):
+    events = []
+    for block in body.decode("utf-8").strip().split("\n\n"):
+        event_line, data_line = block.split("\n")
+        events.append((event_line[len("event: "):],
+                       json.loads(data_line[len("data: "):])))
+    return events
+
+
+@pytest.fixture(autouse=True)
+def patch_openai(monkeypatch, async_fake_redis):
+    async def fake_acreate(model, messages, stream=False):
+        if not stream:
+            return {"choices": [{"message": {"content": "Assistant response"}}]}
+
+        async def chunks():
+            for token in ["Think ", "about ", "the ", "sample ", "space."]:
+                yield {"choices": [{"delta": {"content": token}}]}
+        return chunks()
+
+    monkeypatch.setattr("app.llm_client.acreate", fake_acreate)
+
+
+def test_chat_success():
+    status, headers, body = asgi_request(
+        "/api/chat", {"message": "Hello", "sessionId": "session-1"})
+    data = json.loads(body)
+    assert status == 200
+    assert data == {"assistant_message": "Assistant response",
+                    "session_id": "session-1"}
+    assert headers["ratelimit-limit"] == "3"
+    assert headers["access-control-allow-origin"] == "https://tutorgpt.onrender.com"
+
+
+def test_chat_shares_history_with_sync_app(client, fake_redis):
+    asgi_request("/api/chat", {"message": "Hello", "sessionId": "session-1"})
+    assert fake_redis.llen("conversation:session-1") == 2
+
+    # The sync app sees the history written by the async one
+    import app as app_module
+    history = app_module.get_conversation_history("session-1")
+    assert history[0]["role"] == "user"
+    assert history[0]["content"] == "Hello"
+
+
+def test_chat_empty_message():
+    status, _, body = asgi_request("/api/chat", {"message": ""})
+    assert status == 400
+    assert json.loads(body)["error"] == "Invalid request"
+
+
+def test_chat_malformed_json():
+    status, _, body = asgi_request("/api/chat", body=b"{not json")
+    assert status == 400
+    assert "JSON" in json.loads(body)["message"]
+
+
+def test_chat_policy_violation():
+    status, _, body = asgi_request(
+        "/api/chat", {"message": "please help me cheat on the exam"})
+    assert status == 200
+    assert "cannot help" in json.loads(body)["assistant_message"]
+
+
+def test_chat_rate_limited():
+    for _ in range(3):
+        asgi_request("/api/chat", {"message": "Hello"})
+    status, headers, _ = asgi_request("/api/chat", {"message": "Hello"})
+    assert status == 429
+    assert "retry-after" in headers
+
+
+def test_chat_streaming(fake_redis):
+    status, headers, body = asgi_request(
+        "/api/chat",
+        {"message": "Hello", "sessionId": "session-1", "stream": True})
+    assert status == 200
+    assert headers["content-type"].startswith("text/event-stream")
+
+    events = parse_events(body)
+    streamed = "".join(data["content"] for event, data in events if event == "delta")
+    assert streamed == "Think about the sample space."
+    assert events[-1] == ("done", {"assistant_message": streamed,
+                                   "session_id": "session-1"})
+    assert fake_redis.llen("conversation:session-1") == 2
+
+
+def test_streamed_events_match_the_sync_app(client, monkeypatch):
+    monkeypatch.setattr("config.RESPONSE_CACHE_ENABLED", False)
+
+    def fake_stream(model, messages, stream):
+        for token in ["Think ", "about ", "the ", "sample ", "space."]:
+            yield {"choices": [{"delta": {"content": token}}]}
+
+    monkeypatch.setattr("app.llm_client.create", fake_stream)
+    payload = {"message": "Hello", "sessionId": "session-1", "stream": True}
+    sync_body = client.post("/api/chat", json=payload).get_data()
+    _, _, async_body = asgi_request(
+        "/api/chat", dict(payload, sessionId="session-2"))
+    assert parse_events(async_body) == [
+        (event, dict(data, session_id="session-2")
+         if "session_id" in data else data)
+        for event, data in parse_events(sync_body)]
+
+
+def test_concurrent_streamed_chats_make_one_model_call(monkeypatch):
+    monkeypatch.setattr("config.RESPONSE_CACHE_ENABLED", False)
+    calls = []
+
+    async def fake_acreate(model, messages, stream=False):
+        calls.append(1)
+
+        async def chunks():
+            for token in ["Think ", "about ", "the ", "sample ", "space."]:
+                await asyncio.sleep(0.02)
+                yield {"choices": [{"delta": {"content": token}}]}
+        return chunks()
+
+    monkeypatch.setattr("app.llm_client.acreate", fake_acreate)
+
+    async def chat(i):
+        sent = []
+        incoming = [{"type": "http.request", "more_body": False,
+                     "body": json.dumps({"message": "Hello", "stream": True,
+                                         "sessionId": f"s{i}"}).encode()}]
+
+        async def receive():
+            return incoming.pop(0) if incoming else {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "method": "POST", "path": "/api/chat",
+                 "headers": [], "client": ("127.0.0.1", 5000)}
+        await asgi.application(scope, receive, send)
+        return parse_events(b"".join(m.get("body", b"") for m in sent[1:]))
+
+    async def run():
+        try:
+            return await asyncio.gather(*(chat(i) for i in range(3)))
+        finally:
+            await asgi.async_redis_client.connection_pool.disconnect()
+
+    for events in asyncio.run(run()):
+        assert events[-1][1]["assistant_message"] == \
+            "Think about the sample space."
+    assert len(calls) == 1
+
+
+def test_chat_reuses_cached_response(monkeypatch):
+    calls = []
+    original = asgi.app.llm_client.acreate
+
+    async def counting_acreate(**kwargs):
+        calls.append(kwargs)
+        return await original(**kwargs)
+
+    monkeypatch.setattr("app.llm_client.acreate", counting_acreate)
+    # Same first-turn question in two fresh sessions
+    asgi_request("/api/chat", {"message": "What is a PMF?", "sessionId": "a"})
+    asgi_request("/api/chat", {"message": "what is a  PMF?", "sessionId": "b"})
+    assert len(calls) == 1
+
+
+def test_rate_stores_rating(fake_redis, rating_worker):
+    status, _, body = asgi_request(
+        "/api/rate", {"messageId": "m1", "rating": 4, "userInput": "Hi"})
+    assert status == 200
+    assert json.loads(body)["status"] == "success"
+    rating_worker.poll()
+    stored = fake_redis.hgetall("rating:m1")
+    assert stored["rating"] == "4"
+    assert stored["user_input"] == "Hi"
+    assert fake_redis.ttl("rating:m1") > 0
+
+
+def test_rate_invalid_rating():
+    status, _, _ = asgi_request("/api/rate", {"messageId": "m1", "rating": 9})
+    assert status == 400
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_chat_records_metrics():
+    stages = ["load_state", "policy", "prepare_messages", "cache_lookup",
+              "llm", "filter", "save"]
+    before = {stage: sample("tutorgpt_stage_seconds_count", endpoint="chat",
+                            stage=stage) for stage in stages}
+    requests_before = sample("tutorgpt_request_seconds_count",
+                             endpoint="chat", status="200")
+    round_trips_before = sample("tutorgpt_redis_round_trips_count",
+                                endpoint="chat")
+
+    status, _, _ = asgi_request(
+        "/api/chat", {"message": "Hello", "sessionId": "session-1"})
+    assert status == 200
+
+    for stage in stages:
+        assert sample("tutorgpt_stage_seconds_count", endpoint="chat",
+                      stage=stage) == before[stage] + 1, stage
+    assert sample("tutorgpt_request_seconds_count", endpoint="chat",
+                  status="200") == requests_before + 1
+    assert sample("tutorgpt_redis_round_trips_count",
+                  endpoint="chat") == round_trips_before + 1
+
+
+def test_rate_limited_requests_are_counted():
+    before = sample("tutorgpt_rate_limited_total", endpoint="chat")
+    statuses = [asgi_request("/api/chat", {"message": f"Question {i}"})[0]
+                for i in range(5)]
+    assert statuses.count(429) == 2
+    assert sample("tutorgpt_rate_limited_total", endpoint="chat") == before + 2
+
+
+def test_rate_records_metrics():
+    before = {stage: sample("tutorgpt_stage_seconds_count", endpoint="rate",
+                            stage=stage) for stage in ("rate_limit", "queue")}
+    requests_before = sample("tutorgpt_request_seconds_count",
+                             endpoint="rate", status="200")
+
+    status, _, _ = asgi_request("/api/rate", {"messageId": "m1", "rating": 4})
+    assert status == 200
+
+    for stage, count in before.items():
+        assert sample("tutorgpt_stage_seconds_count", endpoint="rate",
+                      stage=stage) == count + 1, stage
+    assert sample("tutorgpt_request_seconds_count", endpoint="rate",
+                  status="200") == requests_before + 1
+
+
+@pytest.fixture
+def spans(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracing.configure(FileExporter(str(path)))
+
+    def read():
+        finished = [json.loads(line) for line in path.read_text().splitlines()]
+        return {span["name"]: span for span in finished}
+
+    yield read
+    tracing.configure(None)
+
+
+def test_chat_is_traced(spans):
+    status, headers, _ = asgi_request(
+        "/api/chat", {"message": "What is a random variable?"})
+    assert status == 200
+
+    finished = spans()
+    root = finished["POST /api/chat"]
+    assert root["trace_id"] == headers["x-trace-id"]
+    assert root["parent_id"] is None
+    assert root["attributes"]["http.status_code"] == 200
+    assert root["attributes"]["request_id"] == headers["x-request-id"]
+    for name in ["load_state", "policy", "prepare_messages", "cache_lookup",
+                 "llm", "filter", "save"]:
+        assert finished[name]["parent_id"] == root["span_id"], name
+
+    load_state = finished["load_state"]
+    assert finished["redis.read_chat_state"]["parent_id"] == \
+        load_state["span_id"]
+    assert finished["rate_limit.check"]["parent_id"] == load_state["span_id"]
+    assert finished["llm.completion"]["parent_id"] == \
+        finished["llm"]["span_id"]
+
+
+def test_streamed_chat_is_traced(spans):
+    asgi_request("/api/chat", {"message": "Hello", "stream": True})
+
+    finished = spans()
+    root = finished["POST /api/chat"]
+    stream = finished["stream"]
+    assert stream["parent_id"] == root["span_id"]
+    assert "first_chunk_ms" in stream["attributes"]
+    assert finished["save"]["parent_id"] == root["span_id"]
+    # The root span ends once the whole body has been sent
+    assert root["end_ns"] >= finished["save"]["end_ns"]
+
+
+def test_rate_is_traced_with_the_callers_traceparent(spans):
+    trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+    status, headers, _ = asgi_request(
+        "/api/rate", {"messageId": "m1", "rating": 4},
+        headers=[(b"traceparent", f"00-{trace_id}-00f067aa0ba902b7-01"
+                  .encode())])
+    assert status == 200
+    assert headers["x-trace-id"] == trace_id
+
+    finished = spans()
+    root = finished["POST /api/rate"]
+    assert root["parent_id"] == "00f067aa0ba902b7"
+    for name in ["rate_limit", "queue"]:
+        assert finished[name]["parent_id"] == root["span_id"], name
+
+
+def test_other_paths_are_served_by_flask():
+    status, _, _ = asgi_request("/api/chat", method="OPTIONS", headers=[
+        (b"origin", b"http://localhost:3000"),
+        (b"access-control-request-method", b"POST")])
+    assert status == 200
+
+
+def test_async_redis_failure_uses_fallbacks(monkeypatch):
+    class DownRedis:
+        connection_pool = None
+
+        def __getattr__(self, name):
+            async def fail(*args, **kwargs):
+                raise redis.ConnectionError("injected fault")
+            return fail
+
+        def pipeline(self, *args, **kwargs):
+            raise redis.ConnectionError("injected fault")
+
+    monkeypatch.setattr("asgi.async_redis_client", DownRedis())
+    status, headers, body = asgi_request("/api/chat", {"message": "Hello"})
+    assert status == 200
+    assert json.loads(body)["assistant_message"] == "Assistant response"
+    # Rate limiting fell back to the in-process limiter
+    assert headers["ratelimit-limit"] == "3"
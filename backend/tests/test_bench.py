@@ -0,0 +1,112 @@
+import json
+import time
+
+import app as app_module
+import pytest
+from bench import compare, parse_mix, run_benchmark
+from bench.load import percentile
+from bench.stages import StageTimer
+from bench.startup import (
+    BACKEND_DIR,
+    budget_failures,
+    parse_importtime,
+    run_probe,
+)
+from llm_stub import StubChatCompletionServer
+
+
+@pytest.fixture
+def stub():
+    with StubChatCompletionServer(reply_words=(5, 20)) as server:
+        yield server
+
+
+def test_benchmark_reports_latency_and_stages(fake_redis, stub):
+    report = run_benchmark(app_module, fake_redis, stub.api_base, users=3,
+                           duration=30, max_requests=30,
+                           mix={"chat": 2, "stream": 1, "rate": 1})
+
+    assert report["requests"] == 30
+    assert report["errors"] == 0
+    assert set(report["latency_ms"]) == {"p50", "p95", "p99", "mean", "max"}
+    assert sum(e["requests"] for e in report["endpoints"].values()) == 30
+    assert {"redis", "policy", "llm"} <= set(report["stages_ms"])
+    assert report["llm_client"]["requests"] == len(stub.requests)
+    # Ratings were stored by the worker
+    assert fake_redis.xlen("ratings:stream") == 0
+
+
+def test_benchmark_restores_the_app(fake_redis, stub):
+    url = app_module.llm_client.url
+    run_benchmark(app_module, fake_redis, stub.api_base, users=1,
+                  max_requests=1, rating_worker=False)
+
+    assert app_module.redis_client is fake_redis
+    assert app_module.chat_rate_limiter.limit == 3
+    assert app_module.llm_client.url == url
+    assert "create" not in vars(app_module.llm_client)
+
+
+def test_stage_time_is_exclusive():
+    timer = StageTimer()
+    with timer.stage("policy"):
+        with timer.stage("redis"):
+            time.sleep(0.02)
+    assert timer.seconds["redis"] >= 0.02
+    assert timer.seconds["policy"] < 0.01
+
+
+def test_percentile():
+    values = [float(i) for i in range(1, 101)]
+    assert percentile(values, 0.5) == 50
+    assert percentile(values, 0.99) == 99
+    assert percentile([], 0.5) == 0
+
+
+def test_parse_mix():
+    assert parse_mix("chat=3, rate=1") == {"chat": 3, "rate": 1}
+    with pytest.raises(ValueError):
+        parse_mix("upload=1")
+
+
+def test_compare_flags_regressions():
+    baseline = {"throughput_rps": 100, "latency_ms": {"p95": 200}}
+    report = {"throughput_rps": 80, "latency_ms": {"p95": 190}}
+    lines = compare(baseline, report)
+    assert lines[0].startswith("throughput_rps") and lines[0].endswith("worse")
+    assert not lines[1].endswith("worse")
+
+
+def test_parse_importtime_totals_app_and_its_imports():
+    stderr = "\n".join([
+        "import time: self [us] | cumulative | imported package",
+        "import time:       100 |        100 |   _io",
+        "import time:       200 |       5000 |     flask.app",
+        "import time:       300 |      90000 |   flask",
+        "import time:       400 |      30000 |   redis",
+        "import time:       500 |     150000 | app",
+    ])
+    imports = parse_importtime(stderr, top=2)
+    assert imports["app_ms"] == 150
+    assert imports["heaviest"] == [
+        {"module": "flask", "ms": 90},
+        {"module": "redis", "ms": 30},
+    ]
+
+
+def test_budget_failures():
+    report = {"import_ms": 250.0, "deferred_imported": []}
+    assert budget_failures(report, 300) == []
+    assert budget_failures(dict(report, import_ms=340.0), 300) == [
+        "import app took 340.0 ms, over the 300 ms budget"]
+    assert budget_failures(dict(report, import_ms=340.0), 0) == []
+    failures = budget_failures(dict(report, deferred_imported=["redis"]), 300)
+    assert failures == [
+        "import app imported redis, which should load on first use"]
+
+
+def test_import_app_leaves_deferred_modules_unloaded():
+    result = run_probe(BACKEND_DIR, ("/api/health",), lazy_frontend=True)
+    sample = json.loads(result.stdout.strip().splitlines()[-1])
+    assert sample["deferred_imported"] == []
+    assert sample["status"] == {"/api/health": 200}
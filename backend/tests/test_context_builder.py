@@ -0,0 +1,205 @@
+# tests/test_context_builder.py
+import hashlib
+import json
+import socket
+
+import pytest
+import app as app_module
+from app import append_conversation_history, history_key, prepare_messages
+from context_builder import (
+    ENCODING_FILES,
+    ContextBuilder,
+    TokenCounter,
+    encoding_name,
+    encoding_path,
+    estimate_tokens,
+    token_budget,
+    TOKENS_PER_MESSAGE,
+)
+
+SYSTEM = {"role": "system", "content": "You are a tutor."}
+
+
+def make_history(turns):
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"question {i} " * 10})
+        history.append({"role": "assistant", "content": f"answer {i} " * 10})
+    return history
+
+
+def word_counter(monkeypatch):
+    """Count one token per word so budgets are easy to reason about."""
+    monkeypatch.setattr(
+        "context_builder._load_encoder",
+        lambda model_name, cache_dir: lambda text: len(text.split()))
+
+
+@pytest.mark.parametrize(
+    "model_name,expected",
+    [
+        ("gpt-4", 6144),
+        ("gpt-4-32k", 24576),
+        ("gpt-4-0613", 6144),
+        ("gpt-3.5-turbo-16k-0613", 12288),
+        ("ft:gpt-3.5-turbo-0613:stanford::abc123", 3072),
+        ("some-other-model", 3072),
+    ],
+)
+def test_token_budget_per_model(model_name, expected):
+    assert token_budget(model_name) == expected
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("a b c") == 3
+    # Long words count as several tokens
+    assert estimate_tokens("probability") > 1
+
+
+def test_token_counter_memoizes(monkeypatch):
+    calls = []
+
+    def load(model_name, cache_dir):
+        def encode(text):
+            calls.append(text)
+            return len(text.split())
+        return encode
+
+    monkeypatch.setattr("context_builder._load_encoder", load)
+    counter = TokenCounter("gpt-4")
+    assert counter.count("one two three") == 3
+    assert counter.count("one two three") == 3
+    assert calls == ["one two three"]
+
+
+@pytest.fixture
+def no_network(monkeypatch):
+    """Fail, and record, any attempt to open a network connection."""
+    attempts = []
+
+    def connect(*args, **kwargs):
+        attempts.append(args)
+        raise OSError("network access is blocked in this test")
+
+    monkeypatch.setattr(socket.socket, "connect", connect)
+    monkeypatch.setattr(socket, "create_connection", connect)
+    monkeypatch.setattr(socket, "getaddrinfo", connect)
+    return attempts
+
+
+def test_missing_encoding_is_estimated_without_download(tmp_path, no_network):
+    counter = TokenCounter("gpt-4", cache_dir=str(tmp_path))
+    text = "What is the variance of a Bernoulli random variable?"
+    assert counter.count(text) == estimate_tokens(text)
+    assert no_network == []
+
+
+def test_corrupt_encoding_is_not_refetched(tmp_path, no_network):
+    url, _ = ENCODING_FILES["cl100k_base"]
+    (tmp_path / hashlib.sha1(url.encode()).hexdigest()).write_bytes(b"junk")
+    assert encoding_path("cl100k_base", str(tmp_path)) is None
+    counter = TokenCounter("gpt-4", cache_dir=str(tmp_path))
+    counter.load()
+    assert counter.count("a b c") == estimate_tokens("a b c")
+    assert no_network == []
+
+
+@pytest.mark.parametrize(
+    "model_name,expected",
+    [
+        ("gpt-4", "cl100k_base"),
+        ("gpt-3.5-turbo-0613", "cl100k_base"),
+        ("ft:gpt-3.5-turbo-0613:stanford::abc123", "cl100k_base"),
+        ("some-other-model", "cl100k_base"),
+    ],
+)
+def test_encoding_name(model_name, expected):
+    pytest.importorskip("tiktoken")
+    assert encoding_name(model_name) == expected
+
+
+def test_stored_token_count_is_used(monkeypatch):
+    word_counter(monkeypatch)
+    counter = TokenCounter("gpt-4")
+    message = {"role": "user", "content": "one two three", "tokens": 7}
+    assert counter.message_tokens(message) == 7 + TOKENS_PER_MESSAGE
+
+
+def test_build_keeps_everything_within_budget(monkeypatch):
+    word_counter(monkeypatch)
+    builder = ContextBuilder("gpt-4", budget=1000)
+    history = make_history(3)
+    messages = builder.build(SYSTEM, history, "new question")
+
+    assert messages[0] == SYSTEM
+    assert messages[1:-1] == history
+    assert messages[-1] == {"role": "user", "content": "new question"}
+
+
+def test_build_drops_oldest_turns_over_budget(monkeypatch):
+    word_counter(monkeypatch)
+    # Each turn costs 2 * (20 + TOKENS_PER_MESSAGE) = 48 tokens
+    builder = ContextBuilder("gpt-4", budget=130)
+    history = make_history(5)
+    messages = builder.build(SYSTEM, history, "new question")
+
+    # Whole turns only, newest first
+    assert messages[1:-1] == history[-4:]
+    assert messages[1]["role"] == "user"
+
+
+def test_build_strips_stored_token_counts(monkeypatch):
+    word_counter(monkeypatch)
+    builder = ContextBuilder("gpt-4", budget=1000)
+    history = [{"role": "user", "content": "hi", "tokens": 1},
+               {"role": "assistant", "content": "hello", "tokens": 1}]
+    messages = builder.build(SYSTEM, history, "next")
+    assert all(set(message) == {"role", "content"} for message in messages)
+
+
+def test_build_summarizes_dropped_turns(monkeypatch):
+    word_counter(monkeypatch)
+    builder = ContextBuilder("gpt-4", budget=200, summarize=True,
+                             summary_tokens=60)
+    history = [
+        {"role": "user", "content": "What is a PMF? I am confused."},
+        {"role": "assistant", "content": "word " * 100},
+        {"role": "user", "content": "And a CDF?"},
+        {"role": "assistant", "content": "short answer"},
+    ]
+    messages = builder.build(SYSTEM, history, "new question")
+
+    assert messages[1]["role"] == "system"
+    assert '"What is a PMF?"' in messages[1]["content"]
+    assert "confused" not in messages[1]["content"]
+    assert messages[2:-1] == history[2:]
+
+
+def test_build_without_summary_drops_silently(monkeypatch):
+    word_counter(monkeypatch)
+    builder = ContextBuilder("gpt-4", budget=60)
+    messages = builder.build(SYSTEM, make_history(3), "new question")
+    assert [m["role"] for m in messages] == ["system", "user"]
+
+
+def test_history_entries_store_token_counts(fake_redis):
+    append_conversation_history(
+        "session-1", [{"role": "user", "content": "What is variance?"}])
+    stored = json.loads(fake_redis.lindex(history_key("session-1"), 0))
+    assert stored["tokens"] == app_module.context_builder.count_tokens(
+        "What is variance?")
+
+
+def test_prepare_messages_respects_budget(fake_redis, monkeypatch):
+    append_conversation_history(
+        "session-1",
+        [{"role": "user" if i % 2 == 0 else "assistant",
+          "content": "long message " * 200} for i in range(10)])
+    monkeypatch.setattr(app_module.context_builder, "budget", 2000)
+
+    messages = prepare_messages("next question", "session-1")
+    counter = app_module.context_builder.counter
+    assert sum(counter.message_tokens(m) for m in messages) <= 2000
+    assert 1 < len(messages) < 12
+    assert messages[-1]["content"] == "next question"
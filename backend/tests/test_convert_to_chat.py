@@ -0,0 +1,93 @@
+import json
+import os
+
+import pytest
+from convert_to_chat import (convert_file, convert_to_chat_format,
+                             validate_chat_record)
+
+
+def write_lines(path, lines):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def pair(i):
+    return json.dumps({"prompt": f"notes{i}.txt\n\n###\n\nQuestion {i}",
+                       "completion": f" Answer {i} <END>"})
+
+
+def test_convert_to_chat_format_strips_suffixes():
+    record = convert_to_chat_format("hw1.TXT \n\n###\n\nWhat is a PMF?",
+                                    "A function.<END>", system_prompt="TA")
+    assert record == {"messages": [
+        {"role": "system", "content": "TA"},
+        {"role": "user", "content": "hw1What is a PMF?"},
+        {"role": "assistant", "content": "A function."},
+    ]}
+
+
+@pytest.mark.parametrize("record, error", [
+    ({}, "missing messages"),
+    ({"messages": [{"role": "bot", "content": "hi"}]}, "invalid role"),
+    ({"messages": [{"role": "user", "content": " "},
+                   {"role": "assistant", "content": "a"}]},
+     "empty user content"),
+    ({"messages": [{"role": "assistant", "content": "a"}]},
+     "no user message"),
+    ({"messages": [{"role": "user", "content": "q"}]},
+     "does not end with an assistant message"),
+])
+def test_validate_chat_record(record, error):
+    assert validate_chat_record(record) == error
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_convert_file_keeps_input_order(tmp_path, workers):
+    input_path = tmp_path / "old.jsonl"
+    output_path = str(tmp_path / "chat.jsonl")
+    write_lines(input_path, [pair(i) for i in range(200)])
+
+    stats = convert_file(str(input_path), output_path, system_prompt="TA",
+                         workers=workers, chunk_size=256)
+
+    records = read_jsonl(output_path)
+    assert [r["messages"][1]["content"] for r in records] == \
+        [f"notes{i}Question {i}" for i in range(200)]
+    assert records[0]["messages"][2] == {"role": "assistant",
+                                         "content": "Answer 0"}
+    assert stats["records"] == 200
+    assert stats["rejected"] == 0
+    assert stats["bytes"] == os.path.getsize(input_path)
+    # No reject file without rejects
+    assert not os.path.exists(output_path + ".rejects.jsonl")
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_convert_file_rejects_bad_lines(tmp_path, workers):
+    input_path = tmp_path / "old.jsonl"
+    output_path = str(tmp_path / "chat.jsonl")
+    reject_path = str(tmp_path / "rejects.jsonl")
+    write_lines(input_path, [
+        pair(0),
+        "{not json",
+        "",
+        json.dumps({"prompt": "Question", "completion": "<END>"}),
+        json.dumps({"prompt": 3, "completion": "Answer"}),
+        pair(5),
+    ])
+
+    stats = convert_file(str(input_path), output_path,
+                         reject_path=reject_path, workers=workers,
+                         chunk_size=64)
+
+    assert len(read_jsonl(output_path)) == stats["records"] == 2
+    rejects = read_jsonl(reject_path)
+    assert stats["rejected"] == 3
+    assert [r["line"] for r in rejects] == [2, 4, 5]
+    assert rejects[0]["text"] == "{not json"
+    assert rejects[1]["error"] == "empty assistant content"
@@ -0,0 +1,156 @@
+import json
+
+import pytest
+from app import store_rating
+from export_ratings import Checkpoint, export_ratings
+
+
+def rate(message_id, rating, user_input="question", assistant_output="answer"):
+    store_rating({"messageId": message_id, "rating": rating,
+                  "userInput": user_input, "assistantOutput": assistant_output})
+
+
+def read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.fixture
+def output_path(tmp_path):
+    return str(tmp_path / "ratings_chat.jsonl")
+
+
+def test_exports_well_rated_pairs(fake_redis, rating_worker, output_path):
+    rate("m1", 5, "What is a loop?", "A loop repeats code.<END>")
+    rate("m2", 2, "Bad question", "Bad answer")
+    rate("m3", 4, "What is a list?", "An ordered collection.")
+    rating_worker.poll()
+
+    checkpoint = export_ratings(fake_redis, output_path, min_rating=4,
+                                system_prompt="You are a tutor.")
+    assert checkpoint.done
+    assert (checkpoint.scanned, checkpoint.exported) == (3, 2)
+
+    records = sorted(read_jsonl(output_path),
+                     key=lambda r: r["messages"][1]["content"])
+    assert records[0]["messages"] == [
+        {"role": "system", "content": "You are a tutor."},
+        {"role": "user", "content": "What is a list?"},
+        {"role": "assistant", "content": "An ordered collection."},
+    ]
+    assert records[1]["messages"][2] == {"role": "assistant",
+                                         "content": "A loop repeats code."}
+
+
+def test_duplicate_pairs_are_exported_once(fake_redis, rating_worker,
+                                           output_path):
+    rate("m1", 5, "What is  a loop?", "Repeats code.")
+    rate("m2", 4, "what is a loop?", "Repeats code.")
+    rate("m3", 5, "What is a loop?", "Runs code again.")
+    rating_worker.poll()
+
+    checkpoint = export_ratings(fake_redis, output_path, batch_size=1)
+    assert checkpoint.exported == 2
+    assert len(read_jsonl(output_path)) == 2
+
+
+def test_skips_other_keys_and_empty_pairs(fake_redis, rating_worker,
+                                          output_path):
+    rate("m1", 5, "", "answer")
+    rating_worker.poll()
+
+    checkpoint = export_ratings(fake_redis, output_path)
+    # Only rating:m1 matches; the ratings:* aggregates do not
+    assert (checkpoint.scanned, checkpoint.exported) == (1, 0)
+
+
+def test_one_pipeline_per_scan_batch(counting_redis, rating_worker,
+                                     output_path):
+    for i in range(20):
+        rate(f"m{i}", 1)
+    rating_worker.poll()
+    counting_redis.commands.clear()
+
+    export_ratings(counting_redis, output_path, batch_size=1000)
+    assert counting_redis.commands == ["delete", "scan", "pipeline"]
+
+
+def test_resume_continues_from_checkpoint(fake_redis, rating_worker,
+                                          output_path, monkeypatch):
+    for i in range(30):
+        rate(f"m{i}", 5, f"question {i}", f"answer {i}")
+    rating_worker.poll()
+
+    # Interrupt the export after its second batch has been checkpointed
+    import export_ratings as module
+    scan_batches = module.scan_batches
+
+    def interrupted(*args):
+        for i, batch in enumerate(scan_batches(*args)):
+            if i == 2:
+                raise KeyboardInterrupt
+            yield batch
+
+    monkeypatch.setattr(module, "scan_batches", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        export_ratings(fake_redis, output_path, batch_size=5)
+    monkeypatch.setattr(module, "scan_batches", scan_batches)
+
+    checkpoint = Checkpoint.load(output_path + ".checkpoint")
+    assert not checkpoint.done and checkpoint.cursor != 0
+    # A partial line written after the checkpoint is discarded on resume
+    with open(output_path, "a", encoding="utf-8") as f:
+        f.write('{"messages": [')
+
+    checkpoint = export_ratings(fake_redis, output_path, batch_size=5,
+                                resume=True)
+    assert checkpoint.done
+    records = read_jsonl(output_path)
+    assert len(records) == checkpoint.exported == 30
+    assert len({r["messages"][0]["content"] for r in records}) == 30
+
+
+@pytest.mark.parametrize("crash_in", ["save", "mark_seen"])
+def test_resume_after_a_crash_exports_every_pair_once(
+        fake_redis, rating_worker, output_path, monkeypatch, crash_in):
+    # 30 ratings of 15 distinct pairs, so later batches repeat earlier ones
+    for i in range(30):
+        rate(f"m{i}", 5, f"question {i % 15}", f"answer {i % 15}<END>")
+    rating_worker.poll()
+
+    # Crash on the second batch, after its lines are written but before
+    # the checkpoint (or the digest set) records them
+    import export_ratings as module
+    target = module.Checkpoint if crash_in == "save" else module
+    original = getattr(target, crash_in)
+    calls = []
+
+    def crashing(*args):
+        calls.append(args)
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        return original(*args)
+
+    monkeypatch.setattr(target, crash_in, crashing)
+    with pytest.raises(KeyboardInterrupt):
+        export_ratings(fake_redis, output_path, batch_size=5)
+    monkeypatch.setattr(target, crash_in, original)
+
+    checkpoint = export_ratings(fake_redis, output_path, batch_size=5,
+                                resume=True)
+    assert checkpoint.done
+    records = read_jsonl(output_path)
+    assert len(records) == checkpoint.exported == 15
+    assert sorted(r["messages"][0]["content"] for r in records) == sorted(
+        f"question {i}" for i in range(15))
+
+
+def test_resume_after_completion_is_a_no_op(fake_redis, rating_worker,
+                                            output_path):
+    rate("m1", 5)
+    rating_worker.poll()
+    export_ratings(fake_redis, output_path)
+
+    checkpoint = export_ratings(fake_redis, output_path, resume=True)
+    assert checkpoint.done
+    assert len(read_jsonl(output_path)) == 1
@@ -0,0 +1,40 @@
+import pytest
+from filters import dynamic_filter
+
+pytest.importorskip("pytest_benchmark")
+
+PARAGRAPH = (
+    "To find P(A|B), start from the definition of conditional probability. "
+    "What do you know about the joint probability of A and B? "
+    "Think about how the law of total probability lets you expand P(B). "
+)
+CODE_HEAVY = (
+    "Here is a sketch:\n```python\ndef bayes(p_b_given_a, p_a, p_b):\n"
+    "    return p_b_given_a * p_a / p_b\n```\n"
+    "You could also use `math.comb(n, k)` or <code>scipy.stats.binom</code>. "
+)
+
+
+def synthetic_response(paragraphs: int, code_every: int = 0) -> str:
+    parts = []
+    for i in range(paragraphs):
+        if code_every and i % code_every == 0:
+            parts.append(CODE_HEAVY)
+        parts.append(PARAGRAPH)
+    return "\n\n".join(parts)
+
+
+@pytest.mark.benchmark(group="dynamic_filter")
+@pytest.mark.parametrize("paragraphs", [10, 100, 1000])
+def test_benchmark_prose_response(benchmark, paragraphs):
+    response = synthetic_response(paragraphs)
+    result = benchmark(dynamic_filter, response)
+    assert result == response
+
+
+@pytest.mark.benchmark(group="dynamic_filter")
+@pytest.mark.parametrize("paragraphs", [10, 100, 1000])
+def test_benchmark_code_heavy_response(benchmark, paragraphs):
+    response = synthetic_response(paragraphs, code_every=3)
+    result = benchmark(dynamic_filter, response)
+    assert "[CODE BLOCK REMOVED FOR ACADEMIC INTEGRITY]" in result
@@ -0,0 +1,214 @@
+import random
+import re
+
+import pytest
+from filters import (
+    CODE_REFUSAL,
+    StreamingFilter,
+    count_code_characters,
+    dynamic_filter,
+)
+
+
+def sequential_filter(ai_response: str) -> str:
+    """
+    The original one-stage-at-a-time filter, kept as the reference the
+    single-pass implementation must reproduce.
+    """
+    # Stage 1: Remove code blocks with language-specific detection
+    code_block_patterns = [
+        # Markdown code blocks with optional language
+        r"```[\w]*\n[\s\S]*?```",
+        # HTML code tags
+        r"<code>[\s\S]*?</code>",
+        # Inline code backticks
+        r"`[^`]+`",
+    ]
+
+    sanitized_response = ai_response
+    for pattern in code_block_patterns:
+        sanitized_response = re.sub(
+            pattern, "[CODE BLOCK REMOVED FOR ACADEMIC INTEGRITY]", sanitized_response
+        )
+
+    # Stage 2: Remove specific code patterns
+    code_patterns = {
+        "python": r"(def\s+\w+\(.*?\)|class\s+\w+.*?:|import\s+\w+|from\s+\w+\s+import)",
+        "java": r"(public\s+class|private\s+class|protected\s+class|class\s+\w+|public\s+\w+\s+\w+\(.*?\))",
+        "javascript": r"(function\s+\w+\(.*?\)|const\s+\w+\s*=|let\s+\w+\s*=|var\s+\w+\s*=)",
+        "cpp": r"(#include\s*<.*?>|\w+\s+\w+\(.*?\)\s*{)",
+    }
+
+    for lang, pattern in code_patterns.items():
+        sanitized_response = re.sub(
+            pattern,
+            f"[{lang.upper()} CODE REMOVED]",
+            sanitized_response,
+            flags=re.IGNORECASE | re.MULTILINE,
+        )
+
+    # Stage 3: Remove solution-indicating phrases
+    solution_phrases = [
+        r"here'?s\s+the\s+solution",
+        r"the\s+answer\s+is",
+        r"you\s+should\s+write",
+        r"complete\s+solution",
+        r"full\s+implementation",
+        r"implement\s+it\s+like\s+this",
+    ]
+
+    for phrase in solution_phrases:
+        sanitized_response = re.sub(
+            phrase,
+            "[SOLUTION INDICATION REMOVED]",
+            sanitized_response,
+            flags=re.IGNORECASE,
+        )
+
+    # Stage 4: Final safety check
+    if len(re.findall(r"[{};]", sanitized_response)) > 5:
+        # Too many code-like characters, might be code
+        sanitized_response = "I apologize, but I cannot provide direct code solutions. Let me help you understand the concepts instead."
+
+    return sanitized_response
+
+
+SYNTHETIC_RESPONSES = [
+    "Here's some code: ```print('hello')```",
+    "def my_function():",
+    "public class MyClass {",
+    "Here's the solution: x = 42",
+    "Normal explanation text",
+    "Try this:\n```python\nimport os\nprint(os.getcwd())\n```\nThe answer is 3.",
+    "Use `len(xs)` and <code>sum(xs)</code> to compute the mean.",
+    "function add(a, b) then const total = 1; let x = 2; var y = 3;",
+    "#include <stdio.h>\nint main() { return 0; }",
+    "You should write a FULL IMPLEMENTATION, implement it like this.",
+    "A complete solution uses Bayes' theorem: P(A|B) = P(B|A)P(A)/P(B).",
+    "from math import comb; comb(5, 2); {}; {}",
+    "Upper-case tags like <CODE>x = 1</CODE> are not code blocks.",
+]
+
+
+@pytest.mark.parametrize("response", SYNTHETIC_RESPONSES)
+def test_dynamic_filter_matches_sequential_filter(response):
+    assert dynamic_filter(response) == sequential_filter(response)
+
+
+# Fragments that start, end or straddle matches of several stages at once
+FUZZ_TOKENS = [
+    "def", "class", "import", "from", "public", "private", "function",
+    "const", "let", "var", "#include", "here's", "the", "answer", "is",
+    "solution", "complete", "f", "x", "SECRET", "os", "int main",
+    "(", ")", "{", "}", ";", ":", "=", "<", ">", "<code>", "</code>",
+    "`", "```", "```py\n", " ", " ", " ", "\n",
+]
+
+
+def fuzzed_responses(count, seed=109):
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield "".join(rng.choice(FUZZ_TOKENS)
+                      for _ in range(rng.randint(1, 24)))
+
+
+def test_dynamic_filter_matches_sequential_filter_on_fuzzed_input():
+    mismatches = [response for response in fuzzed_responses(5000)
+                  if dynamic_filter(response) != sequential_filter(response)]
+    assert mismatches == []
+
+
+def test_dynamic_filter_applies_stages_to_rewritten_text():
+    assert dynamic_filter("class import SECRET os `") == \
+        "class [PYTHON CODE REMOVED] os `"
+    assert dynamic_filter("def f(a `b)` c") == \
+        "def f(a [CODE BLOCK REMOVED FOR ACADEMIC INTEGRITY] c"
+
+
+@pytest.mark.parametrize(
+    "text,expected",
+    [("", 0), ("no code here", 0), ("{a; b}", 3), ("{{;;}}", 6)],
+)
+def test_count_code_characters(text, expected):
+    assert count_code_characters(text) == expected
+
+
+STREAMED_RESPONSES = SYNTHETIC_RESPONSES + [
+    "  Step 1: think.\n\nThe answer\nis in P(A|B), and the\nfunction f(x) {\n y }  ",
+    "Use `x`\nand ```py\nprint(1)\n``` then <code>a\nb</code> ok",
+    "def\nfoo(x) and here's\nthe\nsolution now",
+    # Later stages see text only after earlier ones rewrote it
+    "</code>#include````py\nanswerletclass> ```answer```py\n#include",
+    "here's#include<code>classint main```\nlet;</code>)complete <code>x\n```",
+    "here's the solutionint main()=var let<</code><code>#include int main(){"
+    "</code>)x",
+]
+
+
+def stream_through_filter(response, chunk_size):
+    response_filter = StreamingFilter()
+    deltas = [
+        response_filter.feed(response[i : i + chunk_size])
+        for i in range(0, len(response), chunk_size)
+    ]
+    deltas.append(response_filter.finish())
+    return response_filter, "".join(deltas)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 4, 16])
+@pytest.mark.parametrize("response", STREAMED_RESPONSES)
+def test_streaming_filter_matches_dynamic_filter(response, chunk_size):
+    response_filter, streamed = stream_through_filter(response, chunk_size)
+    expected = dynamic_filter(response.strip())
+    assert response_filter.result == expected
+    if not response_filter.refused:
+        assert streamed == expected
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7])
+def test_streaming_filter_matches_dynamic_filter_on_fuzzed_input(chunk_size):
+    mismatches = []
+    for response in fuzzed_responses(200, seed=chunk_size):
+        response_filter, streamed = stream_through_filter(response, chunk_size)
+        expected = dynamic_filter(response.strip())
+        if response_filter.result != expected or (
+                not response_filter.refused and streamed != expected):
+            mismatches.append(response)
+    assert mismatches == []
+
+
+def test_streaming_filter_does_not_rescan_an_open_code_block(monkeypatch):
+    scans = []
+    safe_cut = StreamingFilter._safe_cut
+    monkeypatch.setattr(StreamingFilter, "_safe_cut",
+                        lambda self: scans.append(1) or safe_cut(self))
+    response = "Look:\n```python\n" + "x = compute(value)\n" * 500
+    response_filter, _ = stream_through_filter(response + "```\nDone.", 4)
+    assert response_filter.result == dynamic_filter(response + "```\nDone.")
+    # Only chunks up to the opening fence and the closing one are scanned
+    assert len(scans) < 20
+
+
+def test_streaming_filter_emits_prose_before_the_end():
+    response_filter = StreamingFilter()
+    delta = response_filter.feed(
+        "Conditional probability tells us how likely an event is ")
+    assert delta.startswith("Conditional probability")
+
+
+def test_streaming_filter_holds_back_open_code_block():
+    response_filter = StreamingFilter()
+    emitted = response_filter.feed("Look:\n```python\nprint('hi')\n")
+    emitted += response_filter.feed("print('there')\n")
+    assert "print" not in emitted
+    emitted += response_filter.feed("```\nDone.")
+    emitted += response_filter.finish()
+    assert emitted == "Look:\n[CODE BLOCK REMOVED FOR ACADEMIC INTEGRITY]\nDone."
+
+
+def test_streaming_filter_stops_emitting_after_refusal():
+    response_filter, streamed = stream_through_filter(
+        "a; b; c;\nd; e; f; g;\nmore text", 2)
+    assert response_filter.refused
+    assert response_filter.result == CODE_REFUSAL
+    assert "g;" not in streamed
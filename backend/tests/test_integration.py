@@ -1,31 +1,10 @@
 # tests/test_integration.py
+import json
 import pytest
 from app import app
 
-# Create a fake response class to simulate the OpenAI API
-
-
-class FakeCompletion:
-    def __init__(self, message):
-        self.message = message
-
-    def __getitem__(self, key):
-        if key == "choices":
-            return [{"message": {"content": self.message}}]
-        raise KeyError
-
-
-def fake_chat_completion_create(model, messages):
-    # Return a fake completion with a known message
-    return FakeCompletion("Assistant response")
-
-
-@pytest.fixture(autouse=True)
-def patch_openai(monkeypatch):
-    # Override the openai.ChatCompletion.create method in our app with our fake function
-    import openai
-    monkeypatch.setattr(openai.ChatCompletion, "create",
-                        fake_chat_completion_create)
+# Model calls are answered by conftest.fake_completion
+pytestmark = pytest.mark.usefixtures("patch_openai")
 
 
 def test_chat_endpoint_success(client):
@@ -35,6 +14,16 @@ def test_chat_endpoint_success(client):
     assert response.status_code == 200
     assert "assistant_message" in data
     assert data["assistant_message"] == "Assistant response"
+    assert data["session_id"]
+
+
+def test_chat_endpoint_keeps_session_history(client, fake_redis):
+    payload = {"message": "Hello", "sessionId": "session-1"}
+    client.post("/api/chat", json=payload)
+    client.post("/api/chat", json=payload)
+
+    assert fake_redis.llen("conversation:session-1") == 4
+    assert not fake_redis.exists("conversation:session-2")
 
 
 def test_chat_endpoint_empty_message(client):
@@ -45,6 +34,38 @@ def test_chat_endpoint_empty_message(client):
     assert "error" in data
 
 
+def test_chat_endpoint_streaming(client, monkeypatch, fake_redis):
+    def fake_stream(model, messages, stream):
+        assert stream is True
+        for token in ["Think ", "about ", "the ", "sample ", "space."]:
+            yield {"choices": [{"delta": {"content": token}}]}
+
+    monkeypatch.setattr("app.llm_client.create", fake_stream)
+    response = client.post(
+        "/api/chat",
+        json={"message": "Hello", "sessionId": "session-1", "stream": True})
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+
+    events = []
+    for block in response.get_data(as_text=True).strip().split("\n\n"):
+        event_line, data_line = block.split("\n")
+        events.append((event_line[len("event: "):],
+                       json.loads(data_line[len("data: "):])))
+    streamed = "".join(data["content"] for event, data in events if event == "delta")
+    assert streamed == "Think about the sample space."
+    assert events[-1] == (
+        "done", {"assistant_message": "Think about the sample space.",
+                 "session_id": "session-1"})
+
+    history = [(msg["role"], msg["content"]) for msg in map(
+        json.loads, fake_redis.lrange("conversation:session-1", 0, -1))]
+    assert history == [
+        ("user", "Hello"),
+        ("assistant", "Think about the sample space."),
+    ]
+
+
 def test_rate_endpoint(client):
     payload = {
         "messageId": "msg-123",
@@ -56,3 +77,83 @@ def test_rate_endpoint(client):
     data = response.get_json()
     assert response.status_code == 200
     assert data["status"] == "success"
+
+
+def test_chat_endpoint_rate_limit_headers(client):
+    payload = {"message": "Hello", "sessionId": "session-1"}
+    responses = [client.post("/api/chat", json=payload) for _ in range(4)]
+
+    assert [r.status_code for r in responses] == [200, 200, 200, 429]
+    assert responses[0].headers["RateLimit-Limit"] == "3"
+    assert responses[0].headers["RateLimit-Remaining"] == "2"
+    assert "Retry-After" in responses[-1].headers
+
+
+def test_rate_endpoint_rate_limit_headers(client):
+    payload = {"messageId": "msg-123", "rating": 5}
+    response = client.post("/api/rate", json=payload)
+
+    assert response.headers["RateLimit-Limit"] == "10"
+    assert response.headers["RateLimit-Remaining"] == "9"
+
+
+def test_repeated_first_question_is_served_from_cache(client, monkeypatch):
+    calls = []
+
+    def counting_create(model, messages):
+        calls.append(messages)
+        return {"choices": [{"message": {"content": "Assistant response"}}]}
+
+    monkeypatch.setattr("app.llm_client.create", counting_create)
+    first = client.post("/api/chat", json={"message": "What is Bayes' theorem?",
+                                           "sessionId": "student-1"})
+    second = client.post("/api/chat", json={"message": "what is bayes' theorem?",
+                                            "sessionId": "student-2"})
+
+    assert len(calls) == 1
+    assert second.get_json()["assistant_message"] == \
+        first.get_json()["assistant_message"]
+
+
+def test_chat_request_makes_two_redis_round_trips(client, counting_redis,
+                                                  monkeypatch):
+    monkeypatch.setattr("app.redis_client", counting_redis)
+    monkeypatch.setattr("config.RESPONSE_CACHE_ENABLED", False)
+    # The first request loads the rate limit script, policy and prompts
+    client.post("/api/chat", json={"message": "Hello", "sessionId": "s"})
+    counting_redis.commands.clear()
+
+    response = client.post(
+        "/api/chat", json={"message": "What is a PMF?", "sessionId": "s"})
+    assert response.status_code == 200
+    # One pipeline for all reads, one for all writes
+    assert counting_redis.commands == ["pipeline", "pipeline"]
+
+
+def test_chat_request_with_response_cache_adds_one_lookup(client,
+                                                          counting_redis,
+                                                          monkeypatch):
+    monkeypatch.setattr("app.redis_client", counting_redis)
+    client.post("/api/chat", json={"message": "Hello", "sessionId": "s"})
+    counting_redis.commands.clear()
+
+    client.post("/api/chat", json={"message": "What is a PMF?", "sessionId": "s"})
+    # The cache key depends on the history, so it is looked up in between
+    assert counting_redis.commands == ["pipeline", "get", "pipeline"]
+
+
+def test_due_version_checks_ride_along_in_the_read_pipeline(client,
+                                                           counting_redis,
+                                                           monkeypatch):
+    import app as app_module
+    monkeypatch.setattr("app.redis_client", counting_redis)
+    monkeypatch.setattr("config.RESPONSE_CACHE_ENABLED", False)
+    client.post("/api/chat", json={"message": "Hello", "sessionId": "s"})
+    counting_redis.commands.clear()
+
+    app_module.policy_engine.invalidate()
+    app_module.prompt_registry.invalidate()
+    client.post("/api/chat", json={"message": "What is a PMF?", "sessionId": "s"})
+    # Versions are unchanged, so nothing is reloaded
+    assert counting_redis.commands == ["pipeline", "pipeline"]
+    assert not app_module.policy_engine.needs_refresh()
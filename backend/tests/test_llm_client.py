@@ -0,0 +1,170 @@
+import asyncio
+import time
+import pytest
+from llm_client import LatencyWindow, LLMClient, LLMError, parse_retry_after
+from llm_stub import StubChatCompletionServer
+
+MESSAGES = [{"role": "user", "content": "What is a PMF?"}]
+
+
+@pytest.fixture
+def stub():
+    with StubChatCompletionServer(reply="Think about the sample space.") as server:
+        yield server
+
+
+def make_client(stub, **kwargs):
+    kwargs.setdefault("backoff_base", 0.01)
+    return LLMClient(stub.api_base, "test-key", **kwargs)
+
+
+def content(completion):
+    return completion["choices"][0]["message"]["content"]
+
+
+def test_create_returns_completion(stub):
+    client = make_client(stub)
+    completion = client.create(model="gpt-4", messages=MESSAGES)
+    assert content(completion) == "Think about the sample space."
+    assert stub.requests[0]["model"] == "gpt-4"
+    assert stub.requests[0]["messages"] == MESSAGES
+
+
+def test_stream_yields_chunks(stub):
+    client = make_client(stub)
+    chunks = client.create(model="gpt-4", messages=MESSAGES, stream=True)
+    streamed = "".join(c["choices"][0]["delta"]["content"] for c in chunks)
+    assert streamed == "Think about the sample space."
+
+
+def test_retries_rate_limits_and_server_errors(stub):
+    stub.errors = [429, 503]
+    client = make_client(stub)
+    assert content(client.create(model="gpt-4", messages=MESSAGES))
+    assert len(stub.requests) == 3
+    assert client.stats["retries"] == 2
+
+
+def test_gives_up_after_max_retries(stub):
+    stub.errors = [500, 500, 500]
+    client = make_client(stub, max_retries=2)
+    with pytest.raises(LLMError) as excinfo:
+        client.create(model="gpt-4", messages=MESSAGES)
+    assert excinfo.value.status == 500
+    assert len(stub.requests) == 3
+
+
+def test_client_errors_are_not_retried(stub):
+    stub.errors = [400]
+    client = make_client(stub)
+    with pytest.raises(LLMError) as excinfo:
+        client.create(model="gpt-4", messages=MESSAGES)
+    assert excinfo.value.status == 400
+    assert len(stub.requests) == 1
+
+
+def test_honours_retry_after(stub):
+    stub.errors = [429]
+    stub.retry_after = 0.2
+    client = make_client(stub)
+    start = time.perf_counter()
+    client.create(model="gpt-4", messages=MESSAGES)
+    assert time.perf_counter() - start >= 0.2
+
+
+def test_long_retry_after_fails_fast(stub):
+    stub.errors = [429]
+    stub.retry_after = 30
+    client = make_client(stub, backoff_max=1)
+    with pytest.raises(LLMError):
+        client.create(model="gpt-4", messages=MESSAGES)
+    assert len(stub.requests) == 1
+
+
+def test_read_timeout(stub):
+    stub.latency = 0.5
+    client = make_client(stub, read_timeout=0.1, max_retries=0)
+    with pytest.raises(LLMError) as excinfo:
+        client.create(model="gpt-4", messages=MESSAGES)
+    assert excinfo.value.status is None
+
+
+def test_backoff_has_full_jitter():
+    client = LLMClient("http://localhost", None, backoff_base=1, backoff_max=4)
+    delays = [client.backoff(5) for _ in range(200)]
+    assert all(0 <= delay <= 4 for delay in delays)
+    assert len(set(delays)) > 1
+    assert client.backoff(0, retry_after=2) >= 2
+
+
+def test_parse_retry_after():
+    assert parse_retry_after({"Retry-After": "3"}) == 3
+    assert parse_retry_after({"retry-after-ms": "250"}) == 0.25
+    assert parse_retry_after({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}) == 0
+    assert parse_retry_after({}) is None
+
+
+def test_latency_window_percentile():
+    window = LatencyWindow(size=100)
+    assert window.percentile(0.95) is None
+    for ms in range(1, 101):
+        window.record(ms / 1000)
+    assert window.percentile(0.95) == 0.096
+    assert window.percentile(0.95, min_samples=101) is None
+
+
+def test_hedge_fires_past_p95(stub):
+    client = make_client(stub, hedge=True, hedge_min_samples=5)
+    for _ in range(5):
+        client.latency.record(0.05)
+    # The first request stalls; the hedge answers quickly
+    stub.latencies = [1.0, 0.0]
+
+    start = time.perf_counter()
+    completion = client.create(model="gpt-4", messages=MESSAGES)
+    assert content(completion)
+    assert time.perf_counter() - start < 0.5
+    assert client.stats["hedges"] == 1
+    assert client.stats["hedge_wins"] == 1
+    client.close()
+
+
+def test_no_hedge_before_enough_samples(stub):
+    client = make_client(stub, hedge=True, hedge_min_samples=5)
+    stub.latency = 0.1
+    client.create(model="gpt-4", messages=MESSAGES)
+    assert client.stats["hedges"] == 0
+    assert len(stub.requests) == 1
+
+
+def test_acreate_retries_and_streams(stub):
+    stub.errors = [502]
+    client = make_client(stub)
+
+    async def run():
+        completion = await client.acreate(model="gpt-4", messages=MESSAGES)
+        chunks = await client.acreate(model="gpt-4", messages=MESSAGES,
+                                      stream=True)
+        streamed = [c["choices"][0]["delta"]["content"] async for c in chunks]
+        await client.aclose()
+        return completion, "".join(streamed)
+
+    completion, streamed = asyncio.run(run())
+    assert content(completion) == streamed == "Think about the sample space."
+    assert client.stats["retries"] == 1
+
+
+def test_acreate_hedges(stub):
+    client = make_client(stub, hedge=True, hedge_min_samples=5)
+    for _ in range(5):
+        client.latency.record(0.05)
+    stub.latencies = [1.0, 0.0]
+
+    async def run():
+        try:
+            return await client.acreate(model="gpt-4", messages=MESSAGES)
+        finally:
+            await client.aclose()
+
+    assert content(asyncio.run(run()))
+    assert client.stats["hedge_wins"] == 1
@@ -0,0 +1,142 @@
+import os
+import subprocess
+import sys
+
+import fakeredis
+import pytest
+import redis
+import metrics
+from app import create_app
+from prometheus_client import REGISTRY
+from redis_pools import InstrumentedBlockingConnectionPool
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+pytestmark = pytest.mark.usefixtures("patch_openai")
+
+
+@pytest.fixture(autouse=True)
+def model_name(monkeypatch):
+    monkeypatch.setattr("app.model_router.strong_model", "gpt-4")
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def chat(client, message="What is a random variable?"):
+    return client.post("/api/chat", json={"message": message})
+
+
+def test_chat_stages_are_timed(client):
+    stages = ["load_state", "policy", "prepare_messages", "cache_lookup",
+              "llm", "filter", "save"]
+    before = {stage: sample("tutorgpt_stage_seconds_count", endpoint="chat",
+                            stage=stage) for stage in stages}
+    requests_before = sample("tutorgpt_request_seconds_count",
+                             endpoint="chat", status="200")
+
+    assert chat(client).status_code == 200
+
+    for stage in stages:
+        assert sample("tutorgpt_stage_seconds_count", endpoint="chat",
+                      stage=stage) == before[stage] + 1, stage
+    assert sample("tutorgpt_request_seconds_count", endpoint="chat",
+                  status="200") == requests_before + 1
+
+
+def test_token_counts_are_recorded(client):
+    before = sample("tutorgpt_llm_tokens_sum", model="gpt-4", kind="prompt")
+    chat(client)
+    assert sample("tutorgpt_llm_tokens_sum", model="gpt-4",
+                  kind="prompt") == before + 120
+    assert sample("tutorgpt_llm_tokens_count", model="gpt-4",
+                  kind="completion") >= 1
+
+
+def test_cache_hits_and_misses_are_counted(client):
+    hits = sample("tutorgpt_response_cache_lookups_total", result="hit")
+    misses = sample("tutorgpt_response_cache_lookups_total", result="miss")
+    chat(client, "What is a PMF?")
+    chat(client, "What is a PMF?")
+    assert sample("tutorgpt_response_cache_lookups_total",
+                  result="miss") == misses + 1
+    assert sample("tutorgpt_response_cache_lookups_total",
+                  result="hit") == hits + 1
+
+
+def test_rate_limited_requests_are_counted(client):
+    before = sample("tutorgpt_rate_limited_total", endpoint="chat")
+    statuses = [chat(client, f"Question {i}").status_code for i in range(5)]
+    assert statuses.count(429) == 2
+    assert sample("tutorgpt_rate_limited_total", endpoint="chat") == before + 2
+
+
+def test_redis_round_trips_per_request(client, fake_redis_server,
+                                       monkeypatch):
+    pool = InstrumentedBlockingConnectionPool(
+        connection_class=fakeredis.FakeRedisConnection,
+        server=fake_redis_server, decode_responses=True, max_connections=5)
+    monkeypatch.setattr("app.redis_client",
+                        redis.Redis(connection_pool=pool))
+    # The first request loads the rate limit script
+    client.post("/api/rate", json={"messageId": "m0", "rating": 5})
+    before = sample("tutorgpt_redis_round_trips_sum", endpoint="rate")
+    checkouts = pool.metrics()["checkouts"]
+
+    response = client.post("/api/rate", json={"messageId": "m1", "rating": 5})
+    assert response.status_code == 200
+
+    round_trips = sample("tutorgpt_redis_round_trips_sum",
+                         endpoint="rate") - before
+    # The rate limit check, then one XADD
+    assert round_trips == pool.metrics()["checkouts"] - checkouts == 2
+
+
+def test_metrics_endpoint(client, fake_redis_server, monkeypatch):
+    chat(client)
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain")
+    body = response.get_data(as_text=True)
+    assert 'tutorgpt_stage_seconds_bucket{endpoint="chat"' in body
+    assert "tutorgpt_rating_backlog 0.0" in body
+    # fakeredis pools have no metrics()
+    assert "tutorgpt_redis_pool_in_use" not in body
+
+    pool = InstrumentedBlockingConnectionPool(
+        connection_class=fakeredis.FakeRedisConnection,
+        server=fake_redis_server, decode_responses=True, max_connections=5)
+    monkeypatch.setattr("app.redis_client",
+                        redis.Redis(connection_pool=pool))
+    body = client.get("/metrics").get_data(as_text=True)
+    assert "tutorgpt_redis_pool_in_use 0.0" in body
+
+
+def test_metrics_can_be_disabled(client, monkeypatch):
+    monkeypatch.setattr("config.METRICS_ENABLED", False)
+    assert client.get("/metrics").status_code == 404
+
+
+def test_create_app_registers_the_collectors_once():
+    create_app(preload_frontend=False)
+    collectors = metrics.init_metrics()
+    create_app(preload_frontend=False)
+    assert metrics.init_metrics() is collectors
+
+
+def test_multiprocess_exposition_sums_workers(tmp_path):
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path))
+    record = ("import metrics; collectors = metrics.init_metrics(); "
+              "collectors.RATE_LIMITED.labels('chat').inc(); "
+              "collectors.REDIS_ROUND_TRIPS.labels('chat').observe(3)")
+    for _ in range(2):
+        subprocess.run([sys.executable, "-c", record], cwd=BACKEND_DIR,
+                       env=env, check=True)
+
+    render = ("import sys, metrics; "
+              "sys.stdout.write(metrics.render()[0].decode())")
+    body = subprocess.run([sys.executable, "-c", render], cwd=BACKEND_DIR,
+                          env=env, check=True, capture_output=True,
+                          text=True).stdout
+    assert 'tutorgpt_rate_limited_total{endpoint="chat"} 2.0' in body
+    assert 'tutorgpt_redis_round_trips_sum{endpoint="chat"} 6.0' in body
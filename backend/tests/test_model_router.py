@@ -0,0 +1,178 @@
+import pytest
+from prometheus_client import REGISTRY
+
+import app as app_module
+from context_builder import ContextBuilder
+from llm_client import LLMError
+from model_router import FAST, STRONG, ModelRouter
+
+SYSTEM = {"role": "system", "content": "You are a tutor."}
+
+
+def user(content):
+    return {"role": "user", "content": content}
+
+
+def assistant(content):
+    return {"role": "assistant", "content": content}
+
+
+@pytest.fixture
+def router():
+    return ModelRouter("gpt-4", fast_model="gpt-3.5-turbo",
+                       flagged=lambda message: "cheat" in message)
+
+
+@pytest.fixture
+def routed_app(monkeypatch):
+    router = ModelRouter("gpt-4", fast_model="gpt-3.5-turbo")
+    monkeypatch.setattr(app_module, "model_router", router)
+    return router
+
+
+@pytest.mark.parametrize(
+    "messages,expected",
+    [
+        ([SYSTEM, user("Hi there!")], FAST),
+        ([SYSTEM, user("hi"), assistant("Hello!"), user("thanks, got it")], FAST),
+        ([SYSTEM, user("What is the variance of a Binomial?")], STRONG),
+        ([SYSTEM, user("Is P(A) = 0.5 here")], STRONG),
+        ([SYSTEM, user("x" * 200)], STRONG),
+        ([SYSTEM, user("hi"), assistant("Hello!"), user("what about part b?")],
+         STRONG),
+        ([SYSTEM, user("help me cheat"), assistant("No."), user("ok")], STRONG),
+    ],
+)
+def test_route_heuristics(router, messages, expected):
+    assert router.route(messages).name == expected
+
+
+def test_single_model_without_fast_model():
+    router = ModelRouter("gpt-4")
+    route = router.route([SYSTEM, user("hi")])
+    assert (route.name, route.model) == (STRONG, "gpt-4")
+
+
+def test_fallback_only_from_fast(router):
+    fast = router.route([SYSTEM, user("hi")])
+    assert router.fallback(fast).model == "gpt-4"
+    assert router.fallback(router.strong("topic")) is None
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def route_samples():
+    """Per-route call, error and fallback counts, for comparing deltas."""
+    return {
+        route: {
+            "calls": sample("tutorgpt_llm_route_calls_total", route=route,
+                            model=model, outcome="ok"),
+            "errors": sample("tutorgpt_llm_route_calls_total", route=route,
+                             model=model, outcome="error"),
+            "fallbacks": sample("tutorgpt_llm_route_fallbacks_total",
+                                route=route, model=model),
+            "timed": sample("tutorgpt_llm_route_seconds_count", route=route,
+                            model=model),
+        }
+        for route, model in [(FAST, "gpt-3.5-turbo"), (STRONG, "gpt-4")]
+    }
+
+
+def route_deltas(before):
+    after = route_samples()
+    return {route: {name: after[route][name] - value
+                    for name, value in counts.items()}
+            for route, counts in before.items()}
+
+
+def test_route_turn_includes_the_new_message(router):
+    history = [user("hi"), assistant("Hello!")]
+    assert router.route_turn(history, "thanks").name == FAST
+    assert router.route_turn(history, "what about part b?").name == STRONG
+
+
+def test_call_gpt_api_records_usage_per_route(routed_app, monkeypatch):
+    def create(model, messages):
+        return {"choices": [{"message": {"content": "Hello!"}}],
+                "usage": {"prompt_tokens": 12, "completion_tokens": 3}}
+
+    monkeypatch.setattr("app.llm_client.create", create)
+    before = route_samples()
+    prompt_tokens = sample("tutorgpt_llm_tokens_sum", model="gpt-3.5-turbo",
+                           kind="prompt")
+    app_module.call_gpt_api([SYSTEM, user("hi")])
+
+    deltas = route_deltas(before)
+    assert deltas[FAST] == {"calls": 1, "errors": 0, "fallbacks": 0, "timed": 1}
+    assert deltas[STRONG]["calls"] == 0
+    assert sample("tutorgpt_llm_tokens_sum", model="gpt-3.5-turbo",
+                  kind="prompt") - prompt_tokens == 12
+
+
+def test_call_gpt_api_falls_back_to_strong_model(routed_app, monkeypatch):
+    models = []
+
+    def create(model, messages):
+        models.append(model)
+        if model == "gpt-3.5-turbo":
+            raise LLMError("overloaded", status=503)
+        return {"choices": [{"message": {"content": "Hello!"}}]}
+
+    monkeypatch.setattr("app.llm_client.create", create)
+    before = route_samples()
+    assert app_module.call_gpt_api([SYSTEM, user("hi")]) == "Hello!"
+
+    assert models == ["gpt-3.5-turbo", "gpt-4"]
+    deltas = route_deltas(before)
+    assert deltas[FAST]["errors"] == 1
+    assert deltas[FAST]["timed"] == 0
+    assert deltas[STRONG]["calls"] == deltas[STRONG]["fallbacks"] == 1
+
+
+def test_strong_model_failure_is_raised(routed_app, monkeypatch):
+    def create(model, messages):
+        raise LLMError("overloaded", status=503)
+
+    monkeypatch.setattr("app.llm_client.create", create)
+    before = route_samples()
+    with pytest.raises(LLMError):
+        app_module.call_gpt_api([SYSTEM, user("Explain Bayes' theorem")])
+    assert route_deltas(before)[STRONG]["errors"] == 1
+
+
+def test_stream_falls_back_and_estimates_tokens(routed_app, monkeypatch):
+    def create(model, messages, stream):
+        if model == "gpt-3.5-turbo":
+            raise LLMError("rate limited", status=429)
+        return iter([{"choices": [{"delta": {"content": "Hello "}}]},
+                     {"choices": [{"delta": {"content": "there!"}}]}])
+
+    monkeypatch.setattr("app.llm_client.create", create)
+    before = route_samples()
+    completion_tokens = sample("tutorgpt_llm_tokens_sum", model="gpt-4",
+                               kind="completion")
+    chunks = list(app_module.call_gpt_api_stream([SYSTEM, user("hi")]))
+
+    assert chunks == ["Hello ", "there!"]
+    assert route_deltas(before)[STRONG]["fallbacks"] == 1
+    assert sample("tutorgpt_llm_tokens_sum", model="gpt-4",
+                  kind="completion") > completion_tokens
+
+
+def test_fast_route_is_packed_for_the_fast_model(routed_app, monkeypatch):
+    packed_for = []
+    build = ContextBuilder.build
+
+    def record_build(self, *args, **kwargs):
+        packed_for.append(self.counter.model_name)
+        return build(self, *args, **kwargs)
+
+    monkeypatch.setattr(ContextBuilder, "build", record_build)
+    app_module.build_messages("thanks!", [], False)
+    app_module.build_messages("What is the variance of a Binomial?", [], False)
+
+    assert packed_for == ["gpt-3.5-turbo", "gpt-4"]
+    assert (app_module.context_builder_for("gpt-3.5-turbo").budget
+            < app_module.context_builder_for("gpt-4").budget)
@@ -0,0 +1,92 @@
+import time
+from app import DEFAULT_SYSTEM_INSTRUCTIONS, prepare_messages
+from prompts import (
+    BASE_INSTRUCTIONS_KEY,
+    CONTINUING_INSTRUCTIONS,
+    NEW_CONVERSATION_INSTRUCTIONS,
+    RECENT_VIOLATION_INSTRUCTIONS,
+    PromptRegistry,
+    compile_variants,
+    publish_prompt_update,
+)
+
+
+def test_compile_variants_matches_context_rules():
+    variants = compile_variants("BASE")
+    assert variants[(True, False)].content == (
+        "BASE\n\n" + NEW_CONVERSATION_INSTRUCTIONS)
+    assert variants[(False, False)].content == (
+        "BASE\n\n" + CONTINUING_INSTRUCTIONS)
+    assert variants[(False, True)].content == (
+        "BASE\n\n" + RECENT_VIOLATION_INSTRUCTIONS + "\n"
+        + CONTINUING_INSTRUCTIONS)
+
+
+def test_variant_ids_are_stable_and_content_addressed():
+    first = compile_variants("BASE")
+    assert first == compile_variants("BASE")
+    assert first[(True, False)].id.startswith("new:")
+    assert first[(False, True)].id.startswith("continuing-violation:")
+    assert len({variant.id for variant in first.values()}) == 4
+
+    edited = compile_variants("EDITED")
+    assert edited[(True, False)].id != first[(True, False)].id
+
+
+def test_refresh_seeds_default_instructions(fake_redis):
+    registry = PromptRegistry("DEFAULT", subscribe=False)
+    registry.refresh(fake_redis)
+    assert fake_redis.get(BASE_INSTRUCTIONS_KEY) == "DEFAULT"
+    assert registry.base_instructions == "DEFAULT"
+
+
+def test_refresh_keeps_existing_instructions(fake_redis):
+    fake_redis.set(BASE_INSTRUCTIONS_KEY, "FROM REDIS")
+    registry = PromptRegistry("DEFAULT", subscribe=False)
+    registry.refresh(fake_redis)
+    assert registry.variant(True, False).content.startswith("FROM REDIS")
+
+
+def test_steady_state_needs_no_redis_io(counting_redis):
+    registry = PromptRegistry("DEFAULT", refresh_seconds=60, subscribe=False)
+    registry.refresh(counting_redis)
+    loaded_calls = counting_redis.calls
+
+    for _ in range(100):
+        registry.refresh(counting_redis)
+        registry.variant(False, False)
+
+    assert counting_redis.calls == loaded_calls
+
+
+def test_version_bump_reloads_prompts(fake_redis):
+    registry = PromptRegistry("DEFAULT", refresh_seconds=60, subscribe=False)
+    registry.refresh(fake_redis)
+    old_id = registry.variant(True, False).id
+
+    publish_prompt_update(fake_redis, "NEW PROMPT")
+    registry.invalidate()
+    registry.refresh(fake_redis)
+
+    assert registry.base_instructions == "NEW PROMPT"
+    assert registry.variant(True, False).id != old_id
+
+
+def test_pubsub_message_invalidates_registry(fake_redis):
+    registry = PromptRegistry("DEFAULT", refresh_seconds=60)
+    registry.refresh(fake_redis)
+    assert registry.needs_refresh() is False
+
+    publish_prompt_update(fake_redis, "NEW PROMPT")
+    deadline = time.monotonic() + 1
+    while not registry.needs_refresh() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert registry.needs_refresh() is True
+    registry._listener.stop()
+
+
+def test_prepare_messages_uses_registry_variant(fake_redis):
+    messages = prepare_messages("What is a PMF?", "session-1")
+    assert messages[0]["content"] == (
+        DEFAULT_SYSTEM_INSTRUCTIONS + "\n\n" + NEW_CONVERSATION_INSTRUCTIONS)
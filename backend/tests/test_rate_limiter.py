@@ -0,0 +1,94 @@
+import pytest
+from rate_limiter import RateLimiter
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.parametrize(
+    "algorithm", ["fixed_window", "sliding_window", "token_bucket"])
+def test_allows_up_to_limit_then_rejects(fake_redis, algorithm):
+    limiter = RateLimiter("rate", limit=3, window_seconds=5,
+                          algorithm=algorithm, clock=FakeClock())
+
+    results = [limiter.check(fake_redis, "1.2.3.4") for _ in range(4)]
+
+    assert [r.allowed for r in results] == [True, True, True, False]
+    assert [r.remaining for r in results] == [2, 1, 0, 0]
+    assert 0 < results[-1].retry_after <= 5
+
+
+@pytest.mark.parametrize(
+    "algorithm", ["fixed_window", "sliding_window", "token_bucket"])
+def test_limits_are_per_identifier(fake_redis, algorithm):
+    limiter = RateLimiter("rate", limit=1, window_seconds=5,
+                          algorithm=algorithm, clock=FakeClock())
+
+    assert limiter.check(fake_redis, "1.1.1.1").allowed
+    assert limiter.check(fake_redis, "2.2.2.2").allowed
+    assert not limiter.check(fake_redis, "1.1.1.1").allowed
+
+
+def test_sliding_window_frees_slots_as_requests_age(fake_redis):
+    clock = FakeClock()
+    limiter = RateLimiter("rate", limit=2, window_seconds=10,
+                          algorithm="sliding_window", clock=clock)
+
+    limiter.check(fake_redis, "ip")
+    clock.now += 6
+    limiter.check(fake_redis, "ip")
+    rejected = limiter.check(fake_redis, "ip")
+    assert not rejected.allowed
+    assert rejected.retry_after == pytest.approx(4)
+
+    clock.now += 4.5
+    assert limiter.check(fake_redis, "ip").allowed
+
+
+def test_token_bucket_refills_over_time(fake_redis):
+    clock = FakeClock()
+    limiter = RateLimiter("rate", limit=2, window_seconds=10,
+                          algorithm="token_bucket", clock=clock)
+
+    limiter.check(fake_redis, "ip")
+    limiter.check(fake_redis, "ip")
+    rejected = limiter.check(fake_redis, "ip")
+    assert not rejected.allowed
+    assert rejected.retry_after == pytest.approx(5)
+
+    clock.now += 5
+    assert limiter.check(fake_redis, "ip").allowed
+
+
+def test_each_check_is_a_single_evalsha(counting_redis):
+    limiter = RateLimiter("rate", limit=3, window_seconds=5)
+    limiter.check(counting_redis, "ip")  # loads the script on first use
+    counting_redis.commands.clear()
+
+    limiter.check(counting_redis, "ip")
+    limiter.check(counting_redis, "ip")
+
+    assert counting_redis.commands == ["evalsha", "evalsha"]
+
+
+def test_unknown_algorithm_is_rejected():
+    with pytest.raises(ValueError, match="Unknown rate limit algorithm"):
+        RateLimiter("rate", limit=3, window_seconds=5, algorithm="leaky")
+
+
+def test_headers_include_retry_after_only_when_rejected(fake_redis):
+    limiter = RateLimiter("rate", limit=1, window_seconds=5,
+                          clock=FakeClock())
+
+    allowed = limiter.check(fake_redis, "ip").headers()
+    rejected = limiter.check(fake_redis, "ip").headers()
+
+    assert allowed["RateLimit-Limit"] == "1"
+    assert allowed["RateLimit-Remaining"] == "0"
+    assert "Retry-After" not in allowed
+    assert rejected["Retry-After"] == "5"
@@ -0,0 +1,182 @@
+from unittest.mock import ANY
+
+import pytest
+import ratings
+from app import store_rating
+from rating_worker import RatingWorker
+
+
+def rate(message_id, rating):
+    store_rating({"messageId": message_id, "rating": rating,
+                  "userInput": "question", "assistantOutput": "answer"})
+
+
+def today(fake_redis):
+    _, fields = fake_redis.xrange(ratings.STREAM_KEY, count=1)[0]
+    return fields["timestamp"][:10]
+
+
+def test_rate_endpoint_only_queues(client, counting_redis, monkeypatch):
+    monkeypatch.setattr("app.redis_client", counting_redis)
+    # The first request loads the rate limit script
+    client.post("/api/rate", json={"messageId": "m0", "rating": 4})
+    counting_redis.commands.clear()
+
+    response = client.post("/api/rate", json={"messageId": "m1", "rating": 4})
+    assert response.status_code == 200
+    # The rate limit check, then one XADD
+    assert counting_redis.commands == ["evalsha", "xadd"]
+    assert ratings.backlog(counting_redis.client) == 2
+    assert not counting_redis.client.exists("rating:m1")
+
+
+def test_poll_stores_ratings_and_aggregates(fake_redis, rating_worker):
+    rate("m1", 5)
+    rate("m2", 3)
+    rate("m3", 4.0)
+    day = today(fake_redis)
+
+    assert rating_worker.poll() == 3
+    assert fake_redis.hgetall("rating:m2")["rating"] == "3"
+    assert ratings.histogram(fake_redis) == {"5": 1, "3": 1, "4": 1}
+    assert ratings.daily_mean(fake_redis, day) == 4.0
+    assert ratings.backlog(fake_redis) == 0
+
+
+def test_rerating_replaces_old_score(fake_redis, rating_worker):
+    rate("m1", 1)
+    rating_worker.poll()
+    rate("m1", 5)
+    rate("m2", 2)
+    rate("m2", 4)
+    rating_worker.poll()
+
+    assert ratings.histogram(fake_redis) == {"5": 1, "4": 1}
+    day = fake_redis.hget("rating:m1", "timestamp")[:10]
+    assert ratings.daily_mean(fake_redis, day) == 4.5
+
+
+def test_store_retries_when_another_worker_stores_first(fake_redis,
+                                                       monkeypatch):
+    first = RatingWorker(fake_redis, "w1", flush_interval=0.01)
+    second = RatingWorker(fake_redis, "w2", flush_interval=0.01)
+    first.ensure_group()
+    rate("m1", 1)
+    first.poll()
+    rate("m1", 5)
+    rate("m1", 3)
+    first_batch = first.read(count=1)
+    second_batch = second.read(count=1)
+
+    queue_store = ratings.queue_store
+    interleaved = []
+
+    def store_between_read_and_write(pipe, entries, reads):
+        # The second worker stores its re-rating after the first one read
+        # the old score of 1, before the first one writes
+        if not interleaved:
+            interleaved.append(reads)
+            second.store(second_batch)
+        queue_store(pipe, entries, reads)
+
+    monkeypatch.setattr("ratings.queue_store", store_between_read_and_write)
+    first.store(first_batch)
+
+    assert interleaved == [[["1", ANY], ["m1"]]]
+    assert first.retries == 1
+    # The score of 3 was replaced, not the score of 1 a second time
+    assert ratings.histogram(fake_redis) == {"5": 1}
+    assert ratings.backlog(fake_redis) == 0
+
+
+def test_workers_replace_each_others_ratings(fake_redis):
+    first = RatingWorker(fake_redis, "w1", flush_interval=0.01)
+    second = RatingWorker(fake_redis, "w2", flush_interval=0.01)
+    first.ensure_group()
+    rate("m1", 1)
+    first.poll()
+    rate("m1", 5)
+    rate("m1", 3)
+    first_batch = first.read(count=1)
+    second_batch = second.read(count=1)
+
+    second.store(second_batch)
+    first.store(first_batch)
+    day = fake_redis.hget("rating:m1", "timestamp")[:10]
+    assert ratings.histogram(fake_redis) == {"5": 1}
+    assert ratings.daily_mean(fake_redis, day) == 5.0
+
+
+def test_rerating_does_not_count_below_zero(fake_redis, rating_worker):
+    rate("m1", 1)
+    rating_worker.poll()
+    day = fake_redis.hget("rating:m1", "timestamp")[:10]
+    # The aggregates were lost (e.g. the day expired) but the rating was not
+    fake_redis.delete(ratings.HISTOGRAM_KEY, ratings.daily_key(day))
+    rate("m1", 5)
+    rating_worker.poll()
+
+    assert fake_redis.hgetall(ratings.HISTOGRAM_KEY) == {"5": "1"}
+    assert ratings.daily_mean(fake_redis, day) == 5.0
+
+
+def test_daily_aggregates_expire(fake_redis, rating_worker):
+    rate("m1", 4)
+    day = today(fake_redis)
+    rating_worker.poll()
+
+    ttl = fake_redis.ttl(ratings.daily_key(day))
+    assert 0 < ttl <= ratings.DAILY_TTL_SECONDS
+
+
+def test_expired_ratings_leave_lowest(fake_redis, rating_worker):
+    rate("m1", 1)
+    rate("m2", 2)
+    rating_worker.poll()
+    fake_redis.delete("rating:m1")
+    rate("m3", 3)
+    rating_worker.poll()
+
+    assert fake_redis.zrange(ratings.LOWEST_KEY, 0, -1) == ["m2", "m3"]
+
+
+def test_batches_are_bounded(fake_redis):
+    worker = RatingWorker(fake_redis, "w", batch_size=2, flush_interval=0.01)
+    worker.ensure_group()
+    for i in range(5):
+        rate(f"m{i}", 3)
+
+    assert [worker.poll() for _ in range(4)] == [2, 2, 1, 0]
+    assert worker.batches == 3
+
+
+def test_restarted_worker_recovers_unacked_entries(fake_redis):
+    worker = RatingWorker(fake_redis, "w", flush_interval=0.01)
+    worker.ensure_group()
+    rate("m1", 2)
+    # Read but crash before storing
+    assert len(worker.read()) == 1
+    assert ratings.backlog(fake_redis) == 1
+
+    restarted = RatingWorker(fake_redis, "w", flush_interval=0.01)
+    assert restarted.recover() == 1
+    assert fake_redis.hget("rating:m1", "rating") == "2"
+    assert ratings.backlog(fake_redis) == 0
+
+
+def test_workers_share_the_stream(fake_redis):
+    first = RatingWorker(fake_redis, "a", batch_size=1, flush_interval=0.01)
+    second = RatingWorker(fake_redis, "b", batch_size=1, flush_interval=0.01)
+    first.ensure_group()
+    second.ensure_group()
+    rate("m1", 5)
+    rate("m2", 1)
+
+    assert first.poll() + second.poll() == 2
+    assert ratings.histogram(fake_redis) == {"5": 1, "1": 1}
+
+
+def test_queue_fails_fast_while_redis_is_down(faulty_redis):
+    faulty_redis.failing = True
+    with pytest.raises(Exception):
+        rate("m1", 5)
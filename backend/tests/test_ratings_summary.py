@@ -0,0 +1,102 @@
+import pytest
+import ratings
+from app import store_rating
+
+ADMIN = {"Authorization": "Bearer admin-secret"}
+
+
+@pytest.fixture(autouse=True)
+def admin_token(monkeypatch):
+    monkeypatch.setattr("config.ADMIN_API_TOKEN", "admin-secret")
+
+
+def rate(message_id, rating):
+    store_rating({"messageId": message_id, "rating": rating})
+
+
+def stored_day(fake_redis, message_id):
+    return fake_redis.hget(f"rating:{message_id}", "timestamp")[:10]
+
+
+@pytest.mark.parametrize("headers", [
+    {},
+    {"Authorization": "Bearer wrong"},
+    {"Authorization": "Basic admin-secret"},
+])
+def test_summary_requires_admin_token(client, headers):
+    response = client.get("/api/ratings/summary", headers=headers)
+    assert response.status_code == 403
+
+
+def test_summary_disabled_without_token(client, monkeypatch):
+    monkeypatch.setattr("config.ADMIN_API_TOKEN", None)
+    response = client.get("/api/ratings/summary", headers=ADMIN)
+    assert response.status_code == 403
+
+
+def test_summary_reports_aggregates(client, fake_redis, rating_worker):
+    for message_id, rating in [("m1", 5), ("m2", 4), ("m3", 1), ("m4", 4)]:
+        rate(message_id, rating)
+    rating_worker.poll()
+    rate("m5", 2)  # still queued
+
+    response = client.get("/api/ratings/summary?days=7&lowest=2",
+                          headers=ADMIN)
+    assert response.status_code == 200
+    data = response.get_json()
+
+    assert data["counts"] == {"5": 1, "4": 2, "1": 1}
+    assert data["rolling_mean"] == 3.5
+    assert data["window_count"] == 4
+    assert len(data["series"]) == 7
+    assert data["series"][-1] == {"day": stored_day(fake_redis, "m1"),
+                                  "count": 4, "mean": 3.5}
+    assert [r["message_id"] for r in data["lowest_rated"]] == ["m3", "m4"]
+    assert data["backlog"] == 1
+
+
+def test_lowest_rated_is_bounded(fake_redis, rating_worker, monkeypatch):
+    monkeypatch.setattr("ratings.LOWEST_RATED_LIMIT", 3)
+    for i in range(6):
+        rate(f"m{i}", 5 - i % 5)
+    rating_worker.poll()
+
+    assert fake_redis.zcard(ratings.LOWEST_KEY) == 3
+    lowest = ratings.summary(fake_redis, days=1, lowest=3)["lowest_rated"]
+    # Ratings are 5, 4, 3, 2, 1, 5; only the three lowest are kept
+    assert [r["message_id"] for r in lowest] == ["m4", "m3", "m2"]
+
+
+def test_rerated_message_moves_out_of_lowest(fake_redis, rating_worker):
+    rate("m1", 1)
+    rate("m2", 3)
+    rating_worker.poll()
+    rate("m1", 5)
+    rating_worker.poll()
+
+    lowest = ratings.summary(fake_redis, days=1, lowest=1)["lowest_rated"]
+    assert lowest == [{"message_id": "m2", "rating": 3.0,
+                       "timestamp": fake_redis.hget("rating:m2", "timestamp")}]
+
+
+def test_summary_cost_does_not_grow_with_ratings(client, counting_redis,
+                                                 rating_worker, monkeypatch):
+    for i in range(50):
+        rate(f"m{i}", i % 5 + 1)
+    rating_worker.poll()
+    monkeypatch.setattr("app.redis_client", counting_redis)
+
+    client.get("/api/ratings/summary?days=30", headers=ADMIN)
+    assert counting_redis.commands == ["pipeline", "pipeline"]
+
+
+@pytest.mark.parametrize("query", ["days=0", "days=abc", "lowest=1000"])
+def test_summary_validates_parameters(client, query):
+    response = client.get(f"/api/ratings/summary?{query}", headers=ADMIN)
+    assert response.status_code == 400
+
+
+def test_summary_unavailable_while_redis_is_down(client, faulty_redis):
+    faulty_redis.failing = True
+    response = client.get("/api/ratings/summary", headers=ADMIN)
+    assert response.status_code == 503
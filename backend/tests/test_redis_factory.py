@@ -0,0 +1,116 @@
+import asyncio
+import threading
+import time
+import fakeredis
+import fakeredis.aioredis
+import pytest
+import redis
+from prometheus_client import REGISTRY
+from redis_factory import create_async_redis_client, create_redis_client
+from redis_pools import (
+    InstrumentedAsyncBlockingConnectionPool,
+    InstrumentedBlockingConnectionPool,
+)
+
+
+def sample(name):
+    return REGISTRY.get_sample_value(name) or 0
+
+
+def fake_pool(max_connections=1, timeout=0.05):
+    return InstrumentedBlockingConnectionPool(
+        max_connections=max_connections, timeout=timeout,
+        connection_class=fakeredis.FakeRedisConnection,
+        server=fakeredis.FakeServer(), decode_responses=True)
+
+
+def test_client_honors_config(monkeypatch):
+    monkeypatch.setattr("config.REDIS_DB", 3)
+    monkeypatch.setattr("config.REDIS_PASSWORD", "secret")
+    monkeypatch.setattr("config.REDIS_SSL", True)
+    monkeypatch.setattr("config.REDIS_MAX_CONNECTIONS", 7)
+
+    client = create_redis_client()
+    pool = client.connection_pool
+    assert isinstance(pool, InstrumentedBlockingConnectionPool)
+    assert pool.max_connections == 7
+    assert pool.connection_class is redis.SSLConnection
+    assert pool.connection_kwargs["db"] == 3
+    assert pool.connection_kwargs["password"] == "secret"
+    assert pool.connection_kwargs["ssl_cert_reqs"] == "required"
+    assert pool.connection_kwargs["health_check_interval"] > 0
+
+
+def test_async_client_honors_config(monkeypatch):
+    monkeypatch.setattr("config.REDIS_DB", 2)
+    pool = create_async_redis_client().connection_pool
+    assert isinstance(pool, InstrumentedAsyncBlockingConnectionPool)
+    assert pool.connection_class is redis.asyncio.Connection
+    assert pool.connection_kwargs["db"] == 2
+
+
+def test_metrics_count_checkouts():
+    pool = fake_pool(max_connections=2)
+    client = redis.Redis(connection_pool=pool)
+    client.set("key", "value")
+    assert client.get("key") == "value"
+
+    metrics = pool.metrics()
+    assert metrics["checkouts"] == 2
+    assert metrics["waits"] == 0
+    assert metrics["created"] == 1
+    assert metrics["in_use"] == 0
+    assert metrics["saturation"] == 0
+
+
+def test_metrics_report_saturation_and_timeouts():
+    pool = fake_pool(max_connections=1)
+    connection = pool.get_connection("GET")
+    assert pool.metrics()["saturation"] == 1
+    timeouts = sample("tutorgpt_redis_pool_timeouts_total")
+
+    with pytest.raises(redis.ConnectionError):
+        pool.get_connection("GET")
+    assert pool.metrics()["timeouts"] == 1
+    assert sample("tutorgpt_redis_pool_timeouts_total") - timeouts == 1
+    pool.release(connection)
+
+
+def test_metrics_record_wait_time():
+    pool = fake_pool(max_connections=1, timeout=1)
+    connection = pool.get_connection("GET")
+    waits = sample("tutorgpt_redis_pool_waits_total")
+    waited = sample("tutorgpt_redis_pool_wait_seconds_sum")
+    waiter = threading.Thread(
+        target=lambda: pool.release(pool.get_connection("GET")))
+    waiter.start()
+    time.sleep(0.05)
+    pool.release(connection)
+    waiter.join()
+
+    metrics = pool.metrics()
+    assert metrics["waits"] == 1
+    assert metrics["max_wait_seconds"] >= 0.04
+    assert metrics["in_use"] == 0
+    assert sample("tutorgpt_redis_pool_waits_total") - waits == 1
+    assert sample("tutorgpt_redis_pool_wait_seconds_sum") - waited >= 0.04
+
+
+def test_async_metrics_report_timeouts():
+    async def run():
+        pool = InstrumentedAsyncBlockingConnectionPool(
+            max_connections=1, timeout=0.05,
+            connection_class=fakeredis.aioredis.FakeAsyncRedisConnection,
+            server=fakeredis.FakeServer(), decode_responses=True)
+        client = redis.asyncio.Redis(connection_pool=pool)
+        await client.set("key", "value")
+        connection = await pool.get_connection("GET")
+        with pytest.raises(redis.ConnectionError):
+            await pool.get_connection("GET")
+        await pool.release(connection)
+        await pool.disconnect()
+        return pool.metrics()
+
+    metrics = asyncio.run(run())
+    assert metrics["checkouts"] == 2
+    assert metrics["timeouts"] == 1
@@ -0,0 +1,100 @@
+import time
+import pytest
+import redis
+from rate_limiter import LocalRateLimiter
+from resilience import CircuitBreaker, CircuitOpenError
+
+
+def failing_call():
+    raise redis.ConnectionError("down")
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("test", failure_threshold=2)
+
+    for _ in range(2):
+        with pytest.raises(redis.ConnectionError):
+            breaker.call(failing_call)
+
+    assert breaker.is_open
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: "not called")
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker("test", failure_threshold=2)
+    breaker.call(failing_call, fallback=lambda: None)
+    breaker.call(lambda: "ok")
+    breaker.call(failing_call, fallback=lambda: None)
+
+    assert not breaker.is_open
+
+
+def test_open_breaker_uses_fallback_without_calling():
+    breaker = CircuitBreaker("test", failure_threshold=1)
+    breaker.call(failing_call, fallback=lambda: None)
+    calls = []
+
+    result = breaker.call(calls.append, "x", fallback=lambda: "fallback")
+
+    assert result == "fallback"
+    assert calls == []
+
+
+def test_probe_closes_breaker_when_redis_recovers():
+    healthy = []
+
+    def probe():
+        if not healthy:
+            raise redis.ConnectionError("still down")
+
+    breaker = CircuitBreaker("test", failure_threshold=1, probe=probe,
+                             probe_interval=0.01)
+    breaker.call(failing_call, fallback=lambda: None)
+    assert breaker.is_open
+
+    healthy.append(True)
+    deadline = time.monotonic() + 5
+    while breaker.is_open and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert not breaker.is_open
+
+
+def test_local_rate_limiter_enforces_limit():
+    now = [100.0]
+    limiter = LocalRateLimiter(limit=2, window_seconds=5, clock=lambda: now[0])
+
+    assert [limiter.check("ip").allowed for _ in range(3)] == [
+        True, True, False]
+    now[0] += 5
+    assert limiter.check("ip").allowed
+
+
+def test_chat_keeps_working_while_redis_is_down(client, faulty_redis,
+                                                monkeypatch):
+    import app as app_module
+
+    monkeypatch.setattr("app.llm_client.create",
+                        lambda model, messages: {
+                            "choices": [{"message": {"content": "Hi there"}}]})
+    faulty_redis.failing = True
+
+    responses = [
+        client.post("/api/chat", json={"message": "Hello"}) for _ in range(4)]
+
+    assert app_module.redis_breaker.is_open
+    assert [r.status_code for r in responses] == [200, 200, 200, 429]
+    assert responses[0].get_json()["assistant_message"] == "Hi there"
+
+
+def test_rating_fails_fast_while_redis_is_down(client, faulty_redis):
+    import app as app_module
+
+    faulty_redis.failing = True
+    for _ in range(app_module.redis_breaker.failure_threshold):
+        app_module.redis_breaker.call(faulty_redis.ping, fallback=lambda: None)
+
+    response = client.post("/api/rate", json={"messageId": "m", "rating": 5})
+
+    assert response.status_code == 500
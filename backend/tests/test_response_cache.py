@@ -0,0 +1,80 @@
+import pytest
+from response_cache import (
+    ResponseCache,
+    estimate_similarity,
+    minhash_signature,
+)
+
+SYSTEM = {"role": "system", "content": "You are Tutor++."}
+
+
+def first_turn(question):
+    return [SYSTEM, {"role": "user", "content": question}]
+
+
+def test_exact_hit_ignores_case_and_whitespace(fake_redis):
+    cache = ResponseCache()
+    cache.set(fake_redis, first_turn("What is Bayes' theorem?"), "Think about...")
+
+    hit = cache.get(fake_redis, first_turn("  what is   BAYES' theorem? "))
+
+    assert hit.response == "Think about..."
+    assert hit.kind == "exact"
+    assert cache.stats["exact_hits"] == 1
+
+
+def test_different_history_misses(fake_redis):
+    cache = ResponseCache()
+    cache.set(fake_redis, first_turn("Why?"), "Because...")
+    with_history = [
+        SYSTEM,
+        {"role": "user", "content": "Explain variance"},
+        {"role": "assistant", "content": "Variance measures..."},
+        {"role": "user", "content": "Why?"},
+    ]
+
+    assert cache.get(fake_redis, with_history) is None
+    assert cache.stats["misses"] == 1
+
+
+def test_entries_expire(fake_redis):
+    cache = ResponseCache(ttl_seconds=60)
+    cache.set(fake_redis, first_turn("What is a PMF?"), "A PMF...")
+
+    assert 0 < fake_redis.ttl(cache.key(first_turn("What is a PMF?"))) <= 60
+
+
+def test_minhash_similarity_tracks_overlap():
+    question = "can you explain the binomial distribution to me please"
+    same = minhash_signature(question)
+    near = minhash_signature(
+        "can you explain the binomial distribution to me please?")
+    far = minhash_signature("how do I compute the variance of a sum")
+
+    assert estimate_similarity(same, near) == 1.0
+    assert estimate_similarity(same, far) < 0.3
+
+
+def test_similar_first_turn_question_hits(fake_redis):
+    cache = ResponseCache(similarity_enabled=True, similarity_threshold=0.5)
+    cache.set(
+        fake_redis,
+        first_turn("can you explain the binomial distribution to me"),
+        "Start from Bernoulli trials...",
+    )
+
+    hit = cache.get(
+        fake_redis,
+        first_turn("can you explain the binomial distribution to me again"))
+
+    assert hit.kind == "similar"
+    assert hit.response == "Start from Bernoulli trials..."
+    assert cache.stats["similar_hits"] == 1
+
+
+def test_similarity_tier_is_off_by_default(fake_redis):
+    cache = ResponseCache()
+    cache.set(fake_redis, first_turn("explain the binomial distribution"), "x")
+
+    assert cache.get(
+        fake_redis, first_turn("explain the binomial distribution again")) is None
@@ -0,0 +1,418 @@
+import asyncio
+import threading
+import time
+import pytest
+from single_flight import SingleFlight, _StreamAbandoned
+
+MESSAGES = [{"role": "system", "content": "You are a tutor."},
+            {"role": "user", "content": "What is a PMF?"}]
+
+
+class SlowCall:
+    """Counts calls and takes `seconds` to answer."""
+
+    def __init__(self, seconds=0.2, result="A PMF maps outcomes to probabilities."):
+        self.seconds = seconds
+        self.result = result
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.seconds)
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+def run_concurrently(count, target):
+    results = [None] * count
+    errors = [None] * count
+
+    def run(i):
+        try:
+            results[i] = target(i)
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def test_key_matches_normalized_messages():
+    flight = SingleFlight()
+    variant = [MESSAGES[0], {"role": "user", "content": "  what is a   PMF? "}]
+    assert flight.key(MESSAGES) == flight.key(variant)
+    other = [MESSAGES[0], {"role": "user", "content": "What is a CDF?"}]
+    assert flight.key(MESSAGES) != flight.key(other)
+
+
+def test_concurrent_requests_share_one_call():
+    flight = SingleFlight()
+    call = SlowCall()
+    results, errors = run_concurrently(10, lambda i: flight.do(MESSAGES, call))
+
+    assert call.calls == 1
+    assert set(results) == {call.result}
+    assert flight.stats["coalesced"] == 9
+
+
+def contended(flight):
+    flight.mark_contended(flight.key(MESSAGES))
+    return flight
+
+
+def test_uncontended_request_does_not_touch_redis(counting_redis):
+    flight = SingleFlight()
+    call = SlowCall(0)
+    assert flight.do(MESSAGES, call, counting_redis) == call.result
+    assert counting_redis.commands == []
+
+
+def test_followers_mark_the_key_contended():
+    flight = SingleFlight()
+    run_concurrently(3, lambda i: flight.do(MESSAGES, SlowCall()))
+    assert flight.is_contended(flight.key(MESSAGES))
+    assert not SingleFlight(contended_ttl=0).is_contended(flight.key(MESSAGES))
+
+
+def test_workers_share_one_call_through_redis(fake_redis):
+    # Two SingleFlight instances stand in for two worker processes
+    workers = [contended(SingleFlight()), contended(SingleFlight())]
+    call = SlowCall()
+    results, errors = run_concurrently(
+        6, lambda i: workers[i % 2].do(MESSAGES, call, fake_redis))
+
+    assert call.calls == 1
+    assert set(results) == {call.result}
+    assert not fake_redis.exists(workers[0].lock_key(workers[0].key(MESSAGES)))
+
+
+def test_later_request_reads_the_shared_result(fake_redis):
+    contended(SingleFlight()).do(MESSAGES, SlowCall(0), fake_redis)
+    call = SlowCall(0)
+    assert contended(SingleFlight()).do(MESSAGES, call, fake_redis) == \
+        call.result
+    assert call.calls == 0
+
+
+def test_waiting_worker_is_woken_by_publish(fake_redis):
+    leader, follower = contended(SingleFlight()), contended(SingleFlight())
+    started = threading.Event()
+    finished = []
+
+    def lead():
+        def call():
+            started.set()
+            time.sleep(0.2)
+            return "answer"
+        leader.do(MESSAGES, call, fake_redis)
+        finished.append(time.monotonic())
+
+    thread = threading.Thread(target=lead)
+    thread.start()
+    started.wait()
+    call = SlowCall(0)
+    assert follower.do(MESSAGES, call, fake_redis) == "answer"
+    woken = time.monotonic()
+    thread.join()
+    assert call.calls == 0
+    assert follower.stats["shared"] == 1
+    # Woken by the publish, not by a poll interval
+    assert woken - finished[0] < 0.1
+
+
+def test_released_lock_wakes_a_worker_to_take_over(fake_redis):
+    leader, follower = contended(SingleFlight()), contended(SingleFlight())
+    started = threading.Event()
+
+    def fail():
+        started.set()
+        time.sleep(0.1)
+        raise RuntimeError("upstream failed")
+
+    thread = threading.Thread(
+        target=lambda: pytest.raises(
+            RuntimeError, leader.do, MESSAGES, fail, fake_redis))
+    thread.start()
+    started.wait()
+    call = SlowCall(0)
+    start = time.monotonic()
+    assert follower.do(MESSAGES, call, fake_redis) == call.result
+    thread.join()
+    assert call.calls == 1
+    assert follower.stats["calls"] == 1
+    assert time.monotonic() - start < 1
+
+
+def test_follower_calls_itself_after_timeout():
+    flight = SingleFlight(wait_timeout=0.05)
+    call = SlowCall(seconds=0.3)
+    results, errors = run_concurrently(2, lambda i: flight.do(MESSAGES, call))
+
+    assert call.calls == 2
+    assert flight.stats["timeouts"] == 1
+
+
+def test_follower_calls_itself_while_other_worker_holds_lock(fake_redis):
+    flight = contended(SingleFlight(wait_timeout=0.05))
+    fake_redis.set(flight.lock_key(flight.key(MESSAGES)), "other-worker")
+    call = SlowCall(0)
+    assert flight.do(MESSAGES, call, fake_redis) == call.result
+    assert call.calls == 1
+    assert flight.stats["timeouts"] == 1
+
+
+def test_leader_error_is_shared_and_lock_released(fake_redis):
+    flight = contended(SingleFlight())
+    call = SlowCall(result=RuntimeError("upstream failed"))
+    results, errors = run_concurrently(
+        3, lambda i: flight.do(MESSAGES, call, fake_redis))
+
+    assert call.calls == 1
+    assert all(isinstance(e, RuntimeError) for e in errors)
+    assert not fake_redis.exists(flight.lock_key(flight.key(MESSAGES)))
+
+
+def test_redis_failure_falls_back_to_direct_call(faulty_redis):
+    faulty_redis.failing = True
+    call = SlowCall(0)
+    flight = contended(SingleFlight())
+    assert flight.do(MESSAGES, call, faulty_redis) == call.result
+    assert call.calls == 1
+
+
+def test_redis_calls_go_through_the_breaker(fake_redis):
+    from resilience import CircuitBreaker
+    breaker = CircuitBreaker("test")
+    breaker.record_failure(RuntimeError("down"))
+    breaker.record_failure(RuntimeError("down"))
+    breaker.record_failure(RuntimeError("down"))
+    assert breaker.is_open
+    flight = contended(SingleFlight(breaker=breaker))
+    fake_redis.set(flight.lock_key(flight.key(MESSAGES)), "other-worker")
+    call = SlowCall(0)
+    # An open circuit skips Redis instead of waiting on the other worker
+    assert flight.do(MESSAGES, call, fake_redis) == call.result
+    assert call.calls == 1
+    assert flight.stats["timeouts"] == 0
+
+
+def test_async_requests_share_one_call(async_fake_redis):
+    flight = SingleFlight()
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return "answer"
+
+    async def run():
+        try:
+            return await asyncio.gather(
+                *(flight.do_async(MESSAGES, call, async_fake_redis)
+                  for _ in range(5)))
+        finally:
+            await async_fake_redis.connection_pool.disconnect()
+
+    assert asyncio.run(run()) == ["answer"] * 5
+    assert len(calls) == 1
+    assert flight.stats["coalesced"] == 4
+
+
+def test_async_workers_share_one_call_through_redis(async_fake_redis):
+    workers = [contended(SingleFlight()), contended(SingleFlight())]
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return "answer"
+
+    async def run():
+        try:
+            return await asyncio.gather(
+                *(workers[i % 2].do_async(MESSAGES, call, async_fake_redis)
+                  for i in range(4)))
+        finally:
+            await async_fake_redis.connection_pool.disconnect()
+
+    assert asyncio.run(run()) == ["answer"] * 4
+    assert len(calls) == 1
+    assert sum(worker.stats["shared"] for worker in workers) == 1
+
+
+def slow_stream(calls, chunks=("A PMF ", "maps ", "outcomes."), seconds=0.05):
+    def stream():
+        calls.append(1)
+        for chunk in chunks:
+            time.sleep(seconds)
+            yield chunk
+    return stream
+
+
+def test_concurrent_streams_share_one_call():
+    flight = SingleFlight()
+    calls = []
+    results, errors = run_concurrently(
+        5, lambda i: list(flight.stream(MESSAGES, slow_stream(calls))))
+
+    assert len(calls) == 1
+    # Followers that join late still get every chunk, in order
+    assert results == [["A PMF ", "maps ", "outcomes."]] * 5
+    assert flight.stats["coalesced"] == 4
+
+
+def test_stream_follower_fails_when_the_leader_goes_away_mid_stream():
+    flight = SingleFlight()
+    calls = []
+    leader = flight.stream(MESSAGES, slow_stream(calls))
+    assert next(leader) == "A PMF "
+    follower = flight.stream(MESSAGES, slow_stream(calls))
+    # Replays what the leader has so far
+    assert next(follower) == "A PMF "
+    leader.close()
+    # Having sent part of the leader's stream, it cannot start over
+    with pytest.raises(_StreamAbandoned):
+        next(follower)
+    assert len(calls) == 1
+
+
+def test_stream_follower_streams_itself_when_the_leader_is_cancelled():
+    flight = SingleFlight()
+    calls = []
+
+    async def stream(delay):
+        calls.append(1)
+        await asyncio.sleep(delay)
+        yield f"after {delay}s"
+
+    async def collect(delay):
+        return [chunk async for chunk in
+                flight.stream_async(MESSAGES, lambda: stream(delay))]
+
+    async def run():
+        leader = asyncio.ensure_future(collect(10))
+        await asyncio.sleep(0.01)
+        follower = asyncio.ensure_future(collect(0))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(run()) == ["after 0s"]
+    assert len(calls) == 2
+    assert flight.stats["timeouts"] == 0
+
+
+def test_stream_follower_streams_itself_after_timeout():
+    flight = SingleFlight(wait_timeout=0.05)
+    calls = []
+    results, errors = run_concurrently(
+        2, lambda i: list(flight.stream(MESSAGES, slow_stream(
+            calls, seconds=0.2))))
+
+    assert len(calls) == 2
+    assert results == [["A PMF ", "maps ", "outcomes."]] * 2
+    assert flight.stats["timeouts"] == 1
+
+
+def test_stream_leader_error_is_shared():
+    flight = SingleFlight()
+    calls = []
+
+    def failing():
+        calls.append(1)
+        time.sleep(0.1)
+        raise RuntimeError("upstream failed")
+        yield
+
+    results, errors = run_concurrently(
+        3, lambda i: list(flight.stream(MESSAGES, failing)))
+    assert len(calls) == 1
+    assert all(isinstance(e, RuntimeError) for e in errors)
+
+
+def test_stream_workers_share_one_call_through_redis(fake_redis):
+    workers = [contended(SingleFlight()), contended(SingleFlight())]
+    calls = []
+    results, errors = run_concurrently(
+        2, lambda i: list(workers[i].stream(MESSAGES, slow_stream(calls),
+                                            fake_redis)))
+
+    assert len(calls) == 1
+    # The other worker gets the complete text in one chunk
+    assert sorted(results) == [["A PMF ", "maps ", "outcomes."],
+                               ["A PMF maps outcomes."]]
+
+
+def test_async_streams_share_one_call():
+    flight = SingleFlight()
+    calls = []
+
+    async def stream():
+        calls.append(1)
+        for chunk in ("A PMF ", "maps ", "outcomes."):
+            await asyncio.sleep(0.02)
+            yield chunk
+
+    async def collect():
+        return [chunk async for chunk in flight.stream_async(MESSAGES, stream)]
+
+    async def run():
+        return await asyncio.gather(*(collect() for _ in range(4)))
+
+    assert asyncio.run(run()) == [["A PMF ", "maps ", "outcomes."]] * 4
+    assert len(calls) == 1
+    assert flight.stats["coalesced"] == 3
+
+
+def test_concurrent_streamed_chats_make_one_model_call(monkeypatch):
+    from app import app
+    monkeypatch.setattr("config.RESPONSE_CACHE_ENABLED", False)
+    calls = []
+
+    def fake_stream(model, messages, stream):
+        assert stream is True
+        return ({"choices": [{"delta": {"content": chunk}}]}
+                for chunk in slow_stream(calls)())
+
+    monkeypatch.setattr("app.llm_client.create", fake_stream)
+
+    def chat(i):
+        response = app.test_client().post(
+            "/api/chat",
+            json={"message": "What is a PMF?", "sessionId": f"s{i}",
+                  "stream": True})
+        return response.get_data(as_text=True)
+
+    results, errors = run_concurrently(3, chat)
+    assert errors == [None] * 3
+    assert len(calls) == 1
+    for body in results:
+        assert '"assistant_message": "A PMF maps outcomes."' in body
+
+
+@pytest.mark.parametrize("is_contended,expected", [
+    (False, ["pipeline", "pipeline"]),
+    (True, ["pipeline", "evalsha", "evalsha", "pipeline"]),
+])
+def test_chat_round_trips_with_coalescing(client, counting_redis, monkeypatch,
+                                          is_contended, expected):
+    monkeypatch.setattr("app.redis_client", counting_redis)
+    monkeypatch.setattr("config.RESPONSE_CACHE_ENABLED", False)
+    monkeypatch.setattr("app.single_flight.is_contended",
+                        lambda key: is_contended)
+    monkeypatch.setattr("app.llm_client.create", lambda model, messages: {
+        "choices": [{"message": {"content": "Hi"}}]})
+    client.post("/api/chat", json={"message": "Hello", "sessionId": "s"})
+    counting_redis.commands.clear()
+
+    client.post("/api/chat", json={"message": "What is a PMF?", "sessionId": "s"})
+    # Uncontended prompts add nothing; contended ones take the lock before
+    # the call and publish after it
+    assert counting_redis.commands == expected
@@ -0,0 +1,163 @@
+import gzip
+import json
+import os
+
+import pytest
+import static_assets
+from static_assets import StaticAssets, negotiate
+
+MAIN_JS = "console.log('tutor');\n" * 100
+
+
+@pytest.fixture
+def build_dir(tmp_path):
+    files = {
+        "index.html": "<!doctype html><div id=root></div>",
+        "robots.txt": "User-agent: *\n",
+        "static/js/main.1a2b3c4d.js": MAIN_JS,
+        "static/media/KaTeX_Main-Regular.0f1e2d3c4b5a.woff2": "wOF2" * 100,
+    }
+    for path, content in files.items():
+        file_path = tmp_path / path
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_text(content)
+    manifest = {"files": {
+        "main.js": "/static/js/main.1a2b3c4d.js",
+        "static/media/KaTeX_Main-Regular.woff2":
+            "/static/media/KaTeX_Main-Regular.0f1e2d3c4b5a.woff2",
+        "index.html": "/index.html",
+    }}
+    (tmp_path / "asset-manifest.json").write_text(json.dumps(manifest))
+    return tmp_path
+
+
+@pytest.fixture
+def assets(build_dir, monkeypatch):
+    assets = StaticAssets(str(build_dir))
+    monkeypatch.setattr("app.static_assets", assets)
+    return assets
+
+
+def test_hashed_assets_are_immutable(client, assets):
+    response = client.get("/static/js/main.1a2b3c4d.js")
+    assert response.status_code == 200
+    assert response.get_data(as_text=True) == MAIN_JS
+    assert response.headers["Cache-Control"] == \
+        "public, max-age=31536000, immutable"
+
+    font = client.get("/static/media/KaTeX_Main-Regular.0f1e2d3c4b5a.woff2")
+    assert "immutable" in font.headers["Cache-Control"]
+    # Already compressed formats are sent as is
+    assert "Content-Encoding" not in font.headers
+
+
+def test_index_is_revalidated(client, assets):
+    response = client.get("/")
+    assert response.headers["Cache-Control"] == "no-cache"
+    assert b"id=root" in response.data
+    assert client.get("/robots.txt").headers["Cache-Control"] == "no-cache"
+
+
+def test_lazy_assets_load_on_first_request(build_dir, client, monkeypatch):
+    assets = StaticAssets(str(build_dir), lazy=True)
+    monkeypatch.setattr("app.static_assets", assets)
+    assert assets.assets == {}
+    assert "static/js/main.1a2b3c4d.js" in assets.pending
+
+    response = client.get("/static/js/main.1a2b3c4d.js")
+    assert response.get_data(as_text=True) == MAIN_JS
+    assert "immutable" in response.headers["Cache-Control"]
+    assert "static/js/main.1a2b3c4d.js" in assets.assets
+    assert "static/js/main.1a2b3c4d.js" not in assets.pending
+    assert b"id=root" in client.get("/chat/123").data
+
+
+def test_unknown_paths_get_index(client, assets):
+    response = client.get("/chat/some-route")
+    assert response.status_code == 200
+    assert b"id=root" in response.data
+
+
+def test_gzip_variant_is_negotiated(client, assets):
+    response = client.get("/static/js/main.1a2b3c4d.js",
+                          headers={"Accept-Encoding": "gzip, deflate"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert gzip.decompress(response.data).decode() == MAIN_JS
+
+    refused = client.get("/static/js/main.1a2b3c4d.js",
+                         headers={"Accept-Encoding": "gzip;q=0"})
+    assert "Content-Encoding" not in refused.headers
+
+
+def test_prebuilt_variants_are_used(build_dir, monkeypatch):
+    path = build_dir / "static/js/main.1a2b3c4d.js"
+    (build_dir / "static/js/main.1a2b3c4d.js.gz").write_bytes(
+        gzip.compress(MAIN_JS.encode(), compresslevel=1))
+    assets = StaticAssets(str(build_dir))
+    asset = assets.assets["static/js/main.1a2b3c4d.js"]
+    assert asset.bodies["gzip"] == \
+        (build_dir / "static/js/main.1a2b3c4d.js.gz").read_bytes()
+    assert "static/js/main.1a2b3c4d.js.gz" not in assets.assets
+
+    # A variant older than its file is stale
+    os.utime(path, (os.path.getmtime(path) + 10,) * 2)
+    asset = StaticAssets(str(build_dir)).assets["static/js/main.1a2b3c4d.js"]
+    assert gzip.decompress(asset.bodies["gzip"]).decode() == MAIN_JS
+
+
+def test_etag_allows_not_modified(client, assets):
+    response = client.get("/static/js/main.1a2b3c4d.js",
+                          headers={"Accept-Encoding": "gzip"})
+    etag = response.headers["ETag"]
+    again = client.get("/static/js/main.1a2b3c4d.js",
+                       headers={"Accept-Encoding": "gzip",
+                                "If-None-Match": etag})
+    assert again.status_code == 304
+    # The uncompressed representation has a different ETag
+    plain = client.get("/static/js/main.1a2b3c4d.js",
+                       headers={"If-None-Match": etag})
+    assert plain.status_code == 200
+
+
+def test_requests_do_not_touch_the_filesystem(client, assets, monkeypatch):
+    def no_filesystem(*args, **kwargs):
+        raise AssertionError("filesystem access")
+
+    monkeypatch.setattr("os.path.exists", no_filesystem)
+    monkeypatch.setattr("builtins.open", no_filesystem)
+    assert client.get("/").status_code == 200
+    assert client.get("/static/js/main.1a2b3c4d.js").status_code == 200
+
+
+def test_large_files_are_served_from_disk(build_dir, client, monkeypatch):
+    monkeypatch.setattr("static_assets.MAX_IN_MEMORY_BYTES", 1000)
+    monkeypatch.setattr("app.static_assets", StaticAssets(str(build_dir)))
+    response = client.get("/static/js/main.1a2b3c4d.js")
+    assert response.get_data(as_text=True) == MAIN_JS
+    assert "immutable" in response.headers["Cache-Control"]
+    response.close()
+
+
+def test_missing_build_serves_api_only(tmp_path, client, monkeypatch):
+    monkeypatch.setattr("app.static_assets",
+                        StaticAssets(str(tmp_path / "missing")))
+    assert client.get("/").status_code == 404
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip, br", "br"),
+    ("gzip;q=1, br;q=0.5", "gzip"),
+    ("*", "br"),
+    ("identity", "identity"),
+    ("", "identity"),
+])
+def test_negotiate(header, expected):
+    assert negotiate(header, {"identity": b"", "gzip": b"", "br": b""}) == \
+        expected
+
+
+def test_precompress_writes_gzip_variants(build_dir):
+    static_assets.precompress(str(build_dir))
+    assert (build_dir / "static/js/main.1a2b3c4d.js.gz").exists()
+    assert not (build_dir / "robots.txt.gz").exists()
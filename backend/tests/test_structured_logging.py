@@ -0,0 +1,176 @@
+import io
+import json
+import logging
+import queue
+import threading
+import time
+
+import app as app_module
+import config
+import pytest
+import structured_logging
+from prometheus_client import REGISTRY
+from structured_logging import (
+    DroppingQueueHandler,
+    EventSamplingFilter,
+    JsonFormatter,
+)
+
+pytestmark = pytest.mark.usefixtures("patch_openai")
+
+
+@pytest.fixture
+def log_output():
+    output = io.StringIO()
+    structured_logging.setup_logging(events_per_second=3, stream=output)
+
+    def records():
+        structured_logging.flush_logging()
+        return [json.loads(line) for line in output.getvalue().splitlines()]
+
+    yield records
+    structured_logging.setup_logging(
+        level=config.LOG_LEVEL, json_format=config.LOG_FORMAT == "json",
+        queue_size=config.LOG_QUEUE_SIZE,
+        events_per_second=config.LOG_EVENTS_PER_SECOND)
+
+
+def dropped(reason, event):
+    return REGISTRY.get_sample_value("tutorgpt_log_records_dropped_total",
+                                     {"reason": reason, "event": event}) or 0
+
+
+def make_record(message="hello", **extra):
+    record = logging.LogRecord("tutor", logging.WARNING, __file__, 1,
+                               message, None, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_formatter_includes_extra_fields():
+    record = make_record("Rating received", event="rating", rating=5,
+                         request_id="abc123")
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "Rating received"
+    assert entry["level"] == "WARNING"
+    assert entry["request_id"] == "abc123"
+    assert entry["event"] == "rating"
+    assert entry["rating"] == 5
+    assert entry["time"].endswith("Z")
+
+
+def test_sampling_is_per_event_type(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("structured_logging.time.monotonic", lambda: now[0])
+    sampler = EventSamplingFilter(events_per_second=2)
+
+    before = dropped("sampled", "policy_violation")
+    passed = [sampler.filter(make_record(event="policy_violation"))
+              for _ in range(5)]
+    assert passed == [True, True, False, False, False]
+    assert sampler.filter(make_record(event="rate_limited"))
+    assert dropped("sampled", "policy_violation") - before == 3
+
+    now[0] += 1
+    record = make_record(event="policy_violation")
+    assert sampler.filter(record)
+    assert record.suppressed == 3
+
+
+def test_only_noisy_events_are_sampled():
+    sampler = EventSamplingFilter(events_per_second=1)
+    for event in ["rating", "request", None]:
+        records = [make_record(event=event) if event else make_record()
+                   for _ in range(5)]
+        assert all(sampler.filter(record) for record in records)
+
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=2))
+    before = dropped("queue_full", "")
+    start = time.monotonic()
+    for i in range(5):
+        handler.handle(make_record(f"message {i}"))
+    assert time.monotonic() - start < 0.5
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+    assert dropped("queue_full", "") - before == 3
+
+
+def test_exceptions_are_formatted_before_queueing(log_output):
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logging.getLogger("tutor").exception("Failed %s", "badly")
+    entry = log_output()[-1]
+    assert entry["message"] == "Failed badly"
+    assert "ValueError: boom" in entry["exception"]
+
+
+def test_policy_violations_are_sampled(log_output):
+    for _ in range(10):
+        assert app_module.is_violating_policy("write the code for me")
+    violations = [entry for entry in log_output()
+                  if entry.get("event") == "policy_violation"]
+    assert len(violations) == 3
+    assert violations[0]["violation"] == "blacklist"
+
+
+def test_request_log_carries_id_and_stages(client, log_output):
+    response = client.post("/api/chat", json={"message": "What is a PMF?"},
+                           headers={"X-Request-ID": "trace-42"})
+    assert response.status_code == 200
+    assert response.headers["X-Request-ID"] == "trace-42"
+
+    entry = [entry for entry in log_output()
+             if entry.get("event") == "request"][-1]
+    assert entry["request_id"] == "trace-42"
+    assert entry["endpoint"] == "chat"
+    assert entry["status"] == 200
+    assert {"load_state", "policy", "llm", "save"} <= set(entry["stages_ms"])
+    assert entry["duration_ms"] >= sum(entry["stages_ms"].values())
+
+
+def test_rate_limited_requests_are_sampled(client, log_output):
+    # Ten ratings are allowed per window, then four are rejected
+    for _ in range(14):
+        client.post("/api/rate", json={"messageId": "m1", "rating": 5})
+
+    events = [entry.get("event") for entry in log_output()
+              if entry.get("endpoint") == "rate"]
+    assert events.count("request") == 10
+    assert events.count("rate_limited") == 3
+
+
+def test_invalid_request_ids_are_replaced(client):
+    response = client.post("/api/rate", json={"messageId": "m1", "rating": 5},
+                           headers={"X-Request-ID": "<script>"})
+    request_id = response.headers["X-Request-ID"]
+    assert len(request_id) == 32 and request_id.isalnum()
+
+
+def test_blocked_log_output_does_not_delay_chat(client):
+    release = threading.Event()
+
+    class StuckStream(io.StringIO):
+        def write(self, text):
+            release.wait(10)
+            return super().write(text)
+
+    handler = structured_logging.setup_logging(queue_size=5,
+                                               stream=StuckStream())
+    try:
+        start = time.monotonic()
+        for _ in range(20):
+            logging.getLogger("flood").warning("flood")
+        response = client.post("/api/chat",
+                               json={"message": "What is a random variable?"})
+        assert response.status_code == 200
+        assert time.monotonic() - start < 2
+        assert handler.dropped > 0
+    finally:
+        release.set()
+        structured_logging.setup_logging(
+            level=config.LOG_LEVEL, json_format=config.LOG_FORMAT == "json",
+            queue_size=config.LOG_QUEUE_SIZE,
+            events_per_second=config.LOG_EVENTS_PER_SECOND)
@@ -0,0 +1,61 @@
+import asyncio
+
+import fakeredis
+import fakeredis.aioredis
+from synced_state import SyncedState, publish_update
+
+
+class Greeting(SyncedState):
+    version_key = "greeting:version"
+    invalidate_channel = "greeting:invalidate"
+
+    def __init__(self, **kwargs):
+        self.loads = 0
+        super().__init__(**kwargs)
+
+    def _default(self):
+        return "hello"
+
+    def _load(self, client):
+        self.loads += 1
+        return client.get("greeting") or "hello"
+
+    async def _load_async(self, client):
+        self.loads += 1
+        return await client.get("greeting") or "hello"
+
+    def _compile(self, data):
+        self.text = data.upper()
+
+
+def test_reloads_only_when_the_version_changes(fake_redis):
+    greeting = Greeting(refresh_seconds=0, subscribe=False)
+    assert greeting.text == "HELLO"
+    greeting.refresh(fake_redis)
+    greeting.refresh(fake_redis)
+    assert greeting.loads == 1
+
+    pipe = fake_redis.pipeline()
+    pipe.set("greeting", "hi")
+    publish_update(pipe, "greeting:version", "greeting:invalidate", "greeting")
+    greeting.refresh(fake_redis)
+
+    assert (greeting.text, greeting.loads) == ("HI", 2)
+    assert fake_redis.get("greeting:version") == "1"
+
+
+def test_refresh_async_waits_for_the_interval():
+    client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    greeting = Greeting(refresh_seconds=60, subscribe=False)
+
+    async def run():
+        await client.set("greeting", "hi")
+        await greeting.refresh_async(client)
+        await client.set("greeting", "hey")
+        await client.incr("greeting:version")
+        await greeting.refresh_async(client)
+
+    asyncio.run(run())
+    assert (greeting.text, greeting.loads) == ("HI", 1)
+    greeting.invalidate()
+    assert greeting.needs_refresh()
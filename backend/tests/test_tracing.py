@@ -0,0 +1,152 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+import tracing
+from tracing import FileExporter, OtlpHttpExporter
+
+pytestmark = pytest.mark.usefixtures("patch_openai")
+
+
+@pytest.fixture
+def spans(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracing.configure(FileExporter(str(path)))
+
+    def read():
+        if not path.exists():
+            return {}
+        finished = [json.loads(line) for line in path.read_text().splitlines()]
+        return {span["name"]: span for span in finished}
+
+    yield read
+    tracing.configure(None)
+
+
+def test_chat_is_traced_end_to_end(client, spans):
+    response = client.post("/api/chat",
+                           json={"message": "What is a random variable?"})
+    assert response.status_code == 200
+    trace_id = response.headers["X-Trace-ID"]
+    assert "X-Trace-ID" in response.headers["Access-Control-Expose-Headers"]
+    response.close()
+
+    finished = spans()
+    root = finished["POST /api/chat"]
+    assert root["trace_id"] == trace_id
+    assert root["parent_id"] is None
+    assert root["attributes"]["http.status_code"] == 200
+    for name in ["load_state", "policy", "prepare_messages", "cache_lookup",
+                 "llm", "filter", "save"]:
+        assert finished[name]["parent_id"] == root["span_id"], name
+        assert finished[name]["trace_id"] == trace_id
+
+    load_state = finished["load_state"]
+    assert finished["redis.read_chat_state"]["parent_id"] == \
+        load_state["span_id"]
+    assert finished["rate_limit.check"]["parent_id"] == load_state["span_id"]
+    assert finished["PromptRegistry.refresh"]["parent_id"] == \
+        finished["prepare_messages"]["span_id"]
+    completion = finished["llm.completion"]
+    assert completion["parent_id"] == finished["llm"]["span_id"]
+    assert completion["attributes"]["prompt_tokens"] == 120
+    assert completion["attributes"]["completion_tokens"] == 30
+    assert finished["cache_lookup"]["attributes"]["hit"] is False
+
+
+def test_streamed_chat_spans_cover_the_stream(client, spans, monkeypatch):
+    def fake_stream(model, messages, stream):
+        for token in ["Think ", "about ", "the ", "sample ", "space."]:
+            yield {"choices": [{"delta": {"content": token}}]}
+
+    monkeypatch.setattr("app.llm_client.create", fake_stream)
+    response = client.post("/api/chat",
+                           json={"message": "Hello", "stream": True})
+    response.get_data()
+    # The root span is still open until the body has been sent
+    assert "POST /api/chat" not in spans()
+    response.close()
+
+    finished = spans()
+    root = finished["POST /api/chat"]
+    stream = finished["stream"]
+    assert stream["parent_id"] == root["span_id"]
+    assert stream["attributes"]["completion_tokens"] > 0
+    assert "first_chunk_ms" in stream["attributes"]
+    assert finished["save"]["parent_id"] == root["span_id"]
+    assert root["end_ns"] >= stream["end_ns"]
+
+
+def test_traceparent_continues_the_callers_trace(client, spans):
+    trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+    response = client.post(
+        "/api/rate", json={"messageId": "m1", "rating": 5},
+        headers={"traceparent": f"00-{trace_id}-00f067aa0ba902b7-01"})
+    assert response.headers["X-Trace-ID"] == trace_id
+    response.close()
+
+    root = spans()["POST /api/rate"]
+    assert root["trace_id"] == trace_id
+    assert root["parent_id"] == "00f067aa0ba902b7"
+    assert spans()["queue"]["parent_id"] == root["span_id"]
+
+
+def test_tracing_is_off_by_default(client):
+    assert not tracing.enabled()
+    response = client.post("/api/chat", json={"message": "What is a PMF?"})
+    assert "X-Trace-ID" not in response.headers
+    with tracing.span("policy") as span:
+        assert span is None
+
+
+def test_exceptions_are_recorded(spans):
+    root = tracing.start_trace("job")
+    with pytest.raises(ValueError):
+        with tracing.span("step"):
+            raise ValueError("bad input")
+    tracing.end_trace(root)
+    root.end()
+    assert spans()["step"]["error"] == "ValueError: bad input"
+    assert tracing.current_span() is None
+
+
+def test_otlp_exporter_posts_batches():
+    received = []
+
+    class Collector(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers["Content-Length"])
+            received.append((self.path, json.loads(self.rfile.read(length))))
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Collector)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    exporter = OtlpHttpExporter(f"http://127.0.0.1:{server.server_port}",
+                                interval=0.05)
+    tracing.configure(exporter)
+    try:
+        root = tracing.start_trace("GET /api/ratings/summary")
+        with tracing.span("redis", commands=3):
+            pass
+        tracing.end_trace(root)
+        root.end()
+    finally:
+        tracing.configure(None)
+        server.shutdown()
+
+    path, body = received[0]
+    assert path == "/v1/traces"
+    resource_spans = body["resourceSpans"][0]
+    assert resource_spans["resource"]["attributes"][0]["value"] == \
+        {"stringValue": "tutorgpt-backend"}
+    sent = resource_spans["scopeSpans"][0]["spans"]
+    assert [span["name"] for span in sent] == \
+        ["redis", "GET /api/ratings/summary"]
+    assert sent[0]["parentSpanId"] == sent[1]["spanId"]
+    assert sent[0]["attributes"] == [{"key": "commands",
+                                      "value": {"intValue": "3"}}]
@@ -8,7 +8,9 @@ from app import (
     validate_rating_data,
     store_rating,
     get_conversation_history,
-    save_conversation_history,
+    append_conversation_history,
+    history_key,
+    validate_session_id,
     prepare_messages,
     get_base_system_instructions,
 )
@@ -90,7 +92,7 @@ def test_validate_rating_data(rating_data, should_raise):
         validate_rating_data(rating_data)  # Should not raise
 
 
-def test_store_rating(fake_redis):
+def test_store_rating(fake_redis, rating_worker):
     rating_data = {
         "messageId": "test-123",
         "rating": 5,
@@ -98,6 +100,7 @@ def test_store_rating(fake_redis):
         "assistantOutput": "test answer",
     }
     store_rating(rating_data)
+    assert rating_worker.poll() == 1
 
     # Verify data was stored correctly
     stored_data = fake_redis.hgetall(f"rating:{rating_data['messageId']}")
@@ -109,7 +112,7 @@ def test_store_rating(fake_redis):
 
 # Test Conversation History Management
 def test_get_conversation_history_empty(fake_redis):
-    history = get_conversation_history()
+    history = get_conversation_history("session-1")
     assert history == []
 
 
@@ -118,27 +121,64 @@ def test_get_conversation_history_with_data(fake_redis):
         {"role": "user", "content": "test1"},
         {"role": "assistant", "content": "response1"},
     ]
-    fake_redis.set("conversation_history", json.dumps(test_history))
+    fake_redis.rpush(history_key("session-1"),
+                     *[json.dumps(msg) for msg in test_history])
 
-    history = get_conversation_history()
+    history = get_conversation_history("session-1")
     assert len(history) == 2
     assert history[0]["content"] == "test1"
 
 
-def test_save_conversation_history_with_limit(fake_redis):
+def test_get_conversation_history_returns_most_recent(fake_redis):
+    append_conversation_history(
+        "session-1", [{"role": "user", "content": f"msg{i}"} for i in range(20)])
+
+    history = get_conversation_history("session-1", max_messages=5)
+    assert [msg["content"] for msg in history] == [
+        "msg15", "msg16", "msg17", "msg18", "msg19"]
+
+
+def test_conversation_history_is_per_session(fake_redis):
+    append_conversation_history(
+        "session-1", [{"role": "user", "content": "mine"}])
+
+    assert get_conversation_history("session-2") == []
+
+
+def test_append_conversation_history_with_limit(fake_redis):
     # Create history exceeding max_history
     long_history = [{"role": "user", "content": f"msg{i}"} for i in range(100)]
 
-    save_conversation_history(long_history, max_history=50)
-    saved = json.loads(fake_redis.get("conversation_history"))
+    append_conversation_history("session-1", long_history, max_history=50)
+    saved = [json.loads(msg)
+             for msg in fake_redis.lrange(history_key("session-1"), 0, -1)]
 
     assert len(saved) == 50
     assert saved[-1]["content"] == "msg99"  # Should keep most recent
+    assert fake_redis.ttl(history_key("session-1")) > 0
+
+
+@pytest.mark.parametrize(
+    "data,should_raise",
+    [
+        ({"sessionId": "abc-123_XYZ"}, False),
+        ({}, False),
+        ({"sessionId": ""}, True),
+        ({"sessionId": "../etc"}, True),
+        ({"sessionId": 42}, True),
+    ],
+)
+def test_validate_session_id(data, should_raise):
+    if should_raise:
+        with pytest.raises(ValueError):
+            validate_session_id(data)
+    else:
+        assert validate_session_id(data)
 
 
 def test_prepare_messages():
     test_message = "How do I calculate probability?"
-    messages = prepare_messages(test_message)
+    messages = prepare_messages(test_message, "session-1")
 
     assert len(messages) >= 2  # At least system and user message
     assert messages[0]["role"] == "system"
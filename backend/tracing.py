@@ -0,0 +1,302 @@
+"""
+Opt-in request tracing in the OpenTelemetry model.
+
+With TRACING_ENABLED, each API request gets a trace: a root span for the
+request and child spans for the stages inside it (rate limit and history
+read, policy check, prompt refresh, the model call with its token counts,
+filtering, saving). The trace ID is returned in the X-Trace-ID header, and
+an incoming W3C `traceparent` header continues the caller's trace.
+
+Finished spans go to an exporter:
+
+- OtlpHttpExporter batches them on a background thread and posts them as
+  OTLP/HTTP JSON to a collector (`<endpoint>/v1/traces`, port 4318 by
+  default), dropping spans rather than blocking when it falls behind.
+- FileExporter appends one JSON object per span to a file, for tests and
+  local debugging.
+
+With tracing disabled there is no current span, and span() only checks a
+ContextVar before running its block.
+"""
+import contextlib
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import urllib.request
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TRACEPARENT_PATTERN = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+_current: ContextVar[Optional["Span"]] = ContextVar("trace_span", default=None)
+_exporter = None
+
+
+def _new_id(n_bytes: int) -> str:
+    return os.urandom(n_bytes).hex()
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    parent_id: Optional[str] = None
+    span_id: str = field(default_factory=lambda: _new_id(8))
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: Optional[int] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+    # Set while a root span is current, see start_trace()
+    token: Any = field(default=None, repr=False, compare=False)
+
+    def child(self, name: str, **attributes) -> "Span":
+        return Span(name, self.trace_id, self.span_id, attributes=attributes)
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def end(self) -> None:
+        """Finish the span and export it; later calls do nothing."""
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        exporter = _exporter
+        if exporter is not None:
+            exporter.export(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+def configure(exporter) -> None:
+    """Export finished spans to `exporter`; None disables tracing."""
+    global _exporter
+    previous, _exporter = _exporter, exporter
+    if previous is not None and previous is not exporter:
+        previous.shutdown()
+
+
+def enabled() -> bool:
+    return _exporter is not None
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def start_trace(name: str, traceparent: Optional[str] = None, **attributes) -> Span:
+    """
+    A root span, continuing the trace in a valid `traceparent` header if
+    given, made current until end_trace().
+    """
+    match = TRACEPARENT_PATTERN.match(traceparent or "")
+    if match:
+        root = Span(name, match.group(1), match.group(2), attributes=attributes)
+    else:
+        root = Span(name, _new_id(16), attributes=attributes)
+    root.token = _current.set(root)
+    return root
+
+
+def end_trace(root: Span) -> None:
+    """Stop `root` being current; it is exported when root.end() is called."""
+    if root.token is not None:
+        _current.reset(root.token)
+        root.token = None
+
+
+@contextlib.contextmanager
+def span(name: str, parent: Optional[Span] = None, **attributes):
+    """
+    A child span of `parent` (by default the current span) around the block,
+    yielding it so the block can add attributes. Yields None, and records
+    nothing, outside a trace.
+    """
+    parent = parent or _current.get()
+    if parent is None:
+        yield None
+        return
+    child = parent.child(name, **attributes)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        child.end()
+
+
+def set_attributes(**attributes) -> None:
+    """Add attributes to the current span, if there is one."""
+    current = _current.get()
+    if current is not None:
+        current.set(**attributes)
+
+
+class FileExporter:
+    """Appends each finished span to `path` as a JSON line."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, finished: Span) -> None:
+        line = json.dumps(finished.to_dict(), default=str) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    def shutdown(self) -> None:
+        pass
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        # OTLP/JSON encodes 64-bit integers as strings
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_span(finished: Span) -> Dict[str, Any]:
+    encoded = {
+        "traceId": finished.trace_id,
+        "spanId": finished.span_id,
+        "name": finished.name,
+        # SPAN_KIND_SERVER for roots, SPAN_KIND_INTERNAL otherwise
+        "kind": 2 if finished.parent_id is None else 1,
+        "startTimeUnixNano": str(finished.start_ns),
+        "endTimeUnixNano": str(finished.end_ns),
+        "attributes": [
+            {"key": key, "value": _otlp_value(value)}
+            for key, value in finished.attributes.items()
+        ],
+    }
+    if finished.parent_id:
+        encoded["parentSpanId"] = finished.parent_id
+    if finished.error:
+        # STATUS_CODE_ERROR
+        encoded["status"] = {"code": 2, "message": finished.error}
+    return encoded
+
+
+class OtlpHttpExporter:
+    """
+    Sends spans to an OTLP/HTTP collector in batches from a background
+    thread. Spans arriving while `max_queue` are waiting are dropped.
+    """
+
+    def __init__(
+        self,
+        endpoint: str = "http://localhost:4318",
+        service_name: str = "tutorgpt-backend",
+        max_queue: int = 2048,
+        batch_size: int = 256,
+        interval: float = 1.0,
+        timeout: float = 2.0,
+    ):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.interval = interval
+        self.timeout = timeout
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="otlp-exporter", daemon=True
+        )
+        self._thread.start()
+
+    def export(self, finished: Span) -> None:
+        try:
+            self._queue.put_nowait(finished)
+        except queue.Full:
+            self.dropped += 1
+
+    def shutdown(self) -> None:
+        self._stop.set()
+        self._thread.join(self.timeout + self.interval)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._stop.wait(self.interval)
+            while self._send(self._take()) == self.batch_size:
+                pass
+        self._send(self._take())
+
+    def _take(self) -> List[Span]:
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _send(self, batch: List[Span]) -> int:
+        if not batch:
+            return 0
+        body = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {
+                                "key": "service.name",
+                                "value": {"stringValue": self.service_name},
+                            }
+                        ]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "tutorgpt"},
+                            "spans": [otlp_span(s) for s in batch],
+                        }
+                    ],
+                }
+            ]
+        }
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(body, default=str).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout):
+                pass
+        except Exception as e:
+            logger.warning("Dropped %d spans: %s", len(batch), e)
+        return len(batch)
+
+
+def create_exporter(
+    kind: str, endpoint: str, file_path: str, service_name: str = "tutorgpt-backend"
+):
+    """The exporter named by TRACING_EXPORTER: "otlp" or "file"."""
+    if kind == "file":
+        return FileExporter(file_path)
+    if kind == "otlp":
+        return OtlpHttpExporter(endpoint, service_name=service_name)
+    raise ValueError(f"Unknown tracing exporter: {kind}")
@@ -1,5 +1,5 @@
 import React, { useState } from 'react'
-import { sendMessage } from '../utils/api'
+import { sendMessage, traceIdOf } from '../utils/api'
 import Message from './Message'
 import '../styles/App.css'
 /**
@@ -36,7 +36,21 @@ function reflowTextNoSplit (text, maxLen = 300) {
   return result.trim()
 }
 
+/**
+ * Conversation history is stored per session on the backend; keep one
+ * session ID per browser tab so a refresh continues the same conversation.
+ */
+function getSessionId () {
+  let sessionId = window.sessionStorage.getItem('tutorSessionId')
+  if (!sessionId) {
+    sessionId = `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`
+    window.sessionStorage.setItem('tutorSessionId', sessionId)
+  }
+  return sessionId
+}
+
 function ChatRat () {
+  const [sessionId] = useState(getSessionId)
   const [messages, setMessages] = useState([])
   const [inputValue, setInputValue] = useState('')
 
@@ -54,9 +68,22 @@ function ChatRat () {
     setMessages(prev => [...prev, userMessage])
     setInputValue('')
 
+    // Streamed text is shown in a bubble that the final message replaces
+    const assistantId = `msg-${Date.now()}-assistant`
+    let streamedText = ''
+    const onDelta = delta => {
+      streamedText += delta
+      const partial = { role: 'assistant', content: streamedText, id: assistantId }
+      setMessages(prev =>
+        prev.some(msg => msg.id === assistantId)
+          ? prev.map(msg => (msg.id === assistantId ? partial : msg))
+          : [...prev, partial]
+      )
+    }
+
     try {
-      // 3) Call backend
-      const response = await sendMessage(inputValue)
+      // 3) Call backend, streaming the response as it is generated
+      const response = await sendMessage(inputValue, { sessionId, onDelta })
       const assistantMessage = response.data.assistant_message // entire AI response
 
       // 4) Insert line breaks AFTER sentences without splitting them
@@ -68,13 +95,20 @@ function ChatRat () {
         content: reflowed,
         userInput: userMessage.content,
         assistantOutput: assistantMessage,
-        id: `msg-${Date.now()}-assistant`
+        id: assistantId
       }
 
-      // 6) Append the assistant message as a single bubble
-      setMessages(prev => [...prev, newAssistantMessage])
+      // 6) Replace the streamed bubble with the final assistant message
+      setMessages(prev => [
+        ...prev.filter(msg => msg.id !== assistantId),
+        newAssistantMessage
+      ])
     } catch (error) {
-      console.error('Error sending message:', error)
+      console.error('Error sending message:', error, {
+        traceId: traceIdOf(error)
+      })
+      // Drop a partly streamed answer rather than let it pass as complete
+      setMessages(prev => prev.filter(msg => msg.id !== assistantId))
       // Optionally handle or display an error in the UI
     }
   }
@@ -4,8 +4,98 @@ const apiClient = axios.create({
   baseURL: '/api'
 })
 
-export const sendMessage = async message => {
-  return apiClient.post('/chat', { message })
+/**
+ * Parse one Server-Sent Event block ("event: ...\ndata: ...") into
+ * its event name and JSON payload.
+ */
+const parseEvent = block => {
+  let event = 'message'
+  let data = ''
+  for (const line of block.split('\n')) {
+    if (line.startsWith('event:')) event = line.slice(6).trim()
+    else if (line.startsWith('data:')) data += line.slice(5).trim()
+  }
+  return { event, data: data ? JSON.parse(data) : {} }
+}
+
+/**
+ * Request a streamed chat response and call `onDelta` with each chunk of
+ * filtered text as it arrives. Resolves to the same shape as the axios
+ * response so callers can treat both modes alike.
+ */
+const streamMessage = async (message, sessionId, onDelta) => {
+  const response = await fetch('/api/chat', {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      Accept: 'text/event-stream'
+    },
+    body: JSON.stringify({ message, sessionId, stream: true })
+  })
+
+  // Errors and policy refusals come back as plain JSON
+  const contentType = response.headers.get('Content-Type') || ''
+  if (!contentType.startsWith('text/event-stream')) {
+    const data = await response.json().catch(() => ({}))
+    if (!response.ok) {
+      const error = new Error(data.error || `Request failed: ${response.status}`)
+      error.response = { status: response.status, data }
+      error.traceId = response.headers.get('X-Trace-ID')
+      throw error
+    }
+    return { data }
+  }
+
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  let assistantMessage = ''
+  let completed = false
+
+  while (true) {
+    const { value, done } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+
+    let boundary = buffer.indexOf('\n\n')
+    while (boundary !== -1) {
+      const { event, data } = parseEvent(buffer.slice(0, boundary))
+      buffer = buffer.slice(boundary + 2)
+      if (event === 'delta') onDelta(data.content)
+      else if (event === 'done') {
+        assistantMessage = data.assistant_message
+        completed = true
+      } else if (event === 'error') {
+        const error = new Error(data.error)
+        error.traceId = response.headers.get('X-Trace-ID')
+        throw error
+      }
+      boundary = buffer.indexOf('\n\n')
+    }
+  }
+
+  // A stream that ends without 'done' was cut off, so what arrived so far
+  // is not the whole answer
+  if (!completed) {
+    const error = new Error('The response ended before it was complete')
+    error.traceId = response.headers.get('X-Trace-ID')
+    throw error
+  }
+  return { data: { assistant_message: assistantMessage, session_id: sessionId } }
+}
+
+/**
+ * The backend trace ID for a failed request, when tracing is enabled, so a
+ * slow or failing request can be looked up in the collector.
+ */
+export const traceIdOf = error =>
+  error.traceId || error.response?.headers?.['x-trace-id'] || null
+
+export const sendMessage = async (message, { sessionId, onDelta } = {}) => {
+  if (onDelta) {
+    return streamMessage(message, sessionId, onDelta)
+  }
+  return apiClient.post('/chat', { message, sessionId })
 }
 
 export const rateMessage = async (
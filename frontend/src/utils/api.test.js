@@ -0,0 +1,117 @@
+// frontend/src/utils/api.test.js
+import { TextDecoder, TextEncoder } from 'util'
+import { sendMessage } from './api'
+
+// jsdom does not provide these
+global.TextEncoder = global.TextEncoder || TextEncoder
+global.TextDecoder = global.TextDecoder || TextDecoder
+
+const encoder = new TextEncoder()
+
+/**
+ * A fetch response for an event stream whose body reader returns one of
+ * `chunks` (strings or bytes) per read(), like a ReadableStream's reader.
+ */
+const streamResponse = chunks => {
+  const queue = chunks.map(chunk =>
+    typeof chunk === 'string' ? encoder.encode(chunk) : chunk
+  )
+  return {
+    ok: true,
+    status: 200,
+    headers: new Map([
+      ['Content-Type', 'text/event-stream'],
+      ['X-Trace-ID', 'trace-1']
+    ]),
+    body: {
+      getReader: () => ({
+        read: async () =>
+          queue.length
+            ? { value: queue.shift(), done: false }
+            : { value: undefined, done: true }
+      })
+    }
+  }
+}
+
+const stream = (chunks, onDelta = jest.fn()) => {
+  global.fetch.mockResolvedValueOnce(streamResponse(chunks))
+  return sendMessage('Hello', { sessionId: 'session-1', onDelta })
+}
+
+describe('streamMessage', () => {
+  beforeEach(() => {
+    global.fetch = jest.fn()
+  })
+
+  test('calls onDelta per event and resolves with the done message', async () => {
+    const onDelta = jest.fn()
+    const response = await stream(
+      [
+        'event: delta\ndata: {"content": "Think "}\n\n',
+        'event: delta\ndata: {"content": "again."}\n\n' +
+          'event: done\ndata: {"assistant_message": "Think again."}\n\n'
+      ],
+      onDelta
+    )
+
+    expect(onDelta.mock.calls).toEqual([['Think '], ['again.']])
+    expect(response.data).toEqual({
+      assistant_message: 'Think again.',
+      session_id: 'session-1'
+    })
+    const [url, options] = global.fetch.mock.calls[0]
+    expect(url).toBe('/api/chat')
+    expect(JSON.parse(options.body)).toEqual({
+      message: 'Hello',
+      sessionId: 'session-1',
+      stream: true
+    })
+  })
+
+  test('joins an event whose data spans several lines', async () => {
+    const response = await stream([
+      'event: done\ndata: {"assistant_message":\ndata: "Think again."}\n\n'
+    ])
+    expect(response.data.assistant_message).toBe('Think again.')
+  })
+
+  test('reassembles events split across chunks', async () => {
+    const onDelta = jest.fn()
+    // The second event's UTF-8 bytes are cut inside the "é"
+    const bytes = encoder.encode('event: delta\ndata: {"content": "é"}\n\n')
+    const cut = bytes.indexOf(0xc3) + 1
+    const response = await stream(
+      [
+        'event: delta\ndata: {"con',
+        'tent": "Think "}\n',
+        '\n',
+        bytes.slice(0, cut),
+        bytes.slice(cut),
+        'event: done\ndata: {"assistant_message": "Think é"}\n\n'
+      ],
+      onDelta
+    )
+
+    expect(onDelta.mock.calls).toEqual([['Think '], ['é']])
+    expect(response.data.assistant_message).toBe('Think é')
+  })
+
+  test('rejects when the stream ends without a done event', async () => {
+    const onDelta = jest.fn()
+    const result = stream(
+      ['event: delta\ndata: {"content": "Think "}\n\n'],
+      onDelta
+    )
+
+    await expect(result).rejects.toThrow(/ended before it was complete/)
+    await expect(result).rejects.toHaveProperty('traceId', 'trace-1')
+    expect(onDelta).toHaveBeenCalledWith('Think ')
+  })
+
+  test('rejects with the message of an error event', async () => {
+    await expect(
+      stream(['event: error\ndata: {"error": "Internal Server Error"}\n\n'])
+    ).rejects.toThrow('Internal Server Error')
+  })
+})